@@ -0,0 +1,161 @@
+# clean_throughput.py
+"""
+清洗吞吐对比：生成模拟 PDF 抽取结果的文本（作者/单位、Abstract、按行折断的正文、连字符断词、[12] 角标、
+页码行、各种奇怪空白、末尾参考文献），分别用 experimental/deep_clean.clean_text_pipeline 与
+clean_engine.CleanEngine 清洗，报告 MB/s，并检查两者输出是否一致。
+
+    python benchmarks/clean_throughput.py                 # 默认 2 MiB
+    python benchmarks/clean_throughput.py --mb 20 --skip-reference   # 大文本只测新引擎（原管道是平方复杂度）
+    python benchmarks/clean_throughput.py --langs en=0.5,zh=0.5 --json
+
+deep_clean 在导入时把根 logger 配置为 DEBUG 并逐行打日志：“as shipped” 把这些日志写入 devnull，
+“logging off” 把根 logger 调到 WARNING（f-string 仍会求值）。engine stream 从磁盘逐行读取并写出，
+只在前 2000 / 后 5000 个逻辑行中查找作者信息与参考文献，同时报告 tracemalloc 峰值。
+"""
+import argparse
+import contextlib
+import json
+import logging
+import os
+import random
+import sys
+import tempfile
+import time
+import tracemalloc
+import warnings
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+SRC_DIR = os.path.join(os.path.dirname(BENCH_DIR), "src")
+sys.path.insert(0, SRC_DIR)
+sys.path.insert(0, BENCH_DIR)
+
+from clean_engine import CleanEngine  # noqa: E402
+from synth_corpus import parse_mix, sentence  # noqa: E402
+
+ODD_SPACES = ["\u3000", "\u00a0", "\u2009", "\u200b", "\t"]
+
+
+def wrap(text: str, rng: random.Random, width: int) -> str:
+    """按固定宽度折行，偶尔在单词中间加连字符断开、插入奇怪空白（模拟 PDF 抽取）。"""
+    lines, line = [], ""
+    for word in text.split(" "):
+        if line and len(line) + len(word) + 1 > width:
+            if len(word) > 6 and rng.random() < 0.15:
+                cut = len(word) // 2
+                lines.append(line + " " + word[:cut] + "-")
+                line = word[cut:]
+                continue
+            lines.append(line)
+            line = word
+        else:
+            sep = rng.choice(ODD_SPACES) if rng.random() < 0.02 else " "
+            line = line + sep + word if line else word
+    if line:
+        lines.append(line)
+    return "\n".join(lines)
+
+
+def make_document(rng: random.Random, langs: dict, target_bytes: int) -> str:
+    lang_names, weights = list(langs), list(langs.values())
+    parts = ["A Study of Retrieval", "Alice Smith1, Bob Jones2", "1 Department of Things, Some University",
+             "", "Abstract", wrap(" ".join(sentence(rng, "en") for _ in range(5)), rng, 80), ""]
+    size, page, ref = sum(len(p) for p in parts), 1, 1
+    while size < target_bytes:
+        lang = rng.choices(lang_names, weights)[0]
+        body = " ".join(sentence(rng, lang) + (f" [{rng.randint(1, 60)}]" if rng.random() < 0.3 else "")
+                        for _ in range(rng.randint(3, 8)))
+        parts.append(wrap(body, rng, 80 if lang == "en" else 40))
+        parts.append("")
+        if rng.random() < 0.25:
+            page += 1
+            parts.extend([str(page), ""])
+        size += len(body) + 8
+    parts.append("References")
+    for _ in range(60):
+        parts.append(f"{ref}. Smith AB, Jones C, Lee D. {sentence(rng, 'en')} J Med. {rng.randint(1990, 2024)};"
+                     f"{rng.randint(1, 99)}:{rng.randint(1, 999)}-{rng.randint(1000, 1999)}.")
+        ref += 1
+    return "\n".join(parts)
+
+
+def timed(fn, repeat: int):
+    best, result = None, None
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        result = fn()
+        elapsed = time.perf_counter() - t0
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+
+def load_deep_clean():
+    """导入 experimental/deep_clean（它会重新配置根 logger），返回 (模块, devnull)。"""
+    sys.path.insert(0, os.path.join(SRC_DIR, "experimental"))
+    devnull = open(os.devnull, "w")
+    with warnings.catch_warnings(), contextlib.redirect_stderr(devnull):
+        warnings.simplefilter("ignore")
+        import deep_clean
+    for handler in logging.getLogger().handlers:
+        handler.setStream(devnull)
+    return deep_clean, devnull
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--mb", type=float, default=2.0, help="文本大小（MiB）")
+    parser.add_argument("--langs", default="en=0.8,zh=0.2")
+    parser.add_argument("--repeat", type=int, default=3, help="每种方式重复次数，取最快一次")
+    parser.add_argument("--skip-reference", action="store_true", help="不运行 deep_clean.clean_text_pipeline")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", action="store_true")
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    text = make_document(rng, parse_mix(args.langs, ("en", "zh")), int(args.mb * 1024 * 1024))
+    mb = len(text.encode("utf-8")) / 1024 / 1024
+    report = {"mb": round(mb, 2), "lines": text.count("\n") + 1, "results": {}}
+
+    def record(name, seconds, **extra):
+        report["results"][name] = {"seconds": round(seconds, 3), "mb_per_s": round(mb / seconds, 2), **extra}
+
+    engine = CleanEngine()
+    seconds, cleaned = timed(lambda: engine.clean(text), args.repeat)
+    record("engine", seconds, lines_out=engine.stats["lines_out"])
+
+    workdir = tempfile.mkdtemp(prefix="clean_throughput_")
+    src, dst = os.path.join(workdir, "doc.txt"), os.path.join(workdir, "doc.clean.txt")
+    with open(src, "w", encoding="utf-8", newline="") as f:
+        f.write(text)
+    seconds, _ = timed(lambda: engine.clean_file(src, dst), args.repeat)
+    tracemalloc.start()
+    engine.clean_file(src, dst)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    with open(dst, "r", encoding="utf-8", newline="") as f:
+        streamed = f.read()
+    record("engine stream", seconds, traced_peak_mb=round(peak / 1024 / 1024, 2), same_as_engine=streamed == cleaned)
+
+    if not args.skip_reference:
+        deep_clean, devnull = load_deep_clean()
+        seconds, expected = timed(lambda: deep_clean.clean_text_pipeline(text), 1)
+        record("deep_clean (as shipped)", seconds, identical=expected == cleaned)
+        logging.getLogger().setLevel(logging.WARNING)
+        seconds, _ = timed(lambda: deep_clean.clean_text_pipeline(text), 1)
+        record("deep_clean (logging off)", seconds)
+        devnull.close()
+        base = report["results"]["deep_clean (logging off)"]["seconds"]
+        report["speedup"] = round(base / report["results"]["engine"]["seconds"], 1)
+
+    if args.json:
+        print(json.dumps(report, indent=2, ensure_ascii=False))
+        return
+    print(f"{report['mb']} MiB, {report['lines']} lines")
+    for name, r in report["results"].items():
+        extra = "  ".join(f"{k}={v}" for k, v in r.items() if k not in ("seconds", "mb_per_s"))
+        print(f"  {name:<26} {r['seconds']:>8}s  {r['mb_per_s']:>8} MB/s  {extra}")
+    if "speedup" in report:
+        print(f"  engine vs deep_clean (logging off): {report['speedup']}x")
+
+
+if __name__ == "__main__":
+    main()
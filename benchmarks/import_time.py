@@ -0,0 +1,93 @@
+# import_time.py
+"""
+启动耗时基准：用 `python -X importtime` 测量三个标签页模块（rag_tab / literature_tab / anki_tab）
+在 streamlit 之上额外增加的导入时间，并检查重型依赖没有在 import 阶段被加载。
+
+    python benchmarks/import_time.py                 # 默认预算 150ms
+    python benchmarks/import_time.py --budget-ms 200 --top 15
+
+超出预算或重型依赖被提前导入时以退出码 1 结束，可直接用于 CI。
+"""
+import argparse
+import os
+import subprocess
+import sys
+
+SRC_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src")
+TAB_MODULES = ["rag_tab", "literature_tab", "anki_tab"]
+# 这些依赖应在第一次使用时才导入
+HEAVY_MODULES = ["openai", "chromadb", "langchain_chroma", "langchain_community", "langchain.document_loaders",
+                 "nltk", "unstructured", "fitz", "numpy", "docx", "pandas"]
+
+
+def run_importtime(code: str):
+    """在子进程中执行 code，返回 (-X importtime 解析结果 [(self_us, cumulative_us, depth, name)], stdout)。"""
+    env = dict(os.environ, PYTHONPATH=SRC_DIR)
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", code],
+        cwd=SRC_DIR, env=env, capture_output=True, text=True
+    )
+    if proc.returncode != 0:
+        raise RuntimeError(proc.stderr[-2000:])
+    rows = []
+    for line in proc.stderr.splitlines():
+        if not line.startswith("import time:") or "imported package" in line:
+            continue
+        self_us, cum_us, name = line[len("import time:"):].split("|")
+        depth = (len(name) - len(name.lstrip(" "))) // 2
+        rows.append((int(self_us), int(cum_us), depth, name.strip()))
+    return rows, proc.stdout
+
+
+def measure(repeat: int):
+    """取 repeat 次中最快的一次：标签页模块（在 streamlit 已导入之后）的累计导入耗时（毫秒）。"""
+    code = ("import streamlit\n"
+            f"import {', '.join(TAB_MODULES)}\n"
+            "import sys\n"
+            f"print(','.join(m for m in {HEAVY_MODULES!r} if m in sys.modules))")
+    best = None
+    for _ in range(repeat):
+        rows, stdout = run_importtime(code)
+        total = sum(cum for _, cum, depth, name in rows if depth == 0 and name in TAB_MODULES) / 1000
+        if best is None or total < best[0]:
+            best = (total, rows, [m for m in stdout.strip().split(",") if m])
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--budget-ms", type=float, default=float(os.getenv("IMPORT_BUDGET_MS", 150)))
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--top", type=int, default=10, help="列出最慢的模块数")
+    args = parser.parse_args()
+
+    total_ms, rows, heavy = measure(args.repeat)
+
+    # 只统计标签页模块子树中的模块（streamlit 自身的耗时不计入）
+    in_tabs, slowest = False, []
+    for self_us, cum_us, depth, name in reversed(rows):  # importtime 按完成顺序输出，父模块在子模块之后
+        if depth == 0:
+            in_tabs = name in TAB_MODULES
+        if in_tabs:
+            slowest.append((cum_us / 1000, self_us / 1000, name))
+    slowest.sort(reverse=True)
+
+    print(f"Tab modules import time (on top of streamlit): {total_ms:.1f} ms  (budget {args.budget_ms:.0f} ms)")
+    print(f"{'cumulative ms':>14} {'self ms':>9}  module")
+    for cum_ms, self_ms, name in slowest[:args.top]:
+        print(f"{cum_ms:14.1f} {self_ms:9.1f}  {name}")
+
+    failed = False
+    if heavy:
+        print(f"FAIL: heavy dependencies imported at startup: {', '.join(heavy)}")
+        failed = True
+    if total_ms > args.budget_ms:
+        print(f"FAIL: import time {total_ms:.1f} ms exceeds budget {args.budget_ms:.0f} ms")
+        failed = True
+    if not failed:
+        print("OK")
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
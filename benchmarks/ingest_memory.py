@@ -0,0 +1,86 @@
+# ingest_memory.py
+"""
+预处理内存对比：生成一个大 PDF（默认 2000 页），分别用一次性加载（streaming=False）与逐页流式加载预处理，
+每种方式在独立的子进程中运行，报告该文件的 RSS 峰值、tracemalloc 峰值与耗时；--max-rss-mb 可验证上限是否生效。
+
+    python benchmarks/ingest_memory.py
+    python benchmarks/ingest_memory.py --pages 4000 --method 按句子
+    python benchmarks/ingest_memory.py --max-rss-mb 200     # 超过上限的文件应记为失败而不是耗尽内存
+"""
+import argparse
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+SRC_DIR = os.path.join(os.path.dirname(BENCH_DIR), "src")
+sys.path.insert(0, BENCH_DIR)
+
+from synth_corpus import paragraph, write_pdf  # noqa: E402
+
+CHILD = """
+import json, sys, time, warnings
+warnings.filterwarnings("ignore")
+from preprocess import process_documents
+raw, out, method, streaming, cap = sys.argv[1:6]
+t0 = time.perf_counter()
+run = process_documents(raw, out, chunking_method=method, streaming=streaming == "1", trace_memory=True,
+                        max_rss_mb=float(cap) or None)
+print("RESULT " + json.dumps({"seconds": round(time.perf_counter() - t0, 2), "failed": run["failed_files"],
+                              "memory": next(iter(run["memory"].values()), {})}))
+"""
+
+
+def make_pdf(folder: str, pages: int, seed: int) -> str:
+    os.makedirs(folder, exist_ok=True)
+    rng = random.Random(seed)
+    path = os.path.join(folder, "big.pdf")
+    write_pdf(path, [paragraph(rng, "en", 8) for _ in range(pages * 4)], rng, "en")
+    return path
+
+
+def run_mode(raw: str, out: str, method: str, streaming: bool, cap: float) -> dict:
+    proc = subprocess.run([sys.executable, "-c", CHILD, raw, out, method, "1" if streaming else "0", str(cap)],
+                          cwd=SRC_DIR, capture_output=True, text=True)
+    for line in proc.stdout.splitlines():
+        if line.startswith("RESULT "):
+            return json.loads(line[len("RESULT "):])
+    raise RuntimeError(f"preprocess failed:\n{proc.stderr[-2000:]}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--pages", type=int, default=2000)
+    parser.add_argument("--method", default="按段落", choices=["按句子", "按段落", "按页", "固定长度"])
+    parser.add_argument("--max-rss-mb", type=float, default=0, help="流式模式的内存上限（0 表示不限）")
+    parser.add_argument("--workdir", help="工作目录（默认临时目录）")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", action="store_true")
+    args = parser.parse_args()
+
+    workdir = args.workdir or tempfile.mkdtemp(prefix="ingest_memory_")
+    raw = os.path.join(workdir, "raw")
+    pdf = make_pdf(raw, args.pages, args.seed)
+    report = {"pages": args.pages, "pdf_mb": round(os.path.getsize(pdf) / 1024 / 1024, 1), "method": args.method}
+    report["eager"] = run_mode(raw, os.path.join(workdir, "eager"), args.method, False, 0)
+    report["streaming"] = run_mode(raw, os.path.join(workdir, "streaming"), args.method, True, args.max_rss_mb)
+
+    if args.json:
+        print(json.dumps(report, indent=2, ensure_ascii=False))
+        return
+    print(f"{args.pages}-page PDF ({report['pdf_mb']} MiB), method {args.method}")
+    for mode in ("eager", "streaming"):
+        r = report[mode]
+        m = r["memory"]
+        status = f"FAILED ({', '.join(r['failed'])})" if r["failed"] else "ok"
+        print(f"  {mode:<10} RSS {m.get('rss_start_mb')} -> peak {m.get('rss_peak_mb')} MiB  "
+              f"traced peak {m.get('traced_peak_mb')} MiB  {r['seconds']}s  {status}")
+    if args.max_rss_mb:
+        print(f"  cap {args.max_rss_mb:.0f} MiB")
+
+
+if __name__ == "__main__":
+    main()
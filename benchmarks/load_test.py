@@ -0,0 +1,225 @@
+# load_test.py
+"""
+查询服务压测：完全离线运行，报告 p50/p95/p99 延迟与每秒请求数。
+
+步骤：
+1. 启动 openai_standin（离线 embedding / chat 替身，可设置固定延迟）
+2. 生成合成语料，经 cli.py ingest / embed 建好临时项目
+3. 启动 query_service，用 --concurrency 个 keep-alive 连接并发发送 --requests 个请求
+4. 输出延迟分布、吞吐，以及查询向量微批处理的效果（平均每批条数、实际 embedding 请求数）
+
+    python benchmarks/load_test.py
+    python benchmarks/load_test.py --endpoint summarize --concurrency 32 --requests 500 --latency-ms 80
+    python benchmarks/load_test.py --max-batch 1 --json     # 对比：关闭微批处理
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import re
+import subprocess
+import sys
+import tempfile
+import time
+
+SRC_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src")
+sys.path.insert(0, SRC_DIR)
+
+from async_http import Connection  # noqa: E402
+
+PROJECT = "loadtest"
+WORDS = ("retrieval augmented generation embedding vector index chunk summary model latency throughput "
+         "protein enzyme cell membrane receptor signal pathway gene expression neural network attention "
+         "transformer corpus citation review method result analysis sample cohort trial outcome").split()
+
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    if not ordered:
+        return None
+    return ordered[min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))]
+
+
+def synth_corpus(folder, n_files, paragraphs, seed):
+    rng = random.Random(seed)
+    os.makedirs(folder, exist_ok=True)
+    paths = []
+    for i in range(n_files):
+        path = os.path.join(folder, f"doc_{i:03d}.txt")
+        paras = [" ".join(rng.choice(WORDS) for _ in range(rng.randint(40, 90))) + "."
+                 for _ in range(paragraphs)]
+        with open(path, "w", encoding="utf-8") as f:
+            f.write("\n\n".join(paras))
+        paths.append(path)
+    return paths
+
+
+def start_process(args, log_path, env):
+    """启动子进程（输出写入日志文件，避免管道写满阻塞），等待其打印监听地址后返回 (进程, 端口)。"""
+    log = open(log_path, "w", encoding="utf-8")
+    proc = subprocess.Popen([sys.executable, *args], cwd=SRC_DIR, env=env, stdout=log, stderr=subprocess.STDOUT)
+    deadline = time.time() + 60
+    while time.time() < deadline:
+        with open(log_path, "r", encoding="utf-8", errors="replace") as f:
+            m = re.search(r"Listening on http://[\w.]+:(\d+)", f.read())
+        if m:
+            return proc, int(m.group(1))
+        if proc.poll() is not None:
+            break
+        time.sleep(0.1)
+    proc.kill()
+    raise RuntimeError(f"{args[0]} failed to start, see {log_path}")
+
+
+def run_cli(args, env):
+    proc = subprocess.run([sys.executable, "cli.py", *args], cwd=SRC_DIR, env=env, capture_output=True, text=True)
+    if proc.returncode != 0:
+        raise RuntimeError(f"cli.py {args[0]} exited with {proc.returncode}:\n{proc.stderr[-2000:]}")
+    return json.loads(proc.stdout)
+
+
+def make_payload(endpoint, rng, top_k):
+    query = " ".join(rng.choice(WORDS) for _ in range(rng.randint(3, 8)))
+    payload = {"project": PROJECT, "query": query, "top_k": top_k}
+    if endpoint == "cards":
+        payload["num_cards"] = 3
+    return payload
+
+
+async def load(port, endpoint, concurrency, total, top_k, seed):
+    rng = random.Random(seed)
+    payloads = [make_payload(endpoint, rng, top_k) for _ in range(total)]
+    latencies, errors = [], {}
+    next_index = 0
+
+    async def worker():
+        nonlocal next_index
+        conn = Connection("127.0.0.1", port)
+        try:
+            while next_index < total:
+                payload = payloads[next_index]
+                next_index += 1
+                t0 = time.perf_counter()
+                try:
+                    status, _ = await conn.request("POST", f"/{endpoint}", payload)
+                except (ConnectionError, asyncio.IncompleteReadError) as e:
+                    status = type(e).__name__
+                    await conn.close()
+                latencies.append(time.perf_counter() - t0)
+                if status != 200:
+                    errors[str(status)] = errors.get(str(status), 0) + 1
+        finally:
+            await conn.close()
+
+    # 预热：加载项目（Chroma、分块索引）
+    conn = Connection("127.0.0.1", port)
+    status, body = await conn.request("POST", "/search", make_payload("search", rng, top_k))
+    await conn.close()
+    if status != 200:
+        raise RuntimeError(f"Warm-up request failed: {status} {body}")
+
+    t0 = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - t0
+
+    conn = Connection("127.0.0.1", port)
+    _, health = await conn.request("GET", "/health")
+    await conn.close()
+    return latencies, errors, elapsed, health
+
+
+async def get_json(port, path):
+    conn = Connection("127.0.0.1", port)
+    try:
+        return (await conn.request("GET", path))[1]
+    finally:
+        await conn.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--endpoint", choices=["search", "summarize", "cards"], default="search")
+    parser.add_argument("--requests", type=int, default=300)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--top-k", type=int, default=10)
+    parser.add_argument("--files", type=int, default=20, help="合成语料文件数")
+    parser.add_argument("--paragraphs", type=int, default=25, help="每个文件的段落数（=分块数）")
+    parser.add_argument("--latency-ms", type=float, default=20.0, help="替身服务每个请求的固定延迟")
+    parser.add_argument("--provider-rpm", type=float, default=60000,
+                        help="llm_client 对 openai 提供商的限速（默认放开，测服务本身；设为 300 可模拟真实限额）")
+    parser.add_argument("--max-batch", type=int, default=64)
+    parser.add_argument("--max-wait-ms", type=float, default=5.0)
+    parser.add_argument("--workdir", help="工作目录（默认临时目录）")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", action="store_true", help="以 JSON 输出结果")
+    args = parser.parse_args()
+
+    workdir = args.workdir or tempfile.mkdtemp(prefix="loadtest_")
+    projects_dir = os.path.join(workdir, "projects")
+    project = os.path.join(projects_dir, PROJECT)
+    env = dict(os.environ, PYTHONUNBUFFERED="1")
+    procs = []
+    try:
+        standin, standin_port = start_process(
+            ["openai_standin.py", "--port", "0", "--latency-ms", str(args.latency_ms)],
+            os.path.join(workdir, "standin.log"), env)
+        procs.append(standin)
+        env.update(OPENAI_API_BASE=f"http://127.0.0.1:{standin_port}/v1", OPENAI_API_KEY="standin",
+                   LLM_OPENAI_RPM=str(args.provider_rpm), LLM_OPENAI_BURST=str(max(20, int(args.provider_rpm / 60))))
+
+        files = synth_corpus(os.path.join(workdir, "corpus"), args.files, args.paragraphs, args.seed)
+        run_cli(["ingest", "--project", project, "--method", "按段落", "--files", *files], env)
+        embedded = run_cli(["embed", "--project", project], env)
+
+        service, port = start_process(
+            ["query_service.py", "--port", "0", "--projects-dir", projects_dir,
+             "--max-batch", str(args.max_batch), "--max-wait-ms", str(args.max_wait_ms)],
+            os.path.join(workdir, "service.log"), env)
+        procs.append(service)
+
+        before = asyncio.run(get_json(standin_port, "/v1/stats"))
+        latencies, errors, elapsed, health = asyncio.run(
+            load(port, args.endpoint, args.concurrency, args.requests, args.top_k, args.seed))
+        after = asyncio.run(get_json(standin_port, "/v1/stats"))
+    finally:
+        for proc in procs:
+            proc.terminate()
+            proc.wait(timeout=10)
+
+    ms = [x * 1000 for x in latencies]
+    report = {
+        "endpoint": args.endpoint,
+        "requests": len(latencies),
+        "concurrency": args.concurrency,
+        "chunks": embedded["total"],
+        "standin_latency_ms": args.latency_ms,
+        "elapsed_s": round(elapsed, 3),
+        "rps": round(len(latencies) / elapsed, 1) if elapsed else None,
+        "p50_ms": round(percentile(ms, 50), 1),
+        "p95_ms": round(percentile(ms, 95), 1),
+        "p99_ms": round(percentile(ms, 99), 1),
+        "max_ms": round(max(ms), 1),
+        "errors": errors,
+        "query_embedding": health["embedding"],
+        "embedding_api_calls": after["embedding_requests"] - before["embedding_requests"],
+        "chat_api_calls": after["chat_requests"] - before["chat_requests"],
+        "workdir": workdir,
+    }
+    if args.json:
+        print(json.dumps(report, indent=2))
+    else:
+        print(f"{args.endpoint}: {report['requests']} requests, concurrency {args.concurrency}, "
+              f"{report['chunks']} chunks, stand-in latency {args.latency_ms:.0f} ms")
+        print(f"  throughput  {report['rps']} req/s  ({report['elapsed_s']} s)")
+        print(f"  latency     p50 {report['p50_ms']} ms  p95 {report['p95_ms']} ms  "
+              f"p99 {report['p99_ms']} ms  max {report['max_ms']} ms")
+        print(f"  embeddings  {report['embedding_api_calls']} API calls, "
+              f"avg batch {report['query_embedding']['avg_batch']}")
+        if errors:
+            print(f"  errors      {errors}")
+    sys.exit(1 if errors else 0)
+
+
+if __name__ == "__main__":
+    main()
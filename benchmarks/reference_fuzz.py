@@ -0,0 +1,166 @@
+# reference_fuzz.py
+"""
+参考文献行识别的对比模糊测试与对抗样本计时：reference_lines.match_reference 与 deep_clean 原来的
+verbose 正则（下方 LEGACY_PATTERN，照抄自 experimental/deep_clean.remove_references_section）。
+
+    python benchmarks/reference_fuzz.py                      # 模糊测试 + 对抗样本
+    python benchmarks/reference_fuzz.py --fuzz 200000 --seed 3
+    python benchmarks/reference_fuzz.py --sizes 1000,10000,100000,1000000 --legacy-budget 5 --json
+
+模糊测试：按各分支用到的字符（字母、数字、汉字、分隔符、空白、IGNORECASE 下特殊的 ſ/K/İ/ı 等）随机拼行，
+两者判断不一致时打印样例，退出码为 1。
+对抗样本：长串字母、行首长空白、没有句号的标题、汉字段 + 分隔符、成串的逗号/年份等，按长度倍增计时；
+按平方增长估计原正则在下一个长度上会超过 --legacy-budget 秒时不再测它。最后用 ReferenceDetector 验证每行时间上限。
+"""
+import argparse
+import json
+import os
+import random
+import re
+import sys
+import time
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+SRC_DIR = os.path.join(os.path.dirname(BENCH_DIR), "src")
+sys.path.insert(0, SRC_DIR)
+
+from reference_lines import ReferenceDetector, match_reference  # noqa: E402
+
+LEGACY_PATTERN = re.compile(
+    r"""(?x) ^\s*
+    (?:
+      \[\d+\]                         # [123]
+    | \[J\]\.?                        # [J] 或 [J].
+    | \[M\]\.?                        # [M] 或 [M].
+    | \d{1,4}[\.）]\s+                # 123. 或 123)
+    | \d{4}(?:年|;)\s*\d+             # 2020年22 或 2020;22
+    | \d{4}[:,]\d{1,4}                # 2015:1234 或 2015,1234
+    | doi[:：]\S+                     # doi:10.1000/xyz 或 doi：…
+    | https?://\S+                    # http://...
+    | [A-Za-z]{2,}(?:[A-Za-z0-9\-,']+),   # LindholmLH,CarlbergB,
+    | [A-Z][A-Za-z0-9\-\’&, ]{10,}\.\s+[A-Z]
+    | [\u4e00-\u9fa5]{2,}(?:,|，|、).{5,}?[\.。]\s*[\u4e00-\u9fa5A-Za-z]
+    | .+?,\s*\d{4},\s*\d{1,4}:\d{1,5}(?:-\d{1,5})?
+    )
+    """,
+    re.IGNORECASE,
+)
+
+TOKENS = (list("abcXYZJjMm019-,'’&.。，、:：;）[] \t") + ["\u3000", "\u00a0", "年", "王", "继", "光", "等", "\u017f", "\u212a",
+          "İ", "ı", "é", "doi", "DOI", "http://", "https://x", "2015", "2020", "12", "1234", "12345", "et al",
+          "Smith AB", "Group", "Research", " 2019, 12:345-367", "[J]", "[12]", "1. "])
+REAL_LINES = [
+    "[1] Smith AB, Jones C. Retrieval augmented generation. Nature. 2020;12:345-367.",
+    "1. Lindholm LH, Carlberg B, Samuelsson O. Beta blockers in hypertension. Lancet 2005;366:1545-53.",
+    "LindholmLH,CarlbergB,SamuelssonO.Shouldbetablockers",
+    "SPRINT Research Group. A randomized trial of intensive versus standard blood-pressure control.",
+    "王继光,谢良地,牟建军,等.中国高血压防治指南[J].中华高血压杂志,2019,27(1):1-44.",
+    "Journal of Hypertension, 2015, 33:1234-1240",
+    "doi:10.1000/xyz123",
+    "https://example.org/paper",
+    "2020年22卷第3期",
+    "Results were consistent across all subgroups.",
+    "In this study we evaluate retrieval. Results follow.",
+]
+
+
+def adversarial(n: int) -> dict:
+    """每类对抗样本一行，长度约为 n。"""
+    half = n // 2
+    return {
+        "letters": "a" * n,
+        "letters, comma at end": "a" * n + ",",
+        "title without period": "A" + "b" * n,
+        "leading spaces + text": " " * half + "x" * half,
+        "leading spaces + commas": " " * half + "x," * (half // 2),
+        "cjk run + delimiter": "王" * half + "，" + "x" * half,
+        "cjk + dots, no letter": "王王，" + ". 1" * (n // 3),
+        "comma / space runs": "a," + " " * (n - 3) + "1",
+        "year-like commas": ", 2015, 1" * (n // 9),
+        "mixed word soup": ("retrieval, 2019 vector-index. " * (n // 30 + 1))[:n],
+    }
+
+
+def timed(fn, line: str) -> float:
+    t0 = time.perf_counter()
+    fn(line)
+    return time.perf_counter() - t0
+
+
+def run_fuzz(count: int, seed: int) -> dict:
+    rng = random.Random(seed)
+    mismatches = []
+    lines = list(REAL_LINES)
+    for _ in range(count):
+        lines.append("".join(rng.choice(TOKENS) for _ in range(rng.randint(0, 24))))
+    for line in lines:
+        expected = LEGACY_PATTERN.match(line) is not None
+        # deadline 为无穷大时走可中断的逐候选查找，两条路径都要与原正则一致
+        if bool(match_reference(line)) != expected or match_reference(line, float("inf")) != expected:
+            mismatches.append({"line": line, "legacy": expected})
+    return {"lines": len(lines), "mismatches": len(mismatches), "examples": mismatches[:10]}
+
+
+def run_adversarial(sizes, budget: float) -> dict:
+    results = {}
+    for name in adversarial(10):
+        rows, legacy_done = [], False
+        for i, n in enumerate(sizes):
+            line = adversarial(n)[name]
+            row = {"chars": len(line), "new_ms": round(timed(match_reference, line) * 1000, 3)}
+            if not legacy_done:
+                seconds = timed(LEGACY_PATTERN.match, line)
+                row["legacy_ms"] = round(seconds * 1000, 3)
+                row["agree"] = bool(match_reference(line)) == (LEGACY_PATTERN.match(line) is not None) \
+                    if seconds < budget / 2 else None
+                # 按平方增长估计下一个长度的耗时，超过预算就不再测原正则
+                growth = (sizes[i + 1] / n) ** 2 if i + 1 < len(sizes) else 1
+                legacy_done = seconds * growth > budget
+            rows.append(row)
+        results[name] = rows
+    return results
+
+
+def run_time_limit(chars: int, limit: float) -> dict:
+    """超长的一行在时间上限内放弃判断。"""
+    detector = ReferenceDetector(time_limit=limit)
+    line = ("ab, 1: " * (chars // 7 + 1))[:chars]  # 每个逗号都要尝试 “,年份,卷:页”
+    seconds = timed(detector, line)
+    return {"chars": chars, "time_limit_ms": limit * 1000, "elapsed_ms": round(seconds * 1000, 3), **detector.stats}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--fuzz", type=int, default=50000, help="随机行数")
+    parser.add_argument("--sizes", default="1000,4000,16000,64000", help="对抗样本长度（逗号分隔）")
+    parser.add_argument("--legacy-budget", type=float, default=2.0, help="原正则单行耗时预算（秒）")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", action="store_true")
+    args = parser.parse_args()
+
+    report = {
+        "fuzz": run_fuzz(args.fuzz, args.seed),
+        "adversarial": run_adversarial([int(s) for s in args.sizes.split(",")], args.legacy_budget),
+        "time_limit": run_time_limit(5_000_000, 0.001),
+    }
+    if args.json:
+        print(json.dumps(report, indent=2, ensure_ascii=False))
+    else:
+        fuzz = report["fuzz"]
+        print(f"fuzz: {fuzz['lines']} lines, {fuzz['mismatches']} mismatches")
+        for ex in fuzz["examples"]:
+            print(f"  legacy={ex['legacy']}  {ex['line']!r}")
+        print("adversarial lines (ms per line, new / legacy):")
+        for name, rows in report["adversarial"].items():
+            cells = "  ".join(f"{r['chars']}: {r['new_ms']}/{r.get('legacy_ms', '-')}" for r in rows)
+            flag = "" if all(r.get("agree") is not False for r in rows) else "  DISAGREE"
+            print(f"  {name:<26} {cells}{flag}")
+        t = report["time_limit"]
+        print(f"time limit: {t['chars']} chars, limit {t['time_limit_ms']} ms -> {t['elapsed_ms']} ms, "
+              f"timeouts {t['timeouts']}")
+    disagree = any(r.get("agree") is False for rows in report["adversarial"].values() for r in rows)
+    sys.exit(1 if report["fuzz"]["mismatches"] or disagree else 0)
+
+
+if __name__ == "__main__":
+    main()
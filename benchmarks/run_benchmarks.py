@@ -0,0 +1,330 @@
+# run_benchmarks.py
+"""
+端到端基准测试：在合成语料上分别计时分块、向量化、检索与提示词构建，结果追加到 JSON 历史文件，
+并与上一次相同配置的运行对比。全程离线（embedding 走 openai_standin）。
+
+    python benchmarks/run_benchmarks.py                              # 默认小语料
+    python benchmarks/run_benchmarks.py --files 100 --langs en=0.5,zh=0.5 --formats pdf=3,txt=1
+    python benchmarks/run_benchmarks.py --only chunking,search --label "after splitter change"
+
+基准项：
+    chunking  process_documents 在每种分块方式下的耗时、文件/分块吞吐（按格式统计失败文件）
+    embed     create_or_update_embeddings 全量向量化，以及检查点命中后的空跑
+    search    retrieve.search 在不同 top_k 下的 p50/p95 延迟
+    prompts   summarize.build_summary_context + 摘要模板、anki.build_prompt 的耗时
+
+历史文件每行一条 JSON 记录：{"timestamp", "label", "commit", "config", "env", "results"}
+"""
+import argparse
+import contextlib
+import json
+import logging
+import os
+import platform
+import re
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+SRC_DIR = os.path.join(os.path.dirname(BENCH_DIR), "src")
+sys.path.insert(0, SRC_DIR)
+sys.path.insert(0, BENCH_DIR)
+
+from synth_corpus import EN_WORDS, generate_corpus  # noqa: E402
+
+DEFAULT_HISTORY = os.path.join(BENCH_DIR, "results", "history.jsonl")
+CHUNKING_METHODS = ["按句子", "按段落", "按页", "固定长度"]
+SUITES = ["chunking", "embed", "search", "prompts"]
+
+
+@contextlib.contextmanager
+def quiet():
+    """屏蔽被测模块的 print 日志（写入 devnull 的开销可以忽略）。"""
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        yield
+
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))]
+
+
+def latency_stats(seconds):
+    ms = [s * 1000 for s in seconds]
+    return {"n": len(ms), "p50_ms": round(percentile(ms, 50), 3), "p95_ms": round(percentile(ms, 95), 3),
+            "mean_ms": round(statistics.fmean(ms), 3)}
+
+
+def start_standin(workdir, latency_ms):
+    log_path = os.path.join(workdir, "standin.log")
+    log = open(log_path, "w", encoding="utf-8")
+    proc = subprocess.Popen([sys.executable, "openai_standin.py", "--port", "0", "--latency-ms", str(latency_ms)],
+                            cwd=SRC_DIR, stdout=log, stderr=subprocess.STDOUT, env=dict(os.environ, PYTHONUNBUFFERED="1"))
+    deadline = time.time() + 30
+    while time.time() < deadline:
+        with open(log_path, "r", encoding="utf-8") as f:
+            m = re.search(r"Listening on (http://\S+)", f.read())
+        if m:
+            return proc, m.group(1)
+        if proc.poll() is not None:
+            break
+        time.sleep(0.1)
+    proc.kill()
+    raise RuntimeError(f"openai_standin failed to start, see {log_path}")
+
+
+def bench_chunking(corpus_dir, workdir, methods, chunk_size, chunk_overlap):
+    from preprocess import process_documents
+
+    results = {}
+    for method in methods:
+        out = os.path.join(workdir, "chunking", method)
+        shutil.rmtree(out, ignore_errors=True)
+        with quiet():
+            t0 = time.perf_counter()
+            run = process_documents(corpus_dir, out, chunking_method=method, chunk_size=chunk_size,
+                                    chunk_overlap=chunk_overlap, force_reprocess=True)
+            elapsed = time.perf_counter() - t0
+        chunks_dir = os.path.join(out, "chunks")
+        n_chunks = 0
+        for fn in os.listdir(chunks_dir):
+            with open(os.path.join(chunks_dir, fn), "r", encoding="utf-8") as f:
+                n_chunks += len(json.load(f))
+        failed_by_format = {}
+        for name in run["failed_files"]:
+            ext = os.path.splitext(name)[1].lstrip(".")
+            failed_by_format[ext] = failed_by_format.get(ext, 0) + 1
+        results[method] = {
+            "seconds": round(elapsed, 3),
+            "files": run["processed"],
+            "failed_by_format": failed_by_format,
+            "chunks": n_chunks,
+            "files_per_s": round(run["processed"] / elapsed, 2) if elapsed else None,
+            "chunks_per_s": round(n_chunks / elapsed, 1) if elapsed else None,
+        }
+        print(f"  chunking {method:<4} {elapsed:7.2f}s  {run['processed']} files, {n_chunks} chunks"
+              + (f"  (failed: {failed_by_format})" if failed_by_format else ""))
+    return results
+
+
+def bench_embed(processed_dir, db_dir):
+    from embed import create_or_update_embeddings
+
+    chunks_dir = os.path.join(processed_dir, "chunks")
+    shutil.rmtree(db_dir, ignore_errors=True)
+    with quiet():
+        t0 = time.perf_counter()
+        summary = create_or_update_embeddings(chunks_dir, db_dir, resume=False)
+        full = time.perf_counter() - t0
+        t0 = time.perf_counter()
+        create_or_update_embeddings(chunks_dir, db_dir)
+        noop = time.perf_counter() - t0
+    if summary["failed"] or summary["remaining"]:
+        raise RuntimeError(f"Embedding did not complete: {summary}")
+    print(f"  embed          {full:7.2f}s  {summary['embedded']} chunks; checkpointed rerun {noop:.2f}s")
+    return {
+        "seconds": round(full, 3),
+        "chunks": summary["embedded"],
+        "chunks_per_s": round(summary["embedded"] / full, 1) if full else None,
+        "noop_seconds": round(noop, 3),
+    }
+
+
+def bench_search(db_dir, top_ks, queries, seed):
+    import random
+    from retrieve import initialize_chroma, search
+
+    # top_k 大于集合大小时 chromadb 每次查询都会打印警告
+    logging.getLogger("chromadb").setLevel(logging.ERROR)
+    rng = random.Random(seed)
+    texts = [" ".join(rng.choice(EN_WORDS) for _ in range(rng.randint(3, 8))) for _ in range(queries)]
+    with quiet():
+        db = initialize_chroma(db_dir)
+        search(texts[0], max(top_ks), db)  # 预热：建立连接、加载索引
+    results = {}
+    for top_k in top_ks:
+        times = []
+        with quiet():
+            for text in texts:
+                t0 = time.perf_counter()
+                search(text, top_k, db)
+                times.append(time.perf_counter() - t0)
+        results[f"top_k={top_k}"] = latency_stats(times)
+        print(f"  search top_k={top_k:<3} p50 {results[f'top_k={top_k}']['p50_ms']:.2f}ms  "
+              f"p95 {results[f'top_k={top_k}']['p95_ms']:.2f}ms")
+    return results
+
+
+def bench_prompts(processed_dir, repeat, top_k):
+    from anki import build_prompt, load_chunk_index
+    from literature import build_chunk_text
+    from pipeline import summary_prompt
+    from summarize import build_summary_context
+
+    entries = list(load_chunk_index(os.path.join(processed_dir, "chunks")).values())[:top_k]
+    query = "spaced repetition and retrieval"
+    cases = {
+        "summary": lambda: summary_prompt(query).format(
+            context=build_summary_context([build_chunk_text(e) for e in entries])),
+        "anki_qa": lambda: build_prompt(query, "qa", "intermediate", "moderate", 5,
+                                        [e["chunk_text"] for e in entries]),
+        "anki_cloze_zh": lambda: build_prompt(query, "cloze", "intermediate", "moderate", 5,
+                                              [e["chunk_text"] for e in entries], lang="中文"),
+    }
+    results = {}
+    for name, build in cases.items():
+        times = []
+        with quiet():
+            for _ in range(repeat):
+                t0 = time.perf_counter()
+                prompt = build()
+                times.append(time.perf_counter() - t0)
+        results[name] = {**latency_stats(times), "prompt_chars": len(prompt)}
+        print(f"  prompt {name:<14} p50 {results[name]['p50_ms']:.3f}ms  ({len(prompt)} chars)")
+    return results
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=BENCH_DIR, capture_output=True,
+                              text=True, timeout=10).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+def load_history(path):
+    if not os.path.exists(path):
+        return []
+    with open(path, "r", encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def flatten(results, prefix=""):
+    """{"chunking": {"按段落": {"seconds": 1}}} -> {"chunking.按段落.seconds": 1}"""
+    flat = {}
+    for key, value in results.items():
+        name = f"{prefix}{key}"
+        if isinstance(value, dict):
+            flat.update(flatten(value, name + "."))
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            flat[name] = value
+    return flat
+
+
+COMPARED = ("seconds", "p50_ms", "p95_ms")  # 越小越好的指标
+
+
+def compare(previous, current, threshold):
+    """打印与上一次同配置运行的对比，返回变慢超过 threshold 的指标列表。"""
+    before, after = flatten(previous["results"]), flatten(current["results"])
+    regressions = []
+    print(f"\nCompared with {previous['timestamp']} ({previous.get('commit') or '?'}"
+          f"{', ' + previous['label'] if previous.get('label') else ''}):")
+    for name, value in after.items():
+        if not name.endswith(COMPARED) or not before.get(name):
+            continue
+        change = (value - before[name]) / before[name]
+        flag = ""
+        if change > threshold:
+            flag = "  <-- slower"
+            regressions.append(name)
+        print(f"  {name:<45} {before[name]:>10.3f} -> {value:>10.3f}  {change:+7.1%}{flag}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--files", type=int, default=20)
+    parser.add_argument("--paragraphs", type=int, default=20)
+    parser.add_argument("--formats", default="pdf=1,md=1,txt=1,xlsx=1")
+    parser.add_argument("--langs", default="en=0.7,zh=0.3")
+    parser.add_argument("--methods", default=",".join(CHUNKING_METHODS), help="要计时的分块方式")
+    parser.add_argument("--embed-method", default="按段落", help="向量化/检索基准使用哪种分块结果")
+    parser.add_argument("--chunk-size", type=int, default=400)
+    parser.add_argument("--chunk-overlap", type=int, default=50)
+    parser.add_argument("--top-k", default="1,5,10,50")
+    parser.add_argument("--queries", type=int, default=50, help="每个 top_k 的查询次数")
+    parser.add_argument("--prompt-repeat", type=int, default=200)
+    parser.add_argument("--standin-latency-ms", type=float, default=0.0, help="替身服务的固定延迟")
+    parser.add_argument("--only", help=f"只运行部分基准（逗号分隔：{','.join(SUITES)}）")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--label", default="", help="写入历史记录的说明")
+    parser.add_argument("--history", default=DEFAULT_HISTORY)
+    parser.add_argument("--no-history", action="store_true", help="不写入历史文件")
+    parser.add_argument("--threshold", type=float, default=0.2, help="对比时视为变慢的比例")
+    parser.add_argument("--workdir", help="工作目录（默认临时目录，结束后删除）")
+    args = parser.parse_args()
+
+    suites = args.only.split(",") if args.only else SUITES
+    unknown = set(suites) - set(SUITES)
+    if unknown:
+        parser.error(f"Unknown suites: {', '.join(sorted(unknown))}")
+    methods = args.methods.split(",")
+    if args.embed_method not in methods:
+        methods.append(args.embed_method)  # 向量化需要该分块方式的结果
+    config = {k: getattr(args, k) for k in ("files", "paragraphs", "formats", "langs", "chunk_size", "chunk_overlap",
+                                             "top_k", "queries", "prompt_repeat", "standin_latency_ms", "seed")}
+    config.update(methods=methods, embed_method=args.embed_method, suites=suites)
+
+    workdir = args.workdir or tempfile.mkdtemp(prefix="bench_")
+    corpus_dir = os.path.join(workdir, "corpus")
+    processed_dir = os.path.join(workdir, "chunking", args.embed_method)
+    db_dir = os.path.join(workdir, "chroma_db")
+    results, standin = {}, None
+    try:
+        shutil.rmtree(corpus_dir, ignore_errors=True)
+        t0 = time.perf_counter()
+        paths = generate_corpus(corpus_dir, args.files, args.paragraphs, formats=args.formats, langs=args.langs,
+                                seed=args.seed)
+        print(f"Corpus: {len(paths)} files in {time.perf_counter() - t0:.1f}s ({workdir})")
+
+        # 其余基准都需要 embed_method 的分块结果；不计时分块时也要先跑一遍
+        chunking = bench_chunking(corpus_dir, workdir, methods if "chunking" in suites else [args.embed_method],
+                                  args.chunk_size, args.chunk_overlap)
+        if "chunking" in suites:
+            results["chunking"] = chunking
+        if set(suites) & {"embed", "search"}:
+            standin, base = start_standin(workdir, args.standin_latency_ms)
+            os.environ.update(OPENAI_API_BASE=base, OPENAI_API_KEY="standin",
+                              LLM_OPENAI_RPM="60000", LLM_OPENAI_BURST="1000")
+            embed_result = bench_embed(processed_dir, db_dir)
+            if "embed" in suites:
+                results["embed"] = embed_result
+            if "search" in suites:
+                results["search"] = bench_search(db_dir, [int(k) for k in args.top_k.split(",")], args.queries,
+                                                 args.seed)
+        if "prompts" in suites:
+            results["prompts"] = bench_prompts(processed_dir, args.prompt_repeat, 10)
+    finally:
+        if standin is not None:
+            standin.terminate()
+            standin.wait(timeout=10)
+        if not args.workdir:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    record = {
+        "timestamp": datetime.now().isoformat(timespec="seconds"),
+        "label": args.label,
+        "commit": git_commit(),
+        "config": config,
+        "env": {"python": platform.python_version(), "platform": platform.platform(), "cpus": os.cpu_count()},
+        "results": results,
+    }
+    previous = [r for r in load_history(args.history) if r.get("config") == config]
+    regressions = compare(previous[-1], record, args.threshold) if previous else []
+    if not args.no_history:
+        os.makedirs(os.path.dirname(os.path.abspath(args.history)), exist_ok=True)
+        with open(args.history, "a", encoding="utf-8") as f:
+            f.write(json.dumps(record, ensure_ascii=False) + "\n")
+        print(f"\nAppended results to {args.history}")
+    if regressions:
+        print(f"{len(regressions)} metric(s) slower than {args.threshold:.0%}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,141 @@
+# synth_corpus.py
+"""
+合成语料生成器：按给定的文件数、格式比例与语言比例生成确定性的测试文档（同样的参数与 seed 生成同样的文件）。
+
+    python benchmarks/synth_corpus.py out/corpus --files 40 --formats pdf=2,md=1,txt=1,xlsx=1 --langs en=0.7,zh=0.3
+
+格式：pdf（PyMuPDF 写入，多页）、md（标题 + 段落 + 列表）、txt（空行分段）、xlsx（openpyxl，每行一个术语和释义）
+"""
+import argparse
+import os
+import random
+from typing import Dict, List
+
+EN_WORDS = ("retrieval augmented generation embedding vector index chunk summary model latency throughput "
+            "protein enzyme cell membrane receptor signal pathway gene expression neural network attention "
+            "transformer corpus citation review method result analysis sample cohort trial outcome memory "
+            "learning recall interval evidence hypothesis variable measurement baseline control effect").split()
+ZH_WORDS = ("检索 增强 生成 向量 索引 分块 摘要 模型 延迟 吞吐 蛋白质 酶 细胞 膜 受体 信号 通路 基因 表达 "
+            "神经 网络 注意力 语料 引用 综述 方法 结果 分析 样本 队列 试验 结局 记忆 学习 回忆 间隔 证据 假设").split()
+FORMATS = ("pdf", "md", "txt", "xlsx")
+
+
+def parse_mix(spec: str, allowed) -> Dict[str, float]:
+    """解析 "pdf=2,md=1" 形式的比例（权重不必归一化）。"""
+    mix = {}
+    for part in spec.split(","):
+        key, _, weight = part.partition("=")
+        key = key.strip().lower()
+        if key not in allowed:
+            raise ValueError(f"Unknown key {key!r}, expected one of {', '.join(allowed)}")
+        mix[key] = float(weight or 1)
+    if not mix or sum(mix.values()) <= 0:
+        raise ValueError(f"Empty mix: {spec!r}")
+    return mix
+
+
+def _allocate(n: int, mix: Dict[str, float]) -> List[str]:
+    """按权重把 n 个名额分给各个键（最大余数法），结果确定。"""
+    total = sum(mix.values())
+    exact = {k: n * w / total for k, w in mix.items()}
+    counts = {k: int(v) for k, v in exact.items()}
+    for k in sorted(exact, key=lambda k: exact[k] - counts[k], reverse=True)[:n - sum(counts.values())]:
+        counts[k] += 1
+    return [k for k in mix for _ in range(counts[k])]
+
+
+def sentence(rng: random.Random, lang: str) -> str:
+    if lang == "zh":
+        return "".join(rng.choice(ZH_WORDS) for _ in range(rng.randint(8, 20))) + "。"
+    words = [rng.choice(EN_WORDS) for _ in range(rng.randint(8, 22))]
+    return " ".join(words).capitalize() + "."
+
+
+def paragraph(rng: random.Random, lang: str, sentences: int) -> str:
+    sep = "" if lang == "zh" else " "
+    return sep.join(sentence(rng, lang) for _ in range(rng.randint(max(1, sentences - 2), sentences + 2)))
+
+
+def write_txt(path: str, paras: List[str], rng: random.Random, lang: str) -> None:
+    with open(path, "w", encoding="utf-8") as f:
+        f.write("\n\n".join(paras))
+
+
+def write_md(path: str, paras: List[str], rng: random.Random, lang: str) -> None:
+    out = [f"# {sentence(rng, lang).rstrip('.。')}"]
+    for i, para in enumerate(paras):
+        if i % 4 == 0:
+            out.append(f"## {sentence(rng, lang).rstrip('.。')}")
+        out.append(para)
+        if i % 5 == 2:
+            out.append("\n".join(f"- {sentence(rng, lang)}" for _ in range(3)))
+    with open(path, "w", encoding="utf-8") as f:
+        f.write("\n\n".join(out))
+
+
+def write_pdf(path: str, paras: List[str], rng: random.Random, lang: str, paras_per_page: int = 4) -> None:
+    import fitz  # PyMuPDF
+
+    doc = fitz.open()
+    font = "china-s" if lang == "zh" else "helv"
+    for start in range(0, len(paras), paras_per_page):
+        page = doc.new_page()
+        page.insert_textbox(fitz.Rect(50, 50, page.rect.width - 50, page.rect.height - 50),
+                            "\n\n".join(paras[start:start + paras_per_page]), fontsize=9, fontname=font)
+    doc.save(path)
+    doc.close()
+
+
+def write_xlsx(path: str, paras: List[str], rng: random.Random, lang: str) -> None:
+    from openpyxl import Workbook
+
+    wb = Workbook()
+    ws = wb.active
+    ws.append(["term", "definition"])
+    for para in paras:
+        ws.append([(rng.choice(ZH_WORDS if lang == "zh" else EN_WORDS)), para])
+    wb.save(path)
+
+
+WRITERS = {"pdf": write_pdf, "md": write_md, "txt": write_txt, "xlsx": write_xlsx}
+
+
+def generate_corpus(out_dir: str, files: int = 20, paragraphs: int = 20, sentences: int = 4,
+                    formats: str = "pdf=1,md=1,txt=1,xlsx=1", langs: str = "en=1", seed: int = 0) -> List[str]:
+    """生成语料并返回文件路径列表。"""
+    os.makedirs(out_dir, exist_ok=True)
+    fmt_list = _allocate(files, parse_mix(formats, FORMATS))
+    lang_list = _allocate(files, parse_mix(langs, ("en", "zh")))
+    rng = random.Random(seed)
+    rng.shuffle(lang_list)
+    paths = []
+    for i, (fmt, lang) in enumerate(zip(fmt_list, lang_list)):
+        doc_rng = random.Random(f"{seed}:{i}")
+        paras = [paragraph(doc_rng, lang, sentences) for _ in range(paragraphs)]
+        path = os.path.join(out_dir, f"synth_{i:04d}_{lang}.{fmt}")
+        WRITERS[fmt](path, paras, doc_rng, lang)
+        paths.append(path)
+    return paths
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("out_dir")
+    parser.add_argument("--files", type=int, default=20)
+    parser.add_argument("--paragraphs", type=int, default=20, help="每个文件的段落数")
+    parser.add_argument("--sentences", type=int, default=4, help="每段大约的句子数")
+    parser.add_argument("--formats", default="pdf=1,md=1,txt=1,xlsx=1")
+    parser.add_argument("--langs", default="en=1", help="语言比例，如 en=0.7,zh=0.3")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    try:
+        paths = generate_corpus(args.out_dir, args.files, args.paragraphs, args.sentences, args.formats, args.langs,
+                                args.seed)
+    except ValueError as e:
+        parser.error(str(e))
+    size = sum(os.path.getsize(p) for p in paths)
+    print(f"Generated {len(paths)} files ({size / 1024:.0f} KiB) in {args.out_dir}")
+
+
+if __name__ == "__main__":
+    main()
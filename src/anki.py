@@ -2,11 +2,18 @@ import os
 import json
 import csv
 import io
-from typing import List
+from collections import Counter
+from typing import Any, Callable, Dict, List, Optional
+import metrics
 from retrieve import initialize_chroma, search
 from embed import generate_embedding
-from summarize import call_llm_with_prompt
-from format_template import CARD_FORMAT_PROMPT, CARD_FORMAT_PROMPT_EN, ANKI_PROMPT
+from summarize import call_llm_with_prompt, stream_llm_with_prompt
+from card_index import DEFAULT_THRESHOLD, CardIndex
+from card_parser import CardParseResult, ParsedRow, parse_card_stream, rerequest_failed_rows
+from llm_client import LLMCallError
+from format_template import (
+    CARD_FORMAT_PROMPT, CARD_FORMAT_PROMPT_EN, ANKI_PROMPT, EXISTING_CARDS_PROMPT, EXISTING_CARDS_PROMPT_EN
+)
 
 
 def standardize_query_with_llm_anki(user_query: str, optimize: bool = True) -> str:
@@ -20,7 +27,11 @@ def standardize_query_with_llm_anki(user_query: str, optimize: bool = True) -> s
         print("[Anki] 未进行prompt优化，直接返回原始query")
         return user_query
     prompt = ANKI_PROMPT.format(user_query=user_query)
-    improved_query = call_llm_with_prompt(prompt, model="gpt-4o-mini", max_tokens=300)
+    try:
+        improved_query = call_llm_with_prompt(prompt, model="gpt-4o-mini", max_tokens=300, call_class="query_rewrite")
+    except LLMCallError as e:
+        print(f"[Anki] prompt优化失败，使用原始query: {e}")
+        return user_query
     print("[Anki] 优化后的prompt：", improved_query.strip())
     return improved_query.strip()
 
@@ -40,22 +51,38 @@ def get_relevant_texts(
     db = initialize_chroma(chroma_db_folder)
     results = search(query, top_k, db, relevance_threshold)
 
-    # 汇总所有chunks内容（跨文件），只返回匹配chunk_id的chunk_text
-    all_chunks = []
+    hydrated = hydrate_results(results, chunks_folder)
+    return [c["chunk_text"] for c in hydrated if c.get("chunk_text")]
+
+def load_chunk_index(chunks_folder: str) -> Dict[str, Dict[str, Any]]:
+    """
+    读取所有分块文件，返回 chunk_id -> chunk entry 的索引。
+    """
+    by_id = {}
     for file in os.listdir(chunks_folder):
         if file.endswith("_chunks.json"):
             with open(os.path.join(chunks_folder, file), "r", encoding="utf-8") as f:
-                all_chunks.extend(json.load(f))
-
-    texts = []
-    for result in results:
-        chunk_id = result["chunk_id"]
-        entry = next((entry for entry in all_chunks if entry.get("chunk_id") == chunk_id), None)
-        if entry:
-            text = entry.get("chunk_text", "")
-            if text:
-                texts.append(text)
-    return texts
+                for entry in json.load(f):
+                    by_id[entry.get("chunk_id")] = entry
+    return by_id
+
+def hydrate_results(
+    results: List[Dict[str, Any]],
+    chunks_folder: str,
+    index: Optional[Dict[str, Dict[str, Any]]] = None
+) -> List[Dict[str, Any]]:
+    """
+    为 search() 的结果补全 chunk_text。index 为 load_chunk_index() 的结果，未提供时现读。
+    找不到的 chunk 会被跳过。
+    """
+    with metrics.timer("hydrate"):
+        by_id = index if index is not None else load_chunk_index(chunks_folder)
+        hydrated = []
+        for result in results:
+            entry = by_id.get(result["chunk_id"])
+            if entry:
+                hydrated.append({**result, "chunk_text": entry.get("chunk_text", "")})
+    return hydrated
 
 def build_prompt(
     query: str,
@@ -64,11 +91,13 @@ def build_prompt(
     detail_level: str,
     num_cards: int,
     texts: List[str],
-    lang: str = "en"
+    lang: str = "en",
+    existing_cards: Optional[List[str]] = None
 ) -> str:
     """
     构建LLM prompt，包含用户参数和检索文本，格式模板引用外部文件。
     lang: 语言，"中文" 或 "en"
+    existing_cards: 项目中已有的相近卡片正面，提供时要求LLM避免重复
     """
     context = "\n".join(texts)
     if lang == "中文":
@@ -89,9 +118,45 @@ def build_prompt(
             query=query,
             context=context
         )
-    print("[Anki] 构建的prompt：", prompt[:500], "..." if len(prompt) > 500 else "")
+    if existing_cards:
+        template = EXISTING_CARDS_PROMPT if lang == "中文" else EXISTING_CARDS_PROMPT_EN
+        prompt += template.format(cards="\n".join(f"- {c}" for c in existing_cards))
+    metrics.debug("[Anki] 构建的prompt：", prompt[:500], "..." if len(prompt) > 500 else "")
     return prompt
 
+def prepare_card_prompt(
+    query: str,
+    project_folder: str,
+    card_type: str = "qa",
+    difficulty: str = "intermediate",
+    detail_level: str = "moderate",
+    num_cards: int = 5,
+    top_k: int = 10,
+    relevance_threshold: float = 1.5,
+    optimize_prompt: bool = True,
+    lang: str = "en",
+    chunks: Optional[List[Dict[str, Any]]] = None,
+    standardized_query: Optional[str] = None,
+    avoid_existing: int = 0
+) -> str:
+    """
+    标准化query（可跳过）、检索相关文本（可跳过）并构建卡片生成prompt。参数同 generate_anki_cards_llm。
+    """
+    if standardized_query:
+        query_final = standardized_query
+    else:
+        query_final = standardize_query_with_llm_anki(query, optimize=optimize_prompt)
+    if chunks is not None:
+        texts = [c["chunk_text"] for c in chunks if c.get("chunk_text")]
+    else:
+        texts = get_relevant_texts(query_final, project_folder, top_k, relevance_threshold)
+    if not texts:
+        print("[Anki] No relevant texts found for the given query and threshold.")
+        raise ValueError("No relevant texts found for the given query and threshold.")
+    existing = CardIndex(project_folder).nearest(query_final, avoid_existing) if avoid_existing else None
+    return build_prompt(query_final, card_type, difficulty, detail_level, num_cards, texts, lang=lang,
+                        existing_cards=existing)
+
 def generate_anki_cards_llm(
     query: str,
     project_folder: str,
@@ -102,47 +167,154 @@ def generate_anki_cards_llm(
     top_k: int = 10,
     relevance_threshold: float = 1.5,
     optimize_prompt: bool = True,
-    lang: str = "en"
+    lang: str = "en",
+    chunks: Optional[List[Dict[str, Any]]] = None,
+    standardized_query: Optional[str] = None,
+    avoid_existing: int = 0
 ) -> str:
     """
     主函数：检索文本，构建prompt，调用LLM生成卡片，直接返回LLM原始输出。
     optimize_prompt: 是否优化用户query
     lang: 语言，"中文" 或 "en"
+    chunks: 已检索并补全 chunk_text 的分块（见 hydrate_results），提供时跳过检索
+    standardized_query: 已标准化的query，提供时跳过prompt优化
+    avoid_existing: >0 时从项目卡片索引中取最相近的这么多张已有卡片写入prompt，要求不要重复
+    LLM 调用失败时抛出 LLMCallError，不会把错误信息当作卡片内容返回。
     """
-    query_final = standardize_query_with_llm_anki(query, optimize=optimize_prompt)
-    texts = get_relevant_texts(query_final, project_folder, top_k, relevance_threshold)
-    if not texts:
-        print("[Anki] No relevant texts found for the given query and threshold.")
-        raise ValueError("No relevant texts found for the given query and threshold.")
-    prompt = build_prompt(query_final, card_type, difficulty, detail_level, num_cards, texts, lang=lang)
-    llm_response = call_llm_with_prompt(prompt)
-    print("[Anki] LLM返回内容前500字：", llm_response[:500], "..." if len(llm_response) > 500 else "")
+    prompt = prepare_card_prompt(query, project_folder, card_type, difficulty, detail_level, num_cards,
+                                 top_k, relevance_threshold, optimize_prompt, lang, chunks, standardized_query,
+                                 avoid_existing)
+    llm_response = call_llm_with_prompt(prompt, call_class="card_generation")
+    metrics.debug("[Anki] LLM返回内容前500字：", llm_response[:500], "..." if len(llm_response) > 500 else "")
     return llm_response
 
+def generate_anki_cards_validated(
+    query: str,
+    project_folder: str,
+    card_type: str = "qa",
+    difficulty: str = "intermediate",
+    detail_level: str = "moderate",
+    num_cards: int = 5,
+    top_k: int = 10,
+    relevance_threshold: float = 1.5,
+    optimize_prompt: bool = True,
+    lang: str = "en",
+    chunks: Optional[List[Dict[str, Any]]] = None,
+    standardized_query: Optional[str] = None,
+    on_row: Optional[Callable[[ParsedRow], None]] = None,
+    rerequest: bool = True,
+    avoid_existing: int = 0
+) -> CardParseResult:
+    """
+    流式生成卡片：边接收LLM输出边按Q&A/Cloze格式校验，每得到一张合法卡片回调 on_row。
+    本地无法修复的行（rerequest=True 时）单独让LLM重写，不重新生成整批；重写调用失败时这些行保留在 failed 中。
+    其余参数同 generate_anki_cards_llm。
+    """
+    prompt = prepare_card_prompt(query, project_folder, card_type, difficulty, detail_level, num_cards,
+                                 top_k, relevance_threshold, optimize_prompt, lang, chunks, standardized_query,
+                                 avoid_existing)
+    result = parse_card_stream(stream_llm_with_prompt(prompt, call_class="card_generation"), card_type, on_row)
+    if result.failed and rerequest:
+        print(f"[Anki] {len(result.failed)} 行格式错误，仅重新请求这些行")
+        try:
+            rerequest_failed_rows(result, card_type, lambda p: call_llm_with_prompt(p, call_class="card_generation"))
+        except LLMCallError as e:
+            print(f"[Anki] 重新请求失败，保留已校验的卡片，{len(result.failed)} 行记为失败: {e}")
+    print(f"[Anki] 卡片校验结果：{result.summary()}")
+    return result
+
+def filter_known_cards(
+    rows: List[List[str]],
+    project_folder: Optional[str],
+    threshold: float = DEFAULT_THRESHOLD,
+    known: Optional[List[Dict[str, Any]]] = None
+) -> tuple:
+    """
+    用项目卡片索引过滤掉已导出过的（近似）重复卡片，返回 (新卡片行, 重复记录, 索引)。
+    project_folder 为 None 时不过滤。
+    known 为这批卡片生成后算好的重复记录时直接按它过滤、不再查询索引：同一批卡片先导出 CSV（已记入索引）
+    再导出 .apkg 时，不会被当成已有卡片全部跳过。
+    """
+    if not project_folder:
+        return rows, [], None
+    index = CardIndex(project_folder)
+    if known is None:
+        new_rows, known = index.filter_new(rows, threshold)
+    else:
+        drop = Counter(tuple(k["row"]) for k in known)
+        new_rows = []
+        for row in rows:
+            if not row or not row[0].strip():
+                continue
+            if drop[tuple(row)]:
+                drop[tuple(row)] -= 1
+            else:
+                new_rows.append(row)
+    if known:
+        print(f"[Anki] 跳过 {len(known)} 张与已有卡片重复的卡片")
+    return new_rows, known, index
+
 def export_llm_cards_to_csv(
     llm_response: str,
-    output_path: str
-) -> str:
+    output_path: str,
+    project_folder: Optional[str] = None,
+    dedup_threshold: float = DEFAULT_THRESHOLD,
+    known: Optional[List[Dict[str, Any]]] = None
+) -> Optional[str]:
     """
     将LLM输出（表格形式）保存为csv文件。
+    提供 project_folder 时跳过项目中已导出过的重复卡片（known 见 filter_known_cards），并把新卡片记入卡片索引；
+    全部重复时不写文件，返回 None。
     """
-    import csv
-    import io
     from datetime import datetime
 
     if not llm_response.strip():
         raise ValueError("LLM response is empty, nothing to export.")
 
+    rows, _, index = filter_known_cards(parse_csv_to_table(llm_response), project_folder, dedup_threshold, known)
+    if not rows:
+        return None
     timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
     filename = f"anki_cards_{timestamp}.csv"
     filepath = os.path.join(output_path, filename)
     with open(filepath, "w", newline="", encoding="utf-8") as f:
-        reader = csv.reader(io.StringIO(llm_response))
         writer = csv.writer(f)
-        for row in reader:
+        for row in rows:
             writer.writerow(row)
+    if index is not None:
+        index.add([r[0] for r in rows], deck=filename)
     return filepath
 
+def export_llm_cards_to_apkg(
+    llm_response: str,
+    output_path: str,
+    deck_name: str,
+    card_type: str = "qa",
+    incremental: bool = True,
+    project_folder: Optional[str] = None,
+    dedup_threshold: float = DEFAULT_THRESHOLD,
+    known: Optional[List[Dict[str, Any]]] = None
+) -> Dict[str, Any]:
+    """
+    将LLM输出直接写为Anki卡包（.apkg），返回导出统计（见 anki_apkg.export_rows_to_apkg）。
+    incremental=True 时只导出该卡组中新增或内容有变化的卡片。
+    提供 project_folder 时先跳过项目中（任意卡组）已导出过的近似重复卡片（known 见 filter_known_cards），
+    统计中 known 为跳过数量；但该卡组台账中已有的卡片（正面相同）不跳过，由台账按稳定 GUID 判断是否更新。
+    """
+    from anki_apkg import export_rows_to_apkg, ledger_rows
+
+    if not llm_response.strip():
+        raise ValueError("LLM response is empty, nothing to export.")
+    rows, known, index = filter_known_cards(parse_csv_to_table(llm_response), project_folder, dedup_threshold, known)
+    if known and incremental:
+        in_ledger = {id(r) for r in ledger_rows([k["row"] for k in known], output_path, deck_name, card_type)}
+        rows = rows + [k["row"] for k in known if id(k["row"]) in in_ledger]
+        known = [k for k in known if id(k["row"]) not in in_ledger]
+    result = export_rows_to_apkg(rows, output_path, deck_name, card_type, incremental)
+    if index is not None:
+        index.add([r[0] for r in rows], deck=deck_name)
+    return {**result, "known": len(known)}
+
 def parse_csv_to_table(csv_content: str):
     """
     解析LLM生成的CSV文本为表格，便于预览。
@@ -0,0 +1,306 @@
+# anki_apkg.py
+"""
+直接写出 Anki 卡包（.apkg），无需手动导入 CSV。
+
+.apkg 是一个 zip：collection.anki2（Anki 集合 SQLite，schema v11）+ media（JSON）。
+  - 笔记 GUID 由“卡组 + 题型 + 正面内容”稳定派生，同一张卡片每次导出 GUID 不变，
+    Anki 导入时据此更新已有笔记而不是重复添加
+  - 每个卡组在导出目录下维护一个台账（GUID -> 内容哈希），增量导出时只写入新增或有变化的笔记
+  - ApkgWriter 按批次 executemany 写入，全部在一个事务里提交，可以边生成边写，不需要把整个卡组放在内存中
+"""
+import hashlib
+import html
+import json
+import os
+import re
+import sqlite3
+import tempfile
+import time
+import zipfile
+from datetime import datetime
+from typing import Any, Dict, Iterable, List, Optional, Sequence
+
+from card_parser import normalize_card_type
+
+CLOZE_RE = re.compile(r"\{\{c([1-9]\d*)::")  # 卡片序号 ord = N - 1；c0 不是合法的填空编号，不生成卡片
+BASE91 = "abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ0123456789!#$%&()*+,-./:;<=>?@[]^_`{|}~"
+FIELD_SEP = "\x1f"
+BATCH_SIZE = 500
+
+SCHEMA = """
+CREATE TABLE col (
+    id integer primary key, crt integer not null, mod integer not null, scm integer not null,
+    ver integer not null, dty integer not null, usn integer not null, ls integer not null,
+    conf text not null, models text not null, decks text not null, dconf text not null, tags text not null
+);
+CREATE TABLE notes (
+    id integer primary key, guid text not null, mid integer not null, mod integer not null,
+    usn integer not null, tags text not null, flds text not null, sfld integer not null,
+    csum integer not null, flags integer not null, data text not null
+);
+CREATE TABLE cards (
+    id integer primary key, nid integer not null, did integer not null, ord integer not null,
+    mod integer not null, usn integer not null, type integer not null, queue integer not null,
+    due integer not null, ivl integer not null, factor integer not null, reps integer not null,
+    lapses integer not null, left integer not null, odue integer not null, odid integer not null,
+    flags integer not null, data text not null
+);
+CREATE TABLE revlog (
+    id integer primary key, cid integer not null, usn integer not null, ease integer not null,
+    ivl integer not null, lastIvl integer not null, factor integer not null, time integer not null,
+    type integer not null
+);
+CREATE TABLE graves (usn integer not null, oid integer not null, type integer not null);
+CREATE INDEX ix_notes_usn on notes (usn);
+CREATE INDEX ix_cards_usn on cards (usn);
+CREATE INDEX ix_revlog_usn on revlog (usn);
+CREATE INDEX ix_cards_nid on cards (nid);
+CREATE INDEX ix_cards_sched on cards (did, queue, due);
+CREATE INDEX ix_revlog_cid on revlog (cid);
+CREATE INDEX ix_notes_csum on notes (csum);
+"""
+
+CARD_CSS = ".card { font-family: arial; font-size: 20px; text-align: center; color: black; background-color: white; }\n.cloze { font-weight: bold; color: blue; }"
+
+
+def _stable_id(*parts: str, bits: int = 52) -> int:
+    """由字符串派生稳定的正整数 ID（避开 Anki 的默认卡组/模型 ID 1）。"""
+    digest = hashlib.sha1("\x00".join(parts).encode("utf-8")).hexdigest()
+    return (int(digest, 16) >> (160 - bits)) | (1 << (bits - 1))
+
+
+def note_guid(deck_name: str, card_type: str, front: str) -> str:
+    """卡片 GUID：sha256 前 8 字节的 base91 编码（与 genanki 相同的格式）。"""
+    value = int.from_bytes(hashlib.sha256(f"{deck_name}\x1f{card_type}\x1f{front.strip()}".encode("utf-8")).digest()[:8], "big")
+    chars = []
+    while value:
+        value, rem = divmod(value, len(BASE91))
+        chars.append(BASE91[rem])
+    return "".join(reversed(chars)) or BASE91[0]
+
+
+def _field_html(text: str) -> str:
+    return html.escape(text.strip(), quote=False).replace("\n", "<br>")
+
+
+def _checksum(sort_field: str) -> int:
+    plain = re.sub(r"<[^>]+>", "", html.unescape(sort_field))
+    return int(hashlib.sha1(plain.encode("utf-8")).hexdigest()[:8], 16)
+
+
+def _model(model_id: int, deck_id: int, name: str, cloze: bool, now: int) -> Dict[str, Any]:
+    fields = ["Text", "Extra"] if cloze else ["Front", "Back", "Extra"]
+    if cloze:
+        tmpl = {"name": "Cloze", "qfmt": "{{cloze:Text}}", "afmt": "{{cloze:Text}}<br>{{Extra}}"}
+    else:
+        tmpl = {"name": "Card 1", "qfmt": "{{Front}}", "afmt": "{{FrontSide}}<hr id=answer>{{Back}}<br>{{Extra}}"}
+    tmpl.update({"ord": 0, "bqfmt": "", "bafmt": "", "did": None, "bfont": "", "bsize": 0})
+    return {
+        "id": model_id, "name": name, "type": 1 if cloze else 0, "mod": now, "usn": -1,
+        "did": deck_id, "sortf": 0, "tags": [], "vers": [], "css": CARD_CSS,
+        "flds": [{"name": f, "ord": i, "font": "Arial", "size": 20, "media": [], "rtl": False, "sticky": False}
+                 for i, f in enumerate(fields)],
+        "tmpls": [tmpl],
+        "req": [[0, "any", [0]]],
+        "latexPre": "\\documentclass[12pt]{article}\n\\special{papersize=3in,5in}\n\\usepackage{amssymb,amsmath}\n"
+                    "\\pagestyle{empty}\n\\setlength{\\parindent}{0in}\n\\begin{document}\n",
+        "latexPost": "\\end{document}",
+    }
+
+
+def _deck(deck_id: int, name: str, now: int) -> Dict[str, Any]:
+    return {
+        "id": deck_id, "name": name, "mod": now, "usn": -1, "desc": "", "dyn": 0, "conf": 1,
+        "collapsed": False, "extendNew": 10, "extendRev": 50,
+        "newToday": [0, 0], "revToday": [0, 0], "lrnToday": [0, 0], "timeToday": [0, 0],
+    }
+
+
+DEFAULT_DCONF = {
+    "1": {
+        "id": 1, "name": "Default", "mod": 0, "usn": 0, "maxTaken": 60, "autoplay": True, "timer": 0,
+        "replayq": True, "dyn": False,
+        "new": {"bury": True, "delays": [1, 10], "initialFactor": 2500, "ints": [1, 4, 7], "order": 1, "perDay": 20, "separate": True},
+        "rev": {"bury": True, "ease4": 1.3, "fuzz": 0.05, "ivlFct": 1, "maxIvl": 36500, "minSpace": 1, "perDay": 100},
+        "lapse": {"delays": [10], "leechAction": 0, "leechFails": 8, "minInt": 1, "mult": 0},
+    }
+}
+
+
+def card_fields(row: Sequence[str], card_type: str) -> List[str]:
+    """把一行 CSV 转成笔记字段：问答 -> [Front, Back, Extra]，填空 -> [Text, Extra]。"""
+    cells = [c for c in row]
+    if normalize_card_type(card_type) == "cloze":
+        return [cells[0] if cells else "", ", ".join(cells[1:])]
+    cells += [""] * (3 - len(cells))
+    return [cells[0], cells[1], ", ".join(cells[2:])]
+
+
+class ApkgWriter:
+    """
+    流式 .apkg 写入器：
+
+        with ApkgWriter(path, "My Deck", "qa", ledger_path) as w:
+            for row in rows:
+                w.add(row)
+
+    ledger_path 提供时启用增量导出：与台账内容哈希相同的笔记会被跳过。
+    """
+
+    def __init__(self, path: str, deck_name: str, card_type: str = "qa", ledger_path: Optional[str] = None, tags: Sequence[str] = ()):
+        self.path = path
+        self.deck_name = deck_name
+        self.card_type = normalize_card_type(card_type)
+        self.ledger_path = ledger_path
+        self.tags = " ".join(t.replace(" ", "_") for t in tags)
+        self.ledger: Dict[str, str] = {}
+        if ledger_path and os.path.exists(ledger_path):
+            with open(ledger_path, "r", encoding="utf-8") as f:
+                self.ledger = json.load(f)
+        self.stats = {"added": 0, "updated": 0, "unchanged": 0, "skipped": 0}
+        self._seen = set()
+        self._notes: List[tuple] = []
+        self._cards: List[tuple] = []
+        self._now = int(time.time())
+        self._deck_id = _stable_id("deck", deck_name)
+        self._model_id = _stable_id("model", self.card_type)
+        fd, self._db_path = tempfile.mkstemp(suffix=".anki2", dir=os.path.dirname(os.path.abspath(path)))
+        os.close(fd)
+        self._conn = sqlite3.connect(self._db_path)
+        self._conn.executescript(SCHEMA)
+        self._conn.execute("BEGIN")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+
+    def add(self, row: Sequence[str]) -> bool:
+        """加入一张卡片，返回是否写入（未变化、重复或无效的卡片返回 False）。"""
+        fields = card_fields(row, self.card_type)
+        front = fields[0].strip()
+        if not front or (self.card_type == "cloze" and not CLOZE_RE.search(front)):
+            self.stats["skipped"] += 1
+            return False
+        guid = note_guid(self.deck_name, self.card_type, front)
+        content_hash = hashlib.sha1(FIELD_SEP.join(fields).encode("utf-8")).hexdigest()
+        if guid in self._seen:
+            self.stats["skipped"] += 1
+            return False
+        self._seen.add(guid)
+        previous = self.ledger.get(guid)
+        if previous == content_hash:
+            self.stats["unchanged"] += 1
+            return False
+        self.stats["updated" if previous else "added"] += 1
+        self.ledger[guid] = content_hash
+
+        note_id = _stable_id("note", guid)
+        html_fields = [_field_html(f) for f in fields]
+        self._notes.append((note_id, guid, self._model_id, self._now, -1, f" {self.tags} " if self.tags else "",
+                            FIELD_SEP.join(html_fields), html_fields[0], _checksum(html_fields[0]), 0, ""))
+        ords = sorted({int(n) - 1 for n in CLOZE_RE.findall(front)}) if self.card_type == "cloze" else [0]
+        due = len(self._seen)
+        for ord_ in ords:
+            self._cards.append((_stable_id("card", guid, str(ord_)), note_id, self._deck_id, ord_, self._now, -1,
+                                0, 0, due, 0, 0, 0, 0, 0, 0, 0, 0, ""))
+        if len(self._notes) >= BATCH_SIZE:
+            self._flush()
+        return True
+
+    def add_many(self, rows: Iterable[Sequence[str]]) -> None:
+        for row in rows:
+            self.add(row)
+
+    def _flush(self) -> None:
+        self._conn.executemany("INSERT INTO notes VALUES (?,?,?,?,?,?,?,?,?,?,?)", self._notes)
+        self._conn.executemany("INSERT INTO cards VALUES (?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?)", self._cards)
+        self._notes.clear()
+        self._cards.clear()
+
+    def close(self) -> Optional[str]:
+        """提交事务并打包为 .apkg；没有需要写入的笔记时不生成文件，返回 None。"""
+        self._flush()
+        now = self._now
+        model_name = "LLM Cloze" if self.card_type == "cloze" else "LLM Q&A"
+        model = _model(self._model_id, self._deck_id, model_name, self.card_type == "cloze", now)
+        decks = {"1": _deck(1, "Default", now), str(self._deck_id): _deck(self._deck_id, self.deck_name, now)}
+        conf = {"activeDecks": [1], "curDeck": 1, "curModel": str(self._model_id), "nextPos": 1,
+                "newSpread": 0, "collapseTime": 1200, "timeLim": 0, "estTimes": True, "dueCounts": True,
+                "sortType": "noteFld", "sortBackwards": False, "addToCur": True}
+        self._conn.execute(
+            "INSERT INTO col VALUES (1,?,?,?,11,0,0,0,?,?,?,?,?)",
+            (now, now * 1000, now * 1000, json.dumps(conf), json.dumps({str(self._model_id): model}),
+             json.dumps(decks), json.dumps(DEFAULT_DCONF), "{}")
+        )
+        self._conn.commit()
+        self._conn.close()
+
+        written = self.stats["added"] + self.stats["updated"]
+        try:
+            if not written:
+                return None
+            with zipfile.ZipFile(self.path, "w", zipfile.ZIP_DEFLATED) as zf:
+                zf.write(self._db_path, "collection.anki2")
+                zf.writestr("media", "{}")
+        finally:
+            os.remove(self._db_path)
+        if self.ledger_path:
+            with open(self.ledger_path, "w", encoding="utf-8") as f:
+                json.dump(self.ledger, f)
+        return self.path
+
+    def abort(self) -> None:
+        self._conn.rollback()
+        self._conn.close()
+        if os.path.exists(self._db_path):
+            os.remove(self._db_path)
+
+
+def ledger_path(output_path: str, deck_name: str, card_type: str) -> str:
+    """卡组台账文件路径（增量导出时记录 GUID -> 内容哈希）。"""
+    safe = re.sub(r"[^\w\-]+", "_", deck_name).strip("_") or "deck"
+    return os.path.join(output_path, f".{safe}_{normalize_card_type(card_type)}_apkg_ledger.json")
+
+
+def ledger_rows(rows: Iterable[Sequence[str]], output_path: str, deck_name: str, card_type: str = "qa") -> List[Sequence[str]]:
+    """返回 rows 中 GUID 已在该卡组台账里的行（以前导出过同一正面的卡片，再次导出时按 GUID 更新）。"""
+    path = ledger_path(output_path, deck_name, card_type)
+    if not os.path.exists(path):
+        return []
+    with open(path, "r", encoding="utf-8") as f:
+        ledger = json.load(f)
+    card_type = normalize_card_type(card_type)
+    return [r for r in rows if note_guid(deck_name, card_type, card_fields(r, card_type)[0].strip()) in ledger]
+
+
+def export_rows_to_apkg(
+    rows: Iterable[Sequence[str]],
+    output_path: str,
+    deck_name: str,
+    card_type: str = "qa",
+    incremental: bool = True,
+    tags: Sequence[str] = (),
+) -> Dict[str, Any]:
+    """
+    把卡片行写为 .apkg，返回 {"path": 文件路径或 None, "added": .., "updated": .., "unchanged": .., "skipped": ..}。
+    incremental=True 时按卡组台账只导出新增/变化的笔记。
+    """
+    os.makedirs(output_path, exist_ok=True)
+    safe = re.sub(r"[^\w\-]+", "_", deck_name).strip("_") or "deck"
+    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+    path = os.path.join(output_path, f"{safe}_{timestamp}.apkg")
+    ledger = ledger_path(output_path, deck_name, card_type) if incremental else None
+    writer = ApkgWriter(path, deck_name, card_type, ledger, tags)
+    try:
+        writer.add_many(rows)
+    except BaseException:
+        writer.abort()
+        raise
+    result = writer.close()
+    print(f"[Anki] apkg export {deck_name}: {writer.stats} -> {result}")
+    return {"path": result, **writer.stats}
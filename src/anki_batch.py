@@ -0,0 +1,237 @@
+# anki_batch.py
+"""
+批量生成 Anki 卡组：一次输入多个主题，共享一次 query embedding 批量请求与一次向量检索，
+在 llm_client 的限流下并发生成卡片，按正面文本的向量相似度去除近似重复，最后写出一个合并的卡组。
+"""
+import csv
+import os
+import re
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Optional
+
+from anki_apkg import export_rows_to_apkg
+from anki import generate_anki_cards_llm, hydrate_results, load_chunk_index
+from card_index import CardIndex
+from card_parser import parse_cards
+from embed import OpenAIEmbeddingFunction
+from llm_client import LLMCallError
+
+MD_HEADING = re.compile(r"^\s{0,3}(#{1,6})\s+(.+?)\s*#*\s*$")
+
+
+def load_topics_from_file(path: str) -> List[str]:
+    """从文本文件读取主题，每行一个，忽略空行和以 # 开头的注释行。"""
+    with open(path, "r", encoding="utf-8") as f:
+        return parse_topics(f.read())
+
+
+def parse_topics(text: str) -> List[str]:
+    """把多行文本解析为去重后的主题列表（保持原顺序）。"""
+    seen = set()
+    topics = []
+    for line in text.splitlines():
+        line = line.strip()
+        if line and not line.startswith("#") and line.lower() not in seen:
+            seen.add(line.lower())
+            topics.append(line)
+    return topics
+
+
+def extract_topics_from_headings(raw_dir: str, max_level: int = 2, max_topics: int = 100) -> List[str]:
+    """
+    从原始文档的标题中提取主题：
+      - Markdown：# / ## 标题
+      - PDF：PyMuPDF 目录（TOC）
+      - DOCX：样式为 Heading 1/2 的段落
+    """
+    headings = []
+    for fn in sorted(os.listdir(raw_dir)):
+        path = os.path.join(raw_dir, fn)
+        ext = os.path.splitext(fn)[1].lower()
+        try:
+            if ext in {".md", ".markdown"}:
+                with open(path, "r", encoding="utf-8", errors="ignore") as f:
+                    for line in f:
+                        m = MD_HEADING.match(line)
+                        if m and len(m.group(1)) <= max_level:
+                            headings.append(m.group(2))
+            elif ext == ".pdf":
+                import fitz  # PyMuPDF
+                with fitz.open(path) as doc:
+                    headings.extend(title for level, title, _ in doc.get_toc() if level <= max_level)
+            elif ext == ".docx":
+                import docx
+                for para in docx.Document(path).paragraphs:
+                    style = para.style.name if para.style is not None else ""
+                    if style.startswith("Heading") and style[-1:].isdigit() and int(style[-1]) <= max_level:
+                        headings.append(para.text)
+        except Exception as e:
+            print(f"[Batch] Failed to read headings from {fn}: {e}")
+    return parse_topics("\n".join(headings))[:max_topics]
+
+
+def batch_retrieve(topics: List[str], db, top_k: int, relevance_threshold: Optional[float] = None) -> List[List[Dict[str, Any]]]:
+    """
+    一次 embedding 批量请求 + 一次 Chroma 多查询检索，返回与 topics 对齐的结果列表（格式同 search()）。
+    relevance_threshold 与单个查询的 search() 相同。
+    """
+    from retrieve import search_by_vectors
+
+    if not topics:
+        return []
+    query_vectors = db._embedding_function.embed_documents(topics)
+    return search_by_vectors(query_vectors, top_k, db, relevance_threshold)
+
+
+def dedup_cards(cards: List[Dict[str, Any]], threshold: float = 0.92, embed_fn=None,
+                index: Optional[CardIndex] = None) -> List[Dict[str, Any]]:
+    """
+    按卡片正面（第一列）的向量余弦相似度贪心去重：与已保留卡片的相似度 >= threshold 则丢弃。
+    每张卡片形如 {"topic": str, "row": List[str]}。
+    提供 index（项目卡片索引）时用它计算正面向量：向量留在索引的缓存中，随后的重复检查与入库不再重复请求 embedding。
+    """
+    if len(cards) < 2:
+        return cards
+    import numpy as np
+
+    fronts = [c["row"][0] for c in cards]
+    if index is not None:
+        vectors = index.embed(fronts)
+    else:
+        embed_fn = embed_fn or OpenAIEmbeddingFunction()
+        vectors = np.asarray(embed_fn.embed_documents(fronts), dtype=np.float32)
+        vectors /= np.linalg.norm(vectors, axis=1, keepdims=True) + 1e-12
+
+    kept_idx = []
+    kept = np.empty((len(cards), vectors.shape[1]), dtype=np.float32)
+    for i, v in enumerate(vectors):
+        if kept_idx and float((kept[:len(kept_idx)] @ v).max()) >= threshold:
+            continue
+        kept[len(kept_idx)] = v
+        kept_idx.append(i)
+    return [cards[i] for i in kept_idx]
+
+
+def write_deck_csv(cards: List[Dict[str, Any]], output_path: str) -> str:
+    """把合并后的卡片写为一个 CSV 卡组，返回文件路径。"""
+    os.makedirs(output_path, exist_ok=True)
+    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+    filepath = os.path.join(output_path, f"anki_deck_batch_{timestamp}.csv")
+    with open(filepath, "w", newline="", encoding="utf-8") as f:
+        writer = csv.writer(f)
+        for card in cards:
+            writer.writerow(card["row"])
+    return filepath
+
+
+def generate_deck_batch(
+    topics: List[str],
+    project_folder: str,
+    card_type: str = "qa",
+    difficulty: str = "intermediate",
+    detail_level: str = "moderate",
+    num_cards: int = 5,
+    top_k: int = 10,
+    relevance_threshold: Optional[float] = None,
+    lang: str = "en",
+    max_workers: int = 4,
+    dedup_threshold: Optional[float] = 0.92,
+    apkg_deck: Optional[str] = None,
+    progress_cb: Optional[Callable[[int, int, str], None]] = None,
+    skip_known: bool = True,
+) -> Dict[str, Any]:
+    """
+    批量生成卡组。
+
+    Args:
+        topics: 主题列表（每个主题直接作为检索与生成的 query）
+        project_folder: 项目目录
+        relevance_threshold: 检索的相关度阈值，与单个查询的 search() 相同
+        max_workers: 并发生成的线程数；实际吞吐由 llm_client 的并发/限流配置约束
+        dedup_threshold: 近似重复判定阈值（余弦相似度），None 表示不去重
+        apkg_deck: 提供卡组名时同时增量导出 .apkg
+        progress_cb: 每完成一个主题回调 progress_cb(done, total, topic)
+        skip_known: 跳过与项目卡片索引中已导出卡片重复的卡片，并把新卡片记入索引
+
+    Returns:
+        dict: 输出路径、卡片数、去重数、失败主题及耗时
+    """
+    from retrieve import initialize_chroma
+
+    start = time.time()
+    chunks_folder = os.path.join(project_folder, "processed", "chunks")
+    db = initialize_chroma(os.path.join(project_folder, "vectorstore", "chroma_db"))
+    retrieved = batch_retrieve(topics, db, top_k, relevance_threshold)
+    index = load_chunk_index(chunks_folder)
+    print(f"[Batch] Retrieved chunks for {len(topics)} topics in {time.time() - start:.2f}s")
+
+    def generate(topic, results):
+        chunks = hydrate_results(results, chunks_folder, index)
+        if not chunks:
+            raise ValueError("No relevant texts found for the given query and threshold.")
+        return generate_anki_cards_llm(
+            query=topic,
+            project_folder=project_folder,
+            card_type=card_type,
+            difficulty=difficulty,
+            detail_level=detail_level,
+            num_cards=num_cards,
+            lang=lang,
+            chunks=chunks,
+            standardized_query=topic
+        )
+
+    cards: List[Dict[str, Any]] = []
+    failed: Dict[str, str] = {}
+    with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="anki-batch") as pool:
+        futures = {pool.submit(generate, topic, results): topic for topic, results in zip(topics, retrieved)}
+        for done, fut in enumerate(as_completed(futures), 1):
+            topic = futures[fut]
+            try:
+                parsed = parse_cards(fut.result(), card_type)
+                if parsed.failed:
+                    print(f"[Batch] {topic}: dropped {len(parsed.failed)} malformed rows")
+                cards.extend({"topic": topic, "row": row} for row in parsed.cards)
+            except (LLMCallError, ValueError) as e:
+                failed[topic] = str(e)
+                print(f"[Batch] Topic failed: {topic}: {e}")
+            if progress_cb:
+                progress_cb(done, len(topics), topic)
+
+    n_generated = len(cards)
+    # 去重、已有卡片检查与入库共用一个卡片索引，每张卡片正面只请求一次 embedding
+    card_index = CardIndex(project_folder, embed_fn=db._embedding_function)
+    if dedup_threshold is not None:
+        cards = dedup_cards(cards, dedup_threshold, index=card_index)
+    n_deduped = len(cards)
+    index = None
+    if skip_known and cards:
+        index = card_index
+        rows, known = index.filter_new([c["row"] for c in cards])
+        if known:
+            print(f"[Batch] Skipped {len(known)} cards already in the project card index")
+        fresh = {id(r) for r in rows}
+        cards = [c for c in cards if id(c["row"]) in fresh]
+
+    output_dir = os.path.join(project_folder, "anki_cards")
+    output = write_deck_csv(cards, output_dir) if cards else None
+    apkg = None
+    if cards and apkg_deck:
+        apkg = export_rows_to_apkg((c["row"] for c in cards), output_dir, apkg_deck, card_type)["path"]
+    if index is not None and cards:
+        index.add([c["row"][0] for c in cards], deck=apkg_deck or os.path.basename(output))
+    report = {
+        "output_path": output,
+        "apkg_path": apkg,
+        "n_topics": len(topics),
+        "n_generated": n_generated,
+        "n_cards": len(cards),
+        "n_duplicates": n_generated - n_deduped,
+        "n_known": n_deduped - len(cards),
+        "failed": failed,
+        "elapsed": round(time.time() - start, 2),
+    }
+    print(f"[Batch] Done: {report}")
+    return report
@@ -2,11 +2,28 @@ import os
 import streamlit as st
 from anki import (
     standardize_query_with_llm_anki,
-    generate_anki_cards_llm,
+    generate_anki_cards_validated,
+    hydrate_results,
+    load_chunk_index,
     export_llm_cards_to_csv,
+    export_llm_cards_to_apkg,
+    filter_known_cards,
     parse_csv_to_table,
 )
+from anki_batch import extract_topics_from_headings, generate_deck_batch, parse_topics
+from card_coverage import build_clusters, coverage_report, generate_cards_for_clusters
 from lang_utils import get_text  # 新增
+from profiling import profile
+from query_pipeline import speculative_search, format_timings
+
+def render_hits(box, title, hits, limit=5, preview_chars=200):
+    """在 box（st.empty）中展示检索结果（需已补全 chunk_text）的来源与正文预览，再次调用时覆盖之前的内容。"""
+    with box.container():
+        st.markdown(title)
+        for i, hit in enumerate(hits[:limit], 1):
+            preview = hit.get("chunk_text", "")
+            st.markdown(f"**{i}. {hit.get('source', '')}** · `{hit['chunk_id']}` · {hit.get('distance', 0):.4f}")
+            st.caption(preview[:preview_chars] + ("…" if len(preview) > preview_chars else ""))
 
 def render_anki_tab(PROJECTS_DIR, lang):
     text = get_text(lang)["anki_tab"]
@@ -71,16 +88,13 @@ def render_anki_tab(PROJECTS_DIR, lang):
 
     # 新增：prompt优化可选
     optimize_prompt = st.checkbox("优化检索意图（Prompt Optimization）", value=True)
+    avoid_existing = st.checkbox(text["avoid_existing"], value=True, help=text["avoid_existing_help"])
 
+    # 标准化查询在点击检索时与原始查询检索并行生成，这里只复用已缓存的结果
     std_query = ""
-    if query and st.session_state.get("anki_last_query") != query:
-        std_query = standardize_query_with_llm_anki(query, optimize=optimize_prompt)
-        st.session_state["anki_last_query"] = query
-        st.session_state["anki_std_query"] = std_query
-        st.session_state["anki_optimize_prompt"] = optimize_prompt
-    elif query:
+    if (query and st.session_state.get("anki_last_query") == query
+            and st.session_state.get("anki_optimize_prompt") == optimize_prompt):
         std_query = st.session_state.get("anki_std_query", "")
-        optimize_prompt = st.session_state.get("anki_optimize_prompt", True)
 
     col_k, col_rel = st.columns(2)
     with col_k:
@@ -92,20 +106,48 @@ def render_anki_tab(PROJECTS_DIR, lang):
     with col_rel:
         relevance_threshold = st.slider(
             text["relevance_threshold"],
-            min_value=0.0, max_value=1.1, value=0.85, step=0.01,
+            min_value=0.0, max_value=2.0, value=1.5, step=0.05,
             help=text["relevance_threshold_help"]
         )
 
     if st.button(text["retrieve_chunks"]):
-        if not std_query:
+        if not query:
             st.warning(text["please_enter_query"])
             return
+        from retrieve import initialize_chroma, search
+        # 开启性能剖析时（见 profiling.py）把检索流程写入项目的 profiles 目录
+        with profile(project_path, "query"):
+            db = initialize_chroma(chroma_db_folder)
+            retrieve = lambda q: search(q, top_k, db, relevance_threshold)
+            chunk_index = None
+            if std_query:
+                results = retrieve(std_query)
+            else:
+                # 推测式检索：prompt优化与原始查询检索并行，先展示原始查询的结果，优化后的结果到达时替换
+                first_box = st.empty()
+                chunk_index = load_chunk_index(chunks_folder)  # 生成卡片前的补全也复用
+                outcome = speculative_search(
+                    query,
+                    (lambda q: standardize_query_with_llm_anki(q, optimize=True)) if optimize_prompt else None,
+                    retrieve,
+                    top_k,
+                    on_first_results=lambda r: render_hits(
+                        first_box, text["first_results"].format(n=len(r)), hydrate_results(r, chunks_folder, chunk_index))
+                )
+                std_query = outcome["query"]
+                results = outcome["results"]
+                render_hits(first_box, text["final_results"].format(n=len(results)),
+                            hydrate_results(results, chunks_folder, chunk_index))
+                st.session_state["anki_last_query"] = query
+                st.session_state["anki_std_query"] = std_query
+                st.session_state["anki_optimize_prompt"] = optimize_prompt
+                st.caption(text["stage_timings"].format(timings=format_timings(outcome["timings"])))
         # 新增：打印优化后的标准化query
         st.info(f"标准化检索意图（Standardized Query）: {std_query}")
-        from retrieve import initialize_chroma, search
-        db = initialize_chroma(chroma_db_folder)
-        results = search(std_query, top_k, db, relevance_threshold)
+        # 补全分块正文，供生成卡片时直接复用，避免重复检索
+        results = hydrate_results(results, chunks_folder, chunk_index)
         st.session_state["anki_retrieved_chunks"] = results
+        st.session_state["anki_retrieved_for"] = (query, std_query)
         st.info(text["chunks_retrieved"].format(n=len(results)))
         # 新增：检索完成提示
         st.success("检索完成！")
@@ -119,48 +161,185 @@ def render_anki_tab(PROJECTS_DIR, lang):
 
     if st.button(text["generate_cards"]):
         retrieved_chunks = st.session_state.get("anki_retrieved_chunks", [])
-        if not std_query:
+        if not query:
             st.warning(text["please_enter_query"])
             return
-        if not retrieved_chunks:
+        if not std_query or not retrieved_chunks or st.session_state.get("anki_retrieved_for") != (query, std_query):
             st.warning(text["please_retrieve_chunks"])
             return
         try:
             with st.spinner(text["generating_cards"]):
-                llm_response = generate_anki_cards_llm(
-                    query=std_query,
-                    project_folder=project_path,
-                    card_type=card_type,
-                    difficulty=difficulty,
-                    detail_level=detail_level,
-                    num_cards=num_cards,
-                    top_k=top_k,
-                    relevance_threshold=relevance_threshold,
-                    optimize_prompt=optimize_prompt
-                )
                 st.subheader(text["llm_output"])
-                rows = parse_csv_to_table(llm_response)
-                if rows:
-                    st.table(rows)
+                table_box = st.empty()
+                preview = []
+
+                def show_row(row):
+                    # 每校验通过一张卡片就刷新预览
+                    preview.append(row.cells)
+                    table_box.table(preview)
+
+                with profile(project_path, "cards"):
+                    result = generate_anki_cards_validated(
+                        query=std_query,
+                        project_folder=project_path,
+                        card_type=card_type,
+                        difficulty=difficulty,
+                        detail_level=detail_level,
+                        num_cards=num_cards,
+                        top_k=top_k,
+                        relevance_threshold=relevance_threshold,
+                        optimize_prompt=optimize_prompt,
+                        chunks=retrieved_chunks,
+                        standardized_query=std_query,
+                        on_row=show_row,
+                        avoid_existing=20 if avoid_existing else 0
+                    )
+                if result.rows:
+                    table_box.table(result.cards)
                 else:
-                    st.info(text["no_content_preview"])
+                    table_box.info(text["no_content_preview"])
+                st.caption(text["validation_summary"].format(**result.summary()))
+                if result.failed:
+                    with st.expander(text["failed_rows"].format(n=len(result.failed))):
+                        for row in result.failed:
+                            st.text(f"{row.raw.strip()}  ← {row.error}")
 
-                st.session_state["anki_llm_response"] = llm_response
+                st.session_state["anki_llm_response"] = result.to_csv()
+                # 每次生成只查询一次项目卡片索引：CSV 导出会把新卡片记入索引，.apkg 导出不能再拿它们当重复卡片
+                st.session_state["anki_known_cards"] = filter_known_cards(
+                    parse_csv_to_table(st.session_state["anki_llm_response"]), project_path
+                )[1] if avoid_existing and result.rows else []
         except Exception as e:
             st.error(text["error_generating"].format(err=e))
 
     llm_response = st.session_state.get("anki_llm_response", "")
+    known_cards = st.session_state.get("anki_known_cards", [])
     if llm_response:
         if st.button(text["export_csv"]):
             output_path = os.path.join(project_path, "anki_cards")
             os.makedirs(output_path, exist_ok=True)
-            csv_path = export_llm_cards_to_csv(llm_response, output_path)
-            st.success(text["csv_saved"].format(path=csv_path))
-            with open(csv_path, 'r', encoding='utf-8') as f:
-                csv_data = f.read()
-            st.download_button(
-                text["download_cards"],
-                csv_data,
-                file_name=os.path.basename(csv_path),
-                mime='text/csv'
+            csv_path = export_llm_cards_to_csv(
+                llm_response, output_path, project_folder=project_path if avoid_existing else None, known=known_cards
             )
+            if csv_path:
+                st.success(text["csv_saved"].format(path=csv_path))
+                with open(csv_path, 'r', encoding='utf-8') as f:
+                    csv_data = f.read()
+                st.download_button(
+                    text["download_cards"],
+                    csv_data,
+                    file_name=os.path.basename(csv_path),
+                    mime='text/csv'
+                )
+            else:
+                st.info(text["all_cards_known"])
+        deck_name = st.text_input(text["deck_name"], value=selected_project)
+        if st.button(text["export_apkg"]):
+            output_path = os.path.join(project_path, "anki_cards")
+            result = export_llm_cards_to_apkg(llm_response, output_path, deck_name, card_type=card_type,
+                                              project_folder=project_path if avoid_existing else None,
+                                              known=known_cards)
+            if result["known"]:
+                st.caption(text["known_skipped"].format(n=result["known"]))
+            if result["path"]:
+                st.success(text["apkg_saved"].format(**result))
+                with open(result["path"], "rb") as f:
+                    st.download_button(
+                        text["download_cards"],
+                        f.read(),
+                        file_name=os.path.basename(result["path"]),
+                        mime="application/octet-stream"
+                    )
+            else:
+                st.info(text["apkg_unchanged"])
+
+    # —— 批量生成卡组 ——
+    st.divider()
+    with st.expander(text["batch_title"]):
+        st.caption(text["batch_info"])
+        topics_file = st.file_uploader(text["batch_topics_file"], type=["txt"], key="anki_batch_topics_file")
+        if topics_file is not None:
+            st.session_state["anki_batch_topics"] = topics_file.getvalue().decode("utf-8", errors="ignore")
+        if st.button(text["batch_from_headings"]):
+            raw_dir = os.path.join(project_path, "raw_pdfs")
+            if os.path.isdir(raw_dir):
+                st.session_state["anki_batch_topics"] = "\n".join(extract_topics_from_headings(raw_dir))
+        topics_text = st.text_area(
+            text["batch_topics"],
+            value=st.session_state.get("anki_batch_topics", ""),
+            height=200
+        )
+        col_w, col_d = st.columns(2)
+        with col_w:
+            max_workers = st.slider(text["batch_workers"], 1, 16, 4)
+        with col_d:
+            dedup_threshold = st.slider(text["batch_dedup"], 0.80, 1.00, 0.92, step=0.01)
+
+        batch_apkg = st.checkbox(text["batch_apkg"], value=True)
+        topics = parse_topics(topics_text)
+        if st.button(text["batch_generate"].format(n=len(topics)), disabled=not topics):
+            bar = st.progress(0.0)
+            report = generate_deck_batch(
+                topics,
+                project_path,
+                card_type=card_type,
+                difficulty=difficulty,
+                detail_level=detail_level,
+                num_cards=num_cards,
+                top_k=top_k,
+                relevance_threshold=relevance_threshold,
+                max_workers=max_workers,
+                dedup_threshold=dedup_threshold if dedup_threshold < 1.0 else None,
+                apkg_deck=selected_project if batch_apkg else None,
+                progress_cb=lambda done, total, topic: bar.progress(done / total, text=topic)
+            )
+            if report["output_path"]:
+                st.success(text["batch_done"].format(**report))
+            else:
+                st.warning(text["no_content_preview"])
+            if report["failed"]:
+                st.warning(text["batch_failed"].format(topics=", ".join(report["failed"])))
+
+    # —— 语料覆盖（按聚类生成） ——
+    with st.expander(text["coverage_title"]):
+        st.caption(text["coverage_info"])
+        n_clusters = st.number_input(text["coverage_clusters"], min_value=0, max_value=500, value=0, step=5)
+        if st.button(text["coverage_build"]):
+            with st.spinner(text["coverage_building"]):
+                try:
+                    build_clusters(project_path, n_clusters=n_clusters or None)
+                except ValueError as e:
+                    st.error(str(e))
+
+        coverage = coverage_report(project_path)
+        if coverage:
+            st.metric(
+                text["coverage_metric"],
+                f"{coverage['chunk_coverage']:.0%}",
+                help=text["coverage_clusters_covered"].format(**coverage)
+            )
+            st.dataframe(coverage["clusters"], use_container_width=True, hide_index=True)
+            uncovered = [c["cluster"] for c in coverage["clusters"] if not c["covered"]]
+            cov_workers = st.slider(text["batch_workers"], 1, 16, 4, key="anki_coverage_workers")
+            if st.button(text["coverage_generate"].format(n=len(uncovered)), disabled=not uncovered):
+                bar = st.progress(0.0)
+                report = generate_cards_for_clusters(
+                    project_path,
+                    uncovered,
+                    card_type=card_type,
+                    difficulty=difficulty,
+                    detail_level=detail_level,
+                    num_cards=num_cards,
+                    max_workers=cov_workers,
+                    apkg_deck=selected_project,
+                    progress_cb=lambda done, total, cid: bar.progress(done / total, text=f"cluster {cid}")
+                )
+                # 重新运行以刷新覆盖率表格，本次结果存入 session_state 在重新运行后显示
+                st.session_state["anki_coverage_report"] = (project_path, report)
+                st.rerun()
+            report_for, last_report = st.session_state.get("anki_coverage_report", (None, None))
+            if last_report and report_for == project_path:
+                if last_report["output_path"]:
+                    st.success(text["coverage_done"].format(**last_report))
+                if last_report["failed"]:
+                    st.warning(text["batch_failed"].format(topics=", ".join(last_report["failed"])))
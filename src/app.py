@@ -118,16 +118,29 @@ if "tab_funcs" not in st.session_state:
     from rag_tab import render_rag_tab
     from literature_tab import render_literature_tab
     from anki_tab import render_anki_tab
+    from perf_tab import render_perf_tab
     st.session_state.tab_funcs = [
         render_rag_tab,
         render_literature_tab,
-        render_anki_tab
+        render_anki_tab,
+        render_perf_tab
     ]
 
+# 性能剖析与调试输出开关按会话保存（RAG 页与 Performance 页的复选框），在渲染各页之前应用到本会话的脚本线程
+import metrics
+import profiling
+profiling.set_session_enabled(st.session_state.get("profile_enabled"))
+metrics.set_session_debug(st.session_state.get("debug_enabled"))
+
+# 设置 RAG_METRICS_PORT 时在该端口提供 Prometheus /metrics（每个进程只启动一次）
+if os.getenv("RAG_METRICS_PORT"):
+    metrics.start_exporter(int(os.getenv("RAG_METRICS_PORT")))
+
 tab_labels = [
     text["tab_titles"]["RAG"],
     text["tab_titles"]["Literature"],
-    text["tab_titles"]["Anki"]
+    text["tab_titles"]["Anki"],
+    text["tab_titles"]["Performance"]
 ]
 
 tabs = st.tabs(tab_labels)
@@ -0,0 +1,174 @@
+# async_http.py
+"""
+仅依赖标准库 asyncio 的极简 HTTP/1.1 服务端与客户端，供 query_service 与 openai_standin 使用。
+
+- 支持 keep-alive、Content-Length 请求体、JSON 响应与分块传输（StreamResponse，用于 SSE）
+- 处理函数签名：async handler(Request) -> (status, payload) 或 StreamResponse
+  payload 为 dict/list 时按 JSON 输出，为 str/bytes 时原样输出
+"""
+import asyncio
+import json
+import traceback
+from dataclasses import dataclass, field
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, Optional, Tuple, Union
+from urllib.parse import parse_qs
+
+MAX_BODY = 16 * 1024 * 1024
+REASONS = {
+    200: "OK", 400: "Bad Request", 404: "Not Found", 405: "Method Not Allowed", 413: "Payload Too Large",
+    429: "Too Many Requests", 500: "Internal Server Error", 502: "Bad Gateway", 503: "Service Unavailable",
+}
+
+
+class HTTPError(Exception):
+    """处理函数中抛出，直接转换为对应状态码的 JSON 错误响应。"""
+
+    def __init__(self, status: int, message: str, headers: Optional[Dict[str, str]] = None):
+        super().__init__(message)
+        self.status = status
+        self.headers = headers or {}
+
+
+@dataclass
+class Request:
+    method: str
+    path: str
+    query: Dict[str, str]
+    headers: Dict[str, str]
+    body: bytes = b""
+
+    def json(self) -> Any:
+        if not self.body:
+            return {}
+        try:
+            return json.loads(self.body)
+        except ValueError:
+            raise HTTPError(400, "Request body is not valid JSON")
+
+
+@dataclass
+class StreamResponse:
+    chunks: AsyncIterator[Union[str, bytes]]
+    status: int = 200
+    content_type: str = "text/event-stream"
+    headers: Dict[str, str] = field(default_factory=dict)
+
+
+Handler = Callable[[Request], Awaitable[Union[Tuple, StreamResponse]]]
+
+
+def _encode(payload: Any) -> Tuple[bytes, str]:
+    if isinstance(payload, bytes):
+        return payload, "application/octet-stream"
+    if isinstance(payload, str):
+        return payload.encode("utf-8"), "text/plain; charset=utf-8"
+    return json.dumps(payload, ensure_ascii=False, default=str).encode("utf-8"), "application/json"
+
+
+def _head(status: int, headers: Dict[str, str]) -> bytes:
+    lines = [f"HTTP/1.1 {status} {REASONS.get(status, 'Unknown')}"]
+    lines += [f"{k}: {v}" for k, v in headers.items()]
+    return ("\r\n".join(lines) + "\r\n\r\n").encode("latin-1")
+
+
+async def _write_response(writer: asyncio.StreamWriter, resp, keep_alive: bool) -> None:
+    connection = "keep-alive" if keep_alive else "close"
+    if isinstance(resp, StreamResponse):
+        headers = {"Content-Type": resp.content_type, "Transfer-Encoding": "chunked",
+                   "Cache-Control": "no-cache", "Connection": connection, **resp.headers}
+        writer.write(_head(resp.status, headers))
+        async for chunk in resp.chunks:
+            data = chunk.encode("utf-8") if isinstance(chunk, str) else chunk
+            if data:
+                writer.write(f"{len(data):x}\r\n".encode("latin-1") + data + b"\r\n")
+                await writer.drain()
+        writer.write(b"0\r\n\r\n")
+    else:
+        status, payload, *extra = resp
+        body, content_type = _encode(payload)
+        headers = {"Content-Type": content_type, "Content-Length": str(len(body)), "Connection": connection,
+                   **(extra[0] if extra else {})}
+        writer.write(_head(status, headers) + body)
+    await writer.drain()
+
+
+async def _read_headers(reader: asyncio.StreamReader) -> Dict[str, str]:
+    headers = {}
+    while True:
+        line = await reader.readline()
+        if line in (b"\r\n", b"\n", b""):
+            return headers
+        key, _, value = line.decode("latin-1").partition(":")
+        headers[key.strip().lower()] = value.strip()
+
+
+async def _serve_connection(reader: asyncio.StreamReader, writer: asyncio.StreamWriter, handler: Handler) -> None:
+    try:
+        while True:
+            line = await reader.readline()
+            if not line:
+                break
+            method, target, version = line.decode("latin-1").split()
+            headers = await _read_headers(reader)
+            length = int(headers.get("content-length", 0))
+            if length > MAX_BODY:
+                await _write_response(writer, (413, {"error": "Request body too large"}), keep_alive=False)
+                break
+            body = await reader.readexactly(length) if length else b""
+            path, _, qs = target.partition("?")
+            request = Request(method.upper(), path, {k: v[-1] for k, v in parse_qs(qs).items()}, headers, body)
+            try:
+                resp = await handler(request)
+            except HTTPError as e:
+                resp = (e.status, {"error": str(e)}, e.headers)
+            except Exception as e:
+                traceback.print_exc()
+                resp = (500, {"error": f"{type(e).__name__}: {e}"})
+            keep_alive = version == "HTTP/1.1" and headers.get("connection", "").lower() != "close"
+            await _write_response(writer, resp, keep_alive)
+            if not keep_alive:
+                break
+    except (asyncio.IncompleteReadError, ConnectionError, ValueError):
+        pass  # 客户端断开或请求格式错误
+    finally:
+        writer.close()
+
+
+async def start_server(handler: Handler, host: str = "127.0.0.1", port: int = 0) -> asyncio.AbstractServer:
+    """启动服务并返回 asyncio Server（port=0 时由系统分配端口，见 server_port）。"""
+    return await asyncio.start_server(lambda r, w: _serve_connection(r, w, handler), host, port)
+
+
+def server_port(server: asyncio.AbstractServer) -> int:
+    return server.sockets[0].getsockname()[1]
+
+
+class Connection:
+    """keep-alive 的异步 JSON 客户端连接（压测用，不支持分块传输的响应）。"""
+
+    def __init__(self, host: str, port: int):
+        self.host = host
+        self.port = port
+        self._reader: Optional[asyncio.StreamReader] = None
+        self._writer: Optional[asyncio.StreamWriter] = None
+
+    async def request(self, method: str, path: str, payload: Any = None) -> Tuple[int, Any]:
+        if self._writer is None:
+            self._reader, self._writer = await asyncio.open_connection(self.host, self.port)
+        body = json.dumps(payload).encode("utf-8") if payload is not None else b""
+        head = (f"{method} {path} HTTP/1.1\r\nHost: {self.host}:{self.port}\r\n"
+                f"Content-Type: application/json\r\nContent-Length: {len(body)}\r\n\r\n")
+        self._writer.write(head.encode("latin-1") + body)
+        await self._writer.drain()
+        status = int((await self._reader.readline()).split()[1])
+        headers = await _read_headers(self._reader)
+        data = await self._reader.readexactly(int(headers.get("content-length", 0)))
+        if headers.get("connection", "").lower() == "close":
+            await self.close()
+        is_json = headers.get("content-type", "").startswith("application/json")
+        return status, json.loads(data) if is_json and data else data.decode("utf-8", "replace")
+
+    async def close(self) -> None:
+        if self._writer is not None:
+            self._writer.close()
+            self._writer = self._reader = None
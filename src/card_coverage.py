@@ -0,0 +1,309 @@
+# card_coverage.py
+"""
+基于聚类的语料覆盖：把项目向量库中的所有向量聚成若干主题簇，每簇挑出最靠近簇心的代表分块，
+按簇并行生成卡片，并记录哪些簇已经有卡片，直到整个项目被覆盖。
+
+为了在 10 万级以上分块时保持内存可控：
+  - 向量分页从 Chroma 读出，写入磁盘上的 float32 memmap，不整体驻留内存
+  - 聚类使用向量化的 mini-batch 球面 k-means（余弦相似度），每次只读取一个小批次
+  - 最终分配按块进行，块大小由 memory_budget_mb 推算
+"""
+from __future__ import annotations
+
+import json
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import datetime
+from typing import TYPE_CHECKING, Any, Callable, Dict, List, Optional, Tuple
+
+from anki import filter_known_cards, generate_anki_cards_llm, load_chunk_index
+from anki_apkg import export_rows_to_apkg
+from anki_batch import write_deck_csv
+from card_parser import parse_cards
+from llm_client import LLMCallError
+
+if TYPE_CHECKING:
+    import numpy as np  # numpy 在首次计算时才导入
+
+COVERAGE_DIR = os.path.join("processed", "coverage")
+PAGE_SIZE = 2000
+
+
+def _coverage_dir(project_folder: str) -> str:
+    path = os.path.join(project_folder, COVERAGE_DIR)
+    os.makedirs(path, exist_ok=True)
+    return path
+
+
+def _normalize(x: np.ndarray) -> np.ndarray:
+    import numpy as np
+
+    return x / (np.linalg.norm(x, axis=1, keepdims=True) + 1e-12)
+
+
+def export_vectors(collection, out_dir: str, page_size: int = PAGE_SIZE) -> Tuple[List[str], np.memmap]:
+    """
+    分页读出集合中的全部向量，写入 out_dir/vectors.f32（float32 memmap，已归一化），返回 (ids, memmap)。
+    """
+    import numpy as np
+
+    total = collection.count()
+    if total == 0:
+        raise ValueError("The vector collection is empty; embed the project first.")
+    ids: List[str] = []
+    vectors = None
+    offset = 0
+    while offset < total:
+        page = collection.get(include=["embeddings"], limit=page_size, offset=offset)
+        batch = np.asarray(page["embeddings"], dtype=np.float32)
+        if len(batch) == 0:
+            break
+        if vectors is None:
+            vectors = np.memmap(os.path.join(out_dir, "vectors.f32"), dtype=np.float32, mode="w+", shape=(total, batch.shape[1]))
+        vectors[offset:offset + len(batch)] = _normalize(batch)
+        ids.extend(page["ids"])
+        offset += len(batch)
+    vectors.flush()
+    return ids, vectors[:len(ids)]
+
+
+def _kmeans_pp(sample: np.ndarray, k: int, rng: np.random.Generator) -> np.ndarray:
+    """在样本上做 k-means++ 初始化（基于余弦距离）。"""
+    import numpy as np
+
+    centers = np.empty((k, sample.shape[1]), dtype=np.float32)
+    centers[0] = sample[rng.integers(len(sample))]
+    closest = 1.0 - sample @ centers[0]
+    for i in range(1, k):
+        probs = np.clip(closest, 0, None)
+        total = probs.sum()
+        idx = rng.integers(len(sample)) if total <= 0 else rng.choice(len(sample), p=probs / total)
+        centers[i] = sample[idx]
+        closest = np.minimum(closest, 1.0 - sample @ centers[i])
+    return centers
+
+
+def minibatch_kmeans(
+    vectors: np.ndarray,
+    k: int,
+    batch_size: int = 1024,
+    n_iter: int = 100,
+    seed: int = 0,
+) -> np.ndarray:
+    """
+    mini-batch 球面 k-means（Sculley 2010）。vectors 可以是 memmap，每次迭代只读取 batch_size 行。
+    返回归一化的簇心 (k, dim)。
+    """
+    import numpy as np
+
+    n = len(vectors)
+    k = max(1, min(k, n))
+    rng = np.random.default_rng(seed)
+    sample_idx = np.sort(rng.choice(n, size=min(n, max(20 * k, batch_size)), replace=False))
+    centers = _kmeans_pp(np.asarray(vectors[sample_idx]), k, rng)
+    counts = np.zeros(k, dtype=np.int64)
+
+    for _ in range(n_iter):
+        idx = np.sort(rng.integers(0, n, size=min(batch_size, n)))
+        batch = np.asarray(vectors[idx], dtype=np.float32)
+        labels = np.argmax(batch @ centers.T, axis=1)
+        batch_counts = np.bincount(labels, minlength=k)
+        sums = np.zeros_like(centers)
+        np.add.at(sums, labels, batch)
+        hit = batch_counts > 0
+        counts[hit] += batch_counts[hit]
+        eta = (batch_counts[hit] / counts[hit]).astype(np.float32)[:, None]
+        centers[hit] = (1 - eta) * centers[hit] + eta * (sums[hit] / batch_counts[hit][:, None])
+        centers[hit] = _normalize(centers[hit])
+    return centers
+
+
+def assign(vectors: np.ndarray, centers: np.ndarray, block: int = 8192) -> Tuple[np.ndarray, np.ndarray]:
+    """按块把所有向量分配到最近的簇心，返回 (labels, 与簇心的余弦相似度)。"""
+    import numpy as np
+
+    n = len(vectors)
+    labels = np.empty(n, dtype=np.int32)
+    sims = np.empty(n, dtype=np.float32)
+    for start in range(0, n, block):
+        scores = np.asarray(vectors[start:start + block], dtype=np.float32) @ centers.T
+        labels[start:start + block] = np.argmax(scores, axis=1)
+        sims[start:start + block] = scores[np.arange(len(scores)), labels[start:start + block]]
+    return labels, sims
+
+
+def _block_size(dim: int, k: int, memory_budget_mb: int) -> int:
+    # 每行需要 dim 个输入值 + k 个得分（float32）
+    return max(256, int(memory_budget_mb * 1024 * 1024 // (4 * (dim + k) * 2)))
+
+
+def build_clusters(
+    project_folder: str,
+    n_clusters: Optional[int] = None,
+    representatives: int = 5,
+    memory_budget_mb: int = 256,
+    n_iter: int = 100,
+    seed: int = 0,
+) -> Dict[str, Any]:
+    """
+    对项目向量库聚类，写出 processed/coverage/clusters.json 并返回其内容。
+
+    Args:
+        n_clusters: 簇数，默认 sqrt(N/2)，限制在 [2, 500]
+        representatives: 每簇保留的代表分块数（离簇心最近的分块）
+        memory_budget_mb: 聚类与分配阶段的内存预算（不含 memmap 的页缓存）
+    """
+    import numpy as np
+
+    from retrieve import initialize_chroma
+
+    start = time.time()
+    out_dir = _coverage_dir(project_folder)
+    db = initialize_chroma(os.path.join(project_folder, "vectorstore", "chroma_db"))
+    ids, vectors = export_vectors(db._collection, out_dir)
+    n, dim = vectors.shape
+    k = n_clusters or int(min(500, max(2, np.sqrt(n / 2))))
+    block = _block_size(dim, k, memory_budget_mb)
+    print(f"[Coverage] {n} vectors x {dim} dims, k={k}, block={block}")
+
+    centers = minibatch_kmeans(vectors, k, batch_size=min(block, 4096), n_iter=n_iter, seed=seed)
+    labels, sims = assign(vectors, centers, block)
+
+    # 每簇按相似度降序取前 representatives 个作为代表
+    order = np.lexsort((-sims, labels))
+    sorted_labels = labels[order]
+    boundaries = np.flatnonzero(np.diff(sorted_labels)) + 1
+    previous = load_clusters(project_folder)
+    clusters = {}
+    for group in np.split(order, boundaries):
+        if len(group) == 0:
+            continue
+        cid = str(int(labels[group[0]]))
+        clusters[cid] = {
+            "size": int(len(group)),
+            "representatives": [ids[i] for i in group[:representatives]],
+            "card_count": 0,
+        }
+    # 簇心会随数据变化，按代表分块的重合度继承旧簇的卡片计数
+    if previous:
+        old_counts = {rep: c.get("card_count", 0) for c in previous.get("clusters", {}).values() for rep in c["representatives"]}
+        for c in clusters.values():
+            c["card_count"] = max((old_counts.get(r, 0) for r in c["representatives"]), default=0)
+
+    np.save(os.path.join(out_dir, "labels.npy"), labels)
+    with open(os.path.join(out_dir, "ids.json"), "w", encoding="utf-8") as f:
+        json.dump(ids, f)
+    report = {
+        "n_vectors": int(n),
+        "n_clusters": len(clusters),
+        "created": datetime.now().isoformat(),
+        "elapsed": round(time.time() - start, 2),
+        "clusters": clusters,
+    }
+    _save_clusters(project_folder, report)
+    del vectors
+    os.remove(os.path.join(out_dir, "vectors.f32"))
+    print(f"[Coverage] Clustered {n} vectors into {len(clusters)} clusters in {report['elapsed']}s")
+    return report
+
+
+def load_clusters(project_folder: str) -> Optional[Dict[str, Any]]:
+    path = os.path.join(project_folder, COVERAGE_DIR, "clusters.json")
+    if not os.path.exists(path):
+        return None
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def _save_clusters(project_folder: str, report: Dict[str, Any]) -> None:
+    path = os.path.join(_coverage_dir(project_folder), "clusters.json")
+    tmp = path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    os.replace(tmp, path)
+
+
+def coverage_report(project_folder: str) -> Optional[Dict[str, Any]]:
+    """
+    返回覆盖情况：每簇的大小与卡片数，以及已覆盖的簇/分块比例。尚未聚类时返回 None。
+    """
+    data = load_clusters(project_folder)
+    if not data:
+        return None
+    rows = [{"cluster": cid, "size": c["size"], "cards": c.get("card_count", 0), "covered": c.get("card_count", 0) > 0}
+            for cid, c in sorted(data["clusters"].items(), key=lambda kv: -kv[1]["size"])]
+    covered = [r for r in rows if r["covered"]]
+    return {
+        "n_clusters": len(rows),
+        "covered_clusters": len(covered),
+        "chunk_coverage": sum(r["size"] for r in covered) / max(1, sum(r["size"] for r in rows)),
+        "clusters": rows,
+    }
+
+
+def generate_cards_for_clusters(
+    project_folder: str,
+    cluster_ids: Optional[List[str]] = None,
+    card_type: str = "qa",
+    difficulty: str = "intermediate",
+    detail_level: str = "moderate",
+    num_cards: int = 5,
+    lang: str = "en",
+    max_workers: int = 4,
+    apkg_deck: Optional[str] = None,
+    progress_cb: Optional[Callable[[int, int, str], None]] = None,
+) -> Dict[str, Any]:
+    """
+    为指定簇（默认：所有尚未覆盖的簇）并行生成卡片，写出一个卡组并更新覆盖记录。
+    每簇以代表分块为上下文，以最核心分块的开头作为主题。
+    """
+    data = load_clusters(project_folder)
+    if not data:
+        raise ValueError("No clusters found; run build_clusters() first.")
+    clusters = data["clusters"]
+    if cluster_ids is None:
+        cluster_ids = [cid for cid, c in clusters.items() if not c.get("card_count")]
+    index = load_chunk_index(os.path.join(project_folder, "processed", "chunks"))
+
+    def generate(cid):
+        chunks = [{"chunk_id": r, "chunk_text": index[r].get("chunk_text", "")}
+                  for r in clusters[cid]["representatives"] if r in index]
+        if not chunks:
+            raise ValueError("Representative chunks are missing from the chunk store.")
+        topic = " ".join(chunks[0]["chunk_text"].split()[:20])
+        response = generate_anki_cards_llm(
+            query=topic, project_folder=project_folder, card_type=card_type, difficulty=difficulty,
+            detail_level=detail_level, num_cards=num_cards, lang=lang, chunks=chunks,
+            standardized_query=f"Key concepts of: {topic}"
+        )
+        return parse_cards(response, card_type).cards
+
+    cards, failed = [], {}
+    with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="coverage") as pool:
+        futures = {pool.submit(generate, cid): cid for cid in cluster_ids}
+        for done, fut in enumerate(as_completed(futures), 1):
+            cid = futures[fut]
+            try:
+                rows = fut.result()
+                clusters[cid]["card_count"] = clusters[cid].get("card_count", 0) + len(rows)
+                cards.extend({"topic": cid, "row": row} for row in rows)
+            except (LLMCallError, ValueError) as e:
+                failed[cid] = str(e)
+            if progress_cb:
+                progress_cb(done, len(cluster_ids), cid)
+
+    _save_clusters(project_folder, data)
+    rows, known, index = filter_known_cards([c["row"] for c in cards], project_folder) if cards else ([], [], None)
+    fresh = {id(r) for r in rows}
+    cards = [c for c in cards if id(c["row"]) in fresh]
+    output_dir = os.path.join(project_folder, "anki_cards")
+    output = write_deck_csv(cards, output_dir) if cards else None
+    apkg = None
+    if cards and apkg_deck:
+        apkg = export_rows_to_apkg((c["row"] for c in cards), output_dir, apkg_deck, card_type)["path"]
+    if index is not None and cards:
+        index.add([c["row"][0] for c in cards], deck=apkg_deck or os.path.basename(output))
+    print(f"[Coverage] Generated {len(cards)} cards for {len(cluster_ids)} clusters, {len(failed)} failed")
+    return {"output_path": output, "apkg_path": apkg, "n_cards": len(cards), "n_known": len(known),
+            "n_clusters": len(cluster_ids), "failed": failed}
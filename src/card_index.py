@@ -0,0 +1,252 @@
+# card_index.py
+"""
+项目级卡片索引：记录每张已导出卡片正面的 embedding，用于在导出前（或生成前通过 prompt 排除）
+快速判断新卡片是否与已有卡片重复。
+
+存储在 <project>/anki_cards/card_index/ 下，只追加、不重写：
+    vectors.f32   已归一化的 float32 向量，逐行追加
+    cards.jsonl   与向量逐行对应的卡片记录 {"front", "deck", "added"}
+    meta.json     {"dim", "model"}
+查询时以 memmap 分块做矩阵乘法，数万张卡片也不需要把全部向量读入内存；
+规范化后完全相同的正面直接按文本哈希命中，不调用 embedding。
+meta.json 中的模型或维度与当前 embedding 函数不一致时，第一次用到向量前按 cards.jsonl 重新计算全部向量。
+"""
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+import re
+from datetime import datetime
+from typing import TYPE_CHECKING, Dict, List, Optional, Sequence, Tuple
+
+from card_parser import CLOZE_RE
+
+if TYPE_CHECKING:
+    import numpy as np  # numpy 在首次计算时才导入
+
+INDEX_DIR = os.path.join("anki_cards", "card_index")
+DEFAULT_THRESHOLD = 0.92
+BLOCK_ROWS = 8192
+
+
+def normalize_front(text: str) -> str:
+    """去掉填空标记、统一大小写与空白，作为精确匹配和 embedding 的输入。"""
+    text = CLOZE_RE.sub(lambda m: m.group(2).split("::")[0], text)
+    return re.sub(r"\s+", " ", text).strip().lower()
+
+
+def _text_key(text: str) -> str:
+    return hashlib.md5(normalize_front(text).encode("utf-8")).hexdigest()
+
+
+class CardIndex:
+    """
+        index = CardIndex(project_folder)
+        new_rows, known = index.filter_new(rows)
+        ... 导出 new_rows ...
+        index.add([r[0] for r in new_rows], deck="my deck")
+    """
+
+    def __init__(self, project_folder: str, embed_fn=None):
+        self.folder = os.path.join(project_folder, INDEX_DIR)
+        self._embed_fn = embed_fn
+        self._fronts: List[str] = []
+        self._keys: Dict[str, int] = {}
+        self._cache: Dict[str, np.ndarray] = {}  # lookup 时算过的向量，add 时复用
+        self.dim: Optional[int] = None
+        self.model = ""
+        self._load()
+
+    @property
+    def embed_fn(self):
+        if self._embed_fn is None:
+            from embed import OpenAIEmbeddingFunction
+            self._embed_fn = OpenAIEmbeddingFunction()
+        return self._embed_fn
+
+    def __len__(self) -> int:
+        return len(self._fronts)
+
+    def _path(self, name: str) -> str:
+        return os.path.join(self.folder, name)
+
+    def _load(self) -> None:
+        if not os.path.exists(self._path("meta.json")):
+            return
+        with open(self._path("meta.json"), "r", encoding="utf-8") as f:
+            meta = json.load(f)
+        self.dim, self.model = meta["dim"], meta.get("model", "")
+        with open(self._path("cards.jsonl"), "r", encoding="utf-8") as f:
+            records = [json.loads(line) for line in f if line.strip()]
+        # 追加过程中被打断时两个文件可能差几行：以较短者为准并截断另一个，保证后续追加仍然对齐
+        n = min(len(records), os.path.getsize(self._path("vectors.f32")) // (4 * self.dim))
+        if n < len(records):
+            with open(self._path("cards.jsonl"), "w", encoding="utf-8") as f:
+                f.writelines(json.dumps(rec, ensure_ascii=False) + "\n" for rec in records[:n])
+        os.truncate(self._path("vectors.f32"), n * 4 * self.dim)
+        for i, rec in enumerate(records[:n]):
+            self._fronts.append(rec["front"])
+            self._keys.setdefault(_text_key(rec["front"]), i)
+
+    def _vectors(self) -> Optional[np.memmap]:
+        import numpy as np
+
+        if not self._fronts:
+            return None
+        return np.memmap(self._path("vectors.f32"), dtype=np.float32, mode="r", shape=(len(self._fronts), self.dim))
+
+    def _write_meta(self) -> None:
+        tmp = self._path("meta.json.tmp")
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump({"dim": self.dim, "model": self.model}, f)
+        os.replace(tmp, self._path("meta.json"))
+
+    def _embed_normalized(self, fronts: Sequence[str]) -> np.ndarray:
+        import numpy as np
+
+        vectors = np.asarray(self.embed_fn.embed_documents([normalize_front(f) for f in fronts]), dtype=np.float32)
+        vectors /= np.linalg.norm(vectors, axis=1, keepdims=True) + 1e-12
+        return vectors
+
+    def embed(self, fronts: Sequence[str]) -> np.ndarray:
+        import numpy as np
+
+        keys = [_text_key(f) for f in fronts]
+        missing = list({k: f for f, k in zip(fronts, keys) if k not in self._cache}.values())  # 同一批中相同的正面只算一次
+        if missing:
+            self._cache.update(zip((_text_key(f) for f in missing), self._embed_normalized(missing)))
+        return np.stack([self._cache[k] for k in keys])
+
+    def _ensure_compatible(self, dim: int) -> None:
+        """
+        已有向量是用别的模型（或别的维度）算出来的时，用当前 embedding 函数按块重新计算全部向量，
+        写入临时文件后整体替换，不能与新向量混在同一个索引里比较。
+        """
+        model = getattr(self.embed_fn, "model", "")
+        if self.dim is None or (self.model == model and self.dim == dim):
+            return
+        if self._fronts:
+            self._reembed(model, dim)
+        self.dim, self.model = dim, model
+        self._write_meta()
+
+    def _reembed(self, model: str, dim: int) -> None:
+        print(f"[CardIndex] Index was built with {self.model or 'unknown'} ({self.dim} dims); "
+              f"re-embedding {len(self._fronts)} cards with {model or 'unknown'} ({dim} dims)")
+        tmp = self._path("vectors.f32.tmp")
+        with open(tmp, "wb") as f:
+            for start in range(0, len(self._fronts), BLOCK_ROWS):
+                vectors = self._embed_normalized(self._fronts[start:start + BLOCK_ROWS])
+                if vectors.shape[1] != dim:
+                    raise ValueError(f"Embedding function returned {vectors.shape[1]} dims, expected {dim}")
+                f.write(vectors.tobytes())
+        os.replace(tmp, self._path("vectors.f32"))
+
+    def _best_matches(self, vectors: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """对每个查询向量返回 (最相似卡片下标, 相似度)，按块扫描 memmap。"""
+        import numpy as np
+
+        best_idx = np.full(len(vectors), -1, dtype=np.int64)
+        best_score = np.full(len(vectors), -1.0, dtype=np.float32)
+        self._ensure_compatible(vectors.shape[1])
+        stored = self._vectors()
+        if stored is None:
+            return best_idx, best_score
+        for start in range(0, len(stored), BLOCK_ROWS):
+            scores = vectors @ np.asarray(stored[start:start + BLOCK_ROWS]).T
+            idx = np.argmax(scores, axis=1)
+            score = scores[np.arange(len(vectors)), idx]
+            better = score > best_score
+            best_idx[better] = idx[better] + start
+            best_score[better] = score[better]
+        return best_idx, best_score
+
+    def lookup(self, fronts: Sequence[str], threshold: float = DEFAULT_THRESHOLD) -> List[Optional[Tuple[str, float]]]:
+        """
+        检查每个正面是否已有相似卡片，返回与 fronts 对齐的列表：命中为 (已有正面, 相似度)，否则 None。
+        """
+        matches: List[Optional[Tuple[str, float]]] = [None] * len(fronts)
+        pending = []
+        for i, front in enumerate(fronts):
+            hit = self._keys.get(_text_key(front))
+            if hit is not None:
+                matches[i] = (self._fronts[hit], 1.0)
+            else:
+                pending.append(i)
+        if pending and self._fronts:
+            idx, score = self._best_matches(self.embed([fronts[i] for i in pending]))
+            for i, j, s in zip(pending, idx, score):
+                if j >= 0 and s >= threshold:
+                    matches[i] = (self._fronts[j], float(s))
+        return matches
+
+    def filter_new(self, rows: List[List[str]], threshold: float = DEFAULT_THRESHOLD) -> Tuple[List[List[str]], List[Dict]]:
+        """
+        过滤掉与索引中已有卡片（或本批中更早的卡片）重复的行。
+        返回 (新卡片行, 重复记录 [{"front", "match", "score", "row"}])。
+        """
+        rows = [r for r in rows if r and r[0].strip()]
+        if not rows:
+            return [], []
+        fronts = [r[0] for r in rows]
+        matches = self.lookup(fronts, threshold)
+        new_rows, known = [], []
+        seen: Dict[str, int] = {}
+        for row, front, match in zip(rows, fronts, matches):
+            key = _text_key(front)
+            if match is None and key in seen:
+                match = (fronts[seen[key]], 1.0)
+            if match is not None:
+                known.append({"front": front, "match": match[0], "score": round(match[1], 4), "row": row})
+                continue
+            seen[key] = len(new_rows)
+            new_rows.append(row)
+        return new_rows, known
+
+    def add(self, fronts: Sequence[str], deck: str = "", vectors: Optional[np.ndarray] = None) -> int:
+        """把已导出卡片的正面追加到索引，已存在的（规范化后相同）跳过。返回新增数量。"""
+        import numpy as np
+
+        fresh, positions = [], []
+        keys = set()
+        for i, front in enumerate(fronts):
+            key = _text_key(front)
+            if front.strip() and key not in self._keys and key not in keys:
+                keys.add(key)
+                fresh.append(front)
+                positions.append(i)
+        if not fresh:
+            return 0
+        vectors = self.embed(fresh) if vectors is None else np.asarray(vectors, dtype=np.float32)[positions]
+        os.makedirs(self.folder, exist_ok=True)
+        if self.dim is None:
+            self.dim, self.model = int(vectors.shape[1]), getattr(self.embed_fn, "model", "")
+            self._write_meta()
+        else:
+            self._ensure_compatible(int(vectors.shape[1]))
+        now = datetime.now().isoformat()
+        with open(self._path("vectors.f32"), "ab") as f:
+            f.write(vectors.astype(np.float32).tobytes())
+        with open(self._path("cards.jsonl"), "a", encoding="utf-8") as f:
+            for front in fresh:
+                f.write(json.dumps({"front": front, "deck": deck, "added": now}, ensure_ascii=False) + "\n")
+        for front in fresh:
+            self._keys[_text_key(front)] = len(self._fronts)
+            self._fronts.append(front)
+        self._cache.clear()
+        print(f"[CardIndex] Added {len(fresh)} cards ({len(self._fronts)} total)")
+        return len(fresh)
+
+    def nearest(self, text: str, k: int = 20, min_score: float = 0.3) -> List[str]:
+        """返回与 text（通常是查询）最相近的 k 张已有卡片正面，用于在 prompt 中排除。"""
+        import numpy as np
+
+        if not self._fronts or not text.strip():
+            return []
+        query = self.embed([text])[0]
+        self._ensure_compatible(len(query))
+        stored = self._vectors()
+        scores = np.concatenate([np.asarray(stored[s:s + BLOCK_ROWS]) @ query for s in range(0, len(stored), BLOCK_ROWS)])
+        top = np.argsort(-scores)[:k]
+        return [self._fronts[i] for i in top if scores[i] >= min_score]
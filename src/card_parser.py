@@ -0,0 +1,267 @@
+# card_parser.py
+"""
+LLM 卡片输出的增量解析与校验。
+
+CardStreamParser 边接收流式输出边切分 CSV 记录（支持引号内换行），每条完整记录立即按
+问答（Q&A）或填空（Cloze）的格式校验：
+  - 问答：2–3 列，问题与答案非空
+  - 填空：1–2 列，正文包含合法的 {{cN::...}} 标记（N ≥ 1）且括号配对
+```csv 代码围栏与表头行会被忽略。格式错误的行先尝试本地修复（如未加引号的逗号），
+仍然无法修复的行才交给 rerequest_failed_rows() 让 LLM 只重写这些行，而不是整批重新生成。
+"""
+import csv
+import io
+import re
+import time
+from dataclasses import dataclass, field
+from typing import Callable, Iterable, List, Optional
+
+import metrics
+
+FENCE_RE = re.compile(r"^\s*```")
+CLOZE_RE = re.compile(r"\{\{c(\d+)::(.+?)\}\}", re.DOTALL)
+MAX_RECORD_LINES = 8  # 引号未闭合时最多合并的行数，防止一个孤立的引号吞掉后续所有行
+HEADER_WORDS = {"question", "answer", "extra", "extra info", "front", "back", "text", "cloze",
+                "问题", "答案", "补充", "背景", "填空"}
+
+
+@dataclass
+class ParsedRow:
+    line_no: int
+    raw: str
+    cells: List[str]
+    valid: bool
+    error: str = ""
+    repaired: bool = False
+
+
+@dataclass
+class CardParseResult:
+    rows: List[ParsedRow] = field(default_factory=list)
+    failed: List[ParsedRow] = field(default_factory=list)
+    ignored: int = 0
+    rerequested: int = 0
+
+    @property
+    def cards(self) -> List[List[str]]:
+        return [r.cells for r in self.rows]
+
+    def to_csv(self) -> str:
+        buf = io.StringIO()
+        writer = csv.writer(buf)
+        for r in self.rows:
+            writer.writerow(r.cells)
+        return buf.getvalue()
+
+    def summary(self) -> dict:
+        return {
+            "valid": len(self.rows),
+            "repaired": sum(1 for r in self.rows if r.repaired),
+            "failed": len(self.failed),
+            "ignored": self.ignored,
+            "rerequested": self.rerequested,
+        }
+
+
+def normalize_card_type(card_type: str) -> str:
+    """界面上的卡片类型（Q&A / Cloze / 问答 / 填空）统一为 'qa' 或 'cloze'。"""
+    return "cloze" if str(card_type).strip().lower() in {"cloze", "填空"} else "qa"
+
+
+def _is_header(cells: List[str]) -> bool:
+    return all(c.strip().lower().strip("*#: ") in HEADER_WORDS for c in cells if c.strip())
+
+
+def check_cloze(text: str) -> str:
+    """返回填空文本的错误描述，合法时返回空字符串。"""
+    if text.count("{{") != text.count("}}"):
+        return "unbalanced cloze braces"
+    matches = CLOZE_RE.findall(text)
+    if not matches:
+        return "missing {{c1::...}} cloze deletion"
+    if any(not body.strip() for _, body in matches):
+        return "empty cloze deletion"
+    if any(int(n) < 1 for n, _ in matches):
+        return "cloze numbers start at c1"
+    if re.search(r"\{\{(?!c\d+::)", text):
+        return "malformed cloze marker"
+    return ""
+
+
+def validate_row(cells: List[str], card_type: str) -> str:
+    """按卡片类型校验一行，返回错误描述；合法时返回空字符串。"""
+    cells = [c.strip() for c in cells]
+    if normalize_card_type(card_type) == "cloze":
+        if not 1 <= len(cells) <= 2:
+            return f"expected 1-2 columns, got {len(cells)}"
+        return check_cloze(cells[0])
+    if not 2 <= len(cells) <= 3:
+        return f"expected 2-3 columns, got {len(cells)}"
+    if not cells[0] or not cells[1]:
+        return "empty question or answer"
+    return ""
+
+
+def repair_row(cells: List[str], card_type: str) -> Optional[List[str]]:
+    """
+    尝试本地修复常见格式错误，成功返回修复后的字段，否则返回 None：
+      - 填空：未加引号的逗号把正文拆成多列 -> 把含填空标记的最后一列之前的部分合并为正文
+      - 问答：多出的列 -> 以问号结尾的列作为问题边界，其余第二段为答案、剩余合并为补充
+      - 问答只有一列但含有“？/?” -> 在问号处拆成问题与答案
+    """
+    cells = [c.strip() for c in cells if c.strip()]
+    if not cells:
+        return None
+    if normalize_card_type(card_type) == "cloze":
+        last = max((i for i, c in enumerate(cells) if "{{" in c or "}}" in c), default=-1)
+        if last < 0:
+            return None
+        fixed = [", ".join(cells[:last + 1])]
+        if last + 1 < len(cells):
+            fixed.append(", ".join(cells[last + 1:]))
+    elif len(cells) > 3:
+        q_end = next((i for i, c in enumerate(cells[:-1]) if c.endswith(("?", "？"))), None)
+        if q_end is None:
+            return None
+        rest = cells[q_end + 1:]
+        fixed = [", ".join(cells[:q_end + 1]), rest[0]] + ([", ".join(rest[1:])] if len(rest) > 1 else [])
+    elif len(cells) == 1:
+        m = re.match(r"^(.+?[?？])\s*(.+)$", cells[0])
+        if not m:
+            return None
+        fixed = [m.group(1), m.group(2)]
+    else:
+        return None
+    return fixed if not validate_row(fixed, card_type) else None
+
+
+class CardStreamParser:
+    """
+    增量解析器：
+        parser = CardStreamParser("qa", on_row=print)
+        for delta in stream: parser.feed(delta)
+        result = parser.finish()
+    """
+
+    def __init__(self, card_type: str = "qa", on_row: Optional[Callable[[ParsedRow], None]] = None, repair: bool = True):
+        self.card_type = normalize_card_type(card_type)
+        self.on_row = on_row
+        self.repair = repair
+        self.result = CardParseResult()
+        self._buffer = ""
+        self._pending = ""  # 引号未闭合的跨行记录
+        self._line_no = 0
+
+    def feed(self, text: str) -> List[ParsedRow]:
+        """输入一段文本，返回本次新完成的合法行。"""
+        self._buffer += text
+        emitted = []
+        while "\n" in self._buffer:
+            line, self._buffer = self._buffer.split("\n", 1)
+            row = self._consume_line(line)
+            if row is not None:
+                emitted.append(row)
+        return emitted
+
+    def finish(self) -> CardParseResult:
+        """处理剩余缓冲区并返回完整结果。"""
+        if self._buffer:
+            self._consume_line(self._buffer)
+            self._buffer = ""
+        if self._pending:
+            record, self._pending = self._pending, ""
+            self._emit(record)
+        return self.result
+
+    def _consume_line(self, line: str) -> Optional[ParsedRow]:
+        self._line_no += 1
+        record = f"{self._pending}\n{line}" if self._pending else line
+        if record.count('"') % 2 == 1 and record.count("\n") < MAX_RECORD_LINES:
+            self._pending = record
+            return None
+        self._pending = ""
+        return self._emit(record)
+
+    def _emit(self, record: str) -> Optional[ParsedRow]:
+        if not record.strip() or FENCE_RE.match(record):
+            return None
+        try:
+            cells = next(csv.reader(io.StringIO(record), skipinitialspace=True), [])
+        except csv.Error:
+            cells = record.split(",")
+        cells = [c.strip() for c in cells]
+        while cells and not cells[-1]:
+            cells.pop()
+        if not cells or _is_header(cells):
+            self.result.ignored += 1
+            return None
+
+        error = validate_row(cells, self.card_type)
+        row = ParsedRow(self._line_no, record, cells, valid=not error, error=error)
+        if error and self.repair:
+            fixed = repair_row(cells, self.card_type)
+            if fixed:
+                row = ParsedRow(self._line_no, record, fixed, valid=True, repaired=True)
+        if row.valid:
+            self.result.rows.append(row)
+            if self.on_row:
+                self.on_row(row)
+            return row
+        self.result.failed.append(row)
+        return None
+
+
+def parse_cards(text: str, card_type: str = "qa", repair: bool = True) -> CardParseResult:
+    """一次性解析完整的 LLM 输出（内部仍走增量解析器）。"""
+    with metrics.timer("card_parse"):
+        parser = CardStreamParser(card_type, repair=repair)
+        parser.feed(text)
+        return parser.finish()
+
+
+def parse_card_stream(deltas: Iterable[str], card_type: str = "qa",
+                      on_row: Optional[Callable[[ParsedRow], None]] = None) -> CardParseResult:
+    """消费流式输出，每解析出一条合法行就回调 on_row。card_parse 阶段只计解析本身，不含等待流的时间。"""
+    parser = CardStreamParser(card_type, on_row=on_row)
+    spent = 0.0
+    for delta in deltas:
+        t0 = time.perf_counter()
+        parser.feed(delta)
+        spent += time.perf_counter() - t0
+    t0 = time.perf_counter()
+    result = parser.finish()
+    metrics.observe(metrics.STAGE_SECONDS, spent + time.perf_counter() - t0, stage="card_parse")
+    return result
+
+
+REPAIR_PROMPT = """The following flashcard rows are malformed. Rewrite ONLY these rows so that each one is a valid CSV line.
+Format: {format_hint}
+Quote any field that contains a comma with double quotes. Keep the original content; do not add new cards.
+Output only the corrected CSV lines, no header, no code fences.
+
+Malformed rows (with the problem found):
+{rows}
+"""
+
+
+def rerequest_failed_rows(result: CardParseResult, card_type: str, llm: Callable[[str], str]) -> CardParseResult:
+    """
+    把仍然失败的行交给 LLM 只修正这些行，修好的行合并进 result，返回同一个 result。
+
+    Args:
+        llm: 输入 prompt 返回文本的函数（如 lambda p: call_llm_with_prompt(p, call_class="card_generation")）
+    """
+    if not result.failed:
+        return result
+    format_hint = (
+        "cloze_text_with_{{c1::hidden}},extra_info" if normalize_card_type(card_type) == "cloze"
+        else "question,answer,extra_info"
+    )
+    rows = "\n".join(f"{r.raw.strip()}    <-- {r.error}" for r in result.failed)
+    fixed = parse_cards(llm(REPAIR_PROMPT.format(format_hint=format_hint, rows=rows)), card_type)
+    result.rerequested = len(result.failed)
+    for row in fixed.rows:
+        row.repaired = True
+    result.rows.extend(fixed.rows)
+    result.failed = fixed.failed
+    return result
@@ -0,0 +1,353 @@
+# clean_engine.py
+"""
+experimental/deep_clean.clean_text_pipeline 的单遍实现：同样的清洗规则，但不再对全文做十几遍
+replace / re.sub / split / join，也不逐行打调试日志。
+
+    engine = CleanEngine()
+    engine.clean(text)                       # 整篇文本，结果与 clean_text_pipeline(text) 相同
+    for line in engine.iter_clean(lines):    # 流式：输入按 '\\n' 切开的原始行（可以是文件对象/生成器）
+        ...
+    engine.clean_file("big.txt", "big.clean.txt", head_lines=2000, tail_lines=5000)
+    engine.clean_page(page_text)             # 单页清洗（process_documents 的 deep_clean 阶段，不含第 4、5 步）
+
+整条流水线是串起来的生成器，每行只经过一次：
+    1. str.translate 一次完成全部空白替换（全角/不换行/U+2002–U+200A/\\t\\v\\f/U+2028/U+2029 -> 空格，删除零宽空格）
+    2. 按换行数合并：单换行且上一行不以句末标点结尾 -> 空格；三个以上换行 -> 一个空行；
+       连字符断词跨空行拼回（word-\\n\\nword）
+    3. 行首尾去空白、合并连续空格
+    4. 删除开头的作者/单位信息（前言/目录，否则 Abstract/摘要/INTRODUCTION 之前的行）
+    5. 自底向上删除参考文献区块（逐行判断见 reference_lines，线性时间、每行有时间上限）
+    6. 去掉 [12] / (3) 角标、末行行尾的脚注数字、页码行与空行
+正则全部在模块加载时编译。第 4、5 步需要看到开头/结尾的若干行：clean() 不限制（与原管道完全一致），
+流式处理时可用 head_lines / tail_lines 只在前/后若干逻辑行内查找，内存只与窗口大小有关。
+"""
+import re
+from collections import deque
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional
+
+from reference_lines import ReferenceDetector, is_reference_line
+
+# 1. 空白字符表
+_SPACES = "\u3000\u00a0\t\v\f\u2028\u2029" + "".join(map(chr, range(0x2002, 0x200B)))
+WHITESPACE_TABLE = str.maketrans({**{c: " " for c in _SPACES}, "\u200b": None})
+ODD_WHITESPACE = re.compile("[" + re.escape(_SPACES) + "\u200b]")  # 大多数行不含这些字符，先查找再 translate
+SENTENCE_END = frozenset("。！？.!?")
+MULTI_SPACE = re.compile(r" {2,}")
+
+# 4、6. 与 deep_clean 相同的规则，预先编译（第 5 步的参考文献行判断见 reference_lines）
+INTRO_PREFACE = re.compile(r"^\s*前言\b|^\s*目\s*录\b")
+INTRO_ABSTRACT = re.compile(r"\bAbstract\b|\b摘要\b|\bINTRODUCTION\b", re.IGNORECASE)
+CITATION_BRACKET = re.compile(r"\[\d+\]")
+CITATION_PAREN = re.compile(r"\(\s*\d+\s*\)")
+PAREN_OPEN = re.compile(r"\(\s*(?:\d+\s*)?\Z")  # 行尾未闭合、可能跨行的 (3)
+PAGE_NUMBER_LINE = re.compile(r"\s*(?:Page\s*\d+|第\s*\d+\s*页|\d+)\s*")
+
+
+def _is_word(ch: str) -> bool:
+    """与正则 \\w 相同（Unicode 字母数字或下划线）。"""
+    return ch.isalnum() or ch == "_"
+
+
+def strip_trailing_number(text: str) -> str:
+    """
+    r'(?P<t>.+?)\\s+\\d{1,2}(?=[\\.,]?$)' 的线性实现：去掉全文末尾（或末尾换行之前）的“空白 + 1~2 位数字”，
+    保留其后的 . 或 ,。空白可以跨行，此时数字并入上一段内容。原正则对每个起点都向行尾试探，长行上是平方复杂度。
+    """
+    end = len(text) - 1 if text.endswith("\n") else len(text)
+    if end and text[end - 1] in ".,":
+        end -= 1
+    j = end
+    while j > 0 and text[j - 1].isdecimal():
+        j -= 1
+    if not 1 <= end - j <= 2:
+        return text
+    i = j
+    while i > 0 and text[i - 1].isspace():
+        i -= 1
+    if i == j:
+        return text
+    if i == 0:  # 空白前没有内容：.+? 只能取空白中第一个非换行字符
+        i = next((p + 1 for p in range(j - 1) if text[p] != "\n"), 0)
+        if not i:
+            return text
+    return text[:i] + text[end:]
+
+
+def find_intro_start(lines: List[str]) -> int:
+    """remove_authors_from_intro：返回正文起始行（前言/目录优先，其次 Abstract/摘要/INTRODUCTION），没有时为 0。"""
+    for idx, line in enumerate(lines):
+        if INTRO_PREFACE.match(line):
+            return idx
+    for idx, line in enumerate(lines):
+        if INTRO_ABSTRACT.search(line):
+            return idx
+    return 0
+
+
+def find_references_start(lines: List[str], min_ref_lines: int = 2, max_nonmatch_lines: int = 7,
+                          is_reference: Callable[[str], bool] = is_reference_line) -> int:
+    """remove_references_section 的自底向上扫描，返回参考文献区块的起始行（没有时为 len(lines)）。"""
+    n = len(lines)
+    matched = nonmatch = 0
+    boundary = n
+    for i in range(n - 1, -1, -1):
+        if is_reference(lines[i]):
+            matched += 1
+            nonmatch = 0
+            if matched >= min_ref_lines:
+                boundary = i
+        elif matched >= min_ref_lines:
+            nonmatch += 1
+            if nonmatch >= max_nonmatch_lines:
+                break
+    return boundary
+
+
+def _joined_lines(raw_lines: Iterable[str]) -> Iterator[str]:
+    """
+    空白替换 + 换行合并（unify_spaces 与 normalize_whitespace 的第 1–3 步），产出尚未 strip 的行，
+    "" 表示段落之间的空行。行内容用列表累积，长段落不会反复复制字符串。
+    """
+    parts: List[str] = []
+    last = ""        # 当前逻辑行的最后一个字符
+    newlines = 0     # 当前逻辑行之后累计的换行数
+    first = True
+    started = False
+    for raw in raw_lines:
+        if first:
+            first = False
+        else:
+            newlines += 1
+        t = raw.translate(WHITESPACE_TABLE) if ODD_WHITESPACE.search(raw) else raw
+        if not t:
+            continue
+        if not started:
+            started = True
+            if newlines == 1:
+                t = " " + t
+            elif newlines >= 2:
+                yield ""
+                yield ""
+        elif newlines == 1 and last not in SENTENCE_END:
+            parts.append(" ")
+            parts.append(t)
+            last = t[-1]
+            newlines = 0
+            continue
+        else:
+            yield "".join(parts)
+            if newlines >= 2:
+                yield ""
+        parts = [t]
+        last = t[-1]
+        newlines = 0
+    if not started:
+        yield from ("", "", "") if newlines >= 2 else ("",)
+        return
+    if newlines == 0:
+        yield "".join(parts)
+    elif newlines == 1:
+        if last in SENTENCE_END:
+            yield "".join(parts)
+            yield ""
+        else:
+            yield "".join(parts) + " "
+    else:
+        yield "".join(parts)
+        yield ""
+        yield ""
+
+
+def _hyphen_joined(lines: Iterable[str]) -> Iterator[str]:
+    """
+    r'(\\w+)-\\s*\\n\\s*(\\w+)' -> r'\\1\\2'：以“字-”结尾的行与隔着空白行的下一行拼接。
+    与 re.sub 一样不重叠匹配：被拼上的行若整段只是“单词-”，它自己的连字符不再参与下一次拼接。
+    """
+    held: Optional[str] = None   # 以“字-”结尾、等待下一行的行
+    gap: List[str] = []          # held 之后的空白行
+    for line in lines:
+        if held is not None:
+            if not line.strip():
+                gap.append(line)
+                continue
+            y = line.lstrip()
+            if _is_word(y[0]):
+                x = held.rstrip()[:-1]
+                line = x + y
+                word_end = 0
+                while word_end < len(y) and _is_word(y[word_end]):
+                    word_end += 1
+                blocked = y.rstrip() == y[:word_end] + "-"
+                held, gap = None, []
+                if not blocked and _ends_with_hyphen(line):
+                    held = line
+                else:
+                    yield line
+                continue
+            yield held
+            yield from gap
+            held, gap = None, []
+        if _ends_with_hyphen(line):
+            held = line
+        else:
+            yield line
+    if held is not None:
+        yield held
+        yield from gap
+
+
+def _ends_with_hyphen(line: str) -> bool:
+    x = line.rstrip()
+    return len(x) >= 2 and x[-1] == "-" and _is_word(x[-2])
+
+
+def normalized_lines(raw_lines: Iterable[str]) -> Iterator[str]:
+    """第 1–3 步：产出去掉首尾空白、合并了连续空格的逻辑行。"""
+    for line in _hyphen_joined(_joined_lines(raw_lines)):
+        line = line.strip()
+        yield MULTI_SPACE.sub(" ", line) if "  " in line else line
+
+
+def strip_citations(lines: Iterable[str]) -> Iterator[str]:
+    """
+    去掉 [12] / (3) 角标。r'\\(\\s*\\d+\\s*\\)' 中的空白可以跨行（“(” 在行尾、数字在后面的行），
+    这种少见情况把相关的几行拼起来再替换，其余行逐行处理。
+    """
+    group: List[str] = []
+    for line in lines:
+        if "[" in line:
+            line = CITATION_BRACKET.sub("", line)
+        if group:
+            group.append(line)
+            text = "\n".join(group)
+            if PAREN_OPEN.search(text):
+                continue
+            group = []
+            yield from CITATION_PAREN.sub("", text).split("\n")
+            continue
+        if "(" in line:
+            if PAREN_OPEN.search(line):
+                group = [line]
+                continue
+            line = CITATION_PAREN.sub("", line)
+        yield line
+    if group:
+        yield from CITATION_PAREN.sub("", "\n".join(group)).split("\n")
+
+
+def keep_line(line: str) -> bool:
+    """页码行与空行不保留。"""
+    return bool(line.strip()) and PAGE_NUMBER_LINE.fullmatch(line) is None
+
+
+class CleanEngine:
+    def __init__(self, min_ref_lines: int = 2, max_nonmatch_lines: int = 7, remove_intro: bool = True,
+                 remove_references: bool = True, reference_time_limit: Optional[float] = 0.01):
+        """reference_time_limit: 判断一行是否为参考文献的时间上限（秒），超时按非参考文献处理，None 表示不限。"""
+        self.min_ref_lines = min_ref_lines
+        self.max_nonmatch_lines = max_nonmatch_lines
+        self.remove_intro = remove_intro
+        self.remove_references = remove_references
+        self.reference_time_limit = reference_time_limit
+        self.stats: Dict[str, Any] = {}
+
+    # —— 整篇 / 流式 ——
+    def clean(self, text: str) -> str:
+        return "\n".join(self.iter_clean(text.split("\n")))
+
+    def iter_clean(self, raw_lines: Iterable[str], head_lines: Optional[int] = None,
+                   tail_lines: Optional[int] = None) -> Iterator[str]:
+        """
+        逐行产出清洗结果（各行之间用 '\\n' 连接即为 clean() 的结果）。
+        head_lines / tail_lines：只在前/后这么多逻辑行内查找作者信息与参考文献，None 表示不限制。
+        """
+        self.stats = {"lines_in": 0, "intro_lines": 0, "reference_lines": 0, "reference_timeouts": 0, "lines_out": 0}
+        lines = normalized_lines(self._count(raw_lines))
+        if self.remove_intro:
+            lines = self._cut_intro(lines, head_lines)
+        if self.remove_references:
+            lines = self._cut_references(lines, tail_lines)
+        for line in self._finish(lines):
+            self.stats["lines_out"] += 1
+            yield line
+
+    def clean_file(self, src: str, dst: str, head_lines: Optional[int] = 2000,
+                   tail_lines: Optional[int] = 5000) -> Dict[str, Any]:
+        """流式清洗一个文本文件并写出，返回统计。"""
+        with open(src, "r", encoding="utf-8", newline="") as fin, \
+                open(dst, "w", encoding="utf-8", newline="") as fout:
+            raw = (line[:-1] if line.endswith("\n") else line for line in fin)
+            for i, line in enumerate(self.iter_clean(raw, head_lines, tail_lines)):
+                fout.write(("\n" if i else "") + line)
+        return dict(self.stats)
+
+    def _count(self, raw_lines: Iterable[str]) -> Iterator[str]:
+        for line in raw_lines:
+            self.stats["lines_in"] += 1
+            yield line
+
+    def _cut_intro(self, lines: Iterator[str], head_lines: Optional[int]) -> Iterator[str]:
+        head: List[str] = []
+        for line in lines:
+            head.append(line)
+            if head_lines and len(head) >= head_lines:
+                break
+        start = find_intro_start(head)
+        self.stats["intro_lines"] = start
+        yield from head[start:]
+        yield from lines
+
+    def _cut_references(self, lines: Iterator[str], tail_lines: Optional[int]) -> Iterator[str]:
+        tail: deque = deque()
+        for line in lines:
+            tail.append(line)
+            if tail_lines and len(tail) > tail_lines:
+                yield tail.popleft()
+        tail = list(tail)
+        detector = ReferenceDetector(self.reference_time_limit)
+        start = find_references_start(tail, self.min_ref_lines, self.max_nonmatch_lines, detector)
+        self.stats["reference_lines"] = len(tail) - start
+        self.stats["reference_timeouts"] = detector.stats["timeouts"]
+        yield from tail[:start]
+
+    def _finish(self, lines: Iterator[str]) -> Iterator[str]:
+        """
+        角标、页码行、空行与整体首尾空白。末尾脚注数字的规则可以跨行，因此从倒数第二个有内容的行起暂存，
+        最后统一处理；更早的行逐行过滤后直接产出。
+        """
+        buf: List[str] = []
+        last = -1        # buf 中最后一个有内容的行
+        held: Optional[str] = None
+        for line in strip_citations(lines):
+            if line.strip():
+                if last > 0:
+                    for old in buf[:last]:
+                        if keep_line(old):
+                            if held is not None:
+                                yield held
+                            held = old if held is not None else old.lstrip()
+                    buf = buf[last:]
+                last = len(buf)
+            buf.append(line)
+        for line in strip_trailing_number("\n".join(buf)).split("\n") if buf else ():
+            if keep_line(line):
+                if held is not None:
+                    yield held
+                held = line if held is not None else line.lstrip()
+        if held is not None:
+            yield held.rstrip()
+
+    # —— 单页（process_documents 的可选阶段）——
+    def clean_page(self, text: str) -> str:
+        """
+        单页清洗：空白/换行/连字符、角标与页码行，段落之间保留一个空行（供“按段落”分块）。
+        作者信息与参考文献需要整篇文档判断（参考文献行规则中的 “Xxx ... . Y” 也会匹配普通英文句子），
+        末行脚注数字规则也只针对全文末尾，单页都不做。
+        """
+        out: List[str] = []
+        for line in strip_citations(normalized_lines(text.split("\n"))):
+            if keep_line(line):
+                out.append(line)
+            elif not line.strip() and out and out[-1]:
+                out.append("")
+        return "\n".join(out).strip()
@@ -0,0 +1,181 @@
+# cli.py
+"""
+命令行入口，不需要浏览器即可跑完整流程（适合 cron / 调度器）：
+
+    python cli.py ingest    --project demo [--files a.pdf b.pdf] [--method 按段落] [--force] [--deep-clean]
+    python cli.py embed     --project demo [--no-resume]
+    python cli.py search    --project demo "query" [--top-k 10] [--rewrite]
+    python cli.py summarize --project demo "query" [--template-file t.txt] [--model gpt-4o-mini]
+    python cli.py cards     --project demo "query" [--card-type cloze] [--deck "My Deck"]
+
+--project 可以是目录路径，也可以是 src/projects 下的项目名；--profile 开启性能剖析（见 profiling.py）。
+结果以一个 JSON 对象写到 stdout（--pretty 缩进），运行日志写到 stderr。
+
+退出码：
+    0  成功
+    1  运行错误（LLM / 网络 / 文件错误等）
+    2  参数错误
+    3  部分完成（有文件或分块失败、尚未完成，重跑即可从断点继续）
+    4  没有结果（检索不到相关分块、摘要为空、卡片全部重复）
+"""
+import argparse
+import contextlib
+import json
+import os
+import sys
+import traceback
+
+import profiling
+
+EXIT_OK = 0
+EXIT_ERROR = 1
+EXIT_USAGE = 2
+EXIT_PARTIAL = 3
+EXIT_EMPTY = 4
+
+PROJECTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "projects")
+CHUNKING_METHODS = ["按句子", "按段落", "按页", "固定长度"]
+
+
+def resolve_project(project: str) -> str:
+    """目录存在则直接使用，否则视为 src/projects 下的项目名。"""
+    if os.path.isdir(project):
+        return project
+    return os.path.join(PROJECTS_DIR, project)
+
+
+def cmd_ingest(args) -> tuple:
+    from pipeline import ingest
+
+    result = ingest(args.project, files=args.files, chunking_method=args.method, chunk_size=args.chunk_size,
+                    chunk_overlap=args.chunk_overlap, force=args.force, max_rss_mb=args.max_rss_mb,
+                    trace_memory=args.trace_memory or None, dedup_threshold=args.dedup_threshold,
+                    deep_clean=args.deep_clean or None)
+    return result, EXIT_PARTIAL if result["failed"] else EXIT_OK
+
+
+def cmd_embed(args) -> tuple:
+    from pipeline import embed
+
+    result = embed(args.project, only_files=args.only, resume=not args.no_resume)
+    return result, EXIT_PARTIAL if result["failed"] or result["remaining"] else EXIT_OK
+
+
+def cmd_search(args) -> tuple:
+    from pipeline import search
+
+    results = search(args.project, args.query, args.top_k, relevance_threshold=args.threshold, rewrite=args.rewrite)
+    return {"query": args.query, "results": results}, EXIT_OK if results else EXIT_EMPTY
+
+
+def cmd_summarize(args) -> tuple:
+    from pipeline import summarize
+
+    template = None
+    if args.template_file:
+        with open(args.template_file, "r", encoding="utf-8") as f:
+            template = f.read()
+    result = summarize(args.project, args.query, args.top_k, template=template, model=args.model,
+                       max_tokens=args.max_tokens, temperature=args.temperature, lang=args.lang,
+                       rewrite=args.rewrite)
+    if not result["sources"]:
+        return result, EXIT_EMPTY
+    return result, EXIT_OK if result["summary"] else EXIT_ERROR
+
+
+def cmd_cards(args) -> tuple:
+    from pipeline import cards
+
+    try:
+        result = cards(args.project, args.query, card_type=args.card_type, difficulty=args.difficulty,
+                       detail_level=args.detail_level, num_cards=args.num_cards, top_k=args.top_k, lang=args.lang,
+                       rewrite=args.rewrite, deck_name=args.deck, csv=not args.no_csv,
+                       skip_known=not args.keep_known)
+    except ValueError as e:  # 检索不到相关文本
+        return {"query": args.query, "error": str(e)}, EXIT_EMPTY
+    if not result["csv_path"] and not (result["apkg"] and result["apkg"].get("path")):
+        return result, EXIT_EMPTY
+    return result, EXIT_PARTIAL if result["failed_rows"] else EXIT_OK
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    common = argparse.ArgumentParser(add_help=False)
+    common.add_argument("--project", required=True, help="项目目录或 src/projects 下的项目名")
+    common.add_argument("--pretty", action="store_true", help="缩进输出 JSON")
+    common.add_argument("--profile", action="store_true",
+                        help="性能剖析：在项目的 profiles 目录写出 .prof 与 .collapsed（同 RAG_PROFILE=1）")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p = sub.add_parser("ingest", parents=[common], help="复制文件到项目并分块")
+    p.add_argument("--files", nargs="*", default=[], help="要加入项目的文件；省略时只处理 raw_pdfs 中已有的文件")
+    p.add_argument("--method", choices=CHUNKING_METHODS, default="按句子")
+    p.add_argument("--chunk-size", type=int, default=400)
+    p.add_argument("--chunk-overlap", type=int, default=50)
+    p.add_argument("--force", action="store_true", help="清空旧分块并重新处理全部文件")
+    p.add_argument("--max-rss-mb", type=float, help="进程内存软上限（MiB），超过的文件记为失败（默认 RAG_INGEST_MAX_RSS_MB）")
+    p.add_argument("--trace-memory", action="store_true", help="用 tracemalloc 报告每个文件的内存峰值")
+    p.add_argument("--dedup-threshold", type=float,
+                   help="近似重复检测的相似度阈值，0 表示关闭（默认 RAG_DEDUP_THRESHOLD 或 0.9）")
+    p.add_argument("--deep-clean", action="store_true",
+                   help="PDF/文本/Word 页做深度清洗（见 clean_engine，默认 RAG_DEEP_CLEAN）")
+    p.set_defaults(func=cmd_ingest)
+
+    p = sub.add_parser("embed", parents=[common], help="向量化分块（默认从检查点继续）")
+    p.add_argument("--only", nargs="*", help="只处理这些源文件（如 paper.pdf）")
+    p.add_argument("--no-resume", action="store_true", help="忽略检查点，全部重新向量化")
+    p.set_defaults(func=cmd_embed)
+
+    query_common = argparse.ArgumentParser(add_help=False)
+    query_common.add_argument("query")
+    query_common.add_argument("--top-k", type=int, default=10)
+    query_common.add_argument("--rewrite", action="store_true", help="先用 LLM 改写查询并与原始查询结果融合")
+
+    p = sub.add_parser("search", parents=[common, query_common], help="向量检索")
+    p.add_argument("--threshold", type=float, default=None, help="最大距离，超过的结果丢弃")
+    p.set_defaults(func=cmd_search)
+
+    p = sub.add_parser("summarize", parents=[common, query_common], help="检索并生成综述/回答")
+    p.add_argument("--template-file", help="自定义提示词模板（含 {context} / {query} 占位符）")
+    p.add_argument("--model", default="gpt-4o-mini")
+    p.add_argument("--max-tokens", type=int, default=3000)
+    p.add_argument("--temperature", type=float, default=0.8)
+    p.add_argument("--lang", choices=["中文", "English"], default="English")
+    p.set_defaults(func=cmd_summarize)
+
+    p = sub.add_parser("cards", parents=[common, query_common], help="检索并生成 Anki 卡片")
+    p.add_argument("--card-type", choices=["qa", "cloze"], default="qa")
+    p.add_argument("--difficulty", default="intermediate")
+    p.add_argument("--detail-level", default="moderate")
+    p.add_argument("--num-cards", type=int, default=5)
+    p.add_argument("--lang", choices=["中文", "en"], default="en")
+    p.add_argument("--deck", help="同时导出到该卡组的 .apkg")
+    p.add_argument("--no-csv", action="store_true", help="不写 CSV")
+    p.add_argument("--keep-known", action="store_true", help="不跳过项目中已有的重复卡片")
+    p.set_defaults(func=cmd_cards)
+    return parser
+
+
+def main(argv=None) -> int:
+    args = build_parser().parse_args(argv)  # 参数错误时 argparse 以退出码 2 结束
+    args.project = resolve_project(args.project)
+    if args.profile:
+        profiling.set_enabled(True)
+    if args.command != "ingest" and not os.path.isdir(args.project):
+        print(f"[CLI] Project not found: {args.project}", file=sys.stderr)
+        return EXIT_USAGE
+    try:
+        # 各模块的 print 日志转到 stderr，stdout 只留给 JSON 结果
+        with contextlib.redirect_stdout(sys.stderr):
+            result, code = args.func(args)
+    except Exception as e:
+        traceback.print_exc(file=sys.stderr)
+        result, code = {"error": f"{type(e).__name__}: {e}"}, EXIT_ERROR
+    json.dump({"command": args.command, "exit_code": code, **result}, sys.stdout, ensure_ascii=False,
+              indent=2 if args.pretty else None, default=str)
+    sys.stdout.write("\n")
+    return code
+
+
+if __name__ == "__main__":
+    sys.exit(main())
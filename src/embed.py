@@ -1,35 +1,116 @@
 # embed.py
 import os
 import json
+import hashlib
+import time
+from datetime import datetime
 from pathlib import Path
 
-import openai
+import metrics
+from profiling import profiled
+from embed_checkpoint import EmbedCheckpoint
+from llm_client import LLMCallError, call_with_limits
+from preprocess import content_hash
+from project_stats import file_for_chunk_file, load_stats, update_stats
 
-# OpenAI 配置（保持不变）
-openai.api_key = os.getenv("OPENAI_API_KEY")
-client = openai.OpenAI(api_key=openai.api_key, base_url="https://xiaoai.plus/v1")
+# OpenAI 配置：客户端在第一次请求时创建，import 阶段不加载 openai
 embed_model = "text-embedding-3-large"
+EMBED_PROVIDER = "openai"
+WRITE_BATCH = 256  # 每批写入 Chroma 的分块数，批次之间汇报进度
 
-def create_or_update_embeddings(chunks_folder, persist_directory, only_files=None):
+
+def _selected(chunk_file, only_files):
+    """only_files 可以是源文件名（paper.pdf）、stem（paper）或分块文件名。"""
+    if only_files is None:
+        return True
+    name = chunk_file[:-len("_chunks.json")]
+    return bool({chunk_file, name, os.path.splitext(name)[0]} & only_files)
+
+
+def chunk_hashes(chunk):
+    """分块的 (content_hash, 元数据哈希)；旧分块文件没有 content_hash 时现算。"""
+    meta = json.dumps(chunk.get("metadata", {}), ensure_ascii=False, sort_keys=True, default=str)
+    return (chunk.get("content_hash") or content_hash(chunk["chunk_text"]),
+            hashlib.sha1(meta.encode("utf-8")).hexdigest()[:16])
+
+
+class OpenAIEmbeddingFunction:
+    """
+    兼容 LangChain Embeddings 接口（embed_documents / embed_query）的向量函数，
+    可直接传给 Chroma。每个批次的请求都经过 llm_client 的限流、重试与熔断。
+    """
+
+    def __init__(self, model=embed_model, api_key=None, base_url=None, batch_size=64):
+        self.model = model
+        self.batch_size = batch_size
+        self.api_key = api_key
+        self.base_url = base_url
+        self._client = None
+
+    @property
+    def client(self):
+        # 延迟创建客户端；base_url 为 None 时沿用 openai 默认（与原 OpenAIEmbeddings 行为一致）
+        if self._client is None:
+            import openai
+            self._client = openai.OpenAI(
+                api_key=self.api_key or os.getenv("OPENAI_API_KEY"),
+                base_url=self.base_url or os.getenv("OPENAI_API_BASE"),
+            )
+        return self._client
+
+    def _embed_batch(self, batch):
+        with metrics.timer("embed"):
+            response = call_with_limits(EMBED_PROVIDER, lambda timeout: self.client.embeddings.create(
+                input=batch,
+                model=self.model,
+                timeout=timeout
+            ))
+        return [d.embedding for d in sorted(response.data, key=lambda d: d.index)]
+
+    def embed_documents(self, texts):
+        vectors = []
+        for start in range(0, len(texts), self.batch_size):
+            vectors.extend(self._embed_batch(list(texts[start:start + self.batch_size])))
+        return vectors
+
+    def embed_query(self, text):
+        return self._embed_batch([text])[0]
+
+
+# 项目目录 = chunks_folder 的上两级（<project>/processed/chunks）
+@profiled("embed", lambda a: os.path.dirname(os.path.dirname(os.path.normpath(a["chunks_folder"]))))
+def create_or_update_embeddings(chunks_folder, persist_directory, only_files=None, progress_cb=None,
+                                resume=True, max_failed_batches=3):
     """
-    增量向量化并写入Chroma。
+    增量向量化并写入Chroma，每批写入后提交检查点（见 embed_checkpoint），中断后重跑从上次提交处继续。
     - chunks_folder: 所有分块json所在目录
     - persist_directory: Chroma数据库保存路径
-    - only_files: 若指定，仅处理这些stem对应的文件（无后缀）
+    - only_files: 若指定，仅处理这些源文件（文件名、无后缀的 stem 或分块文件名均可）
+    - progress_cb: 每写入一批回调 progress_cb(已完成分块数, 分块总数)；回调抛出的异常会中止本次向量化
+    - resume: False 时丢弃检查点，全部重新向量化
+    - max_failed_batches: 连续失败这么多批后停止（如断网），剩余分块留给下次运行
+    只有新增或内容变化（content_hash 不同）的分块会重新向量化；只有元数据变化的分块原地更新元数据；
+    内容与某个已提交分块相同的新 ID（文件改名、迁移到新 ID 格式）直接复制已有向量；
+    重新分块后消失的分块、以及分块文件已删除的分块从向量库删除。
+    标记了 duplicate_of 的近似重复分块不向量化（已有的向量会被删除）。
+    返回汇总 {"total", "completed", "embedded", "skipped", "reused", "near_duplicates", "updated", "deleted",
+              "failed", "remaining", "errors"}
     """
-    # 修正为 langchain_community
-    from langchain_community.embeddings import OpenAIEmbeddings
     from langchain.vectorstores import Chroma
 
+    started = datetime.now().isoformat()
+    t0 = time.perf_counter()
+    processed_dir = os.path.dirname(os.path.normpath(chunks_folder))
     # 收集所有 chunk
-    chunk_files = [
-        fn for fn in os.listdir(chunks_folder)
-        if fn.endswith("_chunks.json") and (only_files is None or os.path.splitext(fn)[0] in only_files)
-    ]
+    only_files = set(only_files) if only_files is not None else None
+    chunk_files = [fn for fn in os.listdir(chunks_folder) if fn.endswith("_chunks.json") and _selected(fn, only_files)]
     all_chunks = []
+    chunk_file_of = {}
     for fn in chunk_files:
         with open(os.path.join(chunks_folder, fn), "r", encoding="utf-8") as f:
-            all_chunks.extend(json.load(f))
+            for chunk in json.load(f):
+                chunk_file_of[chunk.get("chunk_id", "")] = fn
+                all_chunks.append(chunk)
 
     # 检查并去重 chunk_id
     seen_ids = set()
@@ -46,35 +127,184 @@ def create_or_update_embeddings(chunks_folder, persist_directory, only_files=Non
     if duplicate_ids:
         print(f"[Embed] Skipped duplicate chunk_ids: {', '.join(duplicate_ids)}")
 
-    embeddings = OpenAIEmbeddings(model=embed_model)
+    checkpoint = EmbedCheckpoint(processed_dir)
+    if not resume:
+        checkpoint.reset()
+
+    # 近似重复的分块（见 near_dup）不单独向量化，检索时由其 canonical 分块代表；
+    # canonical 已不存在（所在文件被重新分块或删除）时照常向量化
+    known_ids = set(chunk_file_of).union(*checkpoint.committed.values())
+    near_dups = {c["chunk_id"] for c in unique_chunks
+                 if c.get("duplicate_of") and c["duplicate_of"] in known_ids and c["duplicate_of"] != c["chunk_id"]}
+    if near_dups:
+        unique_chunks = [c for c in unique_chunks if c["chunk_id"] not in near_dups]
+        print(f"[Embed] Skipping {len(near_dups)} near-duplicate chunks linked to a canonical chunk")
+
+    # 跳过检查点中内容未变的分块；只有元数据变化的分块只更新元数据
+    hashes = {c["chunk_id"]: chunk_hashes(c) for c in unique_chunks}
+    pending, meta_only, legacy = [], [], []
+    for c in unique_chunks:
+        state = checkpoint.status(chunk_file_of[c["chunk_id"]], c["chunk_id"], hashes[c["chunk_id"]])
+        {"pending": pending, "metadata": meta_only, "legacy": legacy}.get(state, []).append(c)
+    skipped = len(unique_chunks) - len(pending)
+    if skipped:
+        print(f"[Embed] Resuming from checkpoint: {skipped} chunks already embedded, {len(pending)} to go")
+    if legacy:
+        # 旧格式检查点：补记哈希，之后重新分块也能按内容判断
+        checkpoint.commit([c["chunk_id"] for c in legacy], chunk_file_of, hashes)
+
+    embeddings = OpenAIEmbeddingFunction(model=embed_model)
     db = Chroma(
         persist_directory=persist_directory,
         embedding_function=embeddings,
         collection_name="literature_chunks"
     )
 
-    # 批量 upsert
-    texts = [c["chunk_text"] for c in unique_chunks]
-    metadatas = [c["metadata"] for c in unique_chunks]
-    ids = [c["chunk_id"] for c in unique_chunks]
-    if texts:
-        db.add_texts(texts, metadatas=metadatas, ids=ids)
+    # 内容已向量化过、只是 ID 变了的分块：从向量库复制向量，不调用 API（须在删除旧 ID 之前）
+    by_content = checkpoint.ids_by_content()
+    copyable = [c for c in pending if hashes[c["chunk_id"]][0] in by_content]
+    reused_ids = set()
+    for start in range(0, len(copyable), WRITE_BATCH):
+        batch = copyable[start:start + WRITE_BATCH]
+        sources = [by_content[hashes[c["chunk_id"]][0]] for c in batch]
+        got = db._collection.get(ids=sorted(set(sources)), include=["embeddings"])
+        vectors = dict(zip(got["ids"], got["embeddings"]))
+        batch = [(c, vectors[src]) for c, src in zip(batch, sources) if src in vectors]
+        if not batch:
+            continue
+        ids = [c["chunk_id"] for c, _ in batch]
+        with metrics.timer("upsert"):
+            db._collection.upsert(ids=ids, embeddings=[list(v) for _, v in batch],
+                                  metadatas=[c["metadata"] for c, _ in batch],
+                                  documents=[c["chunk_text"] for c, _ in batch])
+        checkpoint.commit(ids, chunk_file_of, hashes)
+        reused_ids.update(ids)
+    if reused_ids:
+        pending = [c for c in pending if c["chunk_id"] not in reused_ids]
+        skipped += len(reused_ids)
+        print(f"[Embed] Reused {len(reused_ids)} existing vectors for chunks whose ID changed")
+
+    # 从检查点中去掉不再存在的分块；不属于任何当前分块文件的 ID 同时从向量库删除。
+    # 只处理部分文件时不检查其它分块文件（包括已删除的分块文件）
+    current_ids = {}
+    for cid, fn in chunk_file_of.items():
+        if cid not in near_dups:
+            current_ids.setdefault(fn, set()).add(cid)
+    scope = chunk_files if only_files is not None else list(checkpoint.committed)
+    deleted = 0
+    for fn in scope:
+        gone = sorted(set(checkpoint.committed.get(fn, ())) - current_ids.get(fn, set()))
+        if not gone:
+            continue
+        stale = [cid for cid in gone if cid not in chunk_file_of or cid in near_dups]
+        if stale:
+            with metrics.timer("delete"):
+                db.delete(ids=stale)
+            deleted += len(stale)
+        checkpoint.remove(fn, gone)
+    if deleted:
+        print(f"[Embed] Deleted {deleted} stale chunks from the vector store")
+
+    updated = 0
+    for start in range(0, len(meta_only), WRITE_BATCH):
+        batch = meta_only[start:start + WRITE_BATCH]
+        ids = [c["chunk_id"] for c in batch]
+        with metrics.timer("update_metadata"):
+            db._collection.update(ids=ids, metadatas=[c["metadata"] for c in batch])
+        checkpoint.commit(ids, chunk_file_of, hashes)
+        updated += len(batch)
+    if updated:
+        print(f"[Embed] Updated metadata of {updated} unchanged chunks without re-embedding")
+
+    # 批量 upsert，每批成功后提交检查点
+    embedded, failed, attempted, consecutive_failures = 0, 0, 0, 0
+    errors = []
+    for start in range(0, len(pending), WRITE_BATCH):
+        batch = pending[start:start + WRITE_BATCH]
+        ids = [c["chunk_id"] for c in batch]
+        attempted += len(batch)
+        try:
+            # upsert 包含该批的 embedding 请求（单独记在 embed 阶段）与 Chroma 写入
+            with metrics.timer("upsert"):
+                db.add_texts([c["chunk_text"] for c in batch], metadatas=[c["metadata"] for c in batch], ids=ids)
+        except LLMCallError as e:
+            checkpoint.fail(ids, chunk_file_of, str(e))
+            failed += len(batch)
+            errors.append(str(e))
+            consecutive_failures += 1
+            print(f"[Embed] Batch of {len(batch)} chunks failed: {e}")
+            if consecutive_failures >= max_failed_batches:
+                print(f"[Embed] {consecutive_failures} consecutive batches failed, stopping; rerun to continue")
+                break
+            continue
+        checkpoint.commit(ids, chunk_file_of, hashes)
+        metrics.inc("rag_chunks_total", len(batch), stage="embedded")
+        embedded += len(batch)
+        consecutive_failures = 0
+        if progress_cb:
+            progress_cb(skipped + embedded, len(unique_chunks))
     # ...existing code...
     print(f"[Chroma] Persisted to {persist_directory}")
 
+    remaining = len(pending) - attempted
+    completed = skipped + embedded
+    if not failed and not remaining:
+        checkpoint.compact()
+    summary = {
+        "total": len(unique_chunks),
+        "completed": completed,
+        "embedded": embedded,
+        "skipped": skipped,
+        "reused": len(reused_ids),
+        "near_duplicates": len(near_dups),
+        "updated": updated,
+        "deleted": deleted,
+        "failed": failed,
+        "remaining": remaining,
+        "errors": errors[-3:],
+    }
+    print(f"[Embed] Summary: {summary}")
+
+    # 更新项目统计：每个文件的已嵌入分块数、向量总数（count()，不拉取 ID）与本次耗时
+    stats = load_stats(processed_dir) or {}
+    now = datetime.now().isoformat()
+    duration = time.perf_counter() - t0
+    update_stats(
+        processed_dir,
+        files={file_for_chunk_file(stats, fn): {"chunk_file": fn, "n_embedded": len(checkpoint.committed.get(fn, ())),
+                                                "last_embedded": now}
+               for fn in chunk_files},
+        n_embedded=db._collection.count(),
+        run={
+            "stage": "embed",
+            "started": started,
+            "duration": round(duration, 2),
+            "n_files": len(chunk_files),
+            "n_chunks": embedded,
+            "chunks_per_sec": round(embedded / duration, 1) if duration > 0 else None,
+            "failed": failed,
+            "remaining": remaining,
+        },
+    )
+    metrics.flush()
+    return summary
+
 def generate_embedding(text, model=embed_model, api_key=None, base_url=None):
     """
     用 OpenAI API 生成一个文本的 embedding。
     返回 embedding 向量（list of float）或 None。
+    base_url 未指定时依次使用 OPENAI_API_BASE 与默认中转地址（可指向 openai_standin 离线运行）。
     """
     _api_key = api_key or os.getenv("OPENAI_API_KEY")
-    _base_url = base_url or "https://xiaoai.plus/v1"
+    _base_url = base_url or os.getenv("OPENAI_API_BASE", "https://xiaoai.plus/v1")
     try:
+        import openai
         _client = openai.OpenAI(api_key=_api_key, base_url=_base_url)
-        response = _client.embeddings.create(
+        response = call_with_limits(EMBED_PROVIDER, lambda timeout: _client.embeddings.create(
             input=text,
-            model=model
-        )
+            model=model,
+            timeout=timeout
+        ))
         return response.data[0].embedding
     except Exception as e:
         print(f"[generate_embedding] Error: {e}")
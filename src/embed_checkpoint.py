@@ -0,0 +1,166 @@
+# embed_checkpoint.py
+"""
+向量化检查点：每成功写入 Chroma 一批分块，就向 processed/embed_checkpoint.jsonl 追加一行记录，
+中断（断网、429 风暴、进程重启）后重跑时跳过已提交的分块，不重复付费。
+
+每行记录形如：
+    {"file": "paper.pdf_chunks.json", "version": "...", "ids": [...], "hashes": [...], "meta": [...]}  # 已提交
+    {"file": "paper.pdf_chunks.json", "version": "...", "removed": [...]}                           # 已从向量库删除
+    {"file": "paper.pdf_chunks.json", "version": "<md5>:<last_processed>", "failed": [...], "error": "..."}  # 本批失败
+
+hashes / meta 与 ids 一一对应，分别是分块文本的 content_hash 与元数据的哈希：文件重新分块后，
+内容没变的分块仍视为已提交，只有元数据变化的分块只需更新元数据，不必重新向量化。
+没有 hashes 的旧格式记录按 version（manifest 中该文件的 hash 与 last_processed）判断，
+文件变化或被重新分块后自动失效。每次完整运行结束后检查点会被压缩为每个文件一行。
+"""
+import json
+import os
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from project_stats import manifest_chunk_file
+
+CHECKPOINT_FILE = "embed_checkpoint.jsonl"
+
+# 分块的 (content_hash, 元数据哈希)；旧格式记录中为 None
+ChunkHashes = Optional[Tuple[str, str]]
+
+
+def manifest_versions(processed_dir: str) -> Dict[str, str]:
+    """分块文件名 -> 版本号（来自 manifest 的 hash 与 last_processed）。"""
+    path = os.path.join(processed_dir, "manifest.json")
+    if not os.path.exists(path):
+        return {}
+    with open(path, "r", encoding="utf-8") as f:
+        manifest = json.load(f)
+    return {manifest_chunk_file(name, m): f"{m.get('hash', '')}:{m.get('last_processed', '')}"
+            for name, m in manifest.items()}
+
+
+class EmbedCheckpoint:
+    def __init__(self, processed_dir: str, versions: Optional[Dict[str, str]] = None):
+        self.path = os.path.join(processed_dir, CHECKPOINT_FILE)
+        self.versions = versions if versions is not None else manifest_versions(processed_dir)
+        # 分块文件名 -> {chunk_id: (content_hash, 元数据哈希)}
+        self.committed: Dict[str, Dict[str, ChunkHashes]] = {}
+        self.failed: Dict[str, str] = {}
+        self._load()
+
+    def version(self, chunk_file: str) -> str:
+        return self.versions.get(chunk_file, "")
+
+    def _load(self) -> None:
+        if not os.path.exists(self.path):
+            return
+        with open(self.path, "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    rec = json.loads(line)
+                except ValueError:
+                    continue  # 写到一半被中断的最后一行
+                fn = rec.get("file", "")
+                hashes = rec.get("hashes")
+                if hashes is None and "removed" not in rec and rec.get("version") != self.version(fn):
+                    continue
+                done = self.committed.setdefault(fn, {})
+                metas = rec.get("meta") or [""] * len(rec.get("ids", []))
+                for i, cid in enumerate(rec.get("ids", [])):
+                    done[cid] = (hashes[i], metas[i]) if hashes else None
+                    self.failed.pop(cid, None)
+                for cid in rec.get("removed", []):
+                    done.pop(cid, None)
+                for cid in rec.get("failed", []):
+                    if cid not in done:
+                        self.failed[cid] = rec.get("error", "")
+
+    def is_committed(self, chunk_file: str, chunk_id: str) -> bool:
+        return chunk_id in self.committed.get(chunk_file, ())
+
+    def status(self, chunk_file: str, chunk_id: str, hashes: Tuple[str, str]) -> str:
+        """
+        分块相对检查点的状态：
+        "pending" 未提交或内容已变，需要向量化；"metadata" 内容未变、只需更新元数据；
+        "done" 已提交且未变；"legacy" 旧格式记录（按文件版本判断为已提交，但没有哈希）。
+        """
+        done = self.committed.get(chunk_file, {})
+        if chunk_id not in done:
+            return "pending"
+        stored = done[chunk_id]
+        if stored is None:
+            return "legacy"
+        if stored[0] != hashes[0]:
+            return "pending"
+        return "done" if stored[1] == hashes[1] else "metadata"
+
+    def ids_by_content(self) -> Dict[str, str]:
+        """content_hash -> 一个已提交的 chunk_id：改名或重新分块后 ID 变了的分块可直接复用已有向量。"""
+        return {h[0]: cid for done in self.committed.values() for cid, h in done.items() if h}
+
+    def _append(self, records: Iterable[dict]) -> None:
+        with open(self.path, "a", encoding="utf-8") as f:
+            for rec in records:
+                f.write(json.dumps(rec, ensure_ascii=False) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+
+    def _by_file(self, ids: List[str], file_of: Dict[str, str]) -> Dict[str, List[str]]:
+        grouped: Dict[str, List[str]] = {}
+        for cid in ids:
+            grouped.setdefault(file_of[cid], []).append(cid)
+        return grouped
+
+    def _record(self, fn: str, ids: List[str], hashes: Dict[str, ChunkHashes]) -> dict:
+        rec = {"file": fn, "version": self.version(fn), "ids": ids}
+        if all(hashes.get(cid) for cid in ids):
+            rec["hashes"] = [hashes[cid][0] for cid in ids]
+            rec["meta"] = [hashes[cid][1] for cid in ids]
+        return rec
+
+    def commit(self, ids: List[str], file_of: Dict[str, str],
+               hashes: Optional[Dict[str, Tuple[str, str]]] = None) -> None:
+        """记录一批已经写入向量库的分块；hashes 为 chunk_id -> (content_hash, 元数据哈希)。"""
+        hashes = hashes or {}
+        grouped = self._by_file(ids, file_of)
+        self._append(self._record(fn, batch, hashes) for fn, batch in grouped.items())
+        for fn, batch in grouped.items():
+            done = self.committed.setdefault(fn, {})
+            for cid in batch:
+                done[cid] = hashes.get(cid)
+                self.failed.pop(cid, None)
+
+    def remove(self, chunk_file: str, ids: List[str]) -> None:
+        """记录已从向量库删除的分块（重新分块后不再存在）。"""
+        self._append([{"file": chunk_file, "version": self.version(chunk_file), "removed": ids}])
+        done = self.committed.get(chunk_file, {})
+        for cid in ids:
+            done.pop(cid, None)
+
+    def fail(self, ids: List[str], file_of: Dict[str, str], error: str) -> None:
+        """记录一批失败的分块（下次运行会重试）。"""
+        grouped = self._by_file(ids, file_of)
+        self._append({"file": fn, "version": self.version(fn), "failed": batch, "error": error}
+                     for fn, batch in grouped.items())
+        for cid in ids:
+            self.failed[cid] = error
+
+    def compact(self) -> None:
+        """把检查点重写为每个文件一行（旧格式的提交另占一行），只保留当前有效的提交记录。"""
+        records = []
+        for fn, done in self.committed.items():
+            hashed = sorted(cid for cid, h in done.items() if h)
+            legacy = sorted(cid for cid, h in done.items() if not h)
+            if hashed:
+                records.append(self._record(fn, hashed, done))
+            if legacy:
+                records.append({"file": fn, "version": self.version(fn), "ids": legacy})
+        tmp = self.path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            for rec in records:
+                f.write(json.dumps(rec, ensure_ascii=False) + "\n")
+        os.replace(tmp, self.path)
+        self.failed.clear()
+
+    def reset(self) -> None:
+        self.committed.clear()
+        self.failed.clear()
+        if os.path.exists(self.path):
+            os.remove(self.path)
@@ -49,6 +49,16 @@ I am a {{c1::cat}}.,This explains my behavior.
 Do not include any additional text or symbols such as ```csv.
 """
 
+EXISTING_CARDS_PROMPT = """
+以下卡片已经存在于该项目中，请不要生成与它们重复或意思相同的卡片：
+{cards}
+"""
+
+EXISTING_CARDS_PROMPT_EN = """
+The following cards already exist in this project. Do not generate cards that duplicate them or ask the same thing:
+{cards}
+"""
+
 SUMMARIZE_PROMPT = """
 You are an academic assistant. 
 Given the following user input, rewrite it as a clear, structured, and specific question or query for calculate the distance in the database. 
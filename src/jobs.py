@@ -0,0 +1,250 @@
+# jobs.py
+"""
+后台任务：在独立的工作进程中运行预处理（分块）与向量化，Streamlit 页面只负责提交和轮询。
+
+任务状态持久化在 <project>/jobs/<job_id>.json：
+    {"id", "kind": "ingest" | "preprocess" | "embed", "params", "status", "pid",
+     "stage", "progress": {"files_done", "files_total", "chunks_done", "chunks_total",
+                           "throughput", "eta"}, "summary", "created", "started", "finished", "error"}
+status: queued / running / done / failed / cancelled / interrupted（进程意外退出）
+
+- 取消：写入 <job_id>.cancel 标记文件，工作进程在每个文件/批次之间检查并退出
+- 恢复：重新提交同样的参数；预处理按 manifest 跳过已完成的文件，向量化从检查点继续
+- 每个项目同时只允许一个活动任务，不同项目的任务可以并发运行
+"""
+import json
+import multiprocessing
+import os
+import time
+import traceback
+import uuid
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+JOBS_DIR = "jobs"
+ACTIVE_STATUSES = {"queued", "running"}
+QUEUE_TIMEOUT = 60  # 秒；提交后工作进程迟迟没有启动则视为中断
+KINDS = {"ingest": ["preprocess", "embed"], "preprocess": ["preprocess"], "embed": ["embed"]}
+
+
+class JobCancelled(Exception):
+    pass
+
+
+def _jobs_dir(project_folder: str) -> str:
+    path = os.path.join(project_folder, JOBS_DIR)
+    os.makedirs(path, exist_ok=True)
+    return path
+
+
+def _job_path(project_folder: str, job_id: str) -> str:
+    return os.path.join(_jobs_dir(project_folder), f"{job_id}.json")
+
+
+def _write(path: str, job: Dict[str, Any]) -> None:
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(job, f, ensure_ascii=False, indent=2)
+    os.replace(tmp, path)
+
+
+def _read(path: str) -> Optional[Dict[str, Any]]:
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def _pid_alive(pid: Optional[int]) -> bool:
+    if not pid:
+        return False
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def _is_lost(job: Dict[str, Any]) -> bool:
+    if job.get("pid"):
+        return not _pid_alive(job["pid"])
+    # 还没有写入 pid：给工作进程留出启动时间
+    return (datetime.now() - datetime.fromisoformat(job["created"])).total_seconds() > QUEUE_TIMEOUT
+
+
+def get_job(project_folder: str, job_id: str) -> Optional[Dict[str, Any]]:
+    """读取任务状态；工作进程已不存在但状态仍为活动的任务标记为 interrupted。"""
+    multiprocessing.active_children()  # 回收已退出的子进程，避免僵尸进程被当作存活
+    path = _job_path(project_folder, job_id)
+    job = _read(path)
+    if job and job["status"] in ACTIVE_STATUSES and _is_lost(job):
+        job["status"] = "interrupted"
+        job["finished"] = datetime.now().isoformat()
+        _write(path, job)
+    return job
+
+
+def list_jobs(project_folder: str) -> List[Dict[str, Any]]:
+    """按创建时间倒序列出项目的全部任务。"""
+    jobs = []
+    for fn in os.listdir(_jobs_dir(project_folder)):
+        if fn.endswith(".json"):
+            job = get_job(project_folder, fn[:-len(".json")])
+            if job:
+                jobs.append(job)
+    return sorted(jobs, key=lambda j: j["created"], reverse=True)
+
+
+def active_job(project_folder: str) -> Optional[Dict[str, Any]]:
+    return next((j for j in list_jobs(project_folder) if j["status"] in ACTIVE_STATUSES), None)
+
+
+def submit_job(project_folder: str, kind: str, params: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    """
+    提交后台任务并立即返回任务状态。
+
+    Args:
+        kind: "ingest"（预处理 + 向量化）、"preprocess" 或 "embed"
+        params: 传给 process_documents 的参数（chunking_method、chunk_size、chunk_overlap、force_reprocess、
+                max_rss_mb、trace_memory、dedup_threshold、deep_clean）；
+                profile=True 时在工作进程中开启性能剖析（见 profiling.py）
+                以及传给 create_or_update_embeddings 的 only_files
+    """
+    if kind not in KINDS:
+        raise ValueError(f"Unknown job kind: {kind}")
+    project_folder = os.path.abspath(project_folder)
+    running = active_job(project_folder)
+    if running:
+        raise RuntimeError(f"Project already has an active job: {running['id']}")
+    job_id = datetime.now().strftime("%Y%m%d_%H%M%S_") + uuid.uuid4().hex[:6]
+    job = {
+        "id": job_id,
+        "kind": kind,
+        "params": params or {},
+        "status": "queued",
+        "pid": None,
+        "stage": None,
+        "progress": {},
+        "created": datetime.now().isoformat(),
+        "started": None,
+        "finished": None,
+        "error": None,
+    }
+    path = _job_path(project_folder, job_id)
+    _write(path, job)
+    # spawn：不继承 Streamlit 进程中的线程与锁
+    process = multiprocessing.get_context("spawn").Process(
+        target=run_job, args=(project_folder, job_id), name=f"job-{job_id}"
+    )
+    process.start()
+    print(f"[Jobs] Started {kind} job {job_id} for {project_folder} (pid {process.pid})")
+    return job
+
+
+def resume_job(project_folder: str, job_id: str) -> Dict[str, Any]:
+    """以相同参数重新提交被取消、中断或失败的任务（不再强制重新预处理，已完成的文件会被跳过）。"""
+    job = get_job(project_folder, job_id)
+    if job is None:
+        raise ValueError(f"Job not found: {job_id}")
+    params = {**job["params"], "force_reprocess": False, "resume": True}
+    return submit_job(project_folder, job["kind"], params)
+
+
+def cancel_job(project_folder: str, job_id: str) -> None:
+    """请求取消任务；工作进程在下一个文件/批次之间退出。"""
+    open(os.path.join(_jobs_dir(project_folder), f"{job_id}.cancel"), "w").close()
+
+
+class _Reporter:
+    """在工作进程中更新任务状态文件，并计算吞吐与预计剩余时间。写入限频，避免频繁落盘。"""
+
+    def __init__(self, project_folder: str, job_id: str, min_interval: float = 0.5):
+        self.path = _job_path(project_folder, job_id)
+        self.cancel_path = os.path.join(_jobs_dir(project_folder), f"{job_id}.cancel")
+        self.job = _read(self.path)
+        self.min_interval = min_interval
+        self._last_write = 0.0
+        self._stage_start = time.time()
+
+    def update(self, force: bool = False, **fields) -> None:
+        self.job.update(fields)
+        now = time.time()
+        if force or now - self._last_write >= self.min_interval:
+            _write(self.path, self.job)
+            self._last_write = now
+
+    def start_stage(self, stage: str) -> None:
+        self._stage_start = time.time()
+        self.update(force=True, stage=stage)
+
+    def progress(self, unit: str, done: int, total: int) -> None:
+        if os.path.exists(self.cancel_path):
+            raise JobCancelled()
+        elapsed = time.time() - self._stage_start
+        rate = done / elapsed if elapsed > 0 else 0.0
+        self.job["progress"].update({
+            f"{unit}_done": done,
+            f"{unit}_total": total,
+            "throughput": f"{rate:.1f} {unit}/s",
+            "eta": round((total - done) / rate, 1) if rate > 0 else None,
+        })
+        self.update(force=done >= total)
+
+
+def run_job(project_folder: str, job_id: str) -> None:
+    """工作进程入口。"""
+    import profiling
+    from embed import create_or_update_embeddings
+    from preprocess import process_documents
+
+    reporter = _Reporter(project_folder, job_id)
+    reporter.update(force=True, status="running", pid=os.getpid(), started=datetime.now().isoformat())
+    params = reporter.job["params"]
+    if params.get("profile"):
+        profiling.set_enabled(True)
+    proc_dir = os.path.join(project_folder, "processed")
+    try:
+        for stage in KINDS[reporter.job["kind"]]:
+            reporter.start_stage(stage)
+            if stage == "preprocess":
+                process_documents(
+                    os.path.join(project_folder, "raw_pdfs"),
+                    proc_dir,
+                    chunking_method=params.get("chunking_method", "按句子"),
+                    chunk_size=params.get("chunk_size", 400),
+                    chunk_overlap=params.get("chunk_overlap", 50),
+                    force_reprocess=params.get("force_reprocess", False),
+                    max_rss_mb=params.get("max_rss_mb"),
+                    trace_memory=params.get("trace_memory"),
+                    dedup_threshold=params.get("dedup_threshold"),
+                    deep_clean=params.get("deep_clean"),
+                    progress_cb=lambda done, total: reporter.progress("files", done, total),
+                )
+            else:
+                only = params.get("only_files")
+                summary = create_or_update_embeddings(
+                    os.path.join(proc_dir, "chunks"),
+                    os.path.join(project_folder, "vectorstore", "chroma_db"),
+                    only_files=set(only) if only else None,
+                    progress_cb=lambda done, total: reporter.progress("chunks", done, total),
+                    resume=params.get("resume", True),
+                )
+                reporter.update(force=True, summary=summary)
+                if summary["failed"] or summary["remaining"]:
+                    raise RuntimeError(
+                        f"{summary['failed']} chunks failed, {summary['remaining']} remaining; resume to continue"
+                    )
+        reporter.update(force=True, status="done", stage=None)
+    except JobCancelled:
+        print(f"[Jobs] Job {job_id} cancelled")
+        reporter.update(force=True, status="cancelled")
+    except Exception as e:
+        traceback.print_exc()
+        reporter.update(force=True, status="failed", error=str(e))
+    finally:
+        reporter.update(force=True, finished=datetime.now().isoformat())
+        if os.path.exists(reporter.cancel_path):
+            os.remove(reporter.cancel_path)
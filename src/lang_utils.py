@@ -6,6 +6,7 @@ def get_text(lang):
             "RAG": "RAG 数据库管理" if lang == "中文" else "RAG Database",
             "Literature": "文献综述 + 问答数据库" if lang == "中文" else "Literature Review PLUS Database Q&A",
             "Anki": "Anki 记忆卡片" if lang == "中文" else "Anki Cards",
+            "Performance": "性能" if lang == "中文" else "Performance",
         },
         "rag_tab": {
             "header": "RAG：项目与文件管理" if lang == "中文" else "RAG: Project and File Management",
@@ -35,13 +36,21 @@ def get_text(lang):
             "embed_model": "向量模型: **{model}**" if lang == "中文" else "Embedding model: **{model}**",
             "chunk_count": "当前分块总数: **{n}**" if lang == "中文" else "Total Chunks: **{n}**",
             "embed_count": "当前向量数量: **{n}**" if lang == "中文" else "Total Embeddings: **{n}**",
+            "duplicate_count": "{n} 个分块与已有分块近似重复，不单独向量化" if lang == "中文" else "{n} chunks are near-duplicates of existing chunks and are not embedded separately",
             "progress_label": "向量进度（已入库/分块）" if lang == "中文" else "Embedding Progress (completed/chunks)",
 
             "manifest_title": "#### 📄 文件处理状态 (manifest)" if lang == "中文" else "#### 📄 File Processing Status (manifest)",
             "manifest_col_file": "文件" if lang == "中文" else "File",
             "manifest_col_nchunks": "分块数" if lang == "中文" else "Chunks",
+            "manifest_col_nembedded": "已嵌入" if lang == "中文" else "Embedded",
+            "last_preprocess": "上次预处理：{started}，用时 {duration}s（处理 {processed}，跳过 {skipped}，失败 {failed}）" if lang == "中文" else "Last preprocess: {started}, {duration}s ({processed} processed, {skipped} skipped, {failed} failed)",
+            "last_embed": "上次向量化：{started}，用时 {duration}s（{n_chunks} 个分块，{chunks_per_sec} 块/秒）" if lang == "中文" else "Last embedding run: {started}, {duration}s ({n_chunks} chunks, {chunks_per_sec} chunks/s)",
+            "refresh_stats": "重新统计" if lang == "中文" else "Recount",
             "manifest_col_chunkmethod": "分块方式" if lang == "中文" else "Chunk Method",
             "manifest_col_last": "最后处理" if lang == "中文" else "Last Processed",
+            "manifest_col_peak_rss": "内存峰值 (MiB)" if lang == "中文" else "Peak RSS (MiB)",
+            "manifest_col_duplicates": "近似重复" if lang == "中文" else "Near-duplicates",
+            "manifest_col_changes": "上次分块变化（增/删）" if lang == "中文" else "Last chunk changes (+/-)",
             "no_manifest": "暂无 manifest.json，尚未预处理。" if lang == "中文" else "No manifest.json, not yet processed.",
 
             "step2_title": "### 步骤2：预处理文件（分块）" if lang == "中文" else "### Step 2: Preprocess Files (Chunking)",
@@ -50,6 +59,10 @@ def get_text(lang):
             "chunk_length": "固定长度" if lang == "中文" else "Fixed Length",
             "chunk_length_label": "分块长度（字符）" if lang == "中文" else "Chunk length (chars)",
             "force_reprocess": "强制全部重新预处理（忽略 hash，适用于参数变更或修复）" if lang == "中文" else "Force full reprocessing (ignore hash; for param change/fix)",
+            "max_rss": "内存上限（MiB，0 表示不限）" if lang == "中文" else "Memory cap (MiB, 0 = none)",
+            "deep_clean": "深度清洗（合并断行/连字符断词，去角标与页码行）" if lang == "中文" else "Deep clean (join broken lines/hyphenation, drop citation marks and page numbers)",
+            "deep_clean_help": "仅作用于 PDF、文本与 Word 文件；切换后需勾选强制重新预处理才会应用到已处理的文件。" if lang == "中文" else "Applies to PDF, text and Word files only; tick force reprocessing to apply a change to files that were already processed.",
+            "max_rss_help": "预处理逐页检查进程内存，超过上限的文件记为失败并继续处理其它文件，避免超大文档耗尽内存。" if lang == "中文" else "Preprocessing checks process memory after every page; a file that exceeds the cap is marked failed and the remaining files continue, so a huge document cannot exhaust memory.",
             "start_preprocess": "开始预处理" if lang == "中文" else "Start Preprocessing",
             "preprocess_success": "预处理完成！" if lang == "中文" else "Preprocessing complete!",
             "preprocess_fail": "预处理失败: {err}" if lang == "中文" else "Preprocessing failed: {err}",
@@ -60,13 +73,40 @@ def get_text(lang):
             "only_new_chunks": "仅新增分块" if lang == "中文" else "Only new chunks",
             "start_embed": "生成向量" if lang == "中文" else "Generate Embeddings",
             "embed_success": "向量生成完成！" if lang == "中文" else "Embedding complete!",
-            "duplicate_ids": "检测到重复ID，已跳过: {ids}" if lang == "中文" else "Duplicate IDs detected, skipped: {ids}",
-            "partial_embed": "部分分块因ID重复未被生成向量，其余已完成。" if lang == "中文" else "Some chunks skipped due to duplicate IDs, others done.",
+            "resume_checkpoint": "从检查点继续（跳过已嵌入的分块）" if lang == "中文" else "Continue from checkpoint (skip already embedded chunks)",
+            "resume_checkpoint_help": "每批写入向量库后都会记录检查点；取消勾选则忽略检查点，全部重新向量化。" if lang == "中文" else "A checkpoint is committed after every batch written to the vector store; uncheck to ignore it and re-embed everything.",
+            "embed_summary": "完成 {completed}/{total}（本次嵌入 {embedded}，检查点跳过 {skipped}）" if lang == "中文" else "Completed {completed}/{total} ({embedded} embedded now, {skipped} skipped via checkpoint)",
+            "embed_partial": "向量化未全部完成：完成 {completed}/{total}，失败 {failed}，剩余 {remaining}。再次运行将从检查点继续。" if lang == "中文" else "Embedding incomplete: {completed}/{total} completed, {failed} failed, {remaining} remaining. Run again to continue from the checkpoint.",
             "embed_fail": "向量生成失败: {err}" if lang == "中文" else "Embedding failed: {err}",
+            "jobs_title": "### 后台任务" if lang == "中文" else "### Background Jobs",
+            "jobs_info": "在独立进程中运行预处理与向量化（使用上方的分块设置），可以离开页面、取消或在中断后恢复；不同项目的任务可同时运行。" if lang == "中文" else "Runs preprocessing and embedding in a worker process (using the chunking settings above). You can leave the page, cancel, or resume after an interruption; jobs for different projects run concurrently.",
+            "job_ingest": "后台预处理 + 向量化" if lang == "中文" else "Preprocess + embed in background",
+            "job_embed": "后台向量化" if lang == "中文" else "Embed in background",
+            "job_running": "任务 {id} 运行中：{stage}" if lang == "中文" else "Job {id} running: {stage}",
+            "job_files": "文件 {done}/{total}" if lang == "中文" else "Files {done}/{total}",
+            "job_chunks": "已嵌入分块 {done}/{total}" if lang == "中文" else "Chunks embedded {done}/{total}",
+            "job_rate": "吞吐 {rate}，预计剩余 {eta}s" if lang == "中文" else "Throughput {rate}, ETA {eta}s",
+            "job_cancel": "取消任务" if lang == "中文" else "Cancel job",
+            "job_autorefresh": "自动刷新进度" if lang == "中文" else "Auto-refresh progress",
+            "job_resume": "恢复任务 {id}" if lang == "中文" else "Resume job {id}",
+            "job_col_kind": "类型" if lang == "中文" else "Kind",
+            "job_col_status": "状态" if lang == "中文" else "Status",
+            "job_col_finished": "结束时间" if lang == "中文" else "Finished",
+            "job_col_embedded": "已嵌入" if lang == "中文" else "Embedded",
+            "job_col_error": "错误" if lang == "中文" else "Error",
 
             "manifest_check_title": "#### 📊 Manifest 健康检查" if lang == "中文" else "#### 📊 Manifest Health Check",
             "missing_chunks": "未生成分块的文件: {files}" if lang == "中文" else "Files with no chunks: {files}",
             "all_chunked": "所有文件均已分块。" if lang == "中文" else "All files are chunked.",
+            "profile_toggle": "性能剖析（cProfile + 调用栈采样）" if lang == "中文" else "Profiling (cProfile + stack sampling)",
+            "profile_help": "开启后，预处理、向量化（含后台任务）与检索/生成每运行一次，就在项目的 profiles 目录写出 .prof 与火焰图用的 .collapsed 文件。会使运行变慢。" if lang == "中文" else "When on, every preprocessing, embedding (including background jobs), retrieval and generation run writes a .prof file and a flame-graph .collapsed file to the project's profiles folder. Slows runs down.",
+            "profile_title": "#### 🔥 性能剖析热点" if lang == "中文" else "#### 🔥 Profiling Hotspots",
+            "profile_none": "还没有剖析结果。勾选上方的“性能剖析”后运行一次预处理、向量化或检索。" if lang == "中文" else "No profiles yet. Turn on \"Profiling\" above and run preprocessing, embedding or a search.",
+            "profile_select": "剖析结果：" if lang == "中文" else "Profile:",
+            "profile_sort": "排序：" if lang == "中文" else "Sort by:",
+            "profile_sort_options": ["累计耗时", "自身耗时"] if lang == "中文" else ["Cumulative time", "Own time"],
+            "profile_download_prof": "下载 .prof" if lang == "中文" else "Download .prof",
+            "profile_download_collapsed": "下载 .collapsed（火焰图）" if lang == "中文" else "Download .collapsed (flame graph)",
         },
                 "literature_tab": {
             "header": "文献综述与问答" if lang == "中文" else "Literature Review & QA",
@@ -97,12 +137,15 @@ def get_text(lang):
 
             "step4_title": "### 步骤4：检索参数设置与检索" if lang == "中文" else "### Step 4: Retrieval Settings & Run Retrieval",
             "step4_info": "调整检索参数。若无结果，可适当降低相似度阈值。" if lang == "中文" else "Adjust the retrieval parameters. If you get no results, try increasing the maximum distance threshold.",
-            "relevance_threshold": "最小相似度阈值：" if lang == "中文" else "Set Minimum Similarity Score (Relevance Threshold):",
-            "relevance_help": "值越高匹配越严格，若无结果可适当降低。" if lang == "中文" else "Higher values mean stricter match (more similar). If you get no results, try lowering this value.",
+            "relevance_threshold": "最大距离阈值：" if lang == "中文" else "Set Maximum Distance (Relevance Threshold):",
+            "relevance_help": "值越低匹配越严格（距离越小越相似），若无结果可适当调高。" if lang == "中文" else "Lower values mean stricter match (smaller distance = more similar). If you get no results, try raising this value.",
             "num_chunks": "检索块数：" if lang == "中文" else "Select Number of Chunks to Retrieve:",
             "run_retrieval": "执行检索" if lang == "中文" else "Run Retrieval",
             "retrieving": "正在检索相关分块..." if lang == "中文" else "Retrieving relevant chunks...",
             "chunks_found": "{n} 个分块已找到" if lang == "中文" else "{n} Chunks Found",
+            "first_results": "原始查询已检索到 {n} 个分块，正在结合优化后的查询..." if lang == "中文" else "Found {n} chunks for the raw query, refining with the optimized query...",
+            "final_results": "结合优化后的查询共 {n} 个分块：" if lang == "中文" else "{n} chunks after refining with the optimized query:",
+            "stage_timings": "阶段耗时：{timings}" if lang == "中文" else "Stage timings: {timings}",
 
             "step5_title": "### 步骤5：生成摘要" if lang == "中文" else "### Step 5: Summarize Retrieved Chunks",
             "step5_info": "基于检索内容和你的模板生成结构化摘要。" if lang == "中文" else "Generate a structured summary based on the retrieved content and your template.",
@@ -147,11 +190,14 @@ def get_text(lang):
             "query_help": "输入你想制作卡片的主题或概念，系统会自动检索相关内容" if lang == "中文" else "Enter the topic or concept you want to create cards for. The system will find relevant content from your documents.",
             "top_k": "检索Top-K分块：" if lang == "中文" else "Top-K Chunks to Retrieve:",
             "top_k_help": "每次检索多少分块用于卡片生成" if lang == "中文" else "How many relevant chunks to retrieve for card generation",
-            "relevance_threshold": "最小相似度分数：" if lang == "中文" else "Minimum Similarity Score (Relevance Threshold):",
-            "relevance_threshold_help": "值越高匹配越严格，若无结果可适当降低" if lang == "中文" else "Higher values mean stricter match (more similar). If you get no results, try lowering this value.",
+            "relevance_threshold": "最大距离：" if lang == "中文" else "Maximum Distance (Relevance Threshold):",
+            "relevance_threshold_help": "值越低匹配越严格（距离越小越相似），若无结果可适当调高" if lang == "中文" else "Lower values mean stricter match (smaller distance = more similar). If you get no results, try raising this value.",
             "retrieve_chunks": "检索相关分块" if lang == "中文" else "Retrieve Relevant Chunks",
             "please_enter_query": "请先输入检索主题" if lang == "中文" else "Please enter a query first",
             "chunks_retrieved": "检索到 {n} 个相关分块。" if lang == "中文" else "Retrieved {n} relevant chunks.",
+            "first_results": "原始查询已检索到 {n} 个分块，正在结合优化后的查询..." if lang == "中文" else "Found {n} chunks for the raw query, refining with the optimized query...",
+            "final_results": "结合优化后的查询共 {n} 个分块：" if lang == "中文" else "{n} chunks after refining with the optimized query:",
+            "stage_timings": "阶段耗时：{timings}" if lang == "中文" else "Stage timings: {timings}",
             "chunk_id": "**分块 {idx}:** {src}" if lang == "中文" else "**Chunk {idx}:** {src}",
             "no_chunks_found": "未检索到相关分块，请尝试降低阈值或增大Top-K。" if lang == "中文" else "No relevant chunks found. Try lowering the threshold or increasing Top-K.",
             "generate_cards": "生成卡片" if lang == "中文" else "Generate Cards",
@@ -159,10 +205,59 @@ def get_text(lang):
             "generating_cards": "正在生成卡片..." if lang == "中文" else "Generating cards...",
             "llm_output": "LLM输出（CSV格式）：" if lang == "中文" else "LLM Output (CSV format):",
             "no_content_preview": "无内容可预览。" if lang == "中文" else "No content to preview.",
+            "validation_summary": "校验：合法 {valid}，已修复 {repaired}，重新请求 {rerequested}，失败 {failed}，忽略 {ignored}" if lang == "中文" else "Validation: {valid} valid, {repaired} repaired, {rerequested} re-requested, {failed} failed, {ignored} ignored",
+            "failed_rows": "{n} 行无法修复（未导出）" if lang == "中文" else "{n} rows could not be repaired (not exported)",
             "error_generating": "生成卡片出错: {err}" if lang == "中文" else "Error generating cards: {err}",
             "export_csv": "导出为CSV" if lang == "中文" else "Export to CSV",
             "csv_saved": "CSV文件已保存至: {path}" if lang == "中文" else "CSV file saved to: {path}",
             "download_cards": "下载卡片" if lang == "中文" else "Download Cards",
+            "deck_name": "卡组名称：" if lang == "中文" else "Deck name:",
+            "export_apkg": "导出为Anki卡包（.apkg）" if lang == "中文" else "Export to Anki package (.apkg)",
+            "apkg_saved": "卡包已保存至: {path}（新增 {added}，更新 {updated}，未变化 {unchanged}）" if lang == "中文" else "Package saved to: {path} ({added} added, {updated} updated, {unchanged} unchanged)",
+            "apkg_unchanged": "卡组中的卡片均已导出过且没有变化。" if lang == "中文" else "All cards were already exported to this deck and are unchanged.",
+            "avoid_existing": "避免与项目中已有卡片重复" if lang == "中文" else "Avoid duplicating existing project cards",
+            "avoid_existing_help": "生成时把最相近的已有卡片写入提示词；导出时跳过与已导出卡片近似重复的卡片。" if lang == "中文" else "Lists the most similar existing cards in the prompt, and skips near-duplicates of already exported cards on export.",
+            "known_skipped": "已跳过 {n} 张与项目中已有卡片重复的卡片。" if lang == "中文" else "Skipped {n} cards that duplicate existing project cards.",
+            "all_cards_known": "所有卡片均与项目中已导出的卡片重复，未写出文件。" if lang == "中文" else "All cards duplicate already exported project cards; nothing was written.",
+
+            "batch_title": "📚 批量生成卡组" if lang == "中文" else "📚 Batch Deck Generation",
+            "batch_info": "每行一个主题，批量检索并发生成卡片，自动去除近似重复，输出一个合并卡组（使用上方的卡片设置）。" if lang == "中文" else "One topic per line. Topics are retrieved in one batch, cards are generated concurrently, near-duplicates are removed, and one consolidated deck is written (uses the card settings above).",
+            "batch_topics_file": "从文本文件导入主题" if lang == "中文" else "Import topics from a text file",
+            "batch_from_headings": "从文档标题提取主题" if lang == "中文" else "Extract topics from document headings",
+            "batch_topics": "主题列表：" if lang == "中文" else "Topics:",
+            "batch_apkg": "同时导出为 .apkg（增量）" if lang == "中文" else "Also export as .apkg (incremental)",
+            "batch_workers": "并发数：" if lang == "中文" else "Concurrency:",
+            "batch_dedup": "去重相似度阈值（1.0 表示不去重）：" if lang == "中文" else "Dedup similarity threshold (1.0 disables):",
+            "batch_generate": "批量生成（{n} 个主题）" if lang == "中文" else "Generate deck ({n} topics)",
+            "batch_done": "已生成 {n_cards} 张卡片（去重 {n_duplicates} 张，跳过已有 {n_known} 张，用时 {elapsed}s）：{output_path}" if lang == "中文" else "Generated {n_cards} cards ({n_duplicates} duplicates removed, {n_known} already in project, {elapsed}s): {output_path}",
+            "batch_failed": "以下主题生成失败: {topics}" if lang == "中文" else "Failed topics: {topics}",
+            "coverage_title": "🧭 语料覆盖（按主题簇生成）" if lang == "中文" else "🧭 Corpus Coverage (cluster-driven)",
+            "coverage_info": "把项目的全部分块按向量聚成主题簇，为尚无卡片的簇生成卡片，直到整个项目被覆盖（使用上方的卡片设置）。" if lang == "中文" else "Clusters every chunk of the project into topics and generates cards for clusters that have none yet, until the whole project is covered (uses the card settings above).",
+            "coverage_clusters": "簇数（0 表示自动）：" if lang == "中文" else "Number of clusters (0 = auto):",
+            "coverage_build": "聚类 / 重新聚类" if lang == "中文" else "Cluster / re-cluster",
+            "coverage_building": "正在聚类..." if lang == "中文" else "Clustering...",
+            "coverage_metric": "分块覆盖率" if lang == "中文" else "Chunk coverage",
+            "coverage_clusters_covered": "已覆盖 {covered_clusters}/{n_clusters} 个簇" if lang == "中文" else "{covered_clusters}/{n_clusters} clusters covered",
+            "coverage_generate": "为未覆盖的簇生成卡片（{n} 个）" if lang == "中文" else "Generate cards for uncovered clusters ({n})",
+            "coverage_done": "为 {n_clusters} 个簇生成了 {n_cards} 张卡片：{output_path}" if lang == "中文" else "Generated {n_cards} cards for {n_clusters} clusters: {output_path}",
+        },
+        "perf_tab": {
+            "header": "⏱️ 性能" if lang == "中文" else "⏱️ Performance",
+            "info": "各阶段耗时（加载、清洗、分块、哈希、向量化、查询向量、向量检索、补全正文、LLM 调用、卡片解析）与调用计数。" if lang == "中文" else "Per-stage latency (load, clean, chunk, hash, embed, query embedding, vector search, hydration, LLM calls, card parsing) and call counters.",
+            "source": "数据来源：" if lang == "中文" else "Source:",
+            "source_process": "当前进程" if lang == "中文" else "This process",
+            "source_file": "指标文件（所有进程累计）" if lang == "中文" else "Metrics file (all processes)",
+            "no_file": "未设置 RAG_METRICS_FILE，只能查看当前进程的数据。设置后 cli、后台任务与本应用的数据会合并写入该文件。" if lang == "中文" else "RAG_METRICS_FILE is not set, only this process is shown. When set, the CLI, background jobs and this app merge their data into that file.",
+            "file_missing": "指标文件尚不存在：{path}" if lang == "中文" else "Metrics file does not exist yet: {path}",
+            "empty": "还没有数据，先运行一次预处理、检索或生成。" if lang == "中文" else "No data yet; run preprocessing, a search or a generation first.",
+            "stages": "阶段耗时" if lang == "中文" else "Stage latency",
+            "counters": "计数器" if lang == "中文" else "Counters",
+            "refresh": "刷新" if lang == "中文" else "Refresh",
+            "reset": "清空当前进程数据" if lang == "中文" else "Reset this process",
+            "download_prom": "下载（Prometheus 格式）" if lang == "中文" else "Download (Prometheus format)",
+            "download_json": "下载（JSON）" if lang == "中文" else "Download (JSON)",
+            "debug": "调试输出（在控制台打印完整提示词与检索距离）" if lang == "中文" else "Debug output (print full prompts and retrieval distances to the console)",
+            "exporter": "Prometheus 抓取地址：http://127.0.0.1:{port}/metrics" if lang == "中文" else "Prometheus scrape endpoint: http://127.0.0.1:{port}/metrics",
         }
 
 
@@ -12,12 +12,24 @@ from literature import (
     build_chunk_text,
 )
 from lang_utils import get_text  # 新增
+from profiling import profile
+from query_pipeline import speculative_search, format_timings
 
 @st.cache_data(show_spinner=False)
 def cached_load_all_chunks(chunks_folder):
     from literature import load_all_chunks
     return load_all_chunks(chunks_folder)
 
+def render_hits(box, title, hits, all_chunks, limit=5, preview_chars=200):
+    """在 box（st.empty）中展示检索结果的来源与正文预览，再次调用时覆盖之前的内容。"""
+    with box.container():
+        st.markdown(title)
+        for i, hit in enumerate(hits[:limit], 1):
+            entry = find_chunk_by_id(all_chunks, hit["chunk_id"])
+            preview = build_chunk_text(entry)["chunk_text"] if entry else ""
+            st.markdown(f"**{i}. {hit.get('source', '')}** · `{hit['chunk_id']}` · {hit.get('distance', 0):.4f}")
+            st.caption(preview[:preview_chars] + ("…" if len(preview) > preview_chars else ""))
+
 def render_literature_tab(PROJECTS_DIR, lang):
     text = get_text(lang)["literature_tab"]
 
@@ -94,7 +106,7 @@ def render_literature_tab(PROJECTS_DIR, lang):
                 st.session_state['litrev_last_query'] = query
                 st.session_state['litrev_std_query'] = std_query
                 st.session_state['selected_model'] = model_choice
-        elif query:
+        elif query and st.session_state.get('litrev_last_query') == query:
             std_query = st.session_state.get('litrev_std_query', "")
     else:
         std_query = query
@@ -131,16 +143,39 @@ def render_literature_tab(PROJECTS_DIR, lang):
     st.info(text["step4_info"])
     relevance_threshold = st.slider(
         text["relevance_threshold"],
-        min_value=0.0, max_value=1.1, value=0.85, step=0.01,
+        min_value=0.0, max_value=2.0, value=1.5, step=0.05,
         help=text["relevance_help"]
     )
     num_chunks = st.slider(text["num_chunks"], min_value=5, max_value=50, value=15)
 
-    if std_query and st.button(text["run_retrieval"]):
+    if query and st.button(text["run_retrieval"]):
         st.info(text["retrieving"])
-        print(f"[INFO] search params: query={std_query}, top_k={num_chunks}, db={chroma_db_folder}, relevance_threshold={relevance_threshold}")
-        db = initialize_chroma(chroma_db_folder)
-        results = search(std_query, num_chunks, db, relevance_threshold)
+        # 开启性能剖析时（见 profiling.py）把检索流程写入项目的 profiles 目录
+        with profile(project_path, "query"):
+            db = initialize_chroma(chroma_db_folder)
+            retrieve = lambda q: search(q, num_chunks, db, relevance_threshold)
+            if optimize_prompt and not std_query:
+                # 推测式检索：查询优化与原始查询检索并行，先展示原始查询的结果，优化后的结果到达时替换
+                first_box = st.empty()
+                all_chunks = cached_load_all_chunks(chunks_folder)
+                outcome = speculative_search(
+                    query,
+                    lambda q: standardize_query(q, model=model_choice),
+                    retrieve,
+                    num_chunks,
+                    on_first_results=lambda r: render_hits(
+                        first_box, text["first_results"].format(n=len(r)), r, all_chunks)
+                )
+                std_query = outcome["query"]
+                results = outcome["results"]
+                render_hits(first_box, text["final_results"].format(n=len(results)), results, all_chunks)
+                st.session_state['litrev_last_query'] = query
+                st.session_state['litrev_std_query'] = std_query
+                st.session_state['selected_model'] = model_choice
+                st.caption(text["stage_timings"].format(timings=format_timings(outcome["timings"])))
+            else:
+                print(f"[INFO] search params: query={std_query}, top_k={num_chunks}, db={chroma_db_folder}, relevance_threshold={relevance_threshold}")
+                results = retrieve(std_query)
         print(f"[INFO] search returned {len(results)} results")
         st.success(text["chunks_found"].format(n=len(results)))
         all_chunks = cached_load_all_chunks(chunks_folder)
@@ -184,10 +219,11 @@ def render_literature_tab(PROJECTS_DIR, lang):
             dynamic_template = custom_template.format(context="{context}", query=std_query)
             basic_prompt = text["basic_prompt"].format(context="{context}", query=std_query, delimiter="#####")
             final_prompt = basic_prompt + dynamic_template
-            summary, processing_time, token_consumption = summarize_chunks(
-                chunks, final_prompt, model=model_choice, api_key=api_key,
-                max_tokens=max_tokens, base_url=base_url, log_metrics=log_metrics, temperature=temperature
-            )
+            with profile(project_path, "summarize"):
+                summary, processing_time, token_consumption = summarize_chunks(
+                    chunks, final_prompt, model=model_choice, api_key=api_key,
+                    max_tokens=max_tokens, base_url=base_url, log_metrics=log_metrics, temperature=temperature
+                )
             if summary:
                 st.write(summary)
                 if log_metrics:
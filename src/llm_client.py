@@ -0,0 +1,394 @@
+# llm_client.py
+"""
+统一的 LLM / Embedding 调用层。
+
+summarize、anki、embed 的所有远程调用都经过 call_with_limits()，它为每个提供商提供：
+  - 并发上限（信号量）
+  - 令牌桶限流（每分钟请求数 + 突发容量）
+  - 带抖动的指数退避重试（尊重 Retry-After）
+  - 请求截止时间（deadline，传给客户端作为 timeout）
+  - 熔断器：提供商连续失败后快速失败，冷却后放行一个探测请求
+
+失败时抛出 LLMCallError 的子类，而不是返回错误字符串。
+"""
+import os
+import random
+import threading
+import time
+from dataclasses import dataclass, replace
+from typing import Any, Callable, Dict, Optional
+
+import metrics
+
+
+# ——— 错误类型 ———
+
+class LLMCallError(RuntimeError):
+    """所有 LLM/Embedding 调用失败的基类。"""
+
+    def __init__(self, message: str, provider: str = "", attempts: int = 0, cause: Optional[BaseException] = None):
+        super().__init__(message)
+        self.provider = provider
+        self.attempts = attempts
+        self.cause = cause
+
+
+class RateLimitedError(LLMCallError):
+    """提供商持续返回 429，重试次数用尽。"""
+
+
+class RetriesExhaustedError(LLMCallError):
+    """瞬时错误（超时、连接中断、5xx）重试次数用尽。"""
+
+
+class DeadlineExceededError(LLMCallError):
+    """在截止时间内未能完成请求（包括排队等待限流/并发槽位的时间）。"""
+
+
+class CircuitOpenError(LLMCallError):
+    """熔断器处于打开状态，请求被直接拒绝。"""
+
+
+class LLMRequestError(LLMCallError):
+    """不可重试的请求错误（4xx、鉴权失败、参数错误等）。"""
+
+
+# ——— 配置 ———
+
+@dataclass(frozen=True)
+class ProviderLimits:
+    max_concurrency: int = 4          # 同时进行中的请求数
+    requests_per_minute: float = 60   # 令牌桶补充速率
+    burst: int = 10                   # 令牌桶容量
+    max_retries: int = 4              # 首次请求之外的重试次数
+    base_delay: float = 1.0           # 退避基准（秒）
+    max_delay: float = 30.0           # 单次退避上限（秒）
+    deadline: float = 120.0           # 单次调用（含重试）的总时限（秒）
+    failure_threshold: int = 5        # 连续失败多少次后熔断
+    reset_timeout: float = 30.0       # 熔断后多久放行探测请求（秒）
+
+
+DEFAULT_LIMITS: Dict[str, ProviderLimits] = {
+    "openai": ProviderLimits(max_concurrency=8, requests_per_minute=300, burst=20),
+    "qwen": ProviderLimits(max_concurrency=4, requests_per_minute=60, burst=10),
+}
+
+_ENV_FIELDS = {
+    "MAX_CONCURRENCY": ("max_concurrency", int),
+    "RPM": ("requests_per_minute", float),
+    "BURST": ("burst", int),
+    "MAX_RETRIES": ("max_retries", int),
+    "DEADLINE": ("deadline", float),
+    "FAILURE_THRESHOLD": ("failure_threshold", int),
+    "RESET_TIMEOUT": ("reset_timeout", float),
+}
+
+
+def get_limits(provider: str) -> ProviderLimits:
+    """
+    读取提供商的限额配置，可用环境变量覆盖，例如 LLM_OPENAI_RPM=120、LLM_QWEN_MAX_CONCURRENCY=2。
+    """
+    limits = DEFAULT_LIMITS.get(provider, ProviderLimits())
+    overrides = {}
+    for suffix, (field_name, cast) in _ENV_FIELDS.items():
+        value = os.getenv(f"LLM_{provider.upper()}_{suffix}")
+        if value:
+            try:
+                overrides[field_name] = cast(value)
+            except ValueError:
+                print(f"[LLM] Ignoring invalid LLM_{provider.upper()}_{suffix}={value!r}")
+    return replace(limits, **overrides) if overrides else limits
+
+
+# ——— 令牌桶 ———
+
+class TokenBucket:
+    """线程安全的令牌桶，rate 为每秒补充的令牌数。"""
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = max(rate, 1e-6)
+        self.capacity = max(capacity, 1.0)
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self, now: float) -> None:
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def acquire(self, tokens: float = 1.0, timeout: Optional[float] = None) -> bool:
+        """取出令牌；在 timeout 秒内拿不到则返回 False。"""
+        end = None if timeout is None else time.monotonic() + timeout
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._refill(now)
+                if self._tokens >= tokens:
+                    self._tokens -= tokens
+                    return True
+                wait = (tokens - self._tokens) / self.rate
+            if end is not None:
+                left = end - time.monotonic()
+                if left <= 0 or wait > left:
+                    return False
+            time.sleep(min(wait, 1.0))
+
+
+# ——— 熔断器 ———
+
+class CircuitBreaker:
+    """
+    closed -> 连续 failure_threshold 次失败 -> open
+    open   -> 经过 reset_timeout 秒 -> half_open（只放行一个探测请求）
+    half_open -> 探测成功 -> closed；探测失败 -> open
+    """
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = "closed"
+        self._failures = 0
+        self._opened_at = 0.0
+        self._probe_in_flight = False
+        self._lock = threading.Lock()
+
+    def allow(self) -> bool:
+        with self._lock:
+            if self.state == "closed":
+                return True
+            if self.state == "open" and time.monotonic() - self._opened_at >= self.reset_timeout:
+                self.state = "half_open"
+                self._probe_in_flight = False
+            if self.state == "half_open" and not self._probe_in_flight:
+                self._probe_in_flight = True
+                return True
+            return False
+
+    def record_success(self) -> None:
+        with self._lock:
+            self.state = "closed"
+            self._failures = 0
+            self._probe_in_flight = False
+
+    def release_probe(self) -> None:
+        """请求既不算成功也不算失败（如 4xx）：只让出探测名额，不改变状态与失败计数。"""
+        with self._lock:
+            self._probe_in_flight = False
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self._failures += 1
+            if self.state == "half_open" or self._failures >= self.failure_threshold:
+                self.state = "open"
+                self._opened_at = time.monotonic()
+                self._probe_in_flight = False
+
+
+# ——— 每个提供商的闸门 ———
+
+class _ProviderGate:
+    def __init__(self, provider: str):
+        self.limits = get_limits(provider)
+        self.semaphore = threading.BoundedSemaphore(self.limits.max_concurrency)
+        self.bucket = TokenBucket(self.limits.requests_per_minute / 60.0, self.limits.burst)
+        self.breaker = CircuitBreaker(self.limits.failure_threshold, self.limits.reset_timeout)
+
+
+_gates: Dict[str, _ProviderGate] = {}
+_gates_lock = threading.Lock()
+
+
+def get_gate(provider: str) -> _ProviderGate:
+    with _gates_lock:
+        gate = _gates.get(provider)
+        if gate is None:
+            gate = _gates[provider] = _ProviderGate(provider)
+        return gate
+
+
+def reset_gates() -> None:
+    """丢弃所有闸门状态（例如修改环境变量中的限额之后）。"""
+    with _gates_lock:
+        _gates.clear()
+
+
+# ——— 错误分类与退避 ———
+
+RETRYABLE_STATUS = {408, 409, 425, 500, 502, 503, 504}
+TRANSIENT_ERROR_NAMES = {
+    "APITimeoutError", "APIConnectionError", "InternalServerError",
+    "Timeout", "ReadTimeout", "ConnectTimeout", "ConnectError", "RemoteProtocolError",
+}
+
+
+def _status_code(exc: BaseException) -> Optional[int]:
+    status = getattr(exc, "status_code", None)
+    if status is None:
+        status = getattr(getattr(exc, "response", None), "status_code", None)
+    return status if isinstance(status, int) else None
+
+
+def classify_error(exc: BaseException) -> str:
+    """返回 'rate_limit'、'transient' 或 'fatal'。"""
+    status = _status_code(exc)
+    if status == 429 or type(exc).__name__ == "RateLimitError":
+        return "rate_limit"
+    if status in RETRYABLE_STATUS:
+        return "transient"
+    if type(exc).__name__ in TRANSIENT_ERROR_NAMES or isinstance(exc, (TimeoutError, ConnectionError)):
+        return "transient"
+    return "fatal"
+
+
+def _retry_after(exc: BaseException) -> Optional[float]:
+    headers = getattr(getattr(exc, "response", None), "headers", None)
+    if not headers:
+        return None
+    try:
+        return float(headers.get("retry-after"))
+    except (TypeError, ValueError):
+        return None
+
+
+def backoff_delay(attempt: int, base: float, cap: float) -> float:
+    """Full jitter 指数退避：在 [0, min(cap, base * 2^(attempt-1))] 内均匀取值。"""
+    return random.uniform(0, min(cap, base * (2 ** (attempt - 1))))
+
+
+# ——— 流式结果 ———
+
+class SlotStream:
+    """
+    流式调用的返回值包装：持有提供商的并发槽位，直到流被读完、读取出错、close() 或对象被回收时才释放
+    （只释放一次）。其它属性转发给原始流对象。
+    """
+
+    def __init__(self, stream: Any, release: Callable[[], None]):
+        self._stream = stream
+        self._iter = None
+        self._release = release
+        self._lock = threading.Lock()
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        if self._iter is None:
+            self._iter = iter(self._stream)
+        try:
+            return next(self._iter)
+        except BaseException:  # 包括 StopIteration
+            self.close()
+            raise
+
+    def close(self) -> None:
+        with self._lock:
+            release, self._release = self._release, None
+        if release is None:
+            return
+        try:
+            close = getattr(self._stream, "close", None)
+            if close is not None:
+                close()
+        finally:
+            release()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def __del__(self):
+        self.close()
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self._stream, name)
+
+
+# ——— 主入口 ———
+
+def _record_attempt(provider: str, outcome: str, started: float) -> None:
+    """每次尝试（含失败）的耗时记入 llm_call 阶段，次数按结果记入 rag_llm_calls_total"""
+    metrics.observe(metrics.STAGE_SECONDS, time.perf_counter() - started, stage="llm_call", provider=provider)
+    metrics.inc("rag_llm_calls_total", provider=provider, outcome=outcome)
+
+
+def call_with_limits(
+    provider: str,
+    fn: Callable[[float], Any],
+    deadline: Optional[float] = None,
+    max_retries: Optional[int] = None,
+    stream: bool = False,
+) -> Any:
+    """
+    在提供商闸门的保护下执行一次远程调用。
+
+    Args:
+        provider: 提供商名称（'openai'、'qwen' 等），决定使用哪个并发/限流/熔断实例
+        fn: 实际发起请求的函数，参数为本次尝试剩余的超时秒数
+        deadline: 总时限（秒），默认取提供商配置
+        max_retries: 重试次数，默认取提供商配置
+        stream: fn 返回流对象；并发槽位一直占用到流读完或关闭（见 SlotStream）
+
+    Returns:
+        fn 的返回值（stream=True 时为包装后的 SlotStream）
+
+    Raises:
+        LLMCallError 的子类，见模块说明
+    """
+    gate = get_gate(provider)
+    limits = gate.limits
+    retries = limits.max_retries if max_retries is None else max_retries
+    deadline_at = time.monotonic() + (deadline or limits.deadline)
+    attempt = 0
+
+    while True:
+        attempt += 1
+        if not gate.breaker.allow():
+            metrics.inc("rag_llm_calls_total", provider=provider, outcome="circuit_open")
+            raise CircuitOpenError(f"{provider} circuit is open, failing fast", provider, attempt - 1)
+        probe = gate.breaker.state == "half_open"  # 本次是半开状态下放行的探测请求
+
+        remaining = deadline_at - time.monotonic()
+        if remaining <= 0 or not gate.bucket.acquire(timeout=remaining):
+            if probe:  # 探测请求没有发出，让出名额，否则熔断器一直停在 half_open
+                gate.breaker.release_probe()
+            raise DeadlineExceededError(f"{provider}: deadline exceeded while rate limited", provider, attempt - 1)
+        remaining = deadline_at - time.monotonic()
+        if remaining <= 0 or not gate.semaphore.acquire(timeout=remaining):
+            if probe:
+                gate.breaker.release_probe()
+            raise DeadlineExceededError(f"{provider}: deadline exceeded waiting for a concurrency slot", provider, attempt - 1)
+
+        started = time.perf_counter()
+        try:
+            result = fn(max(deadline_at - time.monotonic(), 0.1))
+        except Exception as e:
+            gate.semaphore.release()
+            error = e
+        else:
+            gate.breaker.record_success()
+            _record_attempt(provider, "ok", started)
+            if stream:
+                return SlotStream(result, gate.semaphore.release)
+            gate.semaphore.release()
+            return result
+
+        kind = classify_error(error)
+        _record_attempt(provider, kind, started)
+        if kind == "fatal":
+            # 服务端有响应，只是请求本身有问题：不计入熔断，也不算成功（半开时只让出探测名额）
+            gate.breaker.release_probe()
+            raise LLMRequestError(f"{provider}: {error}", provider, attempt, error) from error
+
+        gate.breaker.record_failure()
+        error_cls = RateLimitedError if kind == "rate_limit" else RetriesExhaustedError
+        if attempt > retries:
+            raise error_cls(f"{provider}: giving up after {attempt} attempts: {error}", provider, attempt, error) from error
+
+        delay = max(backoff_delay(attempt, limits.base_delay, limits.max_delay), _retry_after(error) or 0.0)
+        if time.monotonic() + delay >= deadline_at:
+            raise DeadlineExceededError(f"{provider}: deadline exceeded after {attempt} attempts: {error}", provider, attempt, error) from error
+        print(f"[LLM] {provider} {kind} error (attempt {attempt}/{retries + 1}), retrying in {delay:.1f}s: {error}")
+        time.sleep(delay)
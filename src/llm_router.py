@@ -0,0 +1,216 @@
+# llm_router.py
+"""
+按调用类别（查询改写、摘要、卡片生成）在等价模型之间做延迟感知路由。
+
+- 每个 (provider, model) 维护一个滚动窗口，记录最近的延迟与成败
+- rank() 按“健康优先、p50 延迟次之、首选模型与配置顺序兜底”给候选模型排序
+- call() 依次尝试候选模型，遇到 LLMCallError 自动切换到下一个
+- 可选对冲（hedging）：排第一的模型超过其历史 p95 仍未返回时，并行发出第二个请求，取先成功者
+"""
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from llm_client import LLMCallError, get_gate
+
+# 每个调用类别的等价模型偏好列表，可用 LLM_ROUTE_<CLASS>=model_a,model_b 覆盖
+CALL_CLASS_MODELS: Dict[str, List[str]] = {
+    "query_rewrite": ["gpt-4o-mini", "qwen-turbo", "qwen-plus"],
+    "summary": ["gpt-4o", "qwen-max", "gpt-4o-mini"],
+    "card_generation": ["gpt-4o-mini", "qwen-plus", "gpt-4o"],
+}
+
+WINDOW_SIZE = 100            # 每个模型保留的最近调用数
+WINDOW_SECONDS = 600.0       # 超过该时间的样本不再参与统计
+MIN_SAMPLES = 3              # 少于该样本数时视为“未知”
+UNKNOWN_LATENCY = 5.0        # 未知模型的假定延迟（秒），使其在已知慢模型之前被探索
+MAX_ERROR_RATE = 0.5         # 错误率高于该值视为不健康
+
+
+def _percentile(values: List[float], pct: float) -> Optional[float]:
+    if not values:
+        return None
+    ordered = sorted(values)
+    k = min(len(ordered) - 1, max(0, int(round(pct / 100.0 * (len(ordered) - 1)))))
+    return ordered[k]
+
+
+class ModelStats:
+    """单个模型的滚动延迟/错误率统计。"""
+
+    def __init__(self, window_size: int = WINDOW_SIZE, window_seconds: float = WINDOW_SECONDS):
+        self.window_seconds = window_seconds
+        self._samples = deque(maxlen=window_size)  # (timestamp, latency, ok)
+        self._lock = threading.Lock()
+
+    def record(self, latency: float, ok: bool) -> None:
+        with self._lock:
+            self._samples.append((time.time(), latency, ok))
+
+    def _recent(self):
+        cutoff = time.time() - self.window_seconds
+        with self._lock:
+            return [s for s in self._samples if s[0] >= cutoff]
+
+    def snapshot(self) -> Dict[str, Any]:
+        recent = self._recent()
+        latencies = [lat for _, lat, ok in recent if ok]
+        errors = sum(1 for _, _, ok in recent if not ok)
+        return {
+            "samples": len(recent),
+            "error_rate": errors / len(recent) if recent else 0.0,
+            "p50": _percentile(latencies, 50),
+            "p95": _percentile(latencies, 95),
+        }
+
+
+class ModelRouter:
+    """
+    Args:
+        call_classes: 调用类别 -> 等价模型偏好列表
+        provider_of: 模型名 -> 提供商名（用于查询熔断状态）
+        is_available: 模型是否可用（如对应 API Key 未配置则跳过）
+    """
+
+    def __init__(self,
+                 call_classes: Dict[str, List[str]],
+                 provider_of: Callable[[str], str],
+                 is_available: Optional[Callable[[str], bool]] = None):
+        self.call_classes = call_classes
+        self.provider_of = provider_of
+        self.is_available = is_available or (lambda model: True)
+        self._stats: Dict[str, ModelStats] = {}
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=8, thread_name_prefix="llm-hedge")
+
+    def stats(self, model: str) -> ModelStats:
+        with self._lock:
+            if model not in self._stats:
+                self._stats[model] = ModelStats()
+            return self._stats[model]
+
+    def report(self) -> Dict[str, Dict[str, Any]]:
+        """所有已观测模型的统计快照，便于展示或调试。"""
+        with self._lock:
+            models = list(self._stats)
+        return {m: {"provider": self.provider_of(m), **self.stats(m).snapshot()} for m in models}
+
+    def candidates(self, call_class: str) -> List[str]:
+        env = os.getenv(f"LLM_ROUTE_{call_class.upper()}")
+        if env:
+            return [m.strip() for m in env.split(",") if m.strip()]
+        return list(self.call_classes.get(call_class, []))
+
+    def is_healthy(self, model: str) -> bool:
+        if get_gate(self.provider_of(model)).breaker.state == "open":
+            return False
+        snap = self.stats(model).snapshot()
+        return snap["samples"] < MIN_SAMPLES or snap["error_rate"] <= MAX_ERROR_RATE
+
+    def rank(self, call_class: str, preferred: Optional[str] = None) -> List[str]:
+        """
+        返回按优先级排序的候选模型：健康的在前，再按观测到的 p50 延迟（样本不足时按 UNKNOWN_LATENCY）排序。
+        preferred（例如用户在界面上选的模型）只在延迟相同（如都还没有样本）时优先，不会压过更快的健康模型。
+        """
+        models = self.candidates(call_class)
+        if preferred:
+            models = [preferred] + [m for m in models if m != preferred]
+        models = [m for m in models if m == preferred or self.is_available(m)]
+
+        def key(item):
+            idx, model = item
+            snap = self.stats(model).snapshot()
+            latency = snap["p50"] if snap["samples"] >= MIN_SAMPLES and snap["p50"] is not None else UNKNOWN_LATENCY
+            return (not self.is_healthy(model), latency, 0 if model == preferred else 1, idx)
+
+        return [m for _, m in sorted(enumerate(models), key=key)]
+
+    def _timed(self, model: str, fn: Callable[[str], Any]) -> Any:
+        start = time.monotonic()
+        try:
+            result = fn(model)
+        except LLMCallError:
+            self.stats(model).record(time.monotonic() - start, ok=False)
+            raise
+        self.stats(model).record(time.monotonic() - start, ok=True)
+        return result
+
+    def _hedge_delay(self, model: str, percentile: float) -> Optional[float]:
+        recent = [lat for _, lat, ok in self.stats(model)._recent() if ok]
+        if len(recent) < MIN_SAMPLES:
+            return None
+        return _percentile(recent, percentile)
+
+    def _call_hedged(self, first: str, second: str, fn: Callable[[str], Any],
+                     percentile: float) -> Tuple[bool, Any, Optional[LLMCallError]]:
+        """
+        对冲调用，返回 (是否发出了对冲请求, 结果, 错误)，失败时结果为 None、错误为最后一个 LLMCallError。
+        首选模型在发出对冲之前就失败（没有延迟历史，或在延迟内快速失败）时，第二个候选还没有用过。
+        """
+        delay = self._hedge_delay(first, percentile)
+        primary = self._executor.submit(self._timed, first, fn)
+        if delay is not None:
+            done, _ = wait([primary], timeout=delay)
+        if delay is None or done:
+            try:
+                return False, primary.result(), None
+            except LLMCallError as e:
+                return False, None, e
+        print(f"[Router] {first} slower than p{percentile:g} ({delay:.2f}s), hedging with {second}")
+        pending = {primary, self._executor.submit(self._timed, second, fn)}
+        last_error = None
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for fut in done:
+                try:
+                    return True, fut.result(), None
+                except LLMCallError as e:
+                    last_error = e
+        return True, None, last_error
+
+    def call(self,
+             call_class: str,
+             fn: Callable[[str], Any],
+             preferred: Optional[str] = None,
+             hedge_percentile: Optional[float] = None) -> Any:
+        """
+        依次在候选模型上执行 fn(model)，直到成功。
+
+        Args:
+            call_class: 调用类别，见 CALL_CLASS_MODELS
+            fn: 给定模型名发起一次调用的函数，失败时应抛出 LLMCallError
+            preferred: 用户指定的首选模型（延迟相同时优先，见 rank）
+            hedge_percentile: 设置后对排第一的模型启用对冲（如 95 表示超过历史 p95 即发第二个请求）；
+                              默认读取环境变量 LLM_HEDGE_PERCENTILE，未设置则不对冲
+
+        Raises:
+            LLMCallError: 所有候选模型都失败时抛出最后一个错误
+        """
+        if hedge_percentile is None and os.getenv("LLM_HEDGE_PERCENTILE"):
+            hedge_percentile = float(os.getenv("LLM_HEDGE_PERCENTILE"))
+        ranked = self.rank(call_class, preferred)
+        if not ranked:
+            raise LLMCallError(f"No available model for call class '{call_class}'")
+
+        last_error = None
+        i = 0
+        while i < len(ranked):
+            model = ranked[i]
+            used = 1
+            if hedge_percentile and i == 0 and len(ranked) > 1:
+                hedged, result, error = self._call_hedged(model, ranked[1], fn, hedge_percentile)
+                if error is None:
+                    return result
+                used = 2 if hedged else 1  # 只有真正发出了对冲请求，第二个候选才算用过
+            else:
+                try:
+                    return self._timed(model, fn)
+                except LLMCallError as e:
+                    error = e
+            last_error = error
+            print(f"[Router] {call_class}: {model} failed ({type(error).__name__}), trying next candidate")
+            i += used
+        raise last_error
@@ -0,0 +1,100 @@
+# memory_guard.py
+"""
+预处理时的内存监控：逐页检查进程 RSS 是否超过上限，并可选用 tracemalloc 统计 Python 分配的峰值。
+
+    monitor = MemoryMonitor(max_rss_mb=1024, trace=True)
+    with monitor:
+        for page in pages:
+            ...
+            monitor.check()
+    monitor.report()  # {"rss_start_mb", "rss_peak_mb", "rss_end_mb", "traced_peak_mb"}
+
+上限针对整个进程的 RSS（包括 Streamlit、已加载的库等基线），是软上限：每处理完一页检查一次，
+超过时先 gc.collect()，仍然超过就抛出 MemoryCapExceeded，由调用方把该文件记为失败并继续下一个文件，
+而不是让系统因内存不足杀掉整个进程。RSS 读取顺序：psutil（若已安装）→ /proc/self/statm；
+都不可用时（如未装 psutil 的 Windows）只记录 tracemalloc 数据，不做上限检查。
+"""
+import gc
+import os
+import tracemalloc
+from typing import Any, Dict, Optional
+
+MIB = 1024 * 1024
+
+
+class MemoryCapExceeded(MemoryError):
+    pass
+
+
+def current_rss_mb() -> Optional[float]:
+    """当前进程的常驻内存（MiB），无法读取时返回 None。"""
+    try:
+        import psutil  # 可选依赖
+        return psutil.Process().memory_info().rss / MIB
+    except ImportError:
+        pass
+    try:
+        with open("/proc/self/statm", "r") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / MIB
+    except (OSError, ValueError, AttributeError):
+        return None
+
+
+class MemoryMonitor:
+    """单个文件处理期间的 RSS 采样与上限检查；trace=True 时同时记录 tracemalloc 峰值。"""
+
+    def __init__(self, max_rss_mb: Optional[float] = None, trace: bool = False):
+        self.max_rss_mb = max_rss_mb or None
+        self.trace = trace
+        self.rss_start = self.rss_peak = self.rss_end = None
+        self.traced_peak = None
+        self.checks = 0
+        self._started_tracing = False
+
+    def __enter__(self) -> "MemoryMonitor":
+        if self.trace:
+            if not tracemalloc.is_tracing():
+                tracemalloc.start()
+                self._started_tracing = True
+            tracemalloc.reset_peak()
+        self.rss_start = self.rss_peak = current_rss_mb()
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.rss_end = current_rss_mb()
+        self._record(self.rss_end)
+        if self.trace:
+            self.traced_peak = tracemalloc.get_traced_memory()[1] / MIB
+            if self._started_tracing:
+                tracemalloc.stop()
+
+    def _record(self, rss: Optional[float]) -> None:
+        if rss is not None:
+            self.rss_peak = rss if self.rss_peak is None else max(self.rss_peak, rss)
+
+    def check(self) -> None:
+        """记录一次 RSS；超过上限且回收后仍超过时抛出 MemoryCapExceeded。"""
+        self.checks += 1
+        rss = current_rss_mb()
+        self._record(rss)
+        if self.max_rss_mb is None or rss is None or rss <= self.max_rss_mb:
+            return
+        gc.collect()
+        rss = current_rss_mb()
+        if rss is not None and rss > self.max_rss_mb:
+            raise MemoryCapExceeded(
+                f"RSS {rss:.0f} MiB exceeds the {self.max_rss_mb:.0f} MiB cap after {self.checks} pages"
+            )
+
+    def report(self) -> Dict[str, Any]:
+        def mb(v):
+            return round(v, 1) if v is not None else None
+
+        return {
+            "rss_start_mb": mb(self.rss_start),
+            "rss_peak_mb": mb(self.rss_peak),
+            "rss_end_mb": mb(self.rss_end),
+            "traced_peak_mb": mb(self.traced_peak),
+            "max_rss_mb": self.max_rss_mb,
+            "pages": self.checks,
+        }
@@ -0,0 +1,323 @@
+# metrics.py
+"""
+进程内的计时与计数：替代零散的 print，统一记录各阶段耗时（直方图）与计数器，可导出为
+JSON 文件或 Prometheus 文本格式。
+
+    with metrics.timer("chunk", method="按句子"):
+        ...
+    metrics.inc("rag_chunks_total", len(chunks), stage="created")
+
+阶段耗时统一记在 rag_stage_seconds{stage=...} 直方图中，已埋点的阶段：
+    load / clean / chunk / hash（预处理）、embed / upsert（向量化，upsert 含该批的 embed）、
+    query_embed / vector_search / hydrate（检索）、llm_call（每次 LLM/Embedding 远程调用）、card_parse
+
+导出：
+- RAG_METRICS_FILE=path：每个进程（含 Streamlit、cli、后台任务进程）在阶段结束与退出时把新增的数据
+  合并进该 JSON 文件，“Performance” 面板可读取它
+- RAG_METRICS_PORT=9464：Streamlit 进程在该端口提供 /metrics（Prometheus 格式）；query_service 自带 /metrics
+- RAG_DEBUG=1：打印完整提示词等调试输出（默认关闭，见 debug()）；Streamlit 会话用 set_session_debug() 单独开关
+"""
+import atexit
+import bisect
+import contextvars
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+STAGE_SECONDS = "rag_stage_seconds"
+BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+HELP = {
+    STAGE_SECONDS: "Duration of pipeline stages in seconds",
+    "rag_files_total": "Documents seen by preprocessing, by status",
+    "rag_chunks_total": "Chunks created or embedded",
+    "rag_llm_calls_total": "Remote LLM/embedding call attempts, by provider and outcome",
+    "rag_llm_tokens_total": "Tokens reported by the LLM API",
+}
+
+LabelKey = Tuple[Tuple[str, str], ...]
+
+_lock = threading.Lock()
+_flush_lock = threading.Lock()  # 同一进程内的 flush 串行执行，避免同一段增量被写入两次
+_counters: Dict[str, Dict[LabelKey, float]] = {}
+_histograms: Dict[str, Dict[LabelKey, Dict[str, Any]]] = {}
+_flushed: Dict[str, Any] = {"counters": {}, "histograms": {}}
+_debug = os.getenv("RAG_DEBUG", "").lower() in {"1", "true", "yes"}
+_session_debug: contextvars.ContextVar = contextvars.ContextVar("metrics_session_debug", default=None)
+
+
+def _key(labels: Dict[str, Any]) -> LabelKey:
+    return tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+def inc(name: str, value: float = 1, **labels) -> None:
+    key = _key(labels)
+    with _lock:
+        series = _counters.setdefault(name, {})
+        series[key] = series.get(key, 0) + value
+
+
+def observe(name: str, value: float, **labels) -> None:
+    key = _key(labels)
+    with _lock:
+        hist = _histograms.setdefault(name, {}).get(key)
+        if hist is None:
+            hist = _histograms[name][key] = {"count": 0, "sum": 0.0, "max": 0.0, "buckets": [0] * (len(BUCKETS) + 1)}
+        hist["count"] += 1
+        hist["sum"] += value
+        hist["max"] = max(hist["max"], value)
+        hist["buckets"][bisect.bisect_left(BUCKETS, value)] += 1
+
+
+@contextmanager
+def timer(stage: str, **labels) -> Iterator[None]:
+    """记录一个阶段的耗时到 rag_stage_seconds{stage=..., **labels}（异常时同样记录）。"""
+    t0 = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe(STAGE_SECONDS, time.perf_counter() - t0, stage=stage, **labels)
+
+
+# ——— 调试输出 ———
+
+def set_debug(enabled: bool) -> None:
+    """进程级开关。"""
+    global _debug
+    _debug = enabled
+
+
+def set_session_debug(enabled: Optional[bool]) -> None:
+    """当前上下文的开关（Streamlit 会话），None 表示沿用进程级开关。"""
+    _session_debug.set(enabled)
+
+
+def debug_enabled() -> bool:
+    enabled = _session_debug.get()
+    return _debug if enabled is None else enabled
+
+
+def debug(*args, **kwargs) -> None:
+    """只在调试模式下打印（完整提示词、分块元数据、距离统计等大段输出）。"""
+    if debug_enabled():
+        print(*args, **kwargs)
+
+
+# ——— 快照与导出 ———
+
+def _serialize(counters, histograms) -> Dict[str, Any]:
+    return {
+        "counters": {name: [{"labels": dict(k), "value": v} for k, v in series.items()]
+                     for name, series in counters.items()},
+        "histograms": {name: [{"labels": dict(k), **{f: (list(h[f]) if f == "buckets" else h[f]) for f in h}}
+                              for k, h in series.items()]
+                       for name, series in histograms.items()},
+    }
+
+
+def snapshot() -> Dict[str, Any]:
+    """当前进程的全部数据（可 JSON 序列化）。"""
+    with _lock:
+        return {"created": time.time(), "buckets": list(BUCKETS), **_serialize(_counters, _histograms)}
+
+
+def reset() -> None:
+    with _lock:
+        _counters.clear()
+        _histograms.clear()
+        _flushed["counters"].clear()
+        _flushed["histograms"].clear()
+
+
+def _index(snap: Dict[str, Any], kind: str) -> Dict[Tuple[str, LabelKey], Dict[str, Any]]:
+    return {(name, _key(item["labels"])): item for name, items in snap.get(kind, {}).items() for item in items}
+
+
+def merge(base: Dict[str, Any], extra: Dict[str, Any], sign: int = 1) -> Dict[str, Any]:
+    """把 extra 加到 base 上（sign=-1 时相减，用于计算增量），返回新的快照。"""
+    counters = _index(base, "counters")
+    for key, item in _index(extra, "counters").items():
+        prev = counters.get(key, {"labels": item["labels"], "value": 0})
+        counters[key] = {"labels": item["labels"], "value": prev["value"] + sign * item["value"]}
+    histograms = _index(base, "histograms")
+    for key, item in _index(extra, "histograms").items():
+        prev = histograms.get(key, {"labels": item["labels"], "count": 0, "sum": 0.0, "max": 0.0,
+                                    "buckets": [0] * len(item["buckets"])})
+        histograms[key] = {
+            "labels": item["labels"],
+            "count": prev["count"] + sign * item["count"],
+            "sum": prev["sum"] + sign * item["sum"],
+            # 最大值无法相减，增量中保留较大者（仅用于限制分位数估计的上界）
+            "max": max(prev.get("max", 0.0), item.get("max", 0.0)),
+            "buckets": [a + sign * b for a, b in zip(prev["buckets"], item["buckets"])],
+        }
+    out: Dict[str, Any] = {"created": base.get("created", time.time()), "buckets": list(BUCKETS),
+                           "counters": {}, "histograms": {}}
+    for (name, _), item in counters.items():
+        if item["value"]:
+            out["counters"].setdefault(name, []).append(item)
+    for (name, _), item in histograms.items():
+        if item["count"]:
+            out["histograms"].setdefault(name, []).append(item)
+    return out
+
+
+def load_snapshot(path: str) -> Optional[Dict[str, Any]]:
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+@contextmanager
+def file_lock(path: str, timeout: float = 5.0) -> Iterator[None]:
+    """用 O_EXCL 锁文件（path + ".lock"）串行化多个进程对同一文件的读-改-写；超时后视为遗留的锁并接管。"""
+    lock = path + ".lock"
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            os.close(os.open(lock, os.O_CREAT | os.O_EXCL | os.O_WRONLY))
+            break
+        except FileExistsError:
+            if time.monotonic() > deadline:
+                break
+            time.sleep(0.02)
+    try:
+        yield
+    finally:
+        try:
+            os.remove(lock)
+        except OSError:
+            pass
+
+
+def flush(path: Optional[str] = None) -> None:
+    """把上次 flush 以来的新增数据合并进指标文件（默认 RAG_METRICS_FILE，未设置则不做任何事）。"""
+    path = path or os.getenv("RAG_METRICS_FILE")
+    if not path:
+        return
+    with _flush_lock:
+        current = snapshot()
+        with _lock:
+            delta = merge(current, _flushed, sign=-1)
+        if not delta["counters"] and not delta["histograms"]:
+            return
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        with file_lock(path):
+            combined = merge(load_snapshot(path) or {"created": current["created"]}, delta)
+            combined["updated"] = time.time()
+            tmp = f"{path}.{os.getpid()}.tmp"
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump(combined, f, ensure_ascii=False)
+            os.replace(tmp, path)
+        with _lock:
+            _flushed.update({k: current[k] for k in ("counters", "histograms")})
+
+
+atexit.register(flush)
+
+
+def quantile(hist: Dict[str, Any], q: float) -> Optional[float]:
+    """按桶线性插值估算分位数（秒），不超过记录到的最大值；落在最后一个桶（>60s）时返回桶下界。"""
+    count = hist["count"]
+    if not count:
+        return None
+    target = q * count
+    seen = 0
+    for i, n in enumerate(hist["buckets"]):
+        if n and seen + n >= target:
+            lower = BUCKETS[i - 1] if i > 0 else 0.0
+            if i >= len(BUCKETS):
+                return lower
+            estimate = lower + (BUCKETS[i] - lower) * (target - seen) / n
+            return min(estimate, hist["max"]) if hist.get("max") else estimate
+        seen += n
+    return BUCKETS[-1]
+
+
+def stage_rows(snap: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """阶段耗时汇总表（面板与命令行使用），按总耗时降序。"""
+    rows = []
+    for item in snap.get("histograms", {}).get(STAGE_SECONDS, []):
+        labels = dict(item["labels"])
+        stage = labels.pop("stage", "")
+        rows.append({
+            "stage": stage,
+            "labels": ", ".join(f"{k}={v}" for k, v in sorted(labels.items())),
+            "count": item["count"],
+            "total_s": round(item["sum"], 3),
+            "mean_ms": round(item["sum"] / item["count"] * 1000, 2),
+            "p50_ms": round(quantile(item, 0.5) * 1000, 2),
+            "p95_ms": round(quantile(item, 0.95) * 1000, 2),
+            "max_ms": round(item.get("max", 0.0) * 1000, 2),
+        })
+    return sorted(rows, key=lambda r: r["total_s"], reverse=True)
+
+
+def counter_rows(snap: Dict[str, Any]) -> List[Dict[str, Any]]:
+    return [{"counter": name, "labels": ", ".join(f"{k}={v}" for k, v in sorted(item["labels"].items())),
+             "value": item["value"]}
+            for name, items in sorted(snap.get("counters", {}).items()) for item in items]
+
+
+def _prom_labels(labels: Dict[str, str], extra: Optional[Tuple[str, str]] = None) -> str:
+    pairs = sorted(labels.items()) + ([extra] if extra else [])
+    if not pairs:
+        return ""
+    def esc(v):
+        return str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+    return "{" + ",".join(f'{k}="{esc(v)}"' for k, v in pairs) + "}"
+
+
+def to_prometheus(snap: Optional[Dict[str, Any]] = None) -> str:
+    """Prometheus 文本格式（version 0.0.4）。"""
+    snap = snap or snapshot()
+    lines = []
+    for name, items in sorted(snap.get("counters", {}).items()):
+        lines += [f"# HELP {name} {HELP.get(name, name)}", f"# TYPE {name} counter"]
+        lines += [f"{name}{_prom_labels(i['labels'])} {i['value']}" for i in items]
+    for name, items in sorted(snap.get("histograms", {}).items()):
+        lines += [f"# HELP {name} {HELP.get(name, name)}", f"# TYPE {name} histogram"]
+        for item in items:
+            cumulative = 0
+            for bound, n in zip(list(BUCKETS) + ["+Inf"], item["buckets"]):
+                cumulative += n
+                lines.append(f"{name}_bucket{_prom_labels(item['labels'], ('le', str(bound)))} {cumulative}")
+            lines.append(f"{name}_sum{_prom_labels(item['labels'])} {item['sum']}")
+            lines.append(f"{name}_count{_prom_labels(item['labels'])} {item['count']}")
+    return "\n".join(lines) + "\n"
+
+
+_exporter = None
+
+
+def start_exporter(port: int, host: str = "127.0.0.1"):
+    """在后台线程中提供 GET /metrics（同一进程只启动一次），返回 HTTPServer。"""
+    global _exporter
+    if _exporter is not None:
+        return _exporter
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split("?")[0] != "/metrics":
+                self.send_error(404)
+                return
+            body = to_prometheus().encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    _exporter = ThreadingHTTPServer((host, port), Handler)
+    threading.Thread(target=_exporter.serve_forever, name="metrics-exporter", daemon=True).start()
+    print(f"[Metrics] Prometheus exporter on http://{host}:{_exporter.server_port}/metrics")
+    return _exporter
@@ -0,0 +1,161 @@
+# near_dup.py
+"""
+分块级近似重复检测（MinHash + LSH）：同一篇论文的预印本与正式版、重复的版权声明/页眉页脚、被照抄的摘要，
+只保留第一次出现的分块（canonical）做向量化，其余分块记录 duplicate_of 指向它，不再重复付费、占用 top_k。
+
+    index = NearDupIndex(processed_dir, threshold=0.9)
+    index.load(chunk_files)            # 读取 processed/minhash/ 下各分块文件的签名，建立 LSH 桶
+    old = index.drop("paper.pdf_chunks.json")     # 重新处理某个文件前移除它的旧签名（返回可复用的签名）
+    sig = index.signature(text)
+    canonical = index.match(sig)       # 找到相似度 >= threshold 的 canonical 分块 ID，没有时为 None
+    index.add("paper.pdf_chunks.json", chunk_id, text_hash, sig, canonical)
+    index.save("paper.pdf_chunks.json")
+
+签名：文本转小写后切词（英文/数字按词，中日韩文字按单字），取 3 词 shingle，crc32 后做 NUM_PERM 个
+(a*x+b) mod p 的最小值。LSH 分 BANDS 段、每段 ROWS 行，候选再用签名逐位比较估计 Jaccard 相似度确认。
+每个分块文件的签名存为 minhash/<分块文件>.npz，文件未变化时直接复用，新增文件只需与已有签名比较（增量）。
+"""
+import json
+import os
+import re
+import zlib
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+INDEX_DIR = "minhash"
+NUM_PERM = 128
+BANDS = 16
+ROWS = NUM_PERM // BANDS
+SHINGLE = 3
+_PRIME = (1 << 31) - 1
+_rng = np.random.RandomState(20240501)  # 固定种子：签名在不同进程、不同运行之间可比较
+_A = _rng.randint(1, _PRIME, NUM_PERM).astype(np.uint64)
+_B = _rng.randint(0, _PRIME, NUM_PERM).astype(np.uint64)
+TOKEN = re.compile(r"[a-z0-9]+|[\u3040-\u30ff\u3400-\u9fff\uac00-\ud7af]")
+
+
+def shingles(text: str) -> List[str]:
+    tokens = TOKEN.findall(text.lower())
+    if len(tokens) <= SHINGLE:
+        return [" ".join(tokens)] if tokens else []
+    return [" ".join(tokens[i:i + SHINGLE]) for i in range(len(tokens) - SHINGLE + 1)]
+
+
+def signature(text: str) -> np.ndarray:
+    """文本的 MinHash 签名（NUM_PERM 个 uint32）；没有可用词时返回全 0（不参与匹配）。"""
+    grams = set(shingles(text))
+    if not grams:
+        return np.zeros(NUM_PERM, dtype=np.uint32)
+    x = np.fromiter((zlib.crc32(g.encode("utf-8")) for g in grams), dtype=np.uint64, count=len(grams)) % _PRIME
+    return ((_A[:, None] * x[None, :] + _B[:, None]) % _PRIME).min(axis=1).astype(np.uint32)
+
+
+def similarity(a: np.ndarray, b: np.ndarray) -> float:
+    """两个签名估计的 Jaccard 相似度。"""
+    return float(np.count_nonzero(a == b)) / NUM_PERM
+
+
+class NearDupIndex:
+    def __init__(self, processed_dir: str, threshold: float = 0.9):
+        self.folder = os.path.join(processed_dir, INDEX_DIR)
+        self.threshold = threshold
+        # 分块文件 -> [(chunk_id, content_hash, 签名, canonical_id 或 None)]
+        self.files: Dict[str, List[Tuple[str, str, np.ndarray, Optional[str]]]] = {}
+        self.buckets: Dict[Tuple[int, bytes], List[Tuple[str, int]]] = {}
+        self.file_of: Dict[str, str] = {}  # canonical chunk_id -> 分块文件
+
+    def _path(self, chunk_file: str) -> str:
+        return os.path.join(self.folder, chunk_file + ".npz")
+
+    @staticmethod
+    def signature(text: str) -> np.ndarray:
+        return signature(text)
+
+    def load(self, chunk_files: Iterable[str], chunks_folder: Optional[str] = None) -> None:
+        """
+        读取已有分块文件的签名。没有签名文件的分块文件（启用去重之前生成的）在给出 chunks_folder 时
+        从分块内容补算并保存，它们的分块都作为 canonical。
+        """
+        for fn in chunk_files:
+            path = self._path(fn)
+            if os.path.exists(path):
+                with np.load(path, allow_pickle=False) as data:
+                    rows = list(zip(data["ids"].tolist(), data["hashes"].tolist(), data["sigs"],
+                                    [c or None for c in data["canonical"].tolist()]))
+            elif chunks_folder:
+                with open(os.path.join(chunks_folder, fn), "r", encoding="utf-8") as f:
+                    records = json.load(f)
+                rows = [(r["chunk_id"], r.get("content_hash", ""), signature(r["chunk_text"]), r.get("duplicate_of"))
+                        for r in records]
+            else:
+                continue
+            self.files[fn] = []
+            for row in rows:
+                self.add(fn, *row)
+            if not os.path.exists(path):
+                self.save(fn)
+
+    def _bands(self, sig: np.ndarray) -> Iterable[Tuple[int, bytes]]:
+        for band in range(BANDS):
+            yield band, sig[band * ROWS:(band + 1) * ROWS].tobytes()
+
+    def drop(self, chunk_file: str) -> Dict[str, np.ndarray]:
+        """移除一个分块文件的全部签名（重新处理前调用），返回 content_hash -> 签名 供复用。"""
+        rows = self.files.pop(chunk_file, [])
+        for i, (cid, _, sig, canonical) in enumerate(rows):
+            if canonical is None and sig.any():
+                self.file_of.pop(cid, None)
+                for key in self._bands(sig):
+                    entries = self.buckets.get(key, [])
+                    if (chunk_file, i) in entries:
+                        entries.remove((chunk_file, i))
+                        if not entries:
+                            del self.buckets[key]
+        return {text_hash: sig for _, text_hash, sig, _ in rows}
+
+    def match(self, sig: np.ndarray) -> Optional[str]:
+        """返回与 sig 相似度不低于阈值且最相似的 canonical 分块 ID。"""
+        if not sig.any():
+            return None
+        best, best_sim = None, self.threshold
+        seen = set()
+        for key in self._bands(sig):
+            for entry in self.buckets.get(key, ()):
+                if entry in seen:
+                    continue
+                seen.add(entry)
+                cid, _, other, _ = self.files[entry[0]][entry[1]]
+                sim = similarity(sig, other)
+                if sim >= best_sim:
+                    best, best_sim = cid, sim
+        return best
+
+    def add(self, chunk_file: str, chunk_id: str, text_hash: str, sig: np.ndarray,
+            canonical: Optional[str] = None) -> None:
+        """登记一个分块；canonical 为 None 表示它本身是 canonical，会进入 LSH 桶供后续分块匹配。"""
+        rows = self.files.setdefault(chunk_file, [])
+        rows.append((chunk_id, text_hash, sig, canonical))
+        if canonical is None and sig.any():
+            self.file_of[chunk_id] = chunk_file
+            for key in self._bands(sig):
+                self.buckets.setdefault(key, []).append((chunk_file, len(rows) - 1))
+
+    def save(self, chunk_file: str) -> None:
+        rows = self.files.get(chunk_file, [])
+        os.makedirs(self.folder, exist_ok=True)
+        tmp = self._path(chunk_file) + ".tmp.npz"
+        np.savez(
+            tmp,
+            ids=np.array([r[0] for r in rows], dtype=str),
+            hashes=np.array([r[1] for r in rows], dtype=str),
+            sigs=np.array([r[2] for r in rows], dtype=np.uint32).reshape(len(rows), NUM_PERM),
+            canonical=np.array([r[3] or "" for r in rows], dtype=str),
+        )
+        os.replace(tmp, self._path(chunk_file))
+
+    def remove(self, chunk_file: str) -> None:
+        """删除一个分块文件的签名（分块文件改名或被删除时）。"""
+        self.drop(chunk_file)
+        if os.path.exists(self._path(chunk_file)):
+            os.remove(self._path(chunk_file))
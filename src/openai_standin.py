@@ -0,0 +1,316 @@
+# openai_standin.py
+"""
+离线的 OpenAI 兼容替身服务：实现 /v1/embeddings、/v1/chat/completions（含 stream）与 /v1/models，
+让所有流程（分块 → 向量化 → 检索 → 摘要 / 卡片 / 查询改写）在没有网络的机器上跑通，用于基准测试与回归测试。
+
+- embedding：按词哈希得到确定性的随机向量并求和归一化，相同文本永远得到相同向量，
+  共享词越多的文本越相近（检索结果有意义）
+- chat：按提示词类型返回确定性的固定回答——查询改写返回原始查询、卡片生成返回合法的 Q&A / Cloze CSV 行、
+  摘要返回引用上下文的 Markdown；也可以用 --responses 指定 [{"match": 正则, "response": 文本}] 覆盖
+- 延迟分布（embedding、chat 首包、stream 每个分块分别设置）：
+      50 / fixed:50       固定 50ms
+      uniform:20:80       20–80ms 均匀分布
+      normal:50:10        均值 50ms、标准差 10ms（截断到 ≥0）
+      lognormal:50:0.5    中位数 50ms、对数标准差 0.5（长尾）
+      exp:50              均值 50ms 的指数分布
+- 故障注入：--error-rate 按概率返回 500，--rate-limit-rate 按概率返回 429（带 Retry-After），
+  --rpm 超过每分钟请求数时返回 429；--seed 固定随机序列
+- GET /v1/stats 返回请求与注入故障的计数
+
+    python openai_standin.py --port 8808 --chat-latency lognormal:300:0.6 --rate-limit-rate 0.05
+    export OPENAI_API_BASE=http://127.0.0.1:8808/v1 OPENAI_API_KEY=standin
+    # 若配置了 QWEN_API_KEY，也要设置 QWEN_API_BASE 指向同一地址
+    python cli.py ingest --project demo --files paper.txt && python cli.py embed --project demo
+"""
+import argparse
+import asyncio
+import collections
+import functools
+import hashlib
+import json
+import math
+import random
+import re
+import time
+import uuid
+from typing import Any, Callable, Dict, List, Optional
+
+from async_http import HTTPError, Request, StreamResponse, server_port, start_server
+
+DEFAULT_DIM = 256
+TOKEN = re.compile(r"\w+", re.UNICODE)
+SENTENCE = re.compile(r"[^.!?。！？\n]{20,}[.!?。！？]?")
+CONTEXT_CHUNK = re.compile(r"Chunk (\d+): (.*?)\n\[", re.S)
+CARD_REQUEST = re.compile(r"generate (\d+) (\S+) flashcards|生成(\d+)张(\S+?)类型")
+
+
+@functools.lru_cache(maxsize=65536)
+def _token_vector(token: str, dim: int) -> tuple:
+    rng = random.Random(hashlib.md5(token.encode("utf-8")).digest())
+    return tuple(rng.gauss(0.0, 1.0) for _ in range(dim))
+
+
+def embed_text(text: str, dim: int = DEFAULT_DIM) -> List[float]:
+    """确定性的词袋哈希向量（L2 归一化）。"""
+    acc = [0.0] * dim
+    tokens = TOKEN.findall(text.lower()) or [text]
+    for token in tokens:
+        for i, v in enumerate(_token_vector(token, dim)):
+            acc[i] += v
+    norm = math.sqrt(sum(v * v for v in acc)) or 1.0
+    return [v / norm for v in acc]
+
+
+def _count_tokens(text: str) -> int:
+    return max(1, len(text) // 4)
+
+
+def parse_latency(spec: str) -> Callable[[random.Random], float]:
+    """把延迟描述（见模块说明，单位毫秒）解析为 rng -> 秒 的采样函数。"""
+    kind, _, rest = str(spec).partition(":")
+    if not rest:
+        kind, rest = "fixed", kind
+    try:
+        args = [float(x) for x in rest.split(":")]
+    except ValueError:
+        raise ValueError(f"Invalid latency spec: {spec!r}")
+    samplers = {
+        "fixed": (1, lambda rng, ms: ms),
+        "uniform": (2, lambda rng, lo, hi: rng.uniform(lo, hi)),
+        "normal": (2, lambda rng, mu, sd: rng.gauss(mu, sd)),
+        "lognormal": (2, lambda rng, median, sigma: median * math.exp(rng.gauss(0.0, sigma))),
+        "exp": (1, lambda rng, mean: rng.expovariate(1.0 / mean) if mean > 0 else 0.0),
+    }
+    if kind not in samplers or len(args) != samplers[kind][0]:
+        raise ValueError(f"Invalid latency spec: {spec!r}")
+    sample = samplers[kind][1]
+    return lambda rng: max(0.0, sample(rng, *args)) / 1000
+
+
+def _section(prompt: str, start: str, end: Optional[str] = None) -> str:
+    """取提示词中 start 标记之后（到 end 标记之前）的内容。"""
+    idx = prompt.find(start)
+    if idx < 0:
+        return ""
+    text = prompt[idx + len(start):]
+    if end and end in text:
+        text = text[:text.index(end)]
+    return text.strip()
+
+
+def _sentences(text: str, limit: int) -> List[str]:
+    return [s.strip() for s in SENTENCE.findall(text)][:limit]
+
+
+def _csv_cell(text: str) -> str:
+    return '"' + text.replace('"', '""') + '"'
+
+
+def canned_cards(prompt: str) -> str:
+    """按卡片生成提示词中的数量与类型，用上下文中的句子拼出合法的 CSV 卡片行。"""
+    m = CARD_REQUEST.search(prompt)
+    num = int(m.group(1) or m.group(3)) if m else 3
+    card_type = (m.group(2) or m.group(4) or "qa").lower() if m else "qa"
+    context = _section(prompt, "Relevant content:", "Strictly output") or _section(prompt, "相关内容:", "请严格")
+    sentences = _sentences(context or prompt, num) or ["The stand-in server returns deterministic cards."]
+    rows = []
+    for i in range(num):
+        sentence = sentences[i % len(sentences)]
+        words = TOKEN.findall(sentence)
+        if "cloze" in card_type:
+            key = max(words, key=len) if words else "answer"
+            rows.append(_csv_cell(sentence.replace(key, "{{c1::" + key + "}}", 1)) + ",")
+        else:
+            topic = " ".join(words[:4]) or f"item {i + 1}"
+            rows.append(",".join(_csv_cell(x) for x in (f"What does the text state about {topic}? ({i + 1})",
+                                                         sentence, "stand-in")))
+    return "\n".join(rows)
+
+
+def canned_completion(messages: List[Dict[str, Any]]) -> str:
+    """按提示词类型返回确定性的回答。"""
+    prompt = "\n".join(str(m.get("content", "")) for m in messages)
+    if "User input:" in prompt:  # 查询改写（SUMMARIZE_PROMPT / ANKI_PROMPT）
+        return _section(prompt, "User input:", "Improved query:")
+    # 卡片生成与格式修复要先判断：call_llm_with_prompt / stream_llm_with_prompt 也会用 ##### 包住提示词
+    if CARD_REQUEST.search(prompt) or "flashcard" in prompt or "学习卡片" in prompt:
+        return canned_cards(prompt)
+    if "#####" in prompt:  # 文献综述 / 回答：每个分块（summarize_chunks 的 "Chunk n: 正文\n[引用]"）取第一句
+        chunks = CONTEXT_CHUNK.findall(prompt)
+        bullets = "\n".join(f"- {(_sentences(text, 1) or [text.strip()])[0]} [{n}]" for n, text in chunks)
+        return (f"## Summary\n\n{bullets or '- No context provided.'}\n\n"
+                f"## Conclusion\n\nStand-in summary of {len(chunks)} excerpts.")
+    return "Stand-in answer: " + " ".join(TOKEN.findall(prompt)[:40])
+
+
+class StandinServer:
+    def __init__(self, dim: int = DEFAULT_DIM, embed_latency: str = "0", chat_latency: str = "0",
+                 chunk_latency: str = "0", error_rate: float = 0.0, rate_limit_rate: float = 0.0,
+                 rpm: Optional[float] = None, retry_after: float = 1.0, responses: Optional[List[Dict]] = None,
+                 seed: int = 0):
+        self.dim = dim
+        self.embed_latency = parse_latency(embed_latency)
+        self.chat_latency = parse_latency(chat_latency)
+        self.chunk_latency = parse_latency(chunk_latency)
+        self.error_rate = error_rate
+        self.rate_limit_rate = rate_limit_rate
+        self.rpm = rpm
+        self.retry_after = retry_after
+        self.responses = [(re.compile(r["match"]), r["response"]) for r in responses or []]
+        self.rng = random.Random(seed)
+        self._recent = collections.deque()
+        self.stats = {"embedding_requests": 0, "embedding_inputs": 0, "chat_requests": 0, "stream_requests": 0,
+                      "injected_500": 0, "injected_429": 0, "rpm_429": 0}
+
+    def _fault(self) -> Optional[tuple]:
+        """按配置注入 429 / 500，返回错误响应或 None。"""
+        if self.rpm:
+            now = time.monotonic()
+            while self._recent and now - self._recent[0] > 60:
+                self._recent.popleft()
+            if len(self._recent) >= self.rpm:
+                self.stats["rpm_429"] += 1
+                wait = max(0.0, 60 - (now - self._recent[0]))
+                return _error(429, "Rate limit reached (stand-in rpm)", "rate_limit_exceeded", wait)
+            self._recent.append(now)
+        if self.rate_limit_rate and self.rng.random() < self.rate_limit_rate:
+            self.stats["injected_429"] += 1
+            return _error(429, "Rate limit reached (injected)", "rate_limit_exceeded", self.retry_after)
+        if self.error_rate and self.rng.random() < self.error_rate:
+            self.stats["injected_500"] += 1
+            return _error(500, "Internal server error (injected)", "server_error")
+        return None
+
+    async def embeddings(self, body: Dict[str, Any]):
+        inputs = body.get("input")
+        if isinstance(inputs, str):
+            inputs = [inputs]
+        if not isinstance(inputs, list) or not inputs:
+            raise HTTPError(400, "'input' must be a string or a non-empty list")
+        inputs = [x if isinstance(x, str) else json.dumps(x) for x in inputs]
+        self.stats["embedding_requests"] += 1
+        self.stats["embedding_inputs"] += len(inputs)
+        await asyncio.sleep(self.embed_latency(self.rng))
+        fault = self._fault()
+        if fault:
+            return fault
+        dim = int(body.get("dimensions") or self.dim)
+        tokens = sum(_count_tokens(x) for x in inputs)
+        return 200, {
+            "object": "list",
+            "data": [{"object": "embedding", "index": i, "embedding": embed_text(x, dim)} for i, x in enumerate(inputs)],
+            "model": body.get("model", "standin-embedding"),
+            "usage": {"prompt_tokens": tokens, "total_tokens": tokens},
+        }
+
+    def completion_text(self, messages: List[Dict[str, Any]]) -> str:
+        prompt = "\n".join(str(m.get("content", "")) for m in messages)
+        for pattern, response in self.responses:
+            if pattern.search(prompt):
+                return response
+        return canned_completion(messages)
+
+    async def chat(self, body: Dict[str, Any]):
+        messages = body.get("messages")
+        if not isinstance(messages, list):
+            raise HTTPError(400, "'messages' must be a list")
+        self.stats["chat_requests"] += 1
+        await asyncio.sleep(self.chat_latency(self.rng))
+        fault = self._fault()
+        if fault:
+            return fault
+        model = body.get("model", "standin-chat")
+        text = self.completion_text(messages)
+        prompt_tokens = sum(_count_tokens(str(m.get("content", ""))) for m in messages)
+        completion_id = f"chatcmpl-{uuid.uuid4().hex[:12]}"
+        created = int(time.time())
+        if body.get("stream"):
+            self.stats["stream_requests"] += 1
+            return StreamResponse(self._stream(completion_id, created, model, text))
+        return 200, {
+            "id": completion_id,
+            "object": "chat.completion",
+            "created": created,
+            "model": model,
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": text}, "finish_reason": "stop"}],
+            "usage": {"prompt_tokens": prompt_tokens, "completion_tokens": _count_tokens(text),
+                      "total_tokens": prompt_tokens + _count_tokens(text)},
+        }
+
+    async def _stream(self, completion_id: str, created: int, model: str, text: str):
+        def event(delta: Dict[str, Any], finish=None) -> str:
+            chunk = {"id": completion_id, "object": "chat.completion.chunk", "created": created, "model": model,
+                     "choices": [{"index": 0, "delta": delta, "finish_reason": finish}]}
+            return f"data: {json.dumps(chunk, ensure_ascii=False)}\n\n"
+
+        yield event({"role": "assistant", "content": ""})
+        for piece in re.findall(r"\S+\s*", text):
+            delay = self.chunk_latency(self.rng)
+            if delay:
+                await asyncio.sleep(delay)
+            yield event({"content": piece})
+        yield event({}, "stop")
+        yield "data: [DONE]\n\n"
+
+    async def handle(self, request: Request):
+        path = request.path.rstrip("/")
+        if path.endswith("/embeddings") and request.method == "POST":
+            return await self.embeddings(request.json())
+        if path.endswith("/chat/completions") and request.method == "POST":
+            return await self.chat(request.json())
+        if path.endswith("/models"):
+            return 200, {"object": "list", "data": [{"id": m, "object": "model", "owned_by": "standin"}
+                                                    for m in ("gpt-4o-mini", "text-embedding-3-large")]}
+        if path.endswith("/stats"):
+            return 200, self.stats
+        raise HTTPError(404, f"Unknown endpoint: {request.path}")
+
+
+def _error(status: int, message: str, code: str, retry_after: Optional[float] = None) -> tuple:
+    headers = {"Retry-After": f"{retry_after:.2f}"} if retry_after is not None else {}
+    return status, {"error": {"message": message, "type": code, "param": None, "code": code}}, headers
+
+
+async def serve(host: str, port: int, server: StandinServer) -> None:
+    http = await start_server(server.handle, host, port)
+    print(f"[Standin] Listening on http://{host}:{server_port(http)}/v1", flush=True)
+    async with http:
+        await http.serve_forever()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8808)
+    parser.add_argument("--dim", type=int, default=DEFAULT_DIM, help="embedding 维度")
+    parser.add_argument("--latency-ms", type=float, help="embedding 与 chat 的固定延迟（简写）")
+    parser.add_argument("--embed-latency", default="0", help="embedding 请求延迟分布")
+    parser.add_argument("--chat-latency", default="0", help="chat 请求（首包）延迟分布")
+    parser.add_argument("--chunk-latency", default="0", help="stream 每个分块之间的延迟分布")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="返回 500 的概率")
+    parser.add_argument("--rate-limit-rate", type=float, default=0.0, help="返回 429 的概率")
+    parser.add_argument("--rpm", type=float, help="每分钟请求上限，超过返回 429")
+    parser.add_argument("--retry-after", type=float, default=1.0, help="注入 429 时的 Retry-After（秒）")
+    parser.add_argument("--responses", help="自定义回答 JSON 文件：[{\"match\": 正则, \"response\": 文本}]")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    if args.latency_ms is not None:
+        args.embed_latency = args.chat_latency = str(args.latency_ms)
+    responses = None
+    if args.responses:
+        with open(args.responses, "r", encoding="utf-8") as f:
+            responses = json.load(f)
+    try:
+        parse_latency(args.embed_latency), parse_latency(args.chat_latency), parse_latency(args.chunk_latency)
+    except ValueError as e:
+        parser.error(str(e))
+    server = StandinServer(args.dim, args.embed_latency, args.chat_latency, args.chunk_latency, args.error_rate,
+                           args.rate_limit_rate, args.rpm, args.retry_after, responses, args.seed)
+    try:
+        asyncio.run(serve(args.host, args.port, server))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
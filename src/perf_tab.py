@@ -0,0 +1,63 @@
+import json
+import os
+import streamlit as st
+import metrics
+from lang_utils import get_text
+
+
+def render_perf_tab(PROJECTS_DIR, lang):
+    text = get_text(lang)["perf_tab"]
+
+    st.header(text["header"])
+    st.info(text["info"])
+
+    metrics_file = os.getenv("RAG_METRICS_FILE")
+    port = os.getenv("RAG_METRICS_PORT")
+    if port:
+        st.caption(text["exporter"].format(port=port))
+
+    # 1. 数据来源：当前进程（Streamlit 内的检索与生成），或所有进程合并写入的指标文件
+    if metrics_file:
+        source = st.radio(text["source"], [text["source_process"], text["source_file"]], horizontal=True)
+    else:
+        source = text["source_process"]
+        st.caption(text["no_file"])
+
+    col1, col2 = st.columns(2)
+    with col1:
+        st.button(text["refresh"])
+    with col2:
+        if st.button(text["reset"]):
+            metrics.reset()
+
+    if source == text["source_file"]:
+        metrics.flush()  # 先把本进程的新增数据写入文件，文件视图才是完整的
+        snap = metrics.load_snapshot(metrics_file)
+        if snap is None:
+            st.warning(text["file_missing"].format(path=metrics_file))
+            return
+    else:
+        snap = metrics.snapshot()
+
+    # 2. 阶段耗时与计数器
+    stage_rows = metrics.stage_rows(snap)
+    counter_rows = metrics.counter_rows(snap)
+    if not stage_rows and not counter_rows:
+        st.write(text["empty"])
+    else:
+        st.subheader(text["stages"])
+        st.dataframe(stage_rows, use_container_width=True)
+        st.subheader(text["counters"])
+        st.dataframe(counter_rows, use_container_width=True)
+
+        col1, col2 = st.columns(2)
+        with col1:
+            st.download_button(text["download_prom"], metrics.to_prometheus(snap),
+                               file_name="metrics.prom", mime="text/plain")
+        with col2:
+            st.download_button(text["download_json"], json.dumps(snap, ensure_ascii=False, indent=2),
+                               file_name="metrics.json", mime="application/json")
+
+    # 3. 调试输出开关（默认关闭；环境变量 RAG_DEBUG=1 时默认打开）。
+    #    只影响本会话（保存在 session_state，app.py 每次运行开始时应用），不改进程级开关
+    metrics.set_session_debug(st.checkbox(text["debug"], value=metrics.debug_enabled(), key="debug_enabled"))
@@ -0,0 +1,234 @@
+# pipeline.py
+"""
+无界面的 Python 接口：与 Streamlit 标签页使用同一套函数（process_documents、create_or_update_embeddings、
+search、summarize_chunks、卡片生成），可直接在脚本、定时任务或 cli.py 中调用。
+
+    from pipeline import ingest, embed, search, summarize, cards
+    ingest("projects/demo", files=["paper.pdf"])
+    embed("projects/demo")
+    hits = search("projects/demo", "what is RAG?", top_k=5)
+
+所有函数都以项目目录为第一个参数，返回可直接 JSON 序列化的 dict / list。
+"""
+import os
+import shutil
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from lang_utils import get_text
+from profiling import profiled
+
+DEFAULT_SUMMARY_MODEL = "gpt-4o-mini"
+
+
+def project_paths(project_folder: str) -> Dict[str, str]:
+    """项目目录结构（与 rag_tab 新建项目时一致），不存在的目录会被创建。"""
+    paths = {
+        "raw": os.path.join(project_folder, "raw_pdfs"),
+        "processed": os.path.join(project_folder, "processed"),
+        "chunks": os.path.join(project_folder, "processed", "chunks"),
+        "db": os.path.join(project_folder, "vectorstore", "chroma_db"),
+        "cards": os.path.join(project_folder, "anki_cards"),
+    }
+    for key in ("raw", "chunks", "db"):
+        os.makedirs(paths[key], exist_ok=True)
+    return paths
+
+
+def ingest(
+    project_folder: str,
+    files: Optional[Iterable[str]] = None,
+    chunking_method: str = "按句子",
+    chunk_size: int = 400,
+    chunk_overlap: int = 50,
+    force: bool = False,
+    max_rss_mb: Optional[float] = None,
+    trace_memory: Optional[bool] = None,
+    dedup_threshold: Optional[float] = None,
+    deep_clean: Optional[bool] = None,
+) -> Dict[str, Any]:
+    """
+    把 files（可选）复制到项目的 raw_pdfs 后对整个项目分块，已处理且未变化的文件会被跳过。
+    max_rss_mb / trace_memory / dedup_threshold / deep_clean 见 process_documents
+    （内存上限、tracemalloc 报告、近似重复检测与深度清洗）。
+    返回 process_documents 的运行汇总，另附 copied（本次复制的文件名）。
+    """
+    from preprocess import process_documents
+
+    paths = project_paths(project_folder)
+    copied = []
+    for path in files or []:
+        if not os.path.isfile(path):
+            raise FileNotFoundError(path)
+        shutil.copy2(path, os.path.join(paths["raw"], os.path.basename(path)))
+        copied.append(os.path.basename(path))
+    result = process_documents(
+        paths["raw"],
+        paths["processed"],
+        chunking_method=chunking_method,
+        chunk_size=chunk_size,
+        chunk_overlap=chunk_overlap,
+        force_reprocess=force,
+        max_rss_mb=max_rss_mb,
+        trace_memory=trace_memory,
+        dedup_threshold=dedup_threshold,
+        deep_clean=deep_clean,
+    )
+    return {**result, "copied": copied}
+
+
+def embed(project_folder: str, only_files: Optional[Iterable[str]] = None, resume: bool = True) -> Dict[str, Any]:
+    """向量化项目分块（从检查点继续），返回 create_or_update_embeddings 的汇总。"""
+    from embed import create_or_update_embeddings
+
+    paths = project_paths(project_folder)
+    return create_or_update_embeddings(
+        paths["chunks"], paths["db"], only_files=set(only_files) if only_files else None, resume=resume
+    )
+
+
+@profiled("search", lambda a: a["project_folder"])
+def search(
+    project_folder: str,
+    query: str,
+    top_k: int = 10,
+    relevance_threshold: Optional[float] = None,
+    rewrite: bool = False,
+) -> List[Dict[str, Any]]:
+    """
+    检索并补全分块正文，返回 [{rank, chunk_id, source, distance, chunk_text}]。
+    rewrite=True 时先用 LLM 改写查询，并与原始查询的结果融合（同 Streamlit 的推测式检索）。
+    """
+    return _search(project_folder, query, top_k, relevance_threshold, rewrite)[1]
+
+
+def _search(
+    project_folder: str,
+    query: str,
+    top_k: int,
+    relevance_threshold: Optional[float],
+    rewrite: bool,
+) -> Tuple[str, List[Dict[str, Any]]]:
+    """search() 的实现，同时返回最终使用的查询（改写成功时为改写后的查询），供摘要与制卡的提示词使用。"""
+    from anki import hydrate_results
+    from retrieve import initialize_chroma, search as vector_search
+
+    paths = project_paths(project_folder)
+    db = initialize_chroma(paths["db"])
+    if rewrite:
+        from literature import standardize_query
+        from query_pipeline import speculative_search
+        outcome = speculative_search(
+            query, standardize_query, lambda q: vector_search(q, top_k, db, relevance_threshold), top_k
+        )
+        query, results = outcome["query"], outcome["results"]
+    else:
+        results = vector_search(query, top_k, db, relevance_threshold)
+    return query, hydrate_results(results, paths["chunks"])
+
+
+def summary_prompt(query: str, template: Optional[str] = None, lang: str = "English") -> str:
+    """按文献综述标签页的方式拼接摘要提示词（保留 {context} 占位符），template 为 None 时用默认结构化模板。"""
+    text = get_text(lang)["literature_tab"]
+    template = template or text["default_structured"]
+    return (text["basic_prompt"].format(context="{context}", query=query, delimiter="#####")
+            + template.format(context="{context}", query=query))
+
+
+@profiled("summarize", lambda a: a["project_folder"])
+def summarize(
+    project_folder: str,
+    query: str,
+    top_k: int = 10,
+    template: Optional[str] = None,
+    model: str = DEFAULT_SUMMARY_MODEL,
+    max_tokens: int = 3000,
+    temperature: float = 0.8,
+    lang: str = "English",
+    rewrite: bool = False,
+) -> Dict[str, Any]:
+    """
+    检索后用 summarize_chunks 生成文献综述/回答，提示词的拼法与文献综述标签页相同。
+    template 为 None 时使用界面的默认结构化模板。摘要失败时 summary 为 None。
+    rewrite=True 且改写成功时，提示词使用改写后的查询（同文献综述标签页）。
+    """
+    from anki import load_chunk_index
+    from literature import build_chunk_text
+    from summarize import summarize_chunks
+
+    search_query, hits = _search(project_folder, query, top_k, None, rewrite)
+    index = load_chunk_index(project_paths(project_folder)["chunks"])
+    prompt = summary_prompt(search_query, template, lang)
+    chunks = [build_chunk_text(index[h["chunk_id"]]) for h in hits]
+    summary, processing_time, tokens = summarize_chunks(
+        chunks, prompt, model=model, max_tokens=max_tokens, temperature=temperature
+    ) if chunks else (None, None, None)
+    return {
+        "query": query,
+        "summary": summary,
+        "processing_time": processing_time,
+        "tokens": tokens,
+        "sources": [{"chunk_id": h["chunk_id"], "source": h["source"], "distance": h["distance"]} for h in hits],
+    }
+
+
+@profiled("cards", lambda a: a["project_folder"])
+def cards(
+    project_folder: str,
+    query: str,
+    card_type: str = "qa",
+    difficulty: str = "intermediate",
+    detail_level: str = "moderate",
+    num_cards: int = 5,
+    top_k: int = 10,
+    lang: str = "en",
+    rewrite: bool = False,
+    deck_name: Optional[str] = None,
+    csv: bool = True,
+    skip_known: bool = True,
+) -> Dict[str, Any]:
+    """
+    检索 + 流式生成并校验卡片，写出 CSV（csv=True）和/或 .apkg（提供 deck_name 时）。
+    skip_known=True 时跳过项目中已导出过的重复卡片，并让 LLM 避开最相近的已有卡片。
+    rewrite=True 且改写成功时，以改写后的查询作为生成卡片的标准化查询。
+    """
+    from anki import (
+        export_llm_cards_to_apkg, export_llm_cards_to_csv, filter_known_cards, generate_anki_cards_validated,
+        parse_csv_to_table,
+    )
+
+    search_query, hits = _search(project_folder, query, top_k, None, rewrite)
+    if not hits:
+        raise ValueError("No relevant texts found for the given query.")
+    result = generate_anki_cards_validated(
+        query=query,
+        project_folder=project_folder,
+        card_type=card_type,
+        difficulty=difficulty,
+        detail_level=detail_level,
+        num_cards=num_cards,
+        top_k=top_k,
+        lang=lang,
+        chunks=hits,
+        standardized_query=search_query,
+        avoid_existing=20 if skip_known else 0,
+    )
+    paths = project_paths(project_folder)
+    os.makedirs(paths["cards"], exist_ok=True)
+    known_folder = project_folder if skip_known else None
+    response = result.to_csv()
+    # 只查询一次项目卡片索引：CSV 导出会把新卡片记入索引，.apkg 导出复用同一份重复记录
+    known = filter_known_cards(parse_csv_to_table(response), known_folder)[1] if result.rows else []
+    csv_path = export_llm_cards_to_csv(response, paths["cards"], project_folder=known_folder, known=known) \
+        if csv and result.rows else None
+    apkg = None
+    if deck_name and result.rows:
+        apkg = export_llm_cards_to_apkg(response, paths["cards"], deck_name, card_type=card_type,
+                                        project_folder=known_folder, known=known)
+    return {
+        "query": query,
+        "cards": result.cards,
+        "validation": result.summary(),
+        "failed_rows": [{"raw": r.raw, "error": r.error} for r in result.failed],
+        "csv_path": csv_path,
+        "apkg": apkg,
+    }
@@ -1,38 +1,238 @@
 # preprocess.py
 import datetime
+import functools
+import importlib
 import os
 import json
 import hashlib
 import logging
 import re
+import shutil
+import time
 from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional
 
-import nltk
-from nltk.tokenize import sent_tokenize
-nltk.download('punkt', quiet=True)
+import metrics
+from clean_engine import CleanEngine
+from memory_guard import MemoryMonitor
+from profiling import profiled
+from project_stats import chunk_file_name, manifest_chunk_file, update_stats
 
-from langchain.schema import Document
-from langchain.document_loaders import (
-    PyMuPDFLoader, TextLoader, UnstructuredWordDocumentLoader,
-    UnstructuredExcelLoader, UnstructuredHTMLLoader, UnstructuredMarkdownLoader
-)
-from langchain.text_splitter import CharacterTextSplitter
-
-# 只用 PyMuPDFLoader 解析 PDF
+# 各类型文件的 LangChain loader，按 (模块, 类名) 登记，第一次处理该类型文件时才导入，
+# 避免在 import 阶段加载 unstructured / PyMuPDF 等重型依赖。只用 PyMuPDFLoader 解析 PDF
+LOADERS = "langchain.document_loaders"
 SUPPORTED_EXTENSIONS = {
-    ".pdf": PyMuPDFLoader,
-    ".txt": TextLoader,
-    ".text": TextLoader,  # 新增
-    ".docx": UnstructuredWordDocumentLoader,
-    ".doc": UnstructuredWordDocumentLoader,
-    ".xls": UnstructuredExcelLoader,
-    ".xlsx": UnstructuredExcelLoader,
-    ".html": UnstructuredHTMLLoader,
-    ".htm": UnstructuredHTMLLoader,
-    ".md": UnstructuredMarkdownLoader,
-    ".markdown": UnstructuredMarkdownLoader,
+    ".pdf": (LOADERS, "PyMuPDFLoader"),
+    ".txt": (LOADERS, "TextLoader"),
+    ".text": (LOADERS, "TextLoader"),  # 新增
+    ".docx": (LOADERS, "UnstructuredWordDocumentLoader"),
+    ".doc": (LOADERS, "UnstructuredWordDocumentLoader"),
+    ".xls": (LOADERS, "UnstructuredExcelLoader"),
+    ".xlsx": (LOADERS, "UnstructuredExcelLoader"),
+    ".html": (LOADERS, "UnstructuredHTMLLoader"),
+    ".htm": (LOADERS, "UnstructuredHTMLLoader"),
+    ".md": (LOADERS, "UnstructuredMarkdownLoader"),
+    ".markdown": (LOADERS, "UnstructuredMarkdownLoader"),
 }
 
+
+@functools.lru_cache(maxsize=None)
+def get_loader_class(ext: str):
+    """返回扩展名对应的 loader 类（首次调用时导入），不支持的类型返回 None。"""
+    spec = SUPPORTED_EXTENSIONS.get(ext)
+    if spec is None:
+        return None
+    module, name = spec
+    return getattr(importlib.import_module(module), name)
+
+
+_punkt_ready = None
+# 没有 punkt 数据（离线环境下载失败）时使用的分句规则：中英文句末标点处断开
+SENTENCE_END = re.compile(r"(?<=[.!?;])\s+|(?<=[。！？；])")
+
+
+def ensure_punkt() -> bool:
+    """
+    第一次按句子分块时检查 NLTK punkt 数据，本地没有才下载（不再在 import 阶段联网）。
+    离线下载失败时返回 False，分句退回到 SENTENCE_END 规则。
+    """
+    global _punkt_ready
+    if _punkt_ready is None:
+        import nltk
+        try:
+            nltk.data.find("tokenizers/punkt")
+            _punkt_ready = True
+        except LookupError:
+            _punkt_ready = bool(nltk.download("punkt", quiet=True))
+        if not _punkt_ready:
+            print("[Chunk] NLTK punkt unavailable, falling back to rule-based sentence splitting")
+    return _punkt_ready
+
+
+def split_sentences(text: str):
+    global _punkt_ready
+    if ensure_punkt():
+        from nltk.tokenize import sent_tokenize
+        try:
+            return sent_tokenize(text)
+        except LookupError:  # 新版 nltk 还需要 punkt_tab 数据
+            _punkt_ready = False
+            print("[Chunk] NLTK punkt_tab unavailable, falling back to rule-based sentence splitting")
+    return [s for s in (part.strip() for part in SENTENCE_END.split(text)) if s]
+
+
+def file_hash(path: Path, block_size: int = 1 << 20) -> str:
+    """按块计算文件 MD5，大文件不会整个读进内存。"""
+    h = hashlib.md5()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(block_size), b""):
+            h.update(block)
+    return h.hexdigest()
+
+
+def content_hash(text: str) -> str:
+    """分块内容的 SHA-1：增量分块与向量化检查点据此判断分块是否变化。"""
+    return hashlib.sha1(text.encode("utf-8")).hexdigest()
+
+
+def page_hash(text: str) -> str:
+    """清洗前页面原文的短哈希：未变化的页直接复用旧分块。"""
+    return hashlib.sha1(text.encode("utf-8")).hexdigest()[:16]
+
+
+def doc_key(name: str) -> str:
+    """文件的 ID 前缀：由源文件路径（raw_pdfs 下的文件名）得到，改名时由 process_documents 沿用旧前缀。"""
+    return hashlib.sha1(name.encode("utf-8")).hexdigest()[:8]
+
+
+def make_chunk_id(key: str, text_hash: str, occurrence: int = 0) -> str:
+    """
+    内容寻址的分块 ID：<文件前缀>-<内容哈希前 16 位>，同一文件中相同内容第 n 次出现（n>0）再加 -n。
+    内容不变则 ID 不变，与分块在文件中的位置、前面插入或删除了多少内容无关。
+    """
+    cid = f"{key}-{text_hash[:16]}"
+    return f"{cid}-{occurrence}" if occurrence else cid
+
+
+def load_chunk_records(path: Path) -> List[Dict[str, Any]]:
+    """读取已有的分块文件，不存在或损坏时返回空列表。"""
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return []
+
+
+def _iter_pdf_pages(path: str) -> Iterator[Any]:
+    """
+    用 PyMuPDF 逐页产出 Document，元数据与 PyMuPDFLoader 一致。
+    （PyMuPDFLoader.lazy_load 内部会先构建全部页再逐个返回，起不到流式的作用。）
+    """
+    import fitz  # PyMuPDF
+    from langchain.schema import Document
+
+    with fitz.open(path) as pdf:
+        doc_meta = {k: v for k, v in pdf.metadata.items() if type(v) in [str, int]}
+        for page in pdf:
+            yield Document(
+                page_content=page.get_text(),
+                metadata={"source": path, "file_path": path, "page": page.number, "total_pages": len(pdf), **doc_meta},
+            )
+
+
+def iter_documents(src: Path, ext: str, streaming: bool = True) -> Iterator[Any]:
+    """逐个产出文件的 Document（PDF 为逐页）。非 PDF 的 loader 大多仍一次性读入整个文件。"""
+    if streaming and ext == ".pdf":
+        yield from _iter_pdf_pages(str(src))
+        return
+    loader = get_loader_class(ext)(str(src))
+    yield from (loader.lazy_load() if streaming else loader.load())
+
+
+PDF_SOFT_BREAK = re.compile(r"-\s*\n")
+DEEP_CLEAN_EXTENSIONS = {".pdf", ".txt", ".text", ".doc", ".docx"}  # Markdown/表格/HTML 的行结构有意义，不做深度清洗
+WHITESPACE = re.compile(r"\s+")
+
+
+def clean_document(doc, ext: str) -> None:
+    """简单清洗（原地修改）：去掉 PDF 软换行、Markdown 多空行。"""
+    if ext == ".pdf":
+        t = doc.page_content.replace("•", "")
+        t = PDF_SOFT_BREAK.sub("", t)
+        doc.page_content = WHITESPACE.sub(" ", t)
+    elif ext in {".md", ".markdown"}:
+        # 去除多余空行，保留段落结构
+        doc.page_content = re.sub(r"\n{3,}", "\n\n", doc.page_content)
+
+
+def chunk_document(doc, ext: str, chunking_method: str, chunk_size: int = 400,
+                   chunk_overlap: int = 50) -> List[Any]:
+    """把一个 Document（通常是一页）按 chunking_method 分块；chunk_id 由 process_documents 统一生成。"""
+    from langchain.schema import Document
+
+    if chunking_method == "按页":
+        # PyMuPDFLoader 默认按页拆文档
+        return [doc]
+
+    chunks = []
+    if chunking_method == "按句子":
+        for sent in split_sentences(doc.page_content):
+            chunks.append(Document(page_content=sent, metadata=dict(doc.metadata)))
+
+    elif chunking_method == "按段落":
+        # 针对 Excel 文件，按单行分割
+        if ext in {".xls", ".xlsx"}:
+            paras = doc.page_content.split("\n")
+        else:
+            paras = doc.page_content.split("\n\n")
+        for para in paras:
+            para = para.strip()
+            if para:  # 跳过空段
+                chunks.append(Document(page_content=para, metadata=dict(doc.metadata)))
+
+    else:  # 固定长度
+        from langchain.text_splitter import CharacterTextSplitter
+        splitter = CharacterTextSplitter(
+            chunk_size=chunk_size,
+            chunk_overlap=chunk_overlap
+        )
+        chunks = splitter.split_documents([doc])
+    return chunks
+
+
+class ChunkFileWriter:
+    """
+    逐条追加写出分块 JSON 数组（格式与 json.dumps(..., indent=2) 相同）。
+    先写临时文件，正常结束时替换目标文件；出错时删除临时文件，旧的分块文件保持不变。
+    """
+
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        self.tmp = self.path.with_name(self.path.name + ".tmp")
+        self.count = 0
+        self._f = None
+
+    def __enter__(self) -> "ChunkFileWriter":
+        self._f = open(self.tmp, "w", encoding="utf-8")
+        self._f.write("[")
+        return self
+
+    def write(self, item: Dict[str, Any]) -> None:
+        body = json.dumps(item, ensure_ascii=False, indent=2).replace("\n", "\n  ")
+        self._f.write(("," if self.count else "") + "\n  " + body)
+        self.count += 1
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        if exc_type is None:
+            self._f.write("\n]" if self.count else "]")
+        self._f.close()
+        if exc_type is None:
+            os.replace(self.tmp, self.path)
+        else:
+            os.remove(self.tmp)
+
+
+@profiled("ingest", lambda a: os.path.dirname(os.path.normpath(str(a["output_folder"]))))
 def process_documents(
     input_folder: str,
     output_folder: str,
@@ -43,11 +243,46 @@ def process_documents(
     chunk_size: int = 400,
     chunk_overlap: int = 50,
     force_reprocess: bool = False,
+    progress_cb=None,
+    streaming: bool = True,
+    max_rss_mb: Optional[float] = None,
+    trace_memory: Optional[bool] = None,
+    dedup_threshold: Optional[float] = None,
+    deep_clean: Optional[bool] = None,
 ):
     """
     加载 input_folder 下所有支持文件，按 chunking_method 分块。
     如果 force_reprocess=True，会清空旧 chunks 并重跑所有文件。
+    返回本次运行的汇总（处理/跳过/失败的文件数、失败的文件名、耗时、每个文件的内存报告与分块增减）。
+    progress_cb: 每处理完一个文件回调 progress_cb(已完成文件数, 文件总数)；回调抛出的异常会中止处理，
+    已完成文件的 manifest 记录会保留，下次运行自动跳过。
+    streaming: 逐页加载（PDF 直接用 PyMuPDF 逐页读取），False 时一次性 loader.load()；两种方式的分块结果相同，
+               分块都是边生成边写入文件
+    max_rss_mb: 进程 RSS 软上限（MiB），默认取环境变量 RAG_INGEST_MAX_RSS_MB；超过的文件记为失败（见 memory_guard）
+    trace_memory: 用 tracemalloc 统计每个文件的 Python 分配峰值（会变慢），默认取 RAG_TRACE_MEMORY
+    dedup_threshold: 近似重复检测的 Jaccard 阈值（见 near_dup），默认取 RAG_DEDUP_THRESHOLD 或 0.9，0 表示关闭。
+                     与已有分块（包括本文件前面的分块）近似重复的分块记录 duplicate_of，向量化时跳过，
+                     每个文件的重复数及其来源文件写入 manifest 的 duplicates
+    deep_clean: PDF/文本/Word 页改用 clean_engine 深度清洗（合并断行与连字符断词、去角标与页码行），
+                默认取 RAG_DEEP_CLEAN；写入 manifest 的 chunk_params，切换后需要 force_reprocess 才会对已处理文件生效
+
+    增量分块：每条分块记录带 content_hash（分块文本的 SHA-1）、page（文档内的页序号）与 page_hash。
+    文件变化后重新处理时，分块方法与参数不变且原文未变的页直接复用旧分块（只刷新元数据），
+    并与旧分块的 ID 比较，得到新增/删除/未变的分块数（写入 manifest 的 changes）。
+
+    分块 ID 由文件前缀与内容哈希生成（见 make_chunk_id），分块文件为 <文件名含扩展名>_chunks.json：
+    同名不同类型的文件互不覆盖；内容不变的分块重新分块后 ID 不变，向量无需重算。
+    manifest 中 hash 相同、但原文件已不存在的记录视为改名，沿用其 ID 前缀与旧分块。
+    旧版本的 {stem}_chunks.json 会在该文件下次处理时迁移（改写为新 ID 与文件名后删除）。
     """
+    if max_rss_mb is None and os.getenv("RAG_INGEST_MAX_RSS_MB"):
+        max_rss_mb = float(os.getenv("RAG_INGEST_MAX_RSS_MB"))
+    if trace_memory is None:
+        trace_memory = os.getenv("RAG_TRACE_MEMORY", "").lower() in {"1", "true", "yes"}
+    if dedup_threshold is None:
+        dedup_threshold = float(os.getenv("RAG_DEDUP_THRESHOLD", "0.9"))
+    if deep_clean is None:
+        deep_clean = os.getenv("RAG_DEEP_CLEAN", "").lower() in {"1", "true", "yes"}
 
     input_folder = Path(input_folder)
     output_folder = Path(output_folder)
@@ -67,6 +302,7 @@ def process_documents(
         for f in chunks_folder.glob("*_chunks.json"):
             try: f.unlink()
             except: pass
+        shutil.rmtree(output_folder / "minhash", ignore_errors=True)  # near_dup 的签名目录
         manifest = {}
     else:
         # 读旧 manifest
@@ -76,125 +312,246 @@ def process_documents(
             manifest = {}
 
     # 统计信息
+    run_started = datetime.datetime.now().isoformat()
+    t0 = time.perf_counter()
+    if force_reprocess:
+        update_stats(str(output_folder), reset=True)
     total_files = 0
     processed_files = 0
     skipped_files = 0
     failed_files = 0
+    failed_names = []
+    memory = {}
+    changes = {}
+    chunk_params = {"chunk_size": chunk_size, "chunk_overlap": chunk_overlap}
+    engine = None
+    if deep_clean:
+        chunk_params["deep_clean"] = True  # 清洗方式不同的旧分块不能按页复用
+        engine = CleanEngine()
 
     # 遍历所有文件
     file_list = list(os.listdir(input_folder))
     total_files = len(file_list)
     print(f"[Chunk] Found {total_files} files in {input_folder}")
+    # 原文件已不存在的 manifest 记录：hash 相同的新文件视为改名
+    vanished = {m.get("hash"): name for name, m in manifest.items() if name not in file_list}
+    # 近似重复索引：已有分块文件的 MinHash 签名（没有签名的旧分块文件现算一次）
+    index = None
+    if dedup_threshold:
+        from near_dup import NearDupIndex
+        index = NearDupIndex(str(output_folder), dedup_threshold)
+        index.load(sorted(f.name for f in chunks_folder.glob("*_chunks.json")), str(chunks_folder))
+    n_duplicates = 0
 
     for idx, file in enumerate(file_list, 1):
+        if progress_cb and idx > 1:
+            progress_cb(idx - 1, total_files)
         src = input_folder / file
         ext = src.suffix.lower()
-        loader_cls = SUPPORTED_EXTENSIONS.get(ext)
-        if not loader_cls:
+        if ext not in SUPPORTED_EXTENSIONS:
             print(f"[Chunk] [{idx}/{total_files}] Skipping unsupported file: {file}")
             skipped_files += 1
             continue
 
-        # 计算文件 hash，判断是否需要处理
-        current_hash = hashlib.md5(src.read_bytes()).hexdigest()
+        # 计算文件 hash（分块读取，不把整个文件读进内存），判断是否需要处理
+        with metrics.timer("hash"):
+            current_hash = file_hash(src)
+        chunk_file = chunk_file_name(file)
         prev = manifest.get(file, {})
-        if not force_reprocess and prev.get("hash") == current_hash:
+        renamed_from = None
+        if not prev and current_hash in vanished:
+            renamed_from = vanished.pop(current_hash)
+            prev = manifest.pop(renamed_from)
+            update_stats(str(output_folder), removed=[renamed_from])
+            print(f"[Chunk] [{idx}/{total_files}] {file} is a rename of {renamed_from}, keeping its chunk IDs")
+        if not force_reprocess and prev.get("hash") == current_hash and prev.get("chunk_file") == chunk_file:
             print(f"[Chunk] [{idx}/{total_files}] Skipping unchanged file: {file}")
+            metrics.inc("rag_files_total", status="skipped")
             skipped_files += 1
             continue
 
         print(f"[Chunk] [{idx}/{total_files}] Processing {file} ...")
+        # 逐页加载、清洗、分块并追加写入分块文件，内存中只保留当前页；各阶段耗时按文件累计
+        spent = {"load": 0.0, "clean": 0.0, "chunk": 0.0, "dedup": 0.0}
+        n_chunks = 0
+        chunk_path = chunks_folder / chunk_file
+        # 旧分块（改名或旧版文件名时在原来的分块文件里）：记下旧 ID 用于比较；方法与参数不变时按页分组以便复用
+        old_path = chunks_folder / manifest_chunk_file(renamed_from or file, prev) if prev else chunk_path
+        old_records = load_chunk_records(old_path)
+        old_ids = {r["chunk_id"] for r in old_records}
+        key = prev.get("doc_key") or doc_key(file)
+        seen: Dict[str, int] = {}
+        reusable: Dict[int, List[Dict[str, Any]]] = {}
+        if prev.get("chunk_method") == chunking_method and prev.get("chunk_params") == chunk_params:
+            for r in old_records:
+                if r.get("page_hash"):
+                    reusable.setdefault(r["page"], []).append(r)
+        del old_records
+        diff = {"added": 0, "unchanged": 0, "removed": 0, "pages_reused": 0, "pages_chunked": 0}
+        old_sigs = {}
+        if index:
+            old_sigs = index.drop(chunk_file)
+            if old_path != chunk_path:
+                old_sigs.update(index.drop(old_path.name))
+        dups = {"chunks": 0, "of": {}}
+        get_loader_class(ext)  # 先导入 loader 相关模块，内存报告只反映文档本身
+        if ext == ".pdf":
+            import fitz  # noqa: F401
+        monitor = MemoryMonitor(max_rss_mb, trace=trace_memory)
         try:
-            loader = loader_cls(str(src))
-            docs = loader.load()
+            with monitor, ChunkFileWriter(chunk_path) as writer:
+                pages = iter_documents(src, ext, streaming)
+                page = 0
+                while True:
+                    t = time.perf_counter()
+                    doc = next(pages, None)
+                    spent["load"] += time.perf_counter() - t
+                    if doc is None:
+                        break
+                    p_hash = page_hash(doc.page_content)
+                    old = reusable.pop(page, None)
+                    if old and old[0]["page_hash"] == p_hash:
+                        # 原文未变：复用旧分块，元数据取自本次加载（PDF 元数据可能变了）
+                        texts = [(r["chunk_text"], r["content_hash"]) for r in old]
+                        metas = [dict(doc.metadata) for _ in old]
+                        diff["pages_reused"] += 1
+                    else:
+                        t = time.perf_counter()
+                        if engine and ext in DEEP_CLEAN_EXTENSIONS:
+                            doc.page_content = engine.clean_page(doc.page_content)
+                        else:
+                            clean_document(doc, ext)
+                        spent["clean"] += time.perf_counter() - t
+                        t = time.perf_counter()
+                        chunks = chunk_document(doc, ext, chunking_method, chunk_size, chunk_overlap)
+                        spent["chunk"] += time.perf_counter() - t
+                        texts = [(c.page_content, content_hash(c.page_content)) for c in chunks]
+                        metas = [c.metadata for c in chunks]
+                        diff["pages_chunked"] += 1
+                        del chunks
+                    for (text, text_hash), meta in zip(texts, metas):
+                        occurrence = seen.get(text_hash, 0)
+                        seen[text_hash] = occurrence + 1
+                        meta["chunk_id"] = cid = make_chunk_id(key, text_hash, occurrence)
+                        if cid in old_ids:
+                            old_ids.discard(cid)
+                            diff["unchanged"] += 1
+                        else:
+                            diff["added"] += 1
+                        record = {
+                            "chunk_id": cid,
+                            "chunk_text": text,
+                            "metadata": meta,
+                            "content_hash": text_hash,
+                            "page": page,
+                            "page_hash": p_hash,
+                        }
+                        if index:
+                            t = time.perf_counter()
+                            sig = old_sigs.get(text_hash)
+                            if sig is None:
+                                sig = index.signature(text)
+                            canonical = index.match(sig)
+                            index.add(chunk_file, cid, text_hash, sig, canonical)
+                            spent["dedup"] += time.perf_counter() - t
+                            if canonical:
+                                record["duplicate_of"] = canonical
+                                source = index.file_of[canonical][:-len("_chunks.json")]
+                                dups["chunks"] += 1
+                                dups["of"][source] = dups["of"].get(source, 0) + 1
+                        writer.write(record)
+                    n_chunks += len(texts)
+                    page += 1
+                    del doc, texts, metas, old
+                    monitor.check()
+            diff["removed"] = len(old_ids)
+            if old_path != chunk_path and old_path.exists():
+                old_path.unlink()  # 改名或旧版文件名：新分块文件已写好，删除原来的
+            if index:
+                index.save(chunk_file)
+                if old_path != chunk_path:
+                    index.remove(old_path.name)
         except Exception as e:
-            logging.error(f"Failed to load {file}: {e}")
+            logging.error(f"Failed to process {file}: {e}")
             print(f"[Chunk] [{idx}/{total_files}] Failed to process {file}: {e}")
+            metrics.inc("rag_files_total", status="failed")
             failed_files += 1
+            failed_names.append(file)
+            memory[file] = monitor.report()
+            if index:
+                index.drop(chunk_file)  # 本次写入一半的签名作废，磁盘上的旧签名保持不变
             continue
+        for stage, seconds in spent.items():
+            if stage == "dedup" and not index:
+                continue
+            labels = {"method": chunking_method} if stage == "chunk" else {"ext": ext}
+            metrics.observe(metrics.STAGE_SECONDS, seconds, stage=stage, **labels)
 
-        # 简单清洗：去掉 PDF 软换行、Markdown 多空行
-        if ext == ".pdf":
-            SOFT = re.compile(r"-\s*\n")
-            MULTI = re.compile(r"\s+")
-            for doc in docs:
-                t = doc.page_content.replace("•", "")
-                t = SOFT.sub("", t)
-                t = MULTI.sub(" ", t)
-                doc.page_content = t
-        if ext in {".md", ".markdown"}:
-            for doc in docs:
-                # 去除多余空行，保留段落结构
-                doc.page_content = re.sub(r"\n{3,}", "\n\n", doc.page_content)
-
-        # —— 分块逻辑 —— 
-        chunks = []
-        if chunking_method == "按页":
-            # PyMuPDFLoader 默认按页拆文档
-            chunks = docs
-
-        elif chunking_method == "按句子":
-            for doc in docs:
-                for i, sent in enumerate(sent_tokenize(doc.page_content)):
-                    chunks.append(Document(
-                        page_content=sent,
-                        metadata={**doc.metadata, "chunk_id": f"{src.stem}_sent{i}"}
-                    ))
-
-        elif chunking_method == "按段落":
-            for doc in docs:
-                # 针对 Excel 文件，按单行分割
-                if ext in {".xls", ".xlsx"}:
-                    paras = doc.page_content.split("\n")
-                else:
-                    paras = doc.page_content.split("\n\n")
-                for i, para in enumerate(paras):
-                    para = para.strip()
-                    if para:  # 跳过空段
-                        chunks.append(Document(
-                            page_content=para,
-                            metadata={**doc.metadata, "chunk_id": f"{src.stem}_para{i}"}
-                        ))
-
-        else:  # 固定长度
-            splitter = CharacterTextSplitter(
-                chunk_size=chunk_size,
-                chunk_overlap=chunk_overlap
-            )
-            chunks = splitter.split_documents(docs)
-
-        # 修正：为所有 chunk 自动补全 chunk_id，防止为空
-        for idx, chunk in enumerate(chunks):
-            if not chunk.metadata.get("chunk_id") or not str(chunk.metadata.get("chunk_id")).strip():
-                chunk.metadata["chunk_id"] = f"{src.stem}_chunk{idx}"
-
-        logging.info(f"[Chunk] {file}: {len(chunks)} chunks generated.")
-        print(f"[Chunk] [{idx}/{total_files}] {file}: {len(chunks)} chunks generated.")
-
-        # 写出 chunks JSON
-        out = []
-        for chunk in chunks:
-            out.append({
-                "chunk_id": chunk.metadata.get("chunk_id", ""),
-                "chunk_text": chunk.page_content,
-                "metadata": chunk.metadata
-            })
-        (chunks_folder / f"{src.stem}_chunks.json")\
-            .write_text(json.dumps(out, ensure_ascii=False, indent=2),
-                        encoding="utf-8")
+        mem = memory[file] = monitor.report()
+        mem_note = f"peak RSS {mem['rss_peak_mb']} MiB" if mem["rss_peak_mb"] is not None else "RSS n/a"
+        if mem["traced_peak_mb"] is not None:
+            mem_note += f", traced peak {mem['traced_peak_mb']} MiB"
+        logging.info(f"[Chunk] {file}: {n_chunks} chunks generated.")
+        changes[file] = diff
+        n_duplicates += dups["chunks"]
+        if dups["chunks"]:
+            mem_note = f"{dups['chunks']} near-duplicates; " + mem_note
+        print(f"[Chunk] [{idx}/{total_files}] {file}: {n_chunks} chunks generated "
+              f"(+{diff['added']} -{diff['removed']} ={diff['unchanged']}, "
+              f"{diff['pages_reused']} pages reused; {mem_note}).")
 
         # 更新 manifest
         manifest[file] = {
             "hash": current_hash,
-            "n_chunks": len(chunks),
+            "n_chunks": n_chunks,
             "last_processed": datetime.datetime.now().isoformat(),
-            "chunk_method": chunking_method  # 新增字段
+            "chunk_method": chunking_method,  # 新增字段
+            "chunk_params": chunk_params,
+            "chunk_file": chunk_file,
+            "doc_key": key,
+            "changes": diff,
+            "duplicates": {**dups, "ratio": round(dups["chunks"] / n_chunks, 3) if n_chunks else 0.0},
         }
+        update_stats(str(output_folder), files={file: {
+            "chunk_file": chunk_file,
+            "n_chunks": n_chunks,
+            "last_processed": manifest[file]["last_processed"],
+            "memory": mem,
+            "changes": diff,
+            "n_duplicates": dups["chunks"],
+        }})
 
+        metrics.inc("rag_files_total", status="processed")
+        metrics.inc("rag_chunks_total", n_chunks, stage="created")
+        metrics.inc("rag_chunks_total", diff["unchanged"], stage="unchanged")
+        metrics.inc("rag_chunks_total", dups["chunks"], stage="duplicate")
         processed_files += 1
+        # 每个文件完成后立即落盘 manifest，中断后重跑可以跳过已完成的文件
+        manifest_path.write_text(json.dumps(manifest, ensure_ascii=False, indent=2),
+                                 encoding="utf-8")
+
+    if progress_cb and total_files:
+        progress_cb(total_files, total_files)
 
     # 保存 manifest
     manifest_path.write_text(json.dumps(manifest, ensure_ascii=False, indent=2),
                              encoding="utf-8")
+    run = {
+        "stage": "preprocess",
+        "started": run_started,
+        "duration": round(time.perf_counter() - t0, 2),
+        "chunking_method": chunking_method,
+        "total": total_files,
+        "processed": processed_files,
+        "skipped": skipped_files,
+        "failed": failed_files,
+        "max_rss_mb": max_rss_mb,
+        "peak_rss_mb": max((m["rss_peak_mb"] for m in memory.values() if m["rss_peak_mb"] is not None), default=None),
+        "chunks": {k: sum(d[k] for d in changes.values()) for k in ("added", "removed", "unchanged")},
+        "duplicates": n_duplicates,
+    }
+    update_stats(str(output_folder), run=run)
+    metrics.flush()
     print(f"[Chunk] Done. Total: {total_files}, Processed: {processed_files}, Skipped: {skipped_files}, Failed: {failed_files}")
     logging.info(f"[Chunk] Done. Total: {total_files}, Processed: {processed_files}, Skipped: {skipped_files}, Failed: {failed_files}")
+    return {**run, "failed_files": failed_names, "memory": memory, "changes": changes}
@@ -1,20 +1,11 @@
 import os
-import json
 import streamlit as st
-from preprocess import preprocess_pdfs
-from embed import create_embeddings
-from retrieve import search
-from summarize import summarize_chunks
+from pipeline import embed, ingest, project_paths, summarize
 
-# Paths for processing
+# 单项目的简易流程页：分块 → 向量化 → 检索并摘要（与 cli.py 使用同一套 pipeline 接口）
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
-UPLOAD_FOLDER = os.path.join(BASE_DIR, "uploaded_pdfs")
-PROCESSED_FOLDER = os.path.join(BASE_DIR, "processed_data")
-EMBEDDINGS_FILE = os.path.join(PROCESSED_FOLDER, "embeddings.npy")
-METADATA_FILE = os.path.join(PROCESSED_FOLDER, "metadata.json")
-
-os.makedirs(UPLOAD_FOLDER, exist_ok=True)
-os.makedirs(PROCESSED_FOLDER, exist_ok=True)
+PROJECT_FOLDER = os.path.join(BASE_DIR, "projects", "pipeline_demo")
+paths = project_paths(PROJECT_FOLDER)
 
 # Streamlit UI
 st.title("LLM Pipeline with Midpoint (Embeddings)")
@@ -25,59 +16,38 @@ uploaded_files = st.file_uploader("Upload PDFs:", type="pdf", accept_multiple_fi
 
 if uploaded_files:
     for uploaded_file in uploaded_files:
-        with open(os.path.join(UPLOAD_FOLDER, uploaded_file.name), "wb") as f:
+        with open(os.path.join(paths["raw"], uploaded_file.name), "wb") as f:
             f.write(uploaded_file.read())
     st.success(f"Uploaded {len(uploaded_files)} PDF(s).")
 
 if st.button("Run Preprocessing"):
     st.info("Preprocessing PDFs...")
-    preprocess_pdfs(UPLOAD_FOLDER, PROCESSED_FOLDER)
-    st.success("Preprocessing complete! Chunks saved.")
+    result = ingest(PROJECT_FOLDER)
+    st.success(f"Preprocessing complete! Processed {result['processed']}, skipped {result['skipped']}, "
+               f"failed {result['failed']}.")
 
 # Step 2: Embedding Generation
 st.header("Step 2: Generate Embeddings")
 if st.button("Generate Embeddings"):
-    processed_file = os.path.join(PROCESSED_FOLDER, "processed_chunks.json")
     st.info("Generating embeddings...")
-    create_embeddings(processed_file, EMBEDDINGS_FILE, METADATA_FILE)
-    st.success("Embeddings generated and saved!")
+    summary = embed(PROJECT_FOLDER)
+    if summary["failed"] or summary["remaining"]:
+        st.warning(f"Embedded {summary['embedded']} chunks; {summary['failed']} failed, "
+                   f"{summary['remaining']} remaining. Run again to resume.")
+    else:
+        st.success(f"Embeddings generated and saved! ({summary['embedded']} new, {summary['skipped']} skipped)")
 
 # Step 3: Query for Retrieval and Summarization
 st.header("Step 3: Query and Summarization")
 query = st.text_input("Enter your query:")
 
 if query and st.button("Run Retrieval and Summarization"):
-    st.info("Retrieving relevant chunks...")
-    top_k = 5
-    results = search(query, top_k=top_k)
-
-    # Load metadata to fetch chunk text
-    with open(METADATA_FILE, "r", encoding="utf-8") as f:
-        metadata = json.load(f)
-
-    chunks = []
-    for result in results:
-        chunk_id = result["chunk_id"]
-        for entry in metadata:
-            if entry["chunk_id"] == chunk_id:
-                chunks.append({"chunk_text": entry["chunk_text"]})
-                break
-
-    # Summarize retrieved chunks
-    st.info("Summarizing retrieved chunks...")
-    prompt_template = (
-        "You are given the following excerpts from research papers:\n\n"
-        "{context}\n\n"
-        "Please create a structured literature review with the following sections:\n"
-        "1. Introduction\n"
-        "2. Key Findings\n"
-        "3. Challenges\n"
-        "4. Future Directions\n"
-        "Ensure each section is concise and captures the main points from the excerpts."
-    )
-    if chunks:
-        summary = summarize_chunks(chunks, prompt_template)
+    st.info("Retrieving and summarizing relevant chunks...")
+    result = summarize(PROJECT_FOLDER, query, top_k=5)
+    if not result["sources"]:
+        st.warning("No relevant chunks found for the query.")
+    elif result["summary"]:
         st.success("Summarization complete!")
-        st.text_area("Generated Summary", summary, height=300)
+        st.text_area("Generated Summary", result["summary"], height=300)
     else:
-        st.warning("No relevant chunks found for the query.")
+        st.error("Summarization failed.")
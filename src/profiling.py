@@ -0,0 +1,218 @@
+# profiling.py
+"""
+可选的性能剖析：默认关闭，设置 RAG_PROFILE=1、在 RAG 页勾选“性能剖析”或 cli 加 --profile 时开启。
+
+开启后，预处理（process_documents）、向量化（create_or_update_embeddings）与查询流程（检索 + 摘要/卡片生成）
+每运行一次，就在项目目录下写出：
+    <project>/profiles/<name>-<时间戳>.prof        cProfile 数据（snakeviz / python -m pstats 可直接打开）
+    <project>/profiles/<name>-<时间戳>.collapsed   调用栈采样（折叠格式 "a;b;c 次数"，可直接交给
+                                                    flamegraph.pl / speedscope / inferno 生成火焰图）
+采样线程每 RAG_PROFILE_INTERVAL 毫秒（默认 5）记录一次被剖析线程的调用栈；cProfile 会放慢纯 Python 代码，
+采样结果更接近真实的耗时比例。每个项目只保留最近 MAX_PROFILES 份。
+
+cProfile 与采样默认只看进入 profile() 的线程。交给工作线程执行的函数用 traced(fn) 包一层
+（query_pipeline 的 asyncio.to_thread 已经这样做）：剖析进行中时，该线程的 cProfile 数据合并进同一个 .prof，
+调用栈也一并采样。
+
+同一时间只剖析一个流程：嵌套调用（如 pipeline.summarize 内部的检索）或其它线程同时进入时直接运行、不剖析。
+
+开关：RAG_PROFILE / set_enabled() 对整个进程生效（cli、后台任务）；Streamlit 每个会话各自的复选框
+用 set_session_enabled() 设置，只影响当前上下文（该会话本次运行的脚本线程及其派生的工作线程）。
+"""
+import cProfile
+import contextvars
+import functools
+import inspect
+import os
+import pstats
+import sys
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Any, Callable, Dict, Iterator, List, Optional
+
+PROFILES_DIR = "profiles"
+MAX_PROFILES = 20
+
+_enabled = os.getenv("RAG_PROFILE", "").lower() in {"1", "true", "yes"}
+_session_enabled: contextvars.ContextVar = contextvars.ContextVar("profile_session_enabled", default=None)
+_active: contextvars.ContextVar = contextvars.ContextVar("profile_active", default=None)
+_active_lock = threading.Lock()
+
+
+def set_enabled(enabled: bool) -> None:
+    """进程级开关。"""
+    global _enabled
+    _enabled = enabled
+
+
+def set_session_enabled(enabled: Optional[bool]) -> None:
+    """当前上下文的开关（Streamlit 会话），None 表示沿用进程级开关。"""
+    _session_enabled.set(enabled)
+
+
+def is_enabled() -> bool:
+    enabled = _session_enabled.get()
+    return _enabled if enabled is None else enabled
+
+
+class StackSampler:
+    """后台线程定时读取目标线程（可以随时增减）的当前调用栈，按折叠格式计数。"""
+
+    def __init__(self, thread_id: int, interval: float = 0.005):
+        self.thread_ids = {thread_id}
+        self.interval = interval
+        self.stacks: Counter = Counter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="stack-sampler", daemon=True)
+
+    def start(self) -> "StackSampler":
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.interval):
+            frames = sys._current_frames()
+            for thread_id in list(self.thread_ids):
+                frame = frames.get(thread_id)
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+                    frame = frame.f_back
+                if stack:
+                    self.stacks[";".join(reversed(stack))] += 1
+
+    def write_collapsed(self, path: str) -> None:
+        with open(path, "w", encoding="utf-8") as f:
+            for stack, count in self.stacks.most_common():
+                f.write(f"{stack} {count}\n")
+
+
+def _prune(folder: str, keep: int = MAX_PROFILES) -> None:
+    runs = list_profiles(os.path.dirname(folder))
+    for prof in runs[keep:]:
+        for path in (prof, os.path.splitext(prof)[0] + ".collapsed"):
+            if os.path.exists(path):
+                os.remove(path)
+
+
+@contextmanager
+def profile(project_folder: str, name: str) -> Iterator[Dict[str, str]]:
+    """
+    剖析 with 块内的代码，结束后写出 .prof 与 .collapsed 文件。
+    产出一个字典，退出时填入 {"prof", "collapsed"} 路径；未开启或已有剖析在进行时保持为空。
+    """
+    paths: Dict[str, str] = {}
+    if not is_enabled() or not _active_lock.acquire(blocking=False):
+        yield paths
+        return
+    try:
+        interval = float(os.getenv("RAG_PROFILE_INTERVAL", "5")) / 1000
+        sampler = StackSampler(threading.get_ident(), interval).start()
+        profiler = cProfile.Profile()
+        workers: List[cProfile.Profile] = []  # traced() 在工作线程中产生的 cProfile 数据
+        token = _active.set((sampler, workers))
+        started = time.perf_counter()
+        profiler.enable()
+        try:
+            yield paths
+        finally:
+            profiler.disable()
+            _active.reset(token)
+            sampler.stop()
+            elapsed = time.perf_counter() - started
+            folder = os.path.join(project_folder, PROFILES_DIR)
+            os.makedirs(folder, exist_ok=True)
+            stem = os.path.join(folder, f"{name}-{datetime.now().strftime('%Y%m%d-%H%M%S-%f')}")
+            stats = pstats.Stats(profiler)
+            for worker in workers:
+                stats.add(worker)
+            stats.dump_stats(stem + ".prof")
+            sampler.write_collapsed(stem + ".collapsed")
+            _prune(folder)
+            paths.update(prof=stem + ".prof", collapsed=stem + ".collapsed")
+            print(f"[Profile] {name}: {elapsed:.2f}s, {sum(sampler.stacks.values())} samples -> {stem}.prof")
+    finally:
+        _active_lock.release()
+
+
+def traced(fn: Callable) -> Callable:
+    """
+    包装要交给工作线程执行的函数：调用时（上下文中有进行中的 profile()，asyncio.to_thread 会复制上下文）
+    在该线程开启 cProfile 并加入调用栈采样，结果合并进同一份剖析；没有剖析时直接调用 fn。
+    """
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        active = _active.get()
+        if active is None:
+            return fn(*args, **kwargs)
+        sampler, workers = active
+        thread_id = threading.get_ident()
+        profiler = cProfile.Profile()
+        try:
+            profiler.enable()
+        except ValueError:  # Python 3.12+ 的 cProfile 基于 sys.monitoring，只能有一个，且已覆盖所有线程
+            profiler = None
+        sampler.thread_ids.add(thread_id)
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            sampler.thread_ids.discard(thread_id)
+            if profiler is not None:
+                profiler.disable()
+                workers.append(profiler)
+    return wrapper
+
+
+def profiled(name: str, project_of: Callable[[Dict[str, Any]], str]):
+    """
+    装饰器版本的 profile()。project_of 从绑定后的参数字典取得项目目录，例如
+        @profiled("ingest", lambda a: os.path.dirname(os.path.normpath(a["output_folder"])))
+    """
+    def decorator(fn):
+        signature = inspect.signature(fn)
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            if not is_enabled():
+                return fn(*args, **kwargs)
+            bound = signature.bind(*args, **kwargs)
+            bound.apply_defaults()
+            with profile(project_of(bound.arguments), name):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def list_profiles(project_folder: str) -> List[str]:
+    """项目中已有的 .prof 文件，最新的在前。"""
+    folder = os.path.join(project_folder, PROFILES_DIR)
+    if not os.path.isdir(folder):
+        return []
+    paths = [os.path.join(folder, fn) for fn in os.listdir(folder) if fn.endswith(".prof")]
+    return sorted(paths, key=os.path.getmtime, reverse=True)
+
+
+def top_hotspots(prof_path: str, limit: int = 15, sort: str = "cumulative") -> List[Dict[str, Any]]:
+    """读取 .prof，返回按 sort（'cumulative' 或 'tottime'）排序的前 limit 个函数。"""
+    stats = pstats.Stats(prof_path)
+    key = 3 if sort == "cumulative" else 2
+    rows = []
+    for (filename, line, func), (cc, ncalls, tottime, cumtime, _) in stats.stats.items():
+        rows.append({
+            "function": func,
+            "location": f"{os.path.basename(filename)}:{line}" if line else filename,
+            "ncalls": ncalls,
+            "tottime_s": round(tottime, 4),
+            "cumtime_s": round(cumtime, 4),
+            "_key": (cc, ncalls, tottime, cumtime)[key],
+        })
+    rows.sort(key=lambda r: r["_key"], reverse=True)
+    return [{k: v for k, v in r.items() if k != "_key"} for r in rows[:limit]]
@@ -0,0 +1,145 @@
+# project_stats.py
+"""
+项目统计目录（processed/stats.json）：由预处理与向量化步骤增量更新，RAG 仪表板直接读取，
+不再在每次 Streamlit 重绘时读取全部分块文件或从 Chroma 拉取全部 ID。
+
+    {
+      "files": {"paper.pdf": {"chunk_file": "paper.pdf_chunks.json", "n_chunks": 120, "n_embedded": 120,
+                              "last_processed": "...", "last_embedded": "..."}},
+      "n_chunks": 120,          # 所有文件分块数之和
+      "n_duplicates": 0,        # 其中近似重复、不单独向量化的分块数（见 near_dup）
+      "n_embedded": 120,        # 向量库 collection.count()
+      "runs": {"preprocess": {...}, "embed": {...}},   # 最近一次运行的耗时与结果
+      "updated": "..."
+    }
+
+预处理与向量化可能在不同进程中（后台任务、CLI）同时更新，读-改-写在锁文件 stats.json.lock 下进行。
+"""
+import json
+import os
+import threading
+from datetime import datetime
+from typing import Any, Dict, Iterable, Optional
+
+from metrics import file_lock
+
+STATS_FILE = "stats.json"
+_lock = threading.Lock()
+
+
+def _stats_path(processed_dir: str) -> str:
+    return os.path.join(processed_dir, STATS_FILE)
+
+
+def _empty() -> Dict[str, Any]:
+    return {"files": {}, "n_chunks": 0, "n_embedded": 0, "runs": {}, "updated": None}
+
+
+def load_stats(processed_dir: str) -> Optional[Dict[str, Any]]:
+    path = _stats_path(processed_dir)
+    if not os.path.exists(path):
+        return None
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def _save(processed_dir: str, stats: Dict[str, Any]) -> None:
+    stats["n_chunks"] = sum(f.get("n_chunks", 0) for f in stats["files"].values())
+    stats["n_duplicates"] = sum(f.get("n_duplicates", 0) for f in stats["files"].values())
+    stats["updated"] = datetime.now().isoformat()
+    path = _stats_path(processed_dir)
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(stats, f, ensure_ascii=False, indent=2)
+    os.replace(tmp, path)
+
+
+def update_stats(
+    processed_dir: str,
+    files: Optional[Dict[str, Dict[str, Any]]] = None,
+    removed: Iterable[str] = (),
+    reset: bool = False,
+    n_embedded: Optional[int] = None,
+    run: Optional[Dict[str, Any]] = None,
+) -> Dict[str, Any]:
+    """
+    增量更新统计目录并返回更新后的内容。
+
+    Args:
+        files: 文件名 -> 需要合并的字段（如 {"n_chunks": 12, "chunk_file": ...}）
+        removed: 需要删除的文件名
+        reset: 先清空文件统计（强制重新预处理时使用）
+        n_embedded: 向量库中的向量总数（collection.count()）
+        run: {"stage": "preprocess" | "embed", ...}，记录为该阶段最近一次运行
+    """
+    os.makedirs(processed_dir, exist_ok=True)
+    with _lock, file_lock(_stats_path(processed_dir)):
+        stats = load_stats(processed_dir) or _empty()
+        if reset:
+            stats["files"] = {}
+        for name in removed:
+            stats["files"].pop(name, None)
+        for name, fields in (files or {}).items():
+            stats["files"].setdefault(name, {}).update(fields)
+        if n_embedded is not None:
+            stats["n_embedded"] = n_embedded
+        if run:
+            run = dict(run)
+            stats["runs"][run.pop("stage")] = run
+        _save(processed_dir, stats)
+        return stats
+
+
+def chunk_file_name(name: str) -> str:
+    """源文件对应的分块文件名，保留扩展名（paper.pdf -> paper.pdf_chunks.json），同名不同类型的文件不会互相覆盖。"""
+    return f"{name}_chunks.json"
+
+
+def manifest_chunk_file(name: str, entry: Dict[str, Any]) -> str:
+    """manifest 记录对应的分块文件；没有 chunk_file 字段的旧记录是 {stem}_chunks.json。"""
+    return entry.get("chunk_file") or f"{os.path.splitext(name)[0]}_chunks.json"
+
+
+def file_for_chunk_file(stats: Dict[str, Any], chunk_file: str) -> str:
+    """根据分块文件名找到对应的源文件名；找不到时返回分块文件名本身。"""
+    for name, info in stats.get("files", {}).items():
+        if info.get("chunk_file") == chunk_file:
+            return name
+    return chunk_file
+
+
+def rebuild_stats(processed_dir: str, db_dir: Optional[str] = None) -> Dict[str, Any]:
+    """
+    从 manifest 与向量库重建统计目录（旧项目第一次打开时，或手动“重新统计”时使用）。
+    分块数取自 manifest，向量数使用 collection.count()，都不读取分块内容；已有的每文件嵌入数会保留。
+    """
+    manifest_path = os.path.join(processed_dir, "manifest.json")
+    previous = (load_stats(processed_dir) or _empty())["files"]
+    files = {}
+    if os.path.exists(manifest_path):
+        with open(manifest_path, "r", encoding="utf-8") as f:
+            for name, m in json.load(f).items():
+                files[name] = {
+                    **previous.get(name, {}),
+                    "chunk_file": manifest_chunk_file(name, m),
+                    "n_chunks": m.get("n_chunks", 0),
+                    "last_processed": m.get("last_processed"),
+                }
+    n_embedded = collection_count(db_dir) if db_dir else 0
+    return update_stats(processed_dir, files=files, reset=True, n_embedded=n_embedded)
+
+
+def collection_count(db_dir: str, collection_name: str = "literature_chunks") -> int:
+    """直接用 chromadb 客户端读取集合大小，不需要 embedding 函数，也不拉取 ID。"""
+    if not os.path.isdir(db_dir):
+        return 0
+    try:
+        import chromadb
+        client = chromadb.PersistentClient(path=db_dir)
+        return client.get_collection(collection_name).count()
+    except Exception as e:
+        print(f"[Stats] Failed to count vectors in {db_dir}: {e}")
+        return 0
@@ -0,0 +1,125 @@
+# query_pipeline.py
+"""
+推测式检索：查询改写（LLM，1–3 秒）与原始查询检索并行进行。
+
+    raw query ──► retrieve(raw) ──► on_first_results()   （先给用户看）
+        └──────► rewrite(raw) ──► retrieve(rewritten) ──► 融合 / 替换 ──► 最终结果
+
+各阶段的起止时间（相对流水线开始）记录在 result["timings"] 中，可直接看出改写与检索的重叠。
+"""
+import asyncio
+import time
+from typing import Any, Callable, Dict, List, Optional
+
+import profiling
+
+RRF_K = 60  # Reciprocal Rank Fusion 常数
+
+
+def reciprocal_rank_fusion(result_lists: List[List[Dict[str, Any]]], top_k: int, k: int = RRF_K) -> List[Dict[str, Any]]:
+    """
+    按 chunk_id 融合多路检索结果：score = Σ 1 / (k + rank)。
+    同一 chunk 保留距离最小的那条记录，rank 按融合分数重新编号。
+    """
+    scores: Dict[str, float] = {}
+    best: Dict[str, Dict[str, Any]] = {}
+    for results in result_lists:
+        for rank, hit in enumerate(results, 1):
+            cid = hit["chunk_id"]
+            scores[cid] = scores.get(cid, 0.0) + 1.0 / (k + rank)
+            if cid not in best or hit.get("distance", float("inf")) < best[cid].get("distance", float("inf")):
+                best[cid] = hit
+    fused = sorted(scores, key=lambda cid: scores[cid], reverse=True)[:top_k]
+    return [{**best[cid], "rank": i, "fusion_score": scores[cid]} for i, cid in enumerate(fused, 1)]
+
+
+class _StageTimer:
+    def __init__(self):
+        self.t0 = time.perf_counter()
+        self.timings: Dict[str, Dict[str, float]] = {}
+
+    async def run(self, name: str, fn: Callable, *args):
+        start = time.perf_counter() - self.t0
+        try:
+            return await asyncio.to_thread(profiling.traced(fn), *args)
+        finally:
+            end = time.perf_counter() - self.t0
+            self.timings[name] = {"start": round(start, 3), "end": round(end, 3), "duration": round(end - start, 3)}
+
+
+def _overlap(a: Optional[Dict[str, float]], b: Optional[Dict[str, float]]) -> float:
+    if not a or not b:
+        return 0.0
+    return round(max(0.0, min(a["end"], b["end"]) - max(a["start"], b["start"])), 3)
+
+
+async def run_speculative_query(
+    raw_query: str,
+    rewrite: Optional[Callable[[str], str]],
+    retrieve: Callable[[str], List[Dict[str, Any]]],
+    top_k: int,
+    fusion: str = "rrf",
+    on_first_results: Optional[Callable[[List[Dict[str, Any]]], None]] = None,
+) -> Dict[str, Any]:
+    """
+    Args:
+        raw_query: 用户原始查询
+        rewrite: 查询改写函数（同步，会放到线程中执行）；为 None 时只检索原始查询
+        retrieve: 检索函数，输入查询返回 search() 格式的结果列表
+        top_k: 最终保留的结果数
+        fusion: "rrf" 融合两路结果；"replace" 用改写后的结果替换原始结果
+        on_first_results: 原始查询结果就绪时的回调（在事件循环线程中调用）
+
+    Returns:
+        dict: {"query": 最终查询, "results": 最终结果, "raw_results": 原始查询结果, "timings": 各阶段耗时}
+    """
+    timer = _StageTimer()
+    raw_task = asyncio.create_task(timer.run("retrieve_raw", retrieve, raw_query))
+    rewrite_task = asyncio.create_task(timer.run("rewrite", rewrite, raw_query)) if rewrite else None
+
+    raw_results = await raw_task
+    if on_first_results:
+        on_first_results(raw_results)
+
+    query = raw_query
+    results = raw_results
+    if rewrite_task is not None:
+        rewritten = (await rewrite_task or "").strip()
+        if rewritten and rewritten != raw_query.strip():
+            query = rewritten
+            rewritten_results = await timer.run("retrieve_rewritten", retrieve, rewritten)
+            start = time.perf_counter()
+            if fusion == "replace":
+                results = rewritten_results
+            else:
+                results = reciprocal_rank_fusion([rewritten_results, raw_results], top_k)
+            timer.timings["fuse"] = {"duration": round(time.perf_counter() - start, 3)}
+
+    timings = dict(timer.timings)
+    timings["overlap"] = _overlap(timings.get("rewrite"), timings.get("retrieve_raw"))
+    timings["total"] = round(time.perf_counter() - timer.t0, 3)
+    return {"query": query, "results": results, "raw_results": raw_results, "timings": timings}
+
+
+def speculative_search(raw_query: str,
+                       rewrite: Optional[Callable[[str], str]],
+                       retrieve: Callable[[str], List[Dict[str, Any]]],
+                       top_k: int,
+                       fusion: str = "rrf",
+                       on_first_results: Optional[Callable[[List[Dict[str, Any]]], None]] = None) -> Dict[str, Any]:
+    """run_speculative_query 的同步封装，供 Streamlit 脚本直接调用。"""
+    return asyncio.run(run_speculative_query(raw_query, rewrite, retrieve, top_k, fusion, on_first_results))
+
+
+def format_timings(timings: Dict[str, Any]) -> str:
+    """把阶段耗时格式化为一行文本，例如 'rewrite 0.00–1.82s | retrieve_raw 0.00–0.41s | overlap 0.41s'。"""
+    parts = []
+    for name in ("rewrite", "retrieve_raw", "retrieve_rewritten"):
+        t = timings.get(name)
+        if t:
+            parts.append(f"{name} {t['start']:.2f}–{t['end']:.2f}s")
+    if "fuse" in timings:
+        parts.append(f"fuse {timings['fuse']['duration']:.3f}s")
+    parts.append(f"overlap {timings.get('overlap', 0):.2f}s")
+    parts.append(f"total {timings.get('total', 0):.2f}s")
+    return " | ".join(parts)
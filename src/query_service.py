@@ -0,0 +1,302 @@
+# query_service.py
+"""
+本地 HTTP 查询服务：让其他内部工具通过 HTTP 获取检索、摘要与卡片生成结果。
+
+与 Streamlit 每个会话重新初始化不同，服务进程常驻并保持以下状态：
+- 每个项目的 Chroma 集合与分块正文索引（manifest 变化后自动重新加载分块索引）
+- 共享的 embedding / chat 客户端及其连接池
+- 查询向量微批处理：并发请求的查询文本在 max_wait_ms 内合并为一次 embedding 请求
+
+接口（请求与响应均为 JSON，project 为 projects 目录下的项目名）：
+    GET  /health
+    GET  /metrics    Prometheus 文本格式（见 metrics.py）
+    POST /search     {"project", "query", "top_k"=10, "threshold"}
+    POST /summarize  {"project", "query", "top_k"=10, "template", "model", "max_tokens", "temperature", "lang"}
+    POST /cards      {"project", "query", "top_k"=10, "card_type"="qa", "difficulty", "detail_level",
+                      "num_cards"=5, "lang"="en", "avoid_existing"=0}
+
+    python query_service.py --port 8765 [--projects-dir projects] [--max-batch 64] [--max-wait-ms 5]
+
+错误响应为 {"error": ...}：400 参数错误，404 项目不存在，502 上游 LLM/Embedding 调用失败。
+"""
+import argparse
+import asyncio
+import os
+import re
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Optional
+
+import metrics
+from async_http import HTTPError, Request, server_port, start_server
+from llm_client import LLMCallError
+
+PROJECTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "projects")
+PROJECT_NAME = re.compile(r"^[\w\-. ]+$")
+
+
+class QueryEmbedder:
+    """
+    查询向量微批处理器：embed() 把查询放入队列，后台任务在 max_wait 秒内凑满最多 max_batch 条
+    （相同文本去重）后调用一次 embed_documents；最多 max_inflight 个批次同时在途。
+    """
+
+    def __init__(self, embed_fn, max_batch: int = 64, max_wait: float = 0.005, max_inflight: int = 4):
+        self.embed_fn = embed_fn
+        self.max_batch = max_batch
+        self.max_wait = max_wait
+        self.max_inflight = max_inflight
+        self.stats = {"requests": 0, "batches": 0, "texts": 0}
+        self._queue: Optional[asyncio.Queue] = None
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self) -> None:
+        self._queue = asyncio.Queue()
+        self._task = asyncio.create_task(self._run())
+
+    async def embed(self, text: str) -> List[float]:
+        future = asyncio.get_running_loop().create_future()
+        self.stats["requests"] += 1
+        await self._queue.put((text, future))
+        return await future
+
+    async def _run(self) -> None:
+        loop = asyncio.get_running_loop()
+        slots = asyncio.Semaphore(self.max_inflight)
+        while True:
+            await slots.acquire()  # 在途批次已满时请求在队列中继续累积，下一批更大
+            batch = [await self._queue.get()]
+            deadline = loop.time() + self.max_wait
+            while len(batch) < self.max_batch:
+                if not self._queue.empty():
+                    batch.append(self._queue.get_nowait())
+                    continue
+                remaining = deadline - loop.time()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self._queue.get(), remaining))
+                except asyncio.TimeoutError:
+                    break
+            asyncio.create_task(self._flush(batch, slots))
+
+    async def _flush(self, batch, slots: asyncio.Semaphore) -> None:
+        try:
+            texts = list(dict.fromkeys(text for text, _ in batch))
+            self.stats["batches"] += 1
+            self.stats["texts"] += len(texts)
+            vectors = await asyncio.to_thread(self.embed_fn.embed_documents, texts)
+            by_text = dict(zip(texts, vectors))
+            for text, future in batch:
+                if not future.done():
+                    future.set_result(by_text[text])
+        except Exception as e:
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+        finally:
+            slots.release()
+
+    def summary(self) -> Dict[str, Any]:
+        batches = self.stats["batches"]
+        return {**self.stats, "avg_batch": round(self.stats["texts"] / batches, 2) if batches else 0.0}
+
+
+class ProjectState:
+    """一个项目常驻内存的检索状态。"""
+
+    def __init__(self, folder: str):
+        from retrieve import initialize_chroma
+
+        self.folder = folder
+        self.chunks_dir = os.path.join(folder, "processed", "chunks")
+        self.manifest_path = os.path.join(folder, "processed", "manifest.json")
+        self.db = initialize_chroma(os.path.join(folder, "vectorstore", "chroma_db"))
+        self.loaded = time.time()
+        self._index: Optional[Dict[str, Dict[str, Any]]] = None
+        self._index_version: Optional[float] = None
+
+    def chunk_index(self) -> Dict[str, Dict[str, Any]]:
+        """分块正文索引；每处理完一个文件 manifest 都会更新，据此判断是否需要重新加载。"""
+        from anki import load_chunk_index
+
+        version = os.path.getmtime(self.manifest_path) if os.path.exists(self.manifest_path) else None
+        if self._index is None or version != self._index_version:
+            self._index = load_chunk_index(self.chunks_dir) if os.path.isdir(self.chunks_dir) else {}
+            self._index_version = version
+        return self._index
+
+
+class QueryService:
+    def __init__(self, projects_dir: str = PROJECTS_DIR, max_batch: int = 64, max_wait_ms: float = 5.0,
+                 workers: int = 16):
+        from embed import OpenAIEmbeddingFunction
+        from retrieve import EMBED_MODEL
+
+        self.projects_dir = projects_dir
+        self.workers = workers
+        self.embedder = QueryEmbedder(OpenAIEmbeddingFunction(model=EMBED_MODEL), max_batch, max_wait_ms / 1000)
+        self.projects: Dict[str, ProjectState] = {}
+        self._loading: Dict[str, asyncio.Lock] = {}
+        self.started = time.time()
+        self.requests = 0
+
+    def start(self) -> None:
+        """在事件循环中调用：设置线程池（阻塞的 Chroma / LLM 调用在其中执行）并启动微批处理器。"""
+        asyncio.get_running_loop().set_default_executor(ThreadPoolExecutor(self.workers, "query-service"))
+        self.embedder.start()
+
+    async def project(self, name: Any) -> ProjectState:
+        if not isinstance(name, str) or not PROJECT_NAME.match(name) or name.startswith("."):
+            raise HTTPError(400, "Invalid project name")
+        if name in self.projects:
+            return self.projects[name]
+        async with self._loading.setdefault(name, asyncio.Lock()):
+            if name not in self.projects:
+                folder = os.path.join(self.projects_dir, name)
+                if not os.path.isdir(os.path.join(folder, "vectorstore", "chroma_db")):
+                    raise HTTPError(404, f"Project not found: {name}")
+                self.projects[name] = await asyncio.to_thread(ProjectState, folder)
+                print(f"[Service] Loaded project {name}")
+        return self.projects[name]
+
+    async def retrieve(self, state: ProjectState, query: str, top_k: int) -> List[Dict[str, Any]]:
+        from anki import hydrate_results
+        from retrieve import search_by_vector
+
+        # query_embed 含微批处理的排队等待时间
+        with metrics.timer("query_embed"):
+            vector = await self.embedder.embed(query)
+        results = await asyncio.to_thread(search_by_vector, vector, top_k, state.db)
+        return hydrate_results(results, state.chunks_dir, index=state.chunk_index())
+
+    async def handle_search(self, body: Dict[str, Any]) -> Dict[str, Any]:
+        state = await self.project(body.get("project"))
+        hits = await self.retrieve(state, _query(body), _top_k(body))
+        threshold = body.get("threshold")
+        if threshold is not None:
+            hits = [h for h in hits if h["distance"] <= float(threshold)]
+        return {"query": body["query"], "results": hits}
+
+    async def handle_summarize(self, body: Dict[str, Any]) -> Dict[str, Any]:
+        from literature import build_chunk_text
+        from pipeline import DEFAULT_SUMMARY_MODEL, summary_prompt
+        from summarize import summarize_chunks
+
+        state = await self.project(body.get("project"))
+        query = _query(body)
+        hits = await self.retrieve(state, query, _top_k(body))
+        index = state.chunk_index()
+        chunks = [build_chunk_text(index[h["chunk_id"]]) for h in hits if h["chunk_id"] in index]
+        summary, processing_time, tokens = (None, None, None)
+        if chunks:
+            summary, processing_time, tokens = await asyncio.to_thread(
+                summarize_chunks, chunks, summary_prompt(query, body.get("template"), body.get("lang", "English")),
+                model=body.get("model", DEFAULT_SUMMARY_MODEL), max_tokens=int(body.get("max_tokens", 3000)),
+                temperature=float(body.get("temperature", 0.8)),
+            )
+            if summary is None:
+                raise HTTPError(502, "Summarization failed")
+        return {
+            "query": query,
+            "summary": summary,
+            "processing_time": processing_time,
+            "tokens": tokens,
+            "sources": [{"chunk_id": h["chunk_id"], "source": h["source"], "distance": h["distance"]} for h in hits],
+        }
+
+    async def handle_cards(self, body: Dict[str, Any]) -> Dict[str, Any]:
+        from anki import generate_anki_cards_validated
+
+        state = await self.project(body.get("project"))
+        query = _query(body)
+        hits = await self.retrieve(state, query, _top_k(body))
+        if not hits:
+            return {"query": query, "cards": [], "validation": None}
+        result = await asyncio.to_thread(
+            generate_anki_cards_validated,
+            query=query,
+            project_folder=state.folder,
+            card_type=body.get("card_type", "qa"),
+            difficulty=body.get("difficulty", "intermediate"),
+            detail_level=body.get("detail_level", "moderate"),
+            num_cards=int(body.get("num_cards", 5)),
+            lang=body.get("lang", "en"),
+            chunks=hits,
+            standardized_query=query,
+            avoid_existing=int(body.get("avoid_existing", 0)),
+        )
+        return {"query": query, "cards": result.cards, "validation": result.summary()}
+
+    def health(self) -> Dict[str, Any]:
+        return {
+            "status": "ok",
+            "uptime": round(time.time() - self.started, 1),
+            "requests": self.requests,
+            "projects": sorted(self.projects),
+            "embedding": self.embedder.summary(),
+        }
+
+    async def handle(self, request: Request):
+        self.requests += 1
+        if request.method == "GET" and request.path == "/health":
+            return 200, self.health()
+        if request.method == "GET" and request.path == "/metrics":
+            return 200, metrics.to_prometheus(), {"Content-Type": "text/plain; version=0.0.4; charset=utf-8"}
+        routes = {"/search": self.handle_search, "/summarize": self.handle_summarize, "/cards": self.handle_cards}
+        if request.path not in routes:
+            raise HTTPError(404, f"Unknown endpoint: {request.path}")
+        if request.method != "POST":
+            raise HTTPError(405, "Use POST")
+        body = request.json()
+        if not isinstance(body, dict):
+            raise HTTPError(400, "Request body must be a JSON object")
+        try:
+            return 200, await routes[request.path](body)
+        except LLMCallError as e:
+            raise HTTPError(502, f"{type(e).__name__}: {e}")
+
+
+def _query(body: Dict[str, Any]) -> str:
+    query = body.get("query")
+    if not isinstance(query, str) or not query.strip():
+        raise HTTPError(400, "Missing 'query'")
+    return query.strip()
+
+
+def _top_k(body: Dict[str, Any]) -> int:
+    try:
+        top_k = int(body.get("top_k", 10))
+    except (TypeError, ValueError):
+        raise HTTPError(400, "'top_k' must be an integer")
+    if not 1 <= top_k <= 100:
+        raise HTTPError(400, "'top_k' must be between 1 and 100")
+    return top_k
+
+
+async def serve(host: str, port: int, service: QueryService) -> None:
+    service.start()
+    server = await start_server(service.handle, host, port)
+    print(f"[Service] Listening on http://{host}:{server_port(server)} (projects: {service.projects_dir})", flush=True)
+    async with server:
+        await server.serve_forever()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--projects-dir", default=PROJECTS_DIR)
+    parser.add_argument("--max-batch", type=int, default=64, help="每批查询向量的最大条数")
+    parser.add_argument("--max-wait-ms", type=float, default=5.0, help="凑批的最长等待时间")
+    parser.add_argument("--workers", type=int, default=16, help="执行 Chroma / LLM 调用的线程数")
+    args = parser.parse_args()
+    service = QueryService(args.projects_dir, args.max_batch, args.max_wait_ms, args.workers)
+    try:
+        asyncio.run(serve(args.host, args.port, service))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -1,12 +1,65 @@
 # rag_tab.py
 import os
 import json
+import time
 import streamlit as st
 from preprocess import process_documents
 from embed import create_or_update_embeddings
-from langchain_community.embeddings import OpenAIEmbeddings
-from langchain.vectorstores import Chroma
 from lang_utils import get_text  # 新增
+from project_stats import load_stats, rebuild_stats
+from jobs import active_job, cancel_job, list_jobs, resume_job, submit_job
+import profiling
+
+
+def render_dashboard(text, proc_dir, db_dir, manifest_fp):
+    """
+    仪表板：只读取 processed/stats.json（由预处理与向量化增量维护），不读取分块内容，也不访问向量库。
+    旧项目没有统计文件时，从 manifest 与 collection.count() 重建一次。
+    """
+    stats = load_stats(proc_dir) or rebuild_stats(proc_dir, db_dir)
+    chunk_count = stats["n_chunks"]
+    embed_count = stats["n_embedded"]
+    st.info(text["chunk_count"].format(n=chunk_count))
+    st.info(text["embed_count"].format(n=embed_count))
+    n_dups = stats.get("n_duplicates", 0)
+    if n_dups:
+        st.caption(text["duplicate_count"].format(n=n_dups))
+    # 近似重复的分块不单独向量化，计入已完成
+    prog = min(1.0, (embed_count + n_dups) / chunk_count) if chunk_count else 0.0
+    st.progress(prog, text=text["progress_label"])
+
+    runs = stats.get("runs", {})
+    if runs.get("preprocess"):
+        st.caption(text["last_preprocess"].format(**runs["preprocess"]))
+    if runs.get("embed"):
+        st.caption(text["last_embed"].format(**runs["embed"]))
+
+    # manifest 表格（分块数与已嵌入数来自统计目录）
+    st.markdown(text["manifest_title"])
+    if os.path.exists(manifest_fp):
+        mf = json.load(open(manifest_fp, "r", encoding="utf-8"))
+        rows = []
+        for fn, m in mf.items():
+            info = stats["files"].get(fn, {})
+            rows.append({
+                text["manifest_col_file"]: fn,
+                text["manifest_col_nchunks"]: info.get("n_chunks", m.get("n_chunks", "-")),
+                text["manifest_col_nembedded"]: info.get("n_embedded", 0),
+                text["manifest_col_chunkmethod"]: m.get("chunk_method", "-"),
+                text["manifest_col_last"]: m.get("last_processed", "-"),
+                text["manifest_col_peak_rss"]: (info.get("memory") or {}).get("rss_peak_mb") or "-",
+                text["manifest_col_duplicates"]: (m.get("duplicates") or {}).get("chunks", "-"),
+                text["manifest_col_changes"]: "+{added} -{removed}".format(**m["changes"])
+                if m.get("changes") else "-",
+            })
+        st.dataframe(
+            rows,
+            hide_index=True,
+            use_container_width=True,
+            height=350
+        )
+    else:
+        st.info(text["no_manifest"])
 
 def render_rag_tab(PROJECTS_DIR, lang):
     text = get_text(lang)["rag_tab"]
@@ -70,54 +123,9 @@ def render_rag_tab(PROJECTS_DIR, lang):
         embed_model = os.getenv("EMBED_MODEL", "text-embedding-3-large")
         st.info(text["embed_model"].format(model=embed_model))
 
-        # chunks 数量
-        chunk_count = sum(
-            len(json.load(open(os.path.join(chunks_dir, fn), "r", encoding="utf-8")))
-            for fn in os.listdir(chunks_dir) if fn.endswith("_chunks.json")
-        )
-        st.info(text["chunk_count"].format(n=chunk_count))
-
-        # embeddings 数量
-        try:
-            db = Chroma(
-                persist_directory=db_dir,
-                embedding_function=OpenAIEmbeddings(model=embed_model),
-                collection_name="literature_chunks"
-            )
-            embed_count = len([i for i in db._collection.get()["ids"] if i and len(i) > 0])  # 过滤空ID
-        except:
-            embed_count = 0
-        # 语言化“现有”前缀
-        if "现有" in text.get("embed_count", "") or "Current" in text.get("embed_count", ""):
-            st.info(text["embed_count"].format(n=embed_count))
-        else:
-            prefix = "现有" if lang == "中文" else "Current "
-            st.info(prefix + text["embed_count"].format(n=embed_count))
-
-        prog = (embed_count / chunk_count) if chunk_count else 0.0
-        st.progress(prog, text=text["progress_label"])
-
-        # manifest 表格
-        st.markdown(text["manifest_title"])
-        if os.path.exists(manifest_fp):
-            mf = json.load(open(manifest_fp, "r", encoding="utf-8"))
-            rows = []
-            for fn, m in mf.items():
-                stem = os.path.splitext(fn)[0]
-                rows.append({
-                    text["manifest_col_file"]: fn,
-                    text["manifest_col_nchunks"]: m.get("n_chunks", "-"),
-                    text["manifest_col_chunkmethod"]: m.get("chunk_method", "-"),
-                    text["manifest_col_last"]: m.get("last_processed", "-")
-                })
-            st.dataframe(
-                rows,
-                hide_index=True,
-                use_container_width=True,
-                height=350
-            )
-        else:
-            st.info(text["no_manifest"])
+        if st.button(text["refresh_stats"]):
+            rebuild_stats(proc_dir, db_dir)
+        render_dashboard(text, proc_dir, db_dir, manifest_fp)
 
         # —— 步骤2：预处理文件（分块） —— 
         st.divider()
@@ -132,6 +140,12 @@ def render_rag_tab(PROJECTS_DIR, lang):
         force = st.checkbox(
             text["force_reprocess"], value=False
         )
+        deep_clean = st.checkbox(text["deep_clean"], value=False, help=text["deep_clean_help"])
+        max_rss = st.number_input(text["max_rss"], min_value=0, max_value=65536, value=0, step=256,
+                                  help=text["max_rss_help"])
+        # 只影响本会话（保存在 session_state，app.py 每次运行开始时应用），不改进程级开关
+        profiling.set_session_enabled(st.checkbox(text["profile_toggle"], value=profiling.is_enabled(),
+                                                  key="profile_enabled", help=text["profile_help"]))
 
         if st.button(text["start_preprocess"]):
             try:
@@ -144,47 +158,13 @@ def render_rag_tab(PROJECTS_DIR, lang):
                     chunking_method=method,
                     chunk_size=size or 400,
                     chunk_overlap=50,
-                    force_reprocess=force
+                    force_reprocess=force,
+                    max_rss_mb=max_rss or None,
+                    deep_clean=deep_clean,
                 )
                 st.success(text["preprocess_success"])
                 # 刷新
-                if os.path.exists(manifest_fp):
-                    mf = json.load(open(manifest_fp, "r", encoding="utf-8"))
-                else:
-                    mf = {}
-                chunk_count = sum(
-                    len(json.load(open(os.path.join(chunks_dir, fn), "r", encoding="utf-8")))
-                    for fn in os.listdir(chunks_dir) if fn.endswith("_chunks.json")
-                )
-                try:
-                    db = Chroma(
-                        persist_directory=db_dir,
-                        embedding_function=OpenAIEmbeddings(model=embed_model),
-                        collection_name="literature_chunks"
-                    )
-                    embed_count = len(db._collection.get()["ids"])
-                except:
-                    embed_count = 0
-                st.info(text["chunk_count"].format(n=chunk_count))
-                st.info(text["embed_count"].format(n=embed_count))
-                prog = (embed_count / chunk_count) if chunk_count else 0.0
-                st.progress(prog, text=text["progress_label"])
-                # manifest 表
-                rows = []
-                for fn, m in mf.items():
-                    stem = os.path.splitext(fn)[0]
-                    rows.append({
-                        text["manifest_col_file"]: fn,
-                        text["manifest_col_nchunks"]: m.get("n_chunks", "-"),
-                        text["manifest_col_chunkmethod"]: m.get("chunk_method", "-"),
-                        text["manifest_col_last"]: m.get("last_processed", "-")
-                    })
-                st.dataframe(
-                    rows,
-                    hide_index=True,
-                    use_container_width=True,
-                    height=350
-                )
+                render_dashboard(text, proc_dir, db_dir, manifest_fp)
             except Exception as e:
                 st.error(text["preprocess_fail"].format(err=e))
 
@@ -192,45 +172,79 @@ def render_rag_tab(PROJECTS_DIR, lang):
         st.divider()
         st.markdown(text["step3_title"])
         mode = st.radio(text["embed_mode"], text["embed_modes"], index=0)
-        stems = {os.path.splitext(f)[0] for f in new_files}
+        resume_embed = st.checkbox(text["resume_checkpoint"], value=True, help=text["resume_checkpoint_help"])
         if st.button(text["start_embed"]):
-            duplicate_ids = []
             try:
-                only = stems if mode.endswith(text["only_new_chunks"]) else None
-                try:
-                    # 过滤掉空ID的chunk文件
-                    import glob
-                    import json as _json
-                    import os as _os
-                    filtered = []
-                    for fn in glob.glob(_os.path.join(chunks_dir, "*_chunks.json")):
-                        with open(fn, "r", encoding="utf-8") as f:
-                            arr = _json.load(f)
-                        arr = [c for c in arr if c.get("chunk_id", "").strip()]
-                        if len(arr) == 0:
-                            continue
-                        with open(fn, "w", encoding="utf-8") as f:
-                            _json.dump(arr, f, ensure_ascii=False, indent=2)
-                        filtered.append(fn)
-                    create_or_update_embeddings(chunks_dir, db_dir, only_files=only)
+                only = set(new_files) if mode.endswith(text["only_new_chunks"]) else None
+                summary = create_or_update_embeddings(chunks_dir, db_dir, only_files=only, resume=resume_embed)
+                if summary["failed"] or summary["remaining"]:
+                    st.warning(text["embed_partial"].format(**summary))
+                    for err in summary["errors"]:
+                        st.caption(err)
+                else:
                     st.success(text["embed_success"])
-                except ValueError as ve:
-                    msg = str(ve)
-                    if "Expected IDs to be unique" in msg:
-                        import re
-                        dup_match = re.findall(r"found duplicates of: ([^ ]+)", msg)
-                        duplicate_ids.extend(dup_match)
-                        st.warning(text["duplicate_ids"].format(ids=", ".join(duplicate_ids)))
-                        st.info(text["partial_embed"])
-                    elif "Empty ID" in msg or "ID must have at least one character" in msg:
-                        st.error("有分块ID为空，请检查原始文档或分块逻辑。")
-                    else:
-                        st.error(text["embed_fail"].format(err=ve))
-                except Exception as e:
-                    st.error(text["embed_fail"].format(err=e))
+                    st.caption(text["embed_summary"].format(**summary))
             except Exception as e:
                 st.error(text["embed_fail"].format(err=e))
 
+        # —— 后台任务：在工作进程中预处理/向量化，页面只轮询进度 ——
+        st.divider()
+        st.markdown(text["jobs_title"])
+        st.caption(text["jobs_info"])
+        job = active_job(base)
+        col_ingest, col_embed = st.columns(2)
+        params = {"chunking_method": method, "chunk_size": size or 400, "chunk_overlap": 50, "force_reprocess": force,
+                  "resume": resume_embed, "profile": profiling.is_enabled(), "max_rss_mb": max_rss or None,
+                  "deep_clean": deep_clean}
+        with col_ingest:
+            if st.button(text["job_ingest"], disabled=job is not None):
+                job = submit_job(base, "ingest", params)
+        with col_embed:
+            if st.button(text["job_embed"], disabled=job is not None):
+                job = submit_job(base, "embed", {
+                    "only_files": sorted(new_files) if mode.endswith(text["only_new_chunks"]) else None,
+                    "resume": resume_embed,
+                    "profile": profiling.is_enabled()
+                })
+
+        if job:
+            progress = job.get("progress", {})
+            st.info(text["job_running"].format(id=job["id"], stage=job.get("stage") or job["status"]))
+            if progress.get("files_total"):
+                st.progress(progress["files_done"] / progress["files_total"],
+                            text=text["job_files"].format(done=progress["files_done"], total=progress["files_total"]))
+            if progress.get("chunks_total"):
+                st.progress(progress["chunks_done"] / progress["chunks_total"],
+                            text=text["job_chunks"].format(done=progress["chunks_done"], total=progress["chunks_total"]))
+            if progress.get("throughput"):
+                st.caption(text["job_rate"].format(rate=progress["throughput"], eta=progress.get("eta") or "-"))
+            col_cancel, col_auto = st.columns(2)
+            with col_cancel:
+                if st.button(text["job_cancel"]):
+                    cancel_job(base, job["id"])
+            with col_auto:
+                auto = st.checkbox(text["job_autorefresh"], value=True)
+
+        history = list_jobs(base)[:10]
+        if history:
+            st.dataframe(
+                [{
+                    "id": j["id"],
+                    text["job_col_kind"]: j["kind"],
+                    text["job_col_status"]: j["status"],
+                    text["job_col_finished"]: j.get("finished") or "-",
+                    text["job_col_embedded"]: "{completed}/{total}".format(**j["summary"]) if j.get("summary") else "-",
+                    text["job_col_error"]: j.get("error") or "",
+                } for j in history],
+                hide_index=True,
+                use_container_width=True
+            )
+            last = history[0]
+            if not job and last["status"] in {"interrupted", "cancelled", "failed"}:
+                if st.button(text["job_resume"].format(id=last["id"])):
+                    resume_job(base, last["id"])
+                    st.rerun()
+
         # —— Manifest 健康检查 —— 
         st.divider()
         st.markdown(text["manifest_check_title"])
@@ -241,3 +255,33 @@ def render_rag_tab(PROJECTS_DIR, lang):
                 st.warning(text["missing_chunks"].format(files=", ".join(missing)))
             else:
                 st.success(text["all_chunked"])
+
+        # —— 性能剖析热点：最近一次剖析的前 15 个函数，完整数据可下载后用 snakeviz / 火焰图工具查看 ——
+        st.divider()
+        st.markdown(text["profile_title"])
+        profiles = profiling.list_profiles(base)
+        if not profiles:
+            st.caption(text["profile_none"])
+        else:
+            prof_path = st.selectbox(text["profile_select"], profiles, format_func=os.path.basename)
+            sort = st.radio(text["profile_sort"], text["profile_sort_options"], horizontal=True)
+            st.dataframe(
+                profiling.top_hotspots(prof_path, sort="cumulative" if sort == text["profile_sort_options"][0] else "tottime"),
+                hide_index=True,
+                use_container_width=True
+            )
+            col_prof, col_collapsed = st.columns(2)
+            with col_prof:
+                with open(prof_path, "rb") as f:
+                    st.download_button(text["profile_download_prof"], f.read(), file_name=os.path.basename(prof_path))
+            collapsed_path = os.path.splitext(prof_path)[0] + ".collapsed"
+            if os.path.exists(collapsed_path):
+                with col_collapsed:
+                    with open(collapsed_path, "rb") as f:
+                        st.download_button(text["profile_download_collapsed"], f.read(),
+                                           file_name=os.path.basename(collapsed_path))
+
+        # 有活动任务时定时重绘以刷新进度（放在最后，不阻塞页面其余部分的渲染）
+        if job and auto:
+            time.sleep(2)
+            st.rerun()
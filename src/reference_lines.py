@@ -0,0 +1,101 @@
+# reference_lines.py
+"""
+参考文献行识别（clean_engine 自底向上删除参考文献区块时逐行调用），每行保证线性时间。
+
+deep_clean 原来用一个大的 verbose 正则对每行做 match，其中两处会回溯成平方复杂度：
+    [A-Za-z]{2,}(?:[A-Za-z0-9\\-,']+),   两个量词的字符集重叠，一长串字母后面没有逗号时 O(n²)
+    ^\\s* … | .+?,\\s*\\d{4},…             行首空白每退一格，.+? 就把整行重扫一遍，O(空白 × 行长)
+PDF 空白规范化之后常见上万字符不断行的“行”（表格、公式、乱码、base64），单行就能卡住几秒。
+
+这里把各分支拆开：先用首字符、in 等廉价条件预筛，再用不会回溯的写法判断，结果与原正则逐行一致
+（tests/test_reference_lines.py 做对比模糊测试，benchmarks/reference_fuzz.py 做对抗样本计时）：
+    [12] [J] [M] 12. 2020;12 2015:12 doi: http://    行首固定格式，只看开头几个字符
+    LindholmLH,CarlbergB,                            行首字母/数字/-,' 连续段中第 4 个字符起有逗号
+    Sprint Research Group. Randomized…               锚定的单个正则，贪婪段之后只能是 “.”，回溯是线性的
+    王继光,谢良地,等.独特…                            行首汉字段 + 分隔符，其后第 6 个字符起出现 “。/. + 汉字或字母”
+    期刊名,2015,12:345                               整行查找 “,年份,卷:页”（不再受行首空白影响）
+
+ReferenceDetector 另外给每行设时间上限（time_limit 秒）：在各分支之间、以及整行查找的候选位置之间检查，
+超时的行按非参考文献处理并计入 stats["timeouts"]。
+"""
+import re
+import time
+from typing import Dict, Optional
+
+LEADING_SPACE = re.compile(r"\s*")
+PREFIX = re.compile(
+    r"\[\d+\]|\[J\]|\[M\]|\d{1,4}[\.）]\s|\d{4}(?:年|;)\s*\d|\d{4}[:,]\d|doi[:：]\S|https?://\S", re.IGNORECASE)
+AUTHOR_RUN = re.compile(r"[A-Za-z]{2}[A-Za-z0-9\-,']*", re.IGNORECASE)
+TITLE_SENTENCE = re.compile(r"[A-Z][A-Za-z0-9\-’&, ]{10,}\.\s+[A-Z]", re.IGNORECASE)
+CJK_RUN = re.compile(r"[\u4e00-\u9fa5]{2,}")
+CJK_DELIMITERS = frozenset(",，、")
+CJK_SENTENCE_END = re.compile(r"[\.。]\s*[\u4e00-\u9fa5A-Za-z]", re.IGNORECASE)
+JOURNAL_CITATION = re.compile(r",\s*\d{4},\s*\d{1,4}:\d")
+SENTENCE_MARK = re.compile(r"[\.。]")
+COMMA = re.compile(",")
+TIMED_LINE_CHARS = 4096  # 更短的行不检查时间上限
+
+
+def _search(pattern, marks, line: str, pos: int, deadline: Optional[float]) -> Optional[bool]:
+    """
+    pattern.search(line, pos) 是否有结果。给了 deadline 时逐个尝试 marks 找到的候选起点（pattern 的首字符），
+    每 1024 个候选检查一次时间，超时返回 None。
+    """
+    if not deadline:
+        return pattern.search(line, pos) is not None
+    for n, m in enumerate(marks.finditer(line, pos)):
+        if pattern.match(line, m.start()):
+            return True
+        if not n % 1024 and time.perf_counter() > deadline:
+            return None
+    return False
+
+
+def match_reference(line: str, deadline: Optional[float] = None) -> Optional[bool]:
+    """判断一行是否是参考文献条目；超过 deadline（time.perf_counter 时间）时返回 None。"""
+    s = LEADING_SPACE.match(line).end()
+    if PREFIX.match(line, s):
+        return True
+    comma = "," in line
+    if comma:
+        m = AUTHOR_RUN.match(line, s)
+        if m and line.find(",", s + 3, m.end()) >= 0:
+            return True
+    if deadline and time.perf_counter() > deadline:
+        return None
+    if "." in line and TITLE_SENTENCE.match(line, s):
+        return True
+    m = CJK_RUN.match(line, s)
+    if m and m.end() < len(line) and line[m.end()] in CJK_DELIMITERS:
+        found = _search(CJK_SENTENCE_END, SENTENCE_MARK, line, m.end() + 6, deadline)
+        if found is not False:
+            return found
+    if not (comma and ":" in line):
+        return False
+    # .+? 可以从第 0 个字符开始（行首 \s* 可以不吃空白），所以逗号只需不在第 0 位
+    return _search(JOURNAL_CITATION, COMMA, line, 1, deadline)
+
+
+def is_reference_line(line: str) -> bool:
+    return bool(match_reference(line))
+
+
+class ReferenceDetector:
+    """带每行时间上限与统计的参考文献行判断，可直接当作 is_reference_line 使用。"""
+
+    def __init__(self, time_limit: Optional[float] = 0.01):
+        self.time_limit = time_limit
+        self.stats: Dict[str, int] = {"lines": 0, "matched": 0, "timeouts": 0}
+
+    def __call__(self, line: str) -> bool:
+        self.stats["lines"] += 1
+        deadline = None
+        if self.time_limit and len(line) > TIMED_LINE_CHARS:
+            deadline = time.perf_counter() + self.time_limit
+        found = match_reference(line, deadline)
+        if found is None:
+            self.stats["timeouts"] += 1
+            return False
+        if found:
+            self.stats["matched"] += 1
+        return found
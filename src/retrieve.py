@@ -1,13 +1,15 @@
 # retrieve.py
 
 import os
-from langchain.embeddings import OpenAIEmbeddings
-from langchain_chroma import Chroma  # updated import
+from typing import TYPE_CHECKING
 
-# ——— OpenAI 配置（保持不变） ———
-import openai
-openai.api_key = os.getenv("OPENAI_API_KEY")
-client = openai.OpenAI(api_key=openai.api_key, base_url="https://xiaoai.plus/v1")
+import metrics
+from embed import OpenAIEmbeddingFunction
+
+if TYPE_CHECKING:
+    from langchain_chroma import Chroma
+
+# ——— OpenAI 配置：embedding 客户端见 embed.OpenAIEmbeddingFunction（首次请求时创建） ———
 EMBED_MODEL = "text-embedding-3-large"
 
 
@@ -16,7 +18,9 @@ def initialize_chroma(persist_directory: str, collection_name: str = "literature
     初始化并返回一个 Chroma 对象，用于后续检索。
     persist_directory: Chroma 数据持久化路径
     """
-    embeddings = OpenAIEmbeddings(model=EMBED_MODEL)
+    from langchain_chroma import Chroma  # updated import；首次检索时才加载 chromadb
+
+    embeddings = OpenAIEmbeddingFunction(model=EMBED_MODEL)
     db = Chroma(
         persist_directory=persist_directory,
         embedding_function=embeddings,
@@ -27,44 +31,64 @@ def initialize_chroma(persist_directory: str, collection_name: str = "literature
 
 def search(query: str,
            top_k: int,
-           db: Chroma,
-           relevance_threshold: float = None):  # 可选，不做硬筛选
+           db: "Chroma",
+           relevance_threshold: float = None):
     """
     用 Chroma 检索最相关的 chunks。
+    relevance_threshold: 最大距离（与 Chroma 返回的 distance 同一尺度，越小越相关），超过的结果丢弃；None 时不筛选。
     """
-    qe = db._embedding_function.embed_query(query)
-    resp = db._collection.query(
-        query_embeddings=[qe],
-        n_results=top_k,
-        include=["metadatas", "distances"]
-    )
-    metas_list     = resp["metadatas"][0]
-    distances_list = resp["distances"][0]
-    
-    results = []
-    for i, (meta, dist) in enumerate(zip(metas_list, distances_list)):
-        cid = meta.get("chunk_id", None)
-        if cid is None:
-            print(f"[DEBUG] Skipping result with missing chunk_id: {meta}")
-            continue
-        source = meta.get("source_file", meta.get("source", "unknown"))
-        results.append({
-            "rank":     i + 1,
-            "chunk_id": cid,
-            "source":   source,
-            "distance": dist
-        })
-    
-    # 只在有结果时打印统计信息
-    if distances_list:
-        print(f"[DEBUG] Distance stats: min={min(distances_list):.4f}, "
-              f"max={max(distances_list):.4f}, "
-              f"avg={sum(distances_list)/len(distances_list):.4f}")
-    else:
-        print("[DEBUG] No results found within threshold")
-
-    print(f"[DEBUG] search() returning {len(results)} results")
-    return results
+    with metrics.timer("query_embed"):
+        qe = db._embedding_function.embed_query(query)
+    return search_by_vector(qe, top_k, db, relevance_threshold)
+
+
+def search_by_vector(query_embedding, top_k: int, db: "Chroma", relevance_threshold: float = None):
+    """
+    用已经计算好的查询向量检索（供批量计算查询向量的调用方使用，如 query_service），返回格式同 search()。
+    """
+    return search_by_vectors([query_embedding], top_k, db, relevance_threshold)[0]
+
+
+def search_by_vectors(query_embeddings, top_k: int, db: "Chroma", relevance_threshold: float = None):
+    """
+    多个查询向量一次 Chroma 查询，返回与 query_embeddings 对齐的结果列表（每项格式同 search()）。
+    relevance_threshold 与 search() 相同（最大距离，None 时不筛选）。
+    """
+    with metrics.timer("vector_search"):
+        resp = db._collection.query(
+            query_embeddings=list(query_embeddings),
+            n_results=top_k,
+            include=["metadatas", "distances"]
+        )
+    all_results = []
+    for metas_list, distances_list in zip(resp["metadatas"], resp["distances"]):
+        results = []
+        for i, (meta, dist) in enumerate(zip(metas_list, distances_list)):
+            cid = meta.get("chunk_id", None)
+            if cid is None:
+                metrics.debug(f"[DEBUG] Skipping result with missing chunk_id: {meta}")
+                continue
+            if relevance_threshold is not None and dist > relevance_threshold:
+                continue
+            source = meta.get("source_file", meta.get("source", "unknown"))
+            results.append({
+                "rank":     i + 1,
+                "chunk_id": cid,
+                "source":   source,
+                "distance": dist
+            })
+
+        # 距离统计只在调试模式下打印（RAG_DEBUG=1）
+        if distances_list:
+            metrics.debug(f"[DEBUG] Distance stats: min={min(distances_list):.4f}, "
+                          f"max={max(distances_list):.4f}, "
+                          f"avg={sum(distances_list)/len(distances_list):.4f}")
+        else:
+            metrics.debug("[DEBUG] No results found within threshold")
+
+        metrics.debug(f"[DEBUG] search() returning {len(results)} results")
+        all_results.append(results)
+    return all_results
 
 
 
@@ -1,7 +1,11 @@
-import openai  # type: ignore
+import functools
 import os
 import time
-from typing import Optional, Dict, Any, Tuple, List, Union
+from typing import Optional, Dict, Any, Tuple, List, Union, Iterator
+
+import metrics
+from llm_client import LLMCallError, RetriesExhaustedError, call_with_limits
+from llm_router import CALL_CLASS_MODELS, ModelRouter
 
 # 设置默认API基础URL
 DEFAULT_OPENAI_BASE_URL = "https://api.openai.com/v1"
@@ -77,10 +81,77 @@ def get_client(provider: str, api_key: Optional[str] = None, base_url: Optional[
     
     if base_url is None:
         base_url = os.getenv(f"{provider.upper()}_API_BASE", config["base_url"])
-    
+
+    return _pooled_client(api_key, base_url)
+
+
+@functools.lru_cache(maxsize=16)
+def _pooled_client(api_key: Optional[str], base_url: str) -> Any:
+    """同一 (api_key, base_url) 复用一个客户端及其 HTTP 连接池（OpenAI 客户端是线程安全的）"""
+    import openai  # type: ignore  # 首次请求时才加载
     return openai.OpenAI(api_key=api_key, base_url=base_url)
 
 
+def is_model_available(model: str) -> bool:
+    """
+    判断模型对应提供商的API密钥是否已配置，未配置的模型不参与路由
+    """
+    config = MODEL_CONFIGS.get(get_model_provider(model), MODEL_CONFIGS["openai"])
+    return bool(os.getenv(config["api_key_env"]))
+
+
+# 延迟感知路由：按调用类别在等价模型之间选择最快的健康模型
+router = ModelRouter(CALL_CLASS_MODELS, provider_of=get_model_provider, is_available=is_model_available)
+
+
+def _chat_completion(model: str,
+                     messages: List[Dict[str, str]],
+                     temperature: float,
+                     max_tokens: int,
+                     api_key: Optional[str] = None,
+                     base_url: Optional[str] = None,
+                     stream: bool = False) -> Any:
+    """
+    经由 llm_client 调用层发起一次 chat completion 请求（stream=True 时返回流对象）
+    """
+    provider = get_model_provider(model)
+    client = get_client(provider, api_key, base_url)
+    response = call_with_limits(provider, lambda timeout: client.chat.completions.create(
+        model=model,
+        messages=messages,
+        temperature=temperature,
+        max_tokens=max_tokens,
+        stream=stream,
+        timeout=timeout
+    ), stream=stream)
+    usage = getattr(response, "usage", None) if not stream else None
+    if usage is not None:
+        metrics.inc("rag_llm_tokens_total", getattr(usage, "prompt_tokens", 0) or 0, model=model, kind="prompt")
+        metrics.inc("rag_llm_tokens_total", getattr(usage, "completion_tokens", 0) or 0, model=model, kind="completion")
+    return response
+
+
+def _routed_chat(call_class: str,
+                 preferred: str,
+                 messages: List[Dict[str, str]],
+                 temperature: float,
+                 max_tokens: int,
+                 api_key: Optional[str] = None,
+                 base_url: Optional[str] = None,
+                 stream: bool = False) -> Any:
+    """
+    按调用类别路由 chat completion；显式传入的 api_key/base_url 只用于与首选模型同一提供商的候选
+    """
+    preferred_provider = get_model_provider(preferred)
+
+    def attempt(model: str) -> Any:
+        same = get_model_provider(model) == preferred_provider
+        return _chat_completion(model, messages, temperature, max_tokens,
+                                api_key if same else None, base_url if same else None, stream)
+
+    return router.call(call_class, attempt, preferred=preferred)
+
+
 def standardize_query_with_llm(user_query: str, model: str = None) -> str:
     """
     使用LLM来标准化和结构化用户的查询。
@@ -98,17 +169,48 @@ def standardize_query_with_llm(user_query: str, model: str = None) -> str:
     
     prompt = SUMMARIZE_PROMPT.format(user_query=user_query)
     model = model or "gpt-4o-mini"  # fallback to default if not specified
-    improved_query = call_llm_with_prompt(
-        prompt, 
-        model=model, 
-        max_tokens=300
-    )
-    
-    print("==== Standardized Query by LLM ====")
-    print(improved_query)
+    try:
+        improved_query = call_llm_with_prompt(
+            prompt, 
+            model=model, 
+            max_tokens=300,
+            call_class="query_rewrite"
+        )
+    except LLMCallError as e:
+        # 优化失败不影响检索，直接使用原始查询
+        print(f"[Query] Standardization failed, using raw query: {e}")
+        return user_query
+    
+    metrics.debug("==== Standardized Query by LLM ====")
+    metrics.debug(improved_query)
     return improved_query.strip()
 
 
+def build_summary_context(chunks: List[Dict[str, Any]]) -> str:
+    """
+    使用所有可用元数据为每个块组成摘要上下文（"Chunk n: 正文\n[引用信息]"，块之间空一行）
+    """
+    def format_chunk(i, chunk):
+        # 优先从 chunk['chunk_text'] 获取正文内容
+        text = chunk.get("chunk_text", "")
+        # 兼容部分chunk结构正文可能在 chunk['metadata']['text'] 的情况
+        if not text and "metadata" in chunk and "text" in chunk["metadata"]:
+            text = chunk["metadata"]["text"]
+        
+        meta = chunk
+        ref = []
+        if meta.get("title"): ref.append(f"Title: {meta['title']}")
+        if meta.get("author"): ref.append(f"Author: {meta['author']}")
+        if meta.get("journal"): ref.append(f"Journal: {meta['journal']}")
+        if meta.get("year"): ref.append(f"Year: {meta['year']}")
+        if meta.get("doi"): ref.append(f"DOI: {meta['doi']}")
+        if meta.get("source"): ref.append(f"Source: {meta['source']}")
+        ref_str = "; ".join(ref)
+        return f"Chunk {i + 1}: {text}\n[{ref_str}]"
+
+    return "\n\n".join([format_chunk(i, chunk) for i, chunk in enumerate(chunks)])
+
+
 def summarize_chunks(chunks: List[Dict[str, Any]],
                     prompt_template: str,
                     model: str = "gpt-4o-mini",
@@ -145,52 +247,31 @@ def summarize_chunks(chunks: List[Dict[str, Any]],
         print("No valid chunks with content for summarization.")
         return None, None, None
 
-    # 获取模型提供商并初始化客户端
-    provider = get_model_provider(model)
-    client = get_client(provider, api_key, base_url)
-    
     delimiter = "#####"
     try:
-        # 打印块元数据以便调试
+        # 调试模式下打印块元数据与最终传入LLM的内容（RAG_DEBUG=1，完整提示词可能有数 KB）
         for i, chunk in enumerate(valid_chunks):
-            print(f"Chunk Metadata {i+1}: {chunk}")
-
-        # 使用所有可用元数据为每个块组成上下文
-        def format_chunk(i, chunk):
-            # 优先从 chunk['chunk_text'] 获取正文内容
-            text = chunk.get("chunk_text", "")
-            # 兼容部分chunk结构正文可能在 chunk['metadata']['text'] 的情况
-            if not text and "metadata" in chunk and "text" in chunk["metadata"]:
-                text = chunk["metadata"]["text"]
-            
-            meta = chunk
-            ref = []
-            if meta.get("title"): ref.append(f"Title: {meta['title']}")
-            if meta.get("author"): ref.append(f"Author: {meta['author']}")
-            if meta.get("journal"): ref.append(f"Journal: {meta['journal']}")
-            if meta.get("year"): ref.append(f"Year: {meta['year']}")
-            if meta.get("doi"): ref.append(f"DOI: {meta['doi']}")
-            if meta.get("source"): ref.append(f"Source: {meta['source']}")
-            ref_str = "; ".join(ref)
-            return f"Chunk {i + 1}: {text}\n[{ref_str}]"
-
-        context = "\n\n".join([format_chunk(i, chunk) for i, chunk in enumerate(valid_chunks)])
+            metrics.debug(f"Chunk Metadata {i+1}: {chunk}")
+
+        context = build_summary_context(valid_chunks)
         prompt = prompt_template.format(context=context)
 
-        # 调试：打印最终传入LLM的内容
-        print("==== LLM Prompt Preview ====")
-        print(prompt)
-        print("==== End of LLM Prompt ====")
+        metrics.debug("==== LLM Prompt Preview ====")
+        metrics.debug(prompt)
+        metrics.debug("==== End of LLM Prompt ====")
 
         start_time = time.time()
-        response = client.chat.completions.create(
-            model=model,
+        response = _routed_chat(
+            "summary",
+            model,
             messages=[
                 {"role": "system", "content": f"You are a helpful assistant for summarizing research with citations. The customer service query will be delimited with {delimiter} characters. Do your best and summarize based on user's input in markdown format."},
                 {"role": "user", "content": f"{delimiter}{prompt}{delimiter}"}
             ],
             temperature=temperature,
-            max_tokens=max_tokens
+            max_tokens=max_tokens,
+            api_key=api_key,
+            base_url=base_url
         )
         end_time = time.time()
 
@@ -215,7 +296,8 @@ def call_llm_with_prompt(
     api_key: Optional[str] = None,
     base_url: Optional[str] = None,
     max_tokens: int = 1280,
-    temperature: float = 0.5
+    temperature: float = 0.5,
+    call_class: Optional[str] = None
 ) -> str:
     """
     调用LLM生成内容，返回LLM的原始输出（如csv表格）。
@@ -227,27 +309,54 @@ def call_llm_with_prompt(
         base_url: API基础URL，如果为None则使用默认值
         max_tokens: 生成的最大令牌数
         temperature: 模型温度参数
+        call_class: 调用类别（'query_rewrite'、'summary'、'card_generation'），
+                    设置后 model 作为首选，由路由器在等价模型间选择与回退
     
     Returns:
         str: LLM生成的内容
+
+    Raises:
+        LLMCallError: 调用失败（限流、超时、熔断或请求错误），见 llm_client
     """
-    # 获取模型提供商并初始化客户端
-    provider = get_model_provider(model)
-    client = get_client(provider, api_key, base_url)
-    
     delimiter = "#####"
-    
+    messages = [
+        {"role": "system", "content": f"You are a helpful assistant. The user input is delimited with {delimiter}."},
+        {"role": "user", "content": f"{delimiter}{prompt}{delimiter}"}
+    ]
+    if call_class:
+        response = _routed_chat(call_class, model, messages, temperature, max_tokens, api_key, base_url)
+    else:
+        response = _chat_completion(model, messages, temperature, max_tokens, api_key, base_url)
+    return response.choices[0].message.content or ""
+
+
+def stream_llm_with_prompt(
+    prompt: str,
+    model: str = "gpt-4o-mini",
+    api_key: Optional[str] = None,
+    base_url: Optional[str] = None,
+    max_tokens: int = 1280,
+    temperature: float = 0.5,
+    call_class: Optional[str] = None
+) -> Iterator[str]:
+    """
+    流式调用LLM，逐段产出生成的文本。参数同 call_llm_with_prompt。
+    建立连接的阶段经过调用层（限流、重试、熔断、路由）；读取过程中连接中断会抛出 LLMCallError。
+    """
+    delimiter = "#####"
+    messages = [
+        {"role": "system", "content": f"You are a helpful assistant. The user input is delimited with {delimiter}."},
+        {"role": "user", "content": f"{delimiter}{prompt}{delimiter}"}
+    ]
+    if call_class:
+        stream = _routed_chat(call_class, model, messages, temperature, max_tokens, api_key, base_url, stream=True)
+    else:
+        stream = _chat_completion(model, messages, temperature, max_tokens, api_key, base_url, stream=True)
     try:
-        response = client.chat.completions.create(
-            model=model,
-            messages=[
-                {"role": "system", "content": f"You are a helpful assistant. The user input is delimited with {delimiter}."},
-                {"role": "user", "content": f"{delimiter}{prompt}{delimiter}"}
-            ],
-            temperature=temperature,
-            max_tokens=max_tokens
-        )
-        return response.choices[0].message.content
+        for event in stream:
+            if event.choices and event.choices[0].delta.content:
+                yield event.choices[0].delta.content
     except Exception as e:
-        print(f"Error calling LLM: {e}")
-        return f"Error generating response: {str(e)}"
+        raise RetriesExhaustedError(f"stream interrupted: {e}", get_model_provider(model), 1, e) from e
+    finally:
+        stream.close()  # 提前停止读取时也释放并发槽位
@@ -0,0 +1,69 @@
+import os
+import sqlite3
+import zipfile
+
+from anki_apkg import FIELD_SEP, export_rows_to_apkg, ledger_rows, note_guid
+
+
+def read_collection(apkg_path, tmp_path):
+    """读出 .apkg 中的 notes 与 cards 表：({guid: (note_id, fields)}, [(nid, ord)])。"""
+    db_path = str(tmp_path / "collection.anki2")
+    with zipfile.ZipFile(apkg_path) as zf, open(db_path, "wb") as f:
+        f.write(zf.read("collection.anki2"))
+    conn = sqlite3.connect(db_path)
+    try:
+        notes = {guid: (nid, flds.split(FIELD_SEP)) for nid, guid, flds in conn.execute("SELECT id, guid, flds FROM notes")}
+        cards = sorted(conn.execute("SELECT nid, ord FROM cards"))
+    finally:
+        conn.close()
+    os.remove(db_path)
+    return notes, cards
+
+
+def test_qa_notes_and_cards(tmp_path):
+    rows = [["What is A?", "alpha", "note"], ["What is <B>?", "line1\nline2"], ["", "no front"]]
+    result = export_rows_to_apkg(rows, str(tmp_path / "out"), "Deck")
+    assert (result["added"], result["skipped"]) == (2, 1)
+    notes, cards = read_collection(result["path"], tmp_path)
+    assert notes[note_guid("Deck", "qa", "What is A?")][1] == ["What is A?", "alpha", "note"]
+    assert notes[note_guid("Deck", "qa", "What is <B>?")][1] == ["What is &lt;B&gt;?", "line1<br>line2", ""]
+    assert sorted(nid for nid, _ in notes.values()) == [nid for nid, _ in cards]
+    assert {ord_ for _, ord_ in cards} == {0}
+
+
+def test_cloze_ords_skip_c0(tmp_path):
+    rows = [["{{c1::Paris}} is the capital of {{c2::France}}", "geo"],
+            ["{{c0::Berlin}} and {{c1::Germany}}"],
+            ["{{c0::Rome}} only"]]
+    result = export_rows_to_apkg(rows, str(tmp_path / "out"), "Deck", card_type="cloze")
+    assert (result["added"], result["skipped"]) == (2, 1)
+    notes, cards = read_collection(result["path"], tmp_path)
+    paris = notes[note_guid("Deck", "cloze", rows[0][0])][0]
+    berlin = notes[note_guid("Deck", "cloze", rows[1][0])][0]
+    assert sorted(o for nid, o in cards if nid == paris) == [0, 1]
+    assert [o for nid, o in cards if nid == berlin] == [0]
+    assert min(o for _, o in cards) >= 0
+
+
+def test_reexport_keeps_guids_and_ids(tmp_path):
+    out = str(tmp_path / "out")
+    rows = [["What is A?", "alpha"], ["What is B?", "beta"]]
+    first = export_rows_to_apkg(rows, out, "Deck")
+    notes1, cards1 = read_collection(first["path"], tmp_path)
+    os.remove(first["path"])
+
+    # 未变化的笔记不再导出；改了答案的笔记保持同一 GUID / 笔记 ID，导入时覆盖旧笔记
+    second = export_rows_to_apkg([["What is A?", "alpha"], ["What is B?", "beta (revised)"]], out, "Deck")
+    assert (second["added"], second["updated"], second["unchanged"]) == (0, 1, 1)
+    notes2, cards2 = read_collection(second["path"], tmp_path)
+    guid_b = note_guid("Deck", "qa", "What is B?")
+    assert list(notes2) == [guid_b]
+    assert notes2[guid_b][0] == notes1[guid_b][0]
+    assert notes2[guid_b][1][1] == "beta (revised)"
+    assert cards2 == [c for c in cards1 if c[0] == notes1[guid_b][0]]
+    assert ledger_rows(rows + [["What is C?", "c"]], out, "Deck") == rows
+
+    # 非增量的全量导出同样得到相同的 GUID
+    full = export_rows_to_apkg(rows, str(tmp_path / "full"), "Deck", incremental=False)
+    notes3, _ = read_collection(full["path"], tmp_path)
+    assert {g: nid for g, (nid, _) in notes3.items()} == {g: nid for g, (nid, _) in notes1.items()}
@@ -0,0 +1,33 @@
+from anki_batch import dedup_cards
+from card_index import CardIndex
+from openai_standin import embed_text
+
+
+class CountingEmbeddings:
+    model = "fake"
+
+    def __init__(self):
+        self.texts = []
+
+    def embed_documents(self, texts):
+        self.texts.extend(texts)
+        return [embed_text(t) for t in texts]
+
+
+def test_dedup_vectors_are_reused_by_card_index(tmp_path):
+    fake = CountingEmbeddings()
+    CardIndex(str(tmp_path), embed_fn=fake).add(["What is an enzyme?"])
+    fake.texts.clear()
+
+    index = CardIndex(str(tmp_path), embed_fn=fake)
+    cards = [{"topic": "t", "row": [front, "answer"]} for front in
+             ("What is an enzyme?", "What is a protein?", "What is a protein?", "How do cells divide?")]
+    cards = dedup_cards(cards, 0.99, index=index)
+    assert [c["row"][0] for c in cards] == ["What is an enzyme?", "What is a protein?", "How do cells divide?"]
+
+    rows, known = index.filter_new([c["row"] for c in cards])
+    index.add([r[0] for r in rows])
+    assert [k["front"] for k in known] == ["What is an enzyme?"]
+    assert len(index) == 3
+    # 每个不同的正面只请求一次 embedding
+    assert sorted(fake.texts) == ["how do cells divide?", "what is a protein?", "what is an enzyme?"]
@@ -0,0 +1,58 @@
+import csv
+import io
+
+import pytest
+
+import embed
+from anki import export_llm_cards_to_apkg, export_llm_cards_to_csv, filter_known_cards, parse_csv_to_table
+from card_index import CardIndex
+from openai_standin import embed_text
+
+
+class FakeEmbeddings:
+    model = "fake"
+
+    def embed_documents(self, texts):
+        return [embed_text(t) for t in texts]
+
+
+@pytest.fixture(autouse=True)
+def fake_embeddings(monkeypatch):
+    monkeypatch.setattr(embed, "OpenAIEmbeddingFunction", FakeEmbeddings)
+
+
+def to_csv(rows):
+    buf = io.StringIO()
+    csv.writer(buf).writerows(rows)
+    return buf.getvalue()
+
+
+def test_csv_then_apkg_from_same_generation(tmp_path):
+    project, out = str(tmp_path), str(tmp_path / "anki_cards")
+    # 上一次生成：A 已导出到卡组 Deck（台账与索引中都有）
+    old = [["What is A?", "old answer", ""]]
+    export_llm_cards_to_apkg(to_csv(old), out, "Deck", project_folder=project)
+
+    rows = [["What is A?", "new answer", ""], ["What is B?", "b", ""], ["What is C?", "c", ""]]
+    response = to_csv(rows)
+    known = filter_known_cards(parse_csv_to_table(response), project)[1]
+    assert [k["front"] for k in known] == ["What is A?"]
+
+    csv_path = export_llm_cards_to_csv(response, out, project_folder=project, known=known)
+    with open(csv_path, encoding="utf-8") as f:
+        assert [r[0] for r in csv.reader(f)] == ["What is B?", "What is C?"]
+
+    # CSV 导出已把 B、C 记入索引，.apkg 仍要导出它们；A 在台账中，按稳定 GUID 更新
+    result = export_llm_cards_to_apkg(response, out, "Deck", project_folder=project, known=known)
+    assert result["path"]
+    assert (result["added"], result["updated"], result["known"]) == (2, 1, 0)
+    assert len(CardIndex(project)) == 3
+
+
+def test_known_card_from_other_deck_is_skipped(tmp_path):
+    project, out = str(tmp_path), str(tmp_path / "anki_cards")
+    export_llm_cards_to_apkg(to_csv([["What is A?", "a", ""]]), out, "Other", project_folder=project)
+
+    result = export_llm_cards_to_apkg(to_csv([["What is A?", "a", ""], ["What is B?", "b", ""]]), out, "Deck",
+                                      project_folder=project)
+    assert (result["added"], result["known"]) == (1, 1)
@@ -0,0 +1,104 @@
+import csv
+import json
+import os
+
+import numpy as np
+import pytest
+
+import card_coverage
+import embed
+import retrieve
+from card_coverage import (assign, build_clusters, coverage_report, generate_cards_for_clusters, load_clusters,
+                           minibatch_kmeans)
+from openai_standin import embed_text
+
+
+class FakeEmbeddings:
+    model = "fake"
+
+    def embed_documents(self, texts):
+        return [embed_text(t) for t in texts]
+
+
+class FakeCollection:
+    def __init__(self, ids, vectors):
+        self.ids, self.vectors = ids, vectors
+
+    def count(self):
+        return len(self.ids)
+
+    def get(self, include, limit, offset):
+        return {"ids": self.ids[offset:offset + limit], "embeddings": self.vectors[offset:offset + limit].tolist()}
+
+
+def blobs(n_per=40, dim=16, seed=0):
+    """三个相互正交方向附近的点簇。"""
+    rng = np.random.default_rng(seed)
+    centers = np.eye(dim, dtype=np.float32)[:3]
+    points = np.concatenate([c + 0.05 * rng.standard_normal((n_per, dim)) for c in centers]).astype(np.float32)
+    return points / np.linalg.norm(points, axis=1, keepdims=True)
+
+
+@pytest.fixture
+def project(tmp_path, monkeypatch):
+    monkeypatch.setattr(embed, "OpenAIEmbeddingFunction", FakeEmbeddings)
+    vectors = blobs()
+    ids = [f"c{i}" for i in range(len(vectors))]
+    db = type("DB", (), {"_collection": FakeCollection(ids, vectors)})()
+    monkeypatch.setattr(retrieve, "initialize_chroma", lambda path: db)
+
+    chunks_dir = tmp_path / "processed" / "chunks"
+    chunks_dir.mkdir(parents=True)
+    entries = [{"chunk_id": cid, "chunk_text": f"topic {i // 40} text {i}"} for i, cid in enumerate(ids)]
+    (chunks_dir / "doc_chunks.json").write_text(json.dumps(entries), encoding="utf-8")
+    return str(tmp_path)
+
+
+def test_minibatch_kmeans_separates_blobs():
+    vectors = blobs()
+    labels, sims = assign(vectors, minibatch_kmeans(vectors, 3, batch_size=32, n_iter=50), block=17)
+    groups = [set(labels[i * 40:(i + 1) * 40]) for i in range(3)]
+    assert all(len(g) == 1 for g in groups)
+    assert len(set.union(*groups)) == 3
+    assert sims.min() > 0.9
+
+
+def test_build_clusters_and_report(project):
+    assert coverage_report(project) is None
+    report = build_clusters(project, n_clusters=3, representatives=2, n_iter=30)
+    assert report["n_vectors"] == 120
+    assert sorted(c["size"] for c in report["clusters"].values()) == [40, 40, 40]
+    assert all(len(c["representatives"]) == 2 for c in report["clusters"].values())
+    assert not os.path.exists(os.path.join(project, card_coverage.COVERAGE_DIR, "vectors.f32"))
+
+    coverage = coverage_report(project)
+    assert coverage["n_clusters"] == 3
+    assert coverage["covered_clusters"] == 0
+    assert coverage["chunk_coverage"] == 0
+
+
+def test_generate_cards_marks_clusters_covered(project, monkeypatch):
+    build_clusters(project, n_clusters=3, n_iter=30)
+    first, second, third = sorted(load_clusters(project)["clusters"])
+
+    def fake_llm(query, project_folder, chunks, **kwargs):
+        if chunks[0]["chunk_text"].startswith("topic 2"):
+            raise ValueError("no content")
+        return f'"What is {query}?",answer\n'
+
+    monkeypatch.setattr(card_coverage, "generate_anki_cards_llm", fake_llm)
+    done = []
+    report = generate_cards_for_clusters(project, progress_cb=lambda d, total, cid: done.append(cid))
+    assert sorted(done) == [first, second, third]
+    assert report["n_cards"] == 2
+    assert len(report["failed"]) == 1
+    with open(report["output_path"], newline="", encoding="utf-8") as f:
+        assert len(list(csv.reader(f))) == 2
+
+    coverage = coverage_report(project)
+    assert coverage["covered_clusters"] == 2
+    assert coverage["chunk_coverage"] == pytest.approx(2 / 3)
+
+    # 重新聚类后按代表分块继承卡片计数
+    build_clusters(project, n_clusters=3, n_iter=30)
+    assert coverage_report(project)["covered_clusters"] == 2
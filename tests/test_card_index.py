@@ -0,0 +1,60 @@
+import json
+import os
+
+from card_index import INDEX_DIR, CardIndex
+from openai_standin import embed_text
+
+
+class Embeddings:
+    def __init__(self, model, dim=256):
+        self.model, self.dim = model, dim
+        self.texts = []
+
+    def embed_documents(self, texts):
+        self.texts.extend(texts)
+        return [embed_text(t)[:self.dim] for t in texts]
+
+
+FRONTS = ["What is an enzyme?", "What is a protein?", "How do cells divide?"]
+
+
+def meta(project):
+    with open(os.path.join(project, INDEX_DIR, "meta.json"), encoding="utf-8") as f:
+        return json.load(f)
+
+
+def test_same_model_reuses_stored_vectors(tmp_path):
+    project = str(tmp_path)
+    CardIndex(project, embed_fn=Embeddings("a")).add(FRONTS)
+    fn = Embeddings("a")
+    index = CardIndex(project, embed_fn=fn)
+    assert index.lookup(["what is a  protein"], threshold=0.99)[0][0] == "What is a protein?"
+    assert fn.texts == ["what is a protein"]
+
+
+def test_model_change_rebuilds_vectors(tmp_path):
+    project = str(tmp_path)
+    CardIndex(project, embed_fn=Embeddings("a", dim=256)).add(FRONTS)
+    assert meta(project) == {"dim": 256, "model": "a"}
+
+    fn = Embeddings("b", dim=64)
+    index = CardIndex(project, embed_fn=fn)
+    assert index.lookup(["what is a  protein"], threshold=0.99)[0][0] == "What is a protein?"
+    assert meta(project) == {"dim": 64, "model": "b"}
+    assert os.path.getsize(os.path.join(project, INDEX_DIR, "vectors.f32")) == 3 * 64 * 4
+    assert sorted(fn.texts) == sorted(["what is a protein"] + [f.lower() for f in FRONTS])
+
+    # 重建后继续追加、重新打开都使用新维度
+    index.add(["What is DNA?"])
+    reopened = CardIndex(project, embed_fn=Embeddings("b", dim=64))
+    assert len(reopened) == 4
+    assert reopened.nearest("What is DNA?", k=1) == ["What is DNA?"]
+
+
+def test_dimension_change_with_same_model_name_rebuilds(tmp_path):
+    project = str(tmp_path)
+    CardIndex(project, embed_fn=Embeddings("a", dim=256)).add(FRONTS)
+    index = CardIndex(project, embed_fn=Embeddings("a", dim=32))
+    assert index.add(["What is DNA?"], vectors=index.embed(["What is DNA?"])) == 1
+    assert meta(project) == {"dim": 32, "model": "a"}
+    assert os.path.getsize(os.path.join(project, INDEX_DIR, "vectors.f32")) == 4 * 32 * 4
@@ -0,0 +1,88 @@
+import pytest
+
+import anki
+from card_parser import CardStreamParser, check_cloze, parse_cards, rerequest_failed_rows, validate_row
+from llm_client import LLMCallError
+
+
+def test_stream_parser_emits_rows_as_they_complete():
+    seen = []
+    parser = CardStreamParser("qa", on_row=lambda r: seen.append(r.cells))
+    parser.feed("```csv\nQuestion,Answer,Extra\nWhat is A?,")
+    assert seen == []
+    parser.feed('alpha,\n"What is B, really?","beta\nsecond line",note\n')
+    result = parser.finish()
+    assert seen == [["What is A?", "alpha"], ["What is B, really?", "beta\nsecond line", "note"]]
+    assert result.ignored == 1
+    assert not result.failed
+
+
+def test_quoted_commas_stay_in_one_cell():
+    result = parse_cards('"Why x, y and z?","because a, b",extra\n')
+    assert result.cards == [["Why x, y and z?", "because a, b", "extra"]]
+
+
+def test_unquoted_commas_are_repaired_locally():
+    qa = parse_cards("Why x, y and z?,because,of,this\n")
+    assert qa.cards == [["Why x, y and z?", "because", "of, this"]]
+    assert qa.rows[0].repaired
+
+    cloze = parse_cards("Paris, the {{c1::capital}}, of France,geo\n", "cloze")
+    assert cloze.cards == [["Paris, the {{c1::capital}}", "of France, geo"]]
+
+
+def test_malformed_rows_are_reported_as_failed():
+    result = parse_cards("What is A?,alpha\njust some text\n,missing question\n")
+    assert result.cards == [["What is A?", "alpha"]]
+    assert [r.error for r in result.failed] == ["expected 2-3 columns, got 1", "empty question or answer"]
+    assert result.summary()["failed"] == 2
+
+
+def test_unclosed_quote_does_not_swallow_following_rows():
+    text = '"What is A?,alpha\n' + "".join(f"Q{i}?,a{i}\n" for i in range(12))
+    result = parse_cards(text)
+    # 未闭合的引号最多吞掉 MAX_RECORD_LINES 行，之后的行照常解析
+    assert result.cards == [[f"Q{i}?", f"a{i}"] for i in range(8, 12)]
+    assert len(result.failed) == 1
+
+
+@pytest.mark.parametrize("text, error", [
+    ("The {{c1::sun}} is a star", ""),
+    ("The {{c1::sun}} and {{c2::moon}}", ""),
+    ("The sun is a star", "missing {{c1::...}} cloze deletion"),
+    ("The {{c1::sun} is a star", "unbalanced cloze braces"),
+    ("The {{c1:: }} is a star", "empty cloze deletion"),
+    ("The {{c1::sun}} and {{moon}}", "malformed cloze marker"),
+    ("The {{c0::sun}} is a star", "cloze numbers start at c1"),
+])
+def test_check_cloze(text, error):
+    assert check_cloze(text) == error
+
+
+def test_validate_row_column_counts():
+    assert validate_row(["q?", "a", "extra", "more"], "qa") == "expected 2-3 columns, got 4"
+    assert validate_row(["{{c1::x}}", "extra", "more"], "填空") == "expected 1-2 columns, got 3"
+    assert validate_row(["q?", "a"], "问答") == ""
+
+
+def test_rerequest_merges_fixed_rows():
+    result = parse_cards("What is A?,alpha\nbroken row\n")
+    rerequest_failed_rows(result, "qa", lambda prompt: "What is B?,beta\n")
+    assert result.cards == [["What is A?", "alpha"], ["What is B?", "beta"]]
+    assert result.rows[1].repaired
+    assert result.rerequested == 1
+    assert not result.failed
+
+
+def test_failed_rerequest_keeps_validated_rows(monkeypatch):
+    monkeypatch.setattr(anki, "prepare_card_prompt", lambda *a, **k: "prompt")
+    monkeypatch.setattr(anki, "stream_llm_with_prompt", lambda *a, **k: iter(["What is A?,alpha\n", "broken row\n"]))
+
+    def fail(*args, **kwargs):
+        raise LLMCallError("provider down", provider="test")
+
+    monkeypatch.setattr(anki, "call_llm_with_prompt", fail)
+    result = anki.generate_anki_cards_validated("q", "unused")
+    assert result.cards == [["What is A?", "alpha"]]
+    assert [r.raw for r in result.failed] == ["broken row"]
+    assert result.summary()["rerequested"] == 0
@@ -0,0 +1,115 @@
+import contextlib
+import io
+import logging
+import os
+import random
+import sys
+import warnings
+
+import pytest
+
+from clean_engine import CleanEngine, strip_trailing_number
+
+SRC_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src")
+
+# 随机文档的片段：各种空白、断行、连字符断词、角标、页码行、作者/摘要标记与参考文献行
+PIECES = ["retrieval", "vector", "index", "检索", "向量", "Hyper-", "tension", "word-", "-", ".", "。", "!", ",",
+          " ", "  ", "\n", "\n", "\n\n", "\n\n\n\n", "\u3000", "\u00a0", "\u2009", "\u200b", "\t", "\f", "\u2028",
+          "[12]", "[3]", "(4)", "( 5 )", "(", ")", "(\n6\n)", "12", "7", "Page 3", "第 2 页", "Abstract", "摘要",
+          "前言", "目 录", "INTRODUCTION", "_",
+          "\n1. Smith AB, Jones C. Retrieval augmented generation. Nature. 2020;12:345-367.",
+          "\n[2] Lee D. Vector search. J Med. 2019;3:1-9.",
+          "\n王继光,谢良地,牟建军,等.中国高血压防治指南[J].中华高血压杂志,2019,27(1):1-44.",
+          "\nJournal of Hypertension, 2015, 33:1234-1240"]
+
+
+@pytest.fixture(scope="module")
+def deep_clean():
+    """原来的 experimental/deep_clean（导入时会重新配置根 logger，这里导入后恢复）。"""
+    pytest.importorskip("langchain")
+    root = logging.getLogger()
+    handlers, level = list(root.handlers), root.level
+    sys.path.insert(0, os.path.join(SRC_DIR, "experimental"))
+    try:
+        with warnings.catch_warnings(), contextlib.redirect_stderr(io.StringIO()):
+            warnings.simplefilter("ignore")
+            import deep_clean
+    finally:
+        sys.path.remove(os.path.join(SRC_DIR, "experimental"))
+        root.handlers[:] = handlers
+        root.setLevel(level)
+    return deep_clean
+
+
+def random_document(rng: random.Random) -> str:
+    return "".join(rng.choice(PIECES) for _ in range(rng.randint(0, 120)))
+
+
+def paper(rng: random.Random) -> str:
+    body = []
+    for page in range(2, 6):
+        words = [rng.choice(["retrieval", "vector", "index", "augmented", "generation"]) for _ in range(60)]
+        body.append(" ".join(words) + f" [{page}].\nsecond line of the para-\n\ngraph (3)\n\n{page}\n")
+    refs = "\n".join(f"{i}. Smith AB, Jones C. Paper {i}. J Med. 2020;{i}:1-9." for i in range(1, 8))
+    return "A Study\nAlice Smith1, Bob Jones2\n\nAbstract\n" + "\n\n".join(body) + "\nReferences\n" + refs
+
+
+@pytest.mark.parametrize("text", [
+    "", "\n", "\n\n\n", "  x  ", "word-\n\nword", "word-\n\n\nnext-\nline", "a (\n3\n) b", "end of text 12.",
+    "  \n 7", "Title\nAuthor\n\nAbstract\nBody.", "前言\n正文。", "Page 3\nbody\n第 2 页",
+])
+def test_edge_cases_match_deep_clean(deep_clean, text):
+    assert CleanEngine().clean(text) == deep_clean.clean_text_pipeline(text)
+
+
+def test_random_documents_match_deep_clean(deep_clean):
+    rng = random.Random(0)
+    engine = CleanEngine()
+    for _ in range(1500):
+        text = random_document(rng)
+        assert engine.clean(text) == deep_clean.clean_text_pipeline(text), repr(text)
+
+
+def test_paper_is_cleaned_like_deep_clean(deep_clean):
+    text = paper(random.Random(1))
+    engine = CleanEngine()
+    cleaned = engine.clean(text)
+    assert cleaned == deep_clean.clean_text_pipeline(text)
+    assert cleaned.startswith("Abstract")
+    assert "Smith AB" not in cleaned and "[2]" not in cleaned and "(3)" not in cleaned
+    assert "paragraph" in cleaned
+    assert engine.stats["intro_lines"] == 2  # 标题与作者行合并为一个逻辑行，加一个空行
+    assert engine.stats["reference_lines"] == 7
+
+
+def test_clean_file_streams_same_result(tmp_path):
+    text = paper(random.Random(2))
+    src, dst = tmp_path / "doc.txt", tmp_path / "doc.clean.txt"
+    src.write_text(text, encoding="utf-8")
+    engine = CleanEngine()
+    stats = engine.clean_file(str(src), str(dst))
+    assert dst.read_text(encoding="utf-8") == engine.clean(text)
+    assert stats["lines_in"] == text.count("\n") + 1
+
+
+def test_head_window_limits_intro_search():
+    text = "Title\nAuthor\n\n" + "Body sentence.\n" * 20 + "Abstract\nlate.\n"
+    # 只看前 5 行时找不到 Abstract，不删除开头
+    assert list(CleanEngine().iter_clean(text.split("\n"), head_lines=5))[0] == "Title Author"
+    assert CleanEngine().clean(text).startswith("Abstract")
+
+
+@pytest.mark.parametrize("text, expected", [
+    ("value 12", "value"),
+    ("value 12.", "value."),
+    ("value 123", "value 123"),
+    ("value\n 7,\n", "value,\n"),
+    (" 7", " 7"),
+])
+def test_strip_trailing_number(text, expected):
+    assert strip_trailing_number(text) == expected
+
+
+def test_clean_page_keeps_paragraphs():
+    page = "first para-\n\ngraph[1] text.\n\n\n12\n\nsecond(2) para."
+    assert CleanEngine().clean_page(page) == "first paragraph text.\n\nsecond para."
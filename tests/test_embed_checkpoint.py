@@ -0,0 +1,112 @@
+import json
+import os
+
+import pytest
+
+import embed
+from embed_checkpoint import CHECKPOINT_FILE, EmbedCheckpoint
+from llm_client import LLMCallError
+from openai_standin import embed_text
+
+FILE_OF = {"a1": "a_chunks.json", "a2": "a_chunks.json", "b1": "b_chunks.json"}
+HASHES = {"a1": ("h1", "m1"), "a2": ("h2", "m2"), "b1": ("h3", "m3")}
+
+
+def test_commit_survives_reload(tmp_path):
+    cp = EmbedCheckpoint(str(tmp_path), versions={})
+    cp.commit(["a1", "b1"], FILE_OF, HASHES)
+    cp.fail(["a2"], FILE_OF, "429")
+
+    cp = EmbedCheckpoint(str(tmp_path), versions={})
+    assert cp.status("a_chunks.json", "a1", ("h1", "m1")) == "done"
+    assert cp.status("a_chunks.json", "a1", ("h1", "other")) == "metadata"
+    assert cp.status("a_chunks.json", "a1", ("changed", "m1")) == "pending"
+    assert cp.status("a_chunks.json", "a2", ("h2", "m2")) == "pending"
+    assert cp.failed == {"a2": "429"}
+    assert cp.ids_by_content() == {"h1": "a1", "h3": "b1"}
+
+    # 重试成功后不再记为失败
+    cp.commit(["a2"], FILE_OF, HASHES)
+    assert EmbedCheckpoint(str(tmp_path), versions={}).failed == {}
+
+
+def test_truncated_last_line_is_ignored(tmp_path):
+    cp = EmbedCheckpoint(str(tmp_path), versions={})
+    cp.commit(["a1"], FILE_OF, HASHES)
+    with open(os.path.join(str(tmp_path), CHECKPOINT_FILE), "a", encoding="utf-8") as f:
+        f.write('{"file": "a_chunks.json", "ids": ["a2"')
+    cp = EmbedCheckpoint(str(tmp_path), versions={})
+    assert cp.is_committed("a_chunks.json", "a1")
+    assert not cp.is_committed("a_chunks.json", "a2")
+
+
+def test_remove_and_compact(tmp_path):
+    cp = EmbedCheckpoint(str(tmp_path), versions={})
+    cp.commit(["a1", "a2"], FILE_OF, HASHES)
+    cp.commit(["b1"], FILE_OF, HASHES)
+    cp.remove("a_chunks.json", ["a2"])
+    cp.compact()
+    with open(cp.path, encoding="utf-8") as f:
+        records = [json.loads(line) for line in f]
+    assert sorted((r["file"], r["ids"]) for r in records) == [("a_chunks.json", ["a1"]), ("b_chunks.json", ["b1"])]
+    assert EmbedCheckpoint(str(tmp_path), versions={}).committed == {
+        "a_chunks.json": {"a1": ("h1", "m1")}, "b_chunks.json": {"b1": ("h3", "m3")}}
+
+
+def test_legacy_records_follow_file_version(tmp_path):
+    with open(os.path.join(str(tmp_path), CHECKPOINT_FILE), "w", encoding="utf-8") as f:
+        f.write(json.dumps({"file": "a_chunks.json", "version": "v1", "ids": ["a1"]}) + "\n")
+    cp = EmbedCheckpoint(str(tmp_path), versions={"a_chunks.json": "v1"})
+    assert cp.status("a_chunks.json", "a1", ("h1", "m1")) == "legacy"
+    # 文件重新分块（版本变化）后旧格式记录失效
+    cp = EmbedCheckpoint(str(tmp_path), versions={"a_chunks.json": "v2"})
+    assert cp.status("a_chunks.json", "a1", ("h1", "m1")) == "pending"
+
+
+class FlakyEmbeddings:
+    """embed_documents 调用次数超过 fail_after 后抛出 LLMCallError（模拟断网）。"""
+    calls = 0
+    fail_after = None
+
+    def __init__(self, model=None, **kwargs):
+        self.model = model
+
+    def embed_documents(self, texts):
+        cls = type(self)
+        if cls.fail_after is not None and cls.calls >= cls.fail_after:
+            raise LLMCallError("connection lost", provider="openai")
+        cls.calls += 1
+        return [embed_text(t) for t in texts]
+
+    def embed_query(self, text):
+        return embed_text(text)
+
+
+@pytest.fixture
+def project(tmp_path, monkeypatch):
+    monkeypatch.setattr(embed, "OpenAIEmbeddingFunction", FlakyEmbeddings)
+    monkeypatch.setattr(embed, "WRITE_BATCH", 4)
+    monkeypatch.setattr(FlakyEmbeddings, "calls", 0)
+    chunks = tmp_path / "processed" / "chunks"
+    chunks.mkdir(parents=True)
+    entries = [{"chunk_id": f"doc_{i}", "chunk_text": f"chunk {i} about topic {i}", "metadata": {"source": "doc.txt"}}
+               for i in range(10)]
+    (chunks / "doc.txt_chunks.json").write_text(json.dumps(entries), encoding="utf-8")
+    return str(chunks), str(tmp_path / "vectorstore" / "chroma_db")
+
+
+def test_interrupted_run_resumes_without_re_embedding(project, monkeypatch):
+    chunks, db_dir = project
+    monkeypatch.setattr(FlakyEmbeddings, "fail_after", 1)
+    first = embed.create_or_update_embeddings(chunks, db_dir, max_failed_batches=2)
+    assert (first["embedded"], first["failed"], first["remaining"]) == (4, 6, 0)
+
+    monkeypatch.setattr(FlakyEmbeddings, "fail_after", None)
+    monkeypatch.setattr(FlakyEmbeddings, "calls", 0)
+    second = embed.create_or_update_embeddings(chunks, db_dir)
+    assert (second["skipped"], second["embedded"], second["failed"]) == (4, 6, 0)
+    assert FlakyEmbeddings.calls == 2  # 只为剩下的 6 个分块请求 embedding（每批 4 个）
+
+    third = embed.create_or_update_embeddings(chunks, db_dir)
+    assert (third["skipped"], third["embedded"]) == (10, 0)
+    assert FlakyEmbeddings.calls == 2
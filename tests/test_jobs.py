@@ -0,0 +1,84 @@
+import os
+import time
+from datetime import datetime, timedelta
+
+import pytest
+
+import jobs
+
+
+def make_project(tmp_path, n_files=3):
+    raw = tmp_path / "raw_pdfs"
+    raw.mkdir()
+    for i in range(1, n_files + 1):
+        sentences = " ".join(f"Sentence {j} of document {i} about enzymes." for j in range(50 * i))
+        (raw / f"doc{i}.txt").write_text(sentences, encoding="utf-8")
+    return str(tmp_path)
+
+
+def wait(project, job_id, timeout=60):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        job = jobs.get_job(project, job_id)
+        if job["status"] not in jobs.ACTIVE_STATUSES:
+            return job
+        time.sleep(0.1)
+    pytest.fail(f"job {job_id} did not finish within {timeout}s")
+
+
+def test_preprocess_job_runs_to_completion(tmp_path):
+    project = make_project(tmp_path)
+    job = jobs.submit_job(project, "preprocess", {"chunk_size": 200})
+    with pytest.raises(RuntimeError):
+        jobs.submit_job(project, "embed")  # 同一项目同时只允许一个活动任务
+    job = wait(project, job["id"])
+    assert job["status"] == "done", job["error"]
+    assert job["progress"]["files_done"] == job["progress"]["files_total"] == 3
+    assert job["pid"] and job["started"] and job["finished"]
+    assert sorted(os.listdir(os.path.join(project, "processed", "chunks"))) == [
+        f"doc{i}.txt_chunks.json" for i in (1, 2, 3)]
+    assert [j["id"] for j in jobs.list_jobs(project)] == [job["id"]]
+
+
+def test_cancel_then_resume(tmp_path):
+    project = make_project(tmp_path)
+    job = jobs.submit_job(project, "preprocess")
+    jobs.cancel_job(project, job["id"])  # 工作进程在处理完第一个文件后检查到标记并退出
+    job = wait(project, job["id"])
+    assert job["status"] == "cancelled"
+    assert job["progress"].get("files_done", 0) < 3
+    assert not os.path.exists(os.path.join(project, jobs.JOBS_DIR, f"{job['id']}.cancel"))
+
+    resumed = jobs.resume_job(project, job["id"])
+    assert resumed["params"]["resume"] is True and resumed["params"]["force_reprocess"] is False
+    resumed = wait(project, resumed["id"])
+    assert resumed["status"] == "done", resumed["error"]
+    assert len(os.listdir(os.path.join(project, "processed", "chunks"))) == 3
+
+
+def write_job(project, job_id, **fields):
+    job = {"id": job_id, "kind": "preprocess", "params": {}, "status": "running", "pid": None,
+           "created": datetime.now().isoformat(), **fields}
+    jobs._write(jobs._job_path(project, job_id), job)
+
+
+def test_lost_workers_are_marked_interrupted(tmp_path):
+    project = str(tmp_path)
+    dead = jobs.multiprocessing.get_context("spawn").Process(target=os.getpid)
+    dead.start()
+    dead.join()
+    write_job(project, "dead", pid=dead.pid)
+    write_job(project, "alive", pid=os.getpid())
+    write_job(project, "starting", status="queued")
+    write_job(project, "stale", status="queued",
+              created=(datetime.now() - timedelta(seconds=jobs.QUEUE_TIMEOUT + 1)).isoformat())
+
+    assert jobs.get_job(project, "dead")["status"] == "interrupted"
+    assert jobs.get_job(project, "dead")["finished"]
+    assert jobs.get_job(project, "alive")["status"] == "running"
+    assert jobs.get_job(project, "starting")["status"] == "queued"
+    assert jobs.get_job(project, "stale")["status"] == "interrupted"
+    assert jobs.active_job(project)["id"] in {"alive", "starting"}
+    assert jobs.get_job(project, "missing") is None
+    with pytest.raises(ValueError):
+        jobs.resume_job(project, "missing")
@@ -0,0 +1,65 @@
+import pytest
+
+import llm_client
+from llm_client import CircuitBreaker, DeadlineExceededError, LLMRequestError, call_with_limits, get_gate
+
+
+@pytest.fixture(autouse=True)
+def fresh_gates(monkeypatch):
+    monkeypatch.setenv("LLM_TESTP_MAX_CONCURRENCY", "1")
+    monkeypatch.setenv("LLM_TESTP_DEADLINE", "0.3")
+    llm_client.reset_gates()
+    yield
+    llm_client.reset_gates()
+
+
+def test_stream_holds_concurrency_slot_until_exhausted():
+    stream = call_with_limits("testp", lambda timeout: iter(["a", "b"]), stream=True)
+    assert not get_gate("testp").semaphore.acquire(blocking=False)
+    assert list(stream) == ["a", "b"]
+    assert get_gate("testp").semaphore.acquire(blocking=False)
+
+
+def test_stream_close_releases_slot_once():
+    stream = call_with_limits("testp", lambda timeout: iter(["a", "b"]), stream=True)
+    next(stream)
+    stream.close()
+    stream.close()
+    gate = get_gate("testp")
+    assert gate.semaphore.acquire(blocking=False)
+    gate.semaphore.release()  # BoundedSemaphore：重复释放会抛 ValueError
+
+
+class BadRequest(Exception):
+    status_code = 400
+
+
+def test_fatal_error_does_not_close_half_open_breaker():
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=0)
+    get_gate("testp").breaker = breaker
+    breaker.record_failure()
+    assert breaker.state == "open"
+
+    def bad(timeout):
+        raise BadRequest("bad request")
+
+    with pytest.raises(LLMRequestError):
+        call_with_limits("testp", bad)
+    assert breaker.state == "half_open"
+    assert breaker.allow()  # 探测名额已让出
+
+
+def test_probe_timing_out_for_a_slot_releases_half_open_breaker():
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=0)
+    gate = get_gate("testp")
+    gate.breaker = breaker
+    breaker.record_failure()
+    assert gate.semaphore.acquire(blocking=False)  # 唯一的并发槽位被占用
+    try:
+        with pytest.raises(DeadlineExceededError):
+            call_with_limits("testp", lambda timeout: "never")
+    finally:
+        gate.semaphore.release()
+    assert breaker.state == "half_open"
+    assert call_with_limits("testp", lambda timeout: "ok") == "ok"
+    assert breaker.state == "closed"
@@ -0,0 +1,56 @@
+import pytest
+
+from llm_client import LLMCallError
+from llm_router import ModelRouter
+
+
+def make_router():
+    return ModelRouter({"summary": ["fast-fail", "backup"]}, provider_of=lambda m: f"test-{m}")
+
+
+def flaky(calls):
+    def fn(model):
+        calls.append(model)
+        if model == "fast-fail":
+            raise LLMCallError("boom")
+        return f"ok from {model}"
+    return fn
+
+
+def test_primary_fails_fast_without_history_falls_back():
+    calls = []
+    assert make_router().call("summary", flaky(calls), hedge_percentile=95) == "ok from backup"
+    assert calls == ["fast-fail", "backup"]
+
+
+def test_primary_fails_fast_within_hedge_delay_falls_back():
+    router = make_router()
+    for _ in range(5):
+        router.stats("fast-fail").record(5.0, ok=True)  # p95 = 5s，快速失败时还没发出对冲
+    calls = []
+    assert router.call("summary", flaky(calls), hedge_percentile=95) == "ok from backup"
+    assert calls == ["fast-fail", "backup"]
+
+
+def test_all_candidates_fail_raises_last_error():
+    router = ModelRouter({"summary": ["a", "b"]}, provider_of=lambda m: f"test-{m}")
+
+    def fail(model):
+        raise LLMCallError(model)
+
+    with pytest.raises(LLMCallError, match="b"):
+        router.call("summary", fail, hedge_percentile=95)
+
+
+def test_slower_preferred_model_is_demoted():
+    router = ModelRouter({"summary": ["slow", "fast"]}, provider_of=lambda m: f"test-{m}")
+    for _ in range(5):
+        router.stats("slow").record(3.0, ok=True)
+        router.stats("fast").record(0.5, ok=True)
+    assert router.rank("summary", preferred="slow") == ["fast", "slow"]
+    assert router.call("summary", lambda model: model, preferred="slow") == "fast"
+
+
+def test_preferred_model_breaks_ties_without_history():
+    router = ModelRouter({"summary": ["a", "b"]}, provider_of=lambda m: f"test-{m}")
+    assert router.rank("summary", preferred="b") == ["b", "a"]
@@ -0,0 +1,80 @@
+import pytest
+
+import memory_guard
+import preprocess
+from memory_guard import MemoryCapExceeded, MemoryMonitor, current_rss_mb
+from preprocess import process_documents
+
+
+def fake_rss(monkeypatch, values):
+    """让 current_rss_mb 依次返回 values（用完后重复最后一个值）。"""
+    values = list(values)
+    monkeypatch.setattr(memory_guard, "current_rss_mb", lambda: values.pop(0) if len(values) > 1 else values[0])
+
+
+def test_current_rss_is_readable():
+    assert current_rss_mb() > 0
+
+
+def test_cap_exceeded_raises(monkeypatch):
+    fake_rss(monkeypatch, [100, 150, 900, 900])
+    monitor = MemoryMonitor(max_rss_mb=500)
+    with pytest.raises(MemoryCapExceeded, match="after 2 pages"):
+        with monitor:
+            monitor.check()
+            monitor.check()
+    assert monitor.report()["rss_peak_mb"] == 900
+
+
+def test_gc_bringing_rss_under_cap_continues(monkeypatch):
+    gc_calls = []
+    monkeypatch.setattr(memory_guard.gc, "collect", lambda: gc_calls.append(1))
+    fake_rss(monkeypatch, [100, 600, 400, 300])
+    with MemoryMonitor(max_rss_mb=500) as monitor:
+        monitor.check()
+    assert gc_calls == [1]
+    report = monitor.report()
+    assert (report["rss_start_mb"], report["rss_peak_mb"], report["rss_end_mb"], report["pages"]) == (100, 600, 300, 1)
+
+
+def test_no_cap_or_unreadable_rss_never_raises(monkeypatch):
+    fake_rss(monkeypatch, [10_000])
+    with MemoryMonitor() as monitor:
+        monitor.check()
+    fake_rss(monkeypatch, [None])
+    with MemoryMonitor(max_rss_mb=1) as monitor:
+        monitor.check()
+    assert monitor.report()["rss_peak_mb"] is None
+
+
+def test_trace_reports_python_peak():
+    with MemoryMonitor(trace=True) as monitor:
+        block = bytearray(8 * memory_guard.MIB)
+        monitor.check()
+        del block
+    assert monitor.report()["traced_peak_mb"] >= 8
+    assert not memory_guard.tracemalloc.is_tracing()
+
+
+def test_file_over_cap_is_failed_and_next_file_runs(tmp_path, monkeypatch):
+    raw = tmp_path / "raw"
+    raw.mkdir()
+    (raw / "big.txt").write_text("Big document sentence. " * 200, encoding="utf-8")
+    (raw / "small.txt").write_text("Small document sentence. " * 20, encoding="utf-8")
+    real = current_rss_mb()
+    loading = []
+
+    def iter_documents(src, ext, streaming):
+        loading.append(src.name)
+        return original_iter(src, ext, streaming)
+
+    # 处理 big.txt 期间报告的 RSS 远超上限
+    original_iter = preprocess.iter_documents
+    monkeypatch.setattr(preprocess, "iter_documents", iter_documents)
+    monkeypatch.setattr(memory_guard, "current_rss_mb", lambda: real + 10_000 if loading[-1:] == ["big.txt"] else real)
+    summary = process_documents(str(raw), str(tmp_path / "out"), max_rss_mb=real + 1000, dedup_threshold=0)
+    assert sorted(loading) == ["big.txt", "small.txt"]
+    assert summary["failed_files"] == ["big.txt"]
+    assert summary["processed"] == 1
+    assert summary["memory"]["big.txt"]["rss_peak_mb"] > real + 1000
+    assert [p.name for p in (tmp_path / "out" / "chunks").iterdir()] == ["small.txt_chunks.json"]
@@ -0,0 +1,103 @@
+import contextvars
+import json
+
+import pytest
+
+import metrics
+
+
+@pytest.fixture(autouse=True)
+def clean_metrics(monkeypatch):
+    metrics.reset()
+    monkeypatch.setattr(metrics, "_debug", False)
+    yield
+    metrics.reset()
+
+
+def stage_hist(snap, stage):
+    return next(h for h in snap["histograms"][metrics.STAGE_SECONDS] if h["labels"] == {"stage": stage})
+
+
+def test_histogram_bucketing():
+    for value in (0.0005, 0.001, 0.003, 0.2, 100.0):
+        metrics.observe(metrics.STAGE_SECONDS, value, stage="s")
+    hist = stage_hist(metrics.snapshot(), "s")
+    assert hist["count"] == 5
+    assert hist["sum"] == pytest.approx(100.2045)
+    assert hist["max"] == 100.0
+    # 桶上界包含等于边界的值（le 语义），超过 60s 的落在最后的 +Inf 桶
+    expected = [0] * (len(metrics.BUCKETS) + 1)
+    expected[0] = 2
+    expected[metrics.BUCKETS.index(0.005)] = 1
+    expected[metrics.BUCKETS.index(0.25)] = 1
+    expected[-1] = 1
+    assert hist["buckets"] == expected
+    assert metrics.quantile(hist, 0.5) <= 0.005
+    assert metrics.quantile(hist, 1.0) == metrics.BUCKETS[-1]
+
+
+def test_timer_records_on_exception():
+    with pytest.raises(ValueError):
+        with metrics.timer("boom", kind="x"):
+            raise ValueError
+    item = metrics.snapshot()["histograms"][metrics.STAGE_SECONDS][0]
+    assert item["labels"] == {"kind": "x", "stage": "boom"}
+    assert item["count"] == 1
+
+
+def test_prometheus_text():
+    metrics.inc("rag_chunks_total", 3, stage="created")
+    metrics.inc("rag_chunks_total", 2, stage="created")
+    metrics.observe(metrics.STAGE_SECONDS, 0.02, stage='we"ird')
+    text = metrics.to_prometheus()
+    lines = text.splitlines()
+    assert "# TYPE rag_chunks_total counter" in lines
+    assert 'rag_chunks_total{stage="created"} 5' in lines
+    assert "# TYPE rag_stage_seconds histogram" in lines
+    assert 'rag_stage_seconds_bucket{stage="we\\"ird",le="0.01"} 0' in lines
+    assert 'rag_stage_seconds_bucket{stage="we\\"ird",le="0.025"} 1' in lines
+    assert 'rag_stage_seconds_bucket{stage="we\\"ird",le="+Inf"} 1' in lines
+    assert 'rag_stage_seconds_count{stage="we\\"ird"} 1' in lines
+    assert text.endswith("\n")
+
+
+def test_flush_load_round_trip(tmp_path):
+    path = str(tmp_path / "metrics.json")
+    metrics.inc("rag_files_total", status="ok")
+    metrics.observe(metrics.STAGE_SECONDS, 0.5, stage="embed")
+    metrics.flush(path)
+    # 第二次 flush 只合并新增部分，不重复写入已 flush 的数据
+    metrics.inc("rag_files_total", 2, status="ok")
+    metrics.observe(metrics.STAGE_SECONDS, 1.5, stage="embed")
+    metrics.flush(path)
+    metrics.flush(path)
+
+    loaded = metrics.load_snapshot(path)
+    assert loaded["counters"]["rag_files_total"] == [{"labels": {"status": "ok"}, "value": 3}]
+    hist = stage_hist(loaded, "embed")
+    assert hist["count"] == 2
+    assert hist["sum"] == pytest.approx(2.0)
+    assert hist["max"] == 1.5
+    assert metrics.stage_rows(loaded)[0]["stage"] == "embed"
+    assert json.loads((tmp_path / "metrics.json").read_text())["updated"] > 0
+    assert not (tmp_path / "metrics.json.lock").exists()
+
+
+def test_load_snapshot_missing_or_corrupt(tmp_path):
+    assert metrics.load_snapshot(str(tmp_path / "none.json")) is None
+    (tmp_path / "bad.json").write_text("{", encoding="utf-8")
+    assert metrics.load_snapshot(str(tmp_path / "bad.json")) is None
+
+
+def test_session_debug_is_per_context(capsys):
+    def session(enabled):
+        metrics.set_session_debug(enabled)
+        metrics.debug("visible")
+        return metrics.debug_enabled()
+
+    assert contextvars.copy_context().run(session, True) is True
+    assert capsys.readouterr().out == "visible\n"
+    # 其他会话（上下文）仍沿用进程级开关
+    assert metrics.debug_enabled() is False
+    assert contextvars.copy_context().run(session, None) is False
+    assert capsys.readouterr().out == ""
@@ -0,0 +1,95 @@
+import json
+import os
+
+import numpy as np
+
+from near_dup import INDEX_DIR, NUM_PERM, NearDupIndex, shingles, signature, similarity
+from preprocess import process_documents
+
+ABSTRACT = ("Enzymes are biological catalysts that speed up chemical reactions in cells by lowering the "
+            "activation energy, and most enzymes are proteins folded into a specific three dimensional shape.")
+EDITED = ABSTRACT.replace("most enzymes", "nearly all enzymes")
+OTHER = "The French revolution began in 1789 and reshaped the political order of Europe for decades to come."
+
+
+def test_signature_estimates_jaccard():
+    assert shingles("A b c") == ["a b c"]
+    assert shingles("") == []
+    assert np.array_equal(signature(ABSTRACT), signature(ABSTRACT.upper()))
+    assert similarity(signature(ABSTRACT), signature(EDITED)) > 0.75
+    assert similarity(signature(ABSTRACT), signature(OTHER)) < 0.1
+    assert not signature("!!! ...").any()
+    assert signature(OTHER).shape == (NUM_PERM,)
+
+
+def test_match_only_canonical_chunks_above_threshold():
+    index = NearDupIndex("unused", threshold=0.75)
+    index.add("a_chunks.json", "a1", "h1", signature(ABSTRACT))
+    assert index.match(signature(EDITED)) == "a1"
+    assert index.match(signature(OTHER)) is None
+    assert index.match(signature("")) is None
+    # 记为重复的分块不进入 LSH 桶，后续分块总是指向 canonical
+    index.add("b_chunks.json", "b1", "h2", signature(EDITED), canonical="a1")
+    assert index.match(signature(EDITED)) == "a1"
+    assert NearDupIndex("unused", threshold=0.99).match(signature(EDITED)) is None
+
+
+def test_drop_returns_signatures_and_clears_buckets():
+    index = NearDupIndex("unused", threshold=0.75)
+    sig = signature(ABSTRACT)
+    index.add("a_chunks.json", "a1", "h1", sig)
+    reusable = index.drop("a_chunks.json")
+    assert list(reusable) == ["h1"] and np.array_equal(reusable["h1"], sig)
+    assert index.match(sig) is None
+    assert index.buckets == {} and index.file_of == {}
+
+
+def test_save_load_round_trip(tmp_path):
+    processed = str(tmp_path)
+    index = NearDupIndex(processed, threshold=0.75)
+    index.add("a_chunks.json", "a1", "h1", signature(ABSTRACT))
+    index.add("a_chunks.json", "a2", "h2", signature(OTHER))
+    index.add("b_chunks.json", "b1", "h3", signature(EDITED), canonical="a1")
+    index.save("a_chunks.json")
+    index.save("b_chunks.json")
+
+    loaded = NearDupIndex(processed, threshold=0.75)
+    loaded.load(["a_chunks.json", "b_chunks.json", "missing_chunks.json"])
+    assert [(r[0], r[1], r[3]) for r in loaded.files["b_chunks.json"]] == [("b1", "h3", "a1")]
+    assert loaded.file_of == {"a1": "a_chunks.json", "a2": "a_chunks.json"}
+    assert loaded.match(signature(EDITED)) == "a1"
+    for fn in ("a_chunks.json", "b_chunks.json"):
+        for old, new in zip(index.files[fn], loaded.files[fn]):
+            assert np.array_equal(old[2], new[2])
+
+    loaded.remove("b_chunks.json")
+    assert sorted(os.listdir(os.path.join(processed, INDEX_DIR))) == ["a_chunks.json.npz"]
+
+
+def test_load_backfills_signatures_from_chunk_files(tmp_path):
+    chunks = tmp_path / "chunks"
+    chunks.mkdir()
+    records = [{"chunk_id": "a1", "chunk_text": ABSTRACT, "content_hash": "h1"}]
+    (chunks / "a_chunks.json").write_text(json.dumps(records), encoding="utf-8")
+    index = NearDupIndex(str(tmp_path), threshold=0.75)
+    index.load(["a_chunks.json"], chunks_folder=str(chunks))
+    assert index.match(signature(EDITED)) == "a1"
+    assert os.path.exists(os.path.join(str(tmp_path), INDEX_DIR, "a_chunks.json.npz"))
+
+
+def test_preprocess_links_duplicates_across_files(tmp_path):
+    raw = tmp_path / "raw"
+    raw.mkdir()
+    (raw / "preprint.txt").write_text(ABSTRACT, encoding="utf-8")
+    (raw / "published.txt").write_text(ABSTRACT + "\n\n" + OTHER, encoding="utf-8")
+    out = tmp_path / "out"
+    summary = process_documents(str(raw), str(out), chunking_method="按段落", dedup_threshold=0.8)
+    assert summary["duplicates"] == 1
+
+    chunks = {fn: json.loads((out / "chunks" / fn).read_text(encoding="utf-8"))
+              for fn in ("preprint.txt_chunks.json", "published.txt_chunks.json")}
+    canonical = {c["chunk_id"] for chunks_ in chunks.values() for c in chunks_ if "duplicate_of" not in c}
+    dups = [c for chunks_ in chunks.values() for c in chunks_ if "duplicate_of" in c]
+    assert len(dups) == 1 and dups[0]["duplicate_of"] in canonical
+    manifest = json.loads((out / "manifest.json").read_text(encoding="utf-8"))
+    assert sum(m["duplicates"]["chunks"] for m in manifest.values()) == 1
@@ -0,0 +1,60 @@
+import pytest
+
+import anki
+import literature
+import pipeline
+import retrieve
+import summarize
+from card_parser import CardParseResult
+
+
+@pytest.fixture
+def fake_search(monkeypatch):
+    """向量检索按查询返回固定结果，改写函数在原查询后加上 "(rewritten)"。"""
+    searched = []
+
+    def vector_search(query, top_k, db, relevance_threshold=None):
+        searched.append(query)
+        return [{"rank": 1, "chunk_id": f"id:{query}", "source": "a.pdf", "distance": 0.5}]
+
+    monkeypatch.setattr(retrieve, "initialize_chroma", lambda path: None)
+    monkeypatch.setattr(retrieve, "search", vector_search)
+    monkeypatch.setattr(literature, "standardize_query", lambda q: f"{q} (rewritten)")
+    monkeypatch.setattr(anki, "hydrate_results", lambda results, folder: [{**r, "chunk_text": "text"} for r in results])
+    return searched
+
+
+def test_cards_use_rewritten_query(tmp_path, fake_search, monkeypatch):
+    seen = {}
+
+    def generate(**kwargs):
+        seen.update(kwargs)
+        return CardParseResult()
+
+    monkeypatch.setattr(anki, "generate_anki_cards_validated", generate)
+    out = pipeline.cards(str(tmp_path), "raw", rewrite=True, skip_known=False)
+    assert sorted(fake_search) == ["raw", "raw (rewritten)"]
+    assert seen["standardized_query"] == "raw (rewritten)"
+    assert {h["chunk_id"] for h in seen["chunks"]} == {"id:raw", "id:raw (rewritten)"}
+    assert out["cards"] == []
+
+    pipeline.cards(str(tmp_path), "plain", skip_known=False)
+    assert seen["standardized_query"] == "plain"
+
+
+def test_summarize_prompt_uses_rewritten_query(tmp_path, fake_search, monkeypatch):
+    prompts = []
+
+    def summarize_chunks(chunks, prompt, **kwargs):
+        prompts.append(prompt)
+        return "summary", 1.0, 10
+
+    monkeypatch.setattr(anki, "load_chunk_index", lambda folder: {
+        "id:raw": {"chunk_text": "a"}, "id:raw (rewritten)": {"chunk_text": "b"}})
+    monkeypatch.setattr(literature, "build_chunk_text", lambda entry: entry["chunk_text"])
+    monkeypatch.setattr(summarize, "summarize_chunks", summarize_chunks)
+
+    out = pipeline.summarize(str(tmp_path), "raw", rewrite=True)
+    assert "raw (rewritten)" in prompts[0]
+    assert out["summary"] == "summary"
+    assert len(out["sources"]) == 2
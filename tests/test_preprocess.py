@@ -0,0 +1,99 @@
+import json
+
+import pytest
+
+from preprocess import doc_key, make_chunk_id, process_documents
+
+fitz = pytest.importorskip("fitz")
+
+PAGES = [
+    "Enzymes are proteins that catalyse reactions. They lower the activation energy of a reaction.",
+    "Cells divide by mitosis. Each daughter cell receives a full copy of the genome.",
+    "Photosynthesis converts light into chemical energy. It takes place in the chloroplasts.",
+]
+
+
+def write_pdf(path, pages):
+    pdf = fitz.open()
+    for text in pages:
+        pdf.new_page().insert_textbox(fitz.Rect(50, 50, 550, 800), text, fontsize=11)
+    pdf.save(str(path))
+    pdf.close()
+
+
+def read_chunks(out, chunk_file):
+    return json.loads((out / "chunks" / chunk_file).read_text(encoding="utf-8"))
+
+
+def manifest(out):
+    return json.loads((out / "manifest.json").read_text(encoding="utf-8"))
+
+
+def test_only_changed_pages_are_rechunked(tmp_path):
+    raw, out = tmp_path / "raw", tmp_path / "out"
+    raw.mkdir()
+    write_pdf(raw / "paper.pdf", PAGES)
+    process_documents(str(raw), str(out), chunking_method="按句子", chunk_size=60, chunk_overlap=0, dedup_threshold=0)
+    before = read_chunks(out, "paper.pdf_chunks.json")
+    assert manifest(out)["paper.pdf"]["changes"]["pages_chunked"] == 3
+    assert {c["page"] for c in before} == {0, 1, 2}
+
+    write_pdf(raw / "paper.pdf", [PAGES[0], "Meiosis produces gametes with half the chromosomes.", PAGES[2]])
+    summary = process_documents(str(raw), str(out), chunking_method="按句子", chunk_size=60, chunk_overlap=0,
+                                dedup_threshold=0)
+    changes = summary["changes"]["paper.pdf"]
+    assert (changes["pages_reused"], changes["pages_chunked"]) == (2, 1)
+    after = read_chunks(out, "paper.pdf_chunks.json")
+    kept = {c["chunk_id"] for c in before if c["page"] != 1}
+    assert kept <= {c["chunk_id"] for c in after}
+    assert changes["unchanged"] == len(kept)
+    assert changes["removed"] == len([c for c in before if c["page"] == 1])
+    assert all("Meiosis" in c["chunk_text"] for c in after if c["page"] == 1)
+
+    # 分块参数变化后，即使页面原文未变也要重新分块
+    write_pdf(raw / "paper.pdf", PAGES)
+    summary = process_documents(str(raw), str(out), chunking_method="按句子", chunk_size=200, chunk_overlap=0,
+                                dedup_threshold=0)
+    changes = summary["changes"]["paper.pdf"]
+    assert (changes["pages_reused"], changes["pages_chunked"]) == (0, 3)
+
+
+def test_make_chunk_id_is_content_addressed():
+    assert make_chunk_id("k", "0123456789abcdef0123") == "k-0123456789abcdef"
+    assert make_chunk_id("k", "0123456789abcdef0123", 2) == "k-0123456789abcdef-2"
+    assert doc_key("a.pdf") == doc_key("a.pdf") != doc_key("a.txt")
+
+
+def paragraphs(*texts):
+    return "\n\n".join(texts)
+
+
+def test_chunk_ids_survive_insertions_and_renames(tmp_path):
+    raw, out = tmp_path / "raw", tmp_path / "out"
+    raw.mkdir()
+
+    def run():
+        return process_documents(str(raw), str(out), chunking_method="按段落", dedup_threshold=0)
+
+    (raw / "notes.txt").write_text(paragraphs(PAGES[0], PAGES[1], PAGES[1]), encoding="utf-8")
+    write_pdf(raw / "notes.pdf", [PAGES[2]])
+    run()
+    before = read_chunks(out, "notes.txt_chunks.json")
+    ids = [c["chunk_id"] for c in before]
+    assert len(set(ids)) == 3 and ids[2] == ids[1] + "-1"  # 同一文件中重复的段落加序号区分
+    assert "Photosynthesis" in read_chunks(out, "notes.pdf_chunks.json")[0]["chunk_text"]  # 同名不同类型互不覆盖
+
+    # 在开头插入一段：已有分块的 ID 不变
+    (raw / "notes.txt").write_text(paragraphs(PAGES[2], PAGES[0], PAGES[1], PAGES[1]), encoding="utf-8")
+    summary = run()
+    after = [c["chunk_id"] for c in read_chunks(out, "notes.txt_chunks.json")]
+    assert after[1:] == ids
+    changes = summary["changes"]["notes.txt"]
+    assert (changes["added"], changes["unchanged"], changes["removed"]) == (1, 3, 0)
+
+    # 改名：沿用原来的 ID 前缀，旧分块文件被替换
+    (raw / "notes.txt").rename(raw / "renamed.txt")
+    run()
+    assert [c["chunk_id"] for c in read_chunks(out, "renamed.txt_chunks.json")] == after
+    assert not (out / "chunks" / "notes.txt_chunks.json").exists()
+    assert sorted(manifest(out)) == ["notes.pdf", "renamed.txt"]
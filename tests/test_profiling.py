@@ -0,0 +1,86 @@
+import asyncio
+import contextvars
+import os
+import pstats
+import time
+
+import pytest
+
+import profiling
+
+
+@pytest.fixture(autouse=True)
+def enabled(monkeypatch):
+    monkeypatch.setattr(profiling, "_enabled", True)
+    monkeypatch.setenv("RAG_PROFILE_INTERVAL", "1")
+
+
+def worker_hotspot(n):
+    deadline = time.perf_counter() + 0.1
+    total = 0
+    while time.perf_counter() < deadline:
+        total += sum(range(n))
+    return total
+
+
+def functions(prof_path):
+    return {func for (_, _, func) in pstats.Stats(prof_path).stats}
+
+
+def test_traced_worker_is_merged_into_profile(tmp_path):
+    async def run():
+        return await asyncio.to_thread(profiling.traced(worker_hotspot), 100)
+
+    with profiling.profile(str(tmp_path), "query") as paths:
+        assert asyncio.run(run()) > 0
+    assert "worker_hotspot" in functions(paths["prof"])
+    with open(paths["collapsed"], encoding="utf-8") as f:
+        assert any("worker_hotspot" in line for line in f)
+
+
+def test_untraced_worker_is_not_profiled(tmp_path):
+    async def run():
+        return await asyncio.to_thread(worker_hotspot, 100)
+
+    with profiling.profile(str(tmp_path), "query") as paths:
+        asyncio.run(run())
+    assert "worker_hotspot" not in functions(paths["prof"])
+
+
+def test_traced_without_profile_just_calls(tmp_path):
+    assert profiling.traced(lambda x: x + 1)(1) == 2
+    assert profiling.list_profiles(str(tmp_path)) == []
+
+
+def test_nested_profile_and_session_switch(tmp_path):
+    with profiling.profile(str(tmp_path), "outer") as outer:
+        with profiling.profile(str(tmp_path), "inner") as inner:
+            worker_hotspot(10)
+    assert outer and inner == {}
+
+    def session_disabled():
+        profiling.set_session_enabled(False)
+        with profiling.profile(str(tmp_path), "off") as paths:
+            return paths
+
+    assert contextvars.copy_context().run(session_disabled) == {}
+    assert len(profiling.list_profiles(str(tmp_path))) == 1
+
+
+def test_profiled_decorator_and_pruning(tmp_path):
+    @profiling.profiled("job", lambda a: a["project"])
+    def job(project, n=10):
+        return worker_hotspot(n)
+
+    for _ in range(3):
+        job(str(tmp_path))
+    folder = os.path.join(str(tmp_path), profiling.PROFILES_DIR)
+    newest = profiling.list_profiles(str(tmp_path))[:2]
+    profiling._prune(folder, keep=2)
+    profiles = profiling.list_profiles(str(tmp_path))
+    assert profiles == newest
+    assert len(os.listdir(folder)) == 2 * 2
+    assert all(os.path.basename(p).startswith("job-") for p in profiles)
+    rows = profiling.top_hotspots(profiles[0], limit=5)
+    assert len(rows) == 5
+    assert rows[0]["cumtime_s"] >= rows[-1]["cumtime_s"]
@@ -0,0 +1,34 @@
+import multiprocessing
+import os
+
+from project_stats import load_stats, update_stats
+
+
+def _update_many(processed_dir, worker, n):
+    for i in range(n):
+        update_stats(processed_dir, files={f"w{worker}_{i}.pdf": {"n_chunks": 1}})
+
+
+def test_update_stats_merges_fields(tmp_path):
+    processed = str(tmp_path / "processed")
+    update_stats(processed, files={"a.pdf": {"n_chunks": 3, "n_duplicates": 1}})
+    update_stats(processed, files={"a.pdf": {"n_embedded": 2}, "b.pdf": {"n_chunks": 4}}, run={"stage": "embed", "ok": 1})
+    stats = update_stats(processed, removed=["b.pdf"], n_embedded=2)
+    assert stats["files"] == {"a.pdf": {"n_chunks": 3, "n_duplicates": 1, "n_embedded": 2}}
+    assert (stats["n_chunks"], stats["n_duplicates"], stats["n_embedded"]) == (3, 1, 2)
+    assert stats["runs"] == {"embed": {"ok": 1}}
+    assert load_stats(processed) == stats
+
+
+def test_concurrent_processes_do_not_lose_updates(tmp_path):
+    processed = str(tmp_path / "processed")
+    ctx = multiprocessing.get_context("fork")
+    procs = [ctx.Process(target=_update_many, args=(processed, w, 20)) for w in range(4)]
+    for p in procs:
+        p.start()
+    for p in procs:
+        p.join(30)
+    stats = load_stats(processed)
+    assert len(stats["files"]) == 80
+    assert stats["n_chunks"] == 80
+    assert not [f for f in os.listdir(processed) if f.endswith((".lock", ".tmp"))]
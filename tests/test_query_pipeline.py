@@ -0,0 +1,89 @@
+import asyncio
+import threading
+import time
+
+import pytest
+
+from query_pipeline import RRF_K, format_timings, reciprocal_rank_fusion, run_speculative_query, speculative_search
+
+
+def hit(cid, distance):
+    return {"chunk_id": cid, "source": "a.pdf", "distance": distance}
+
+
+def test_rrf_scores_and_keeps_closest_hit():
+    fused = reciprocal_rank_fusion([[hit("a", 0.3), hit("b", 0.4)], [hit("b", 0.2), hit("c", 0.5)]], top_k=3)
+    assert [h["chunk_id"] for h in fused] == ["b", "a", "c"]
+    assert [h["rank"] for h in fused] == [1, 2, 3]
+    assert fused[0]["fusion_score"] == pytest.approx(1 / (RRF_K + 2) + 1 / (RRF_K + 1))
+    assert fused[0]["distance"] == 0.2
+    # a 只在第一路排第 1，c 只在第二路排第 2
+    assert fused[1]["fusion_score"] == pytest.approx(1 / (RRF_K + 1))
+    assert fused[2]["fusion_score"] == pytest.approx(1 / (RRF_K + 2))
+    assert reciprocal_rank_fusion([[hit("a", 0.1), hit("b", 0.2)]], top_k=1) == [
+        {**hit("a", 0.1), "rank": 1, "fusion_score": pytest.approx(1 / (RRF_K + 1))}]
+
+
+def test_rewrite_overlaps_raw_retrieval():
+    first = []
+
+    def rewrite(q):
+        time.sleep(0.2)
+        return f"{q} rewritten"
+
+    def retrieve(q):
+        time.sleep(0.2)
+        return [hit(f"{q}-1", 0.1), hit("shared", 0.5)]
+
+    out = speculative_search("q", rewrite, retrieve, top_k=3, on_first_results=first.append)
+    assert out["query"] == "q rewritten"
+    assert first == [out["raw_results"]]
+    assert [h["chunk_id"] for h in out["results"]] == ["shared", "q rewritten-1", "q-1"]
+    timings = out["timings"]
+    # 改写与原始查询检索并行：重叠接近 0.2s，总耗时约为 改写 + 改写后检索
+    assert timings["overlap"] >= 0.15
+    assert timings["retrieve_rewritten"]["start"] >= timings["rewrite"]["end"]
+    assert timings["total"] < 0.55
+    assert "overlap" in format_timings(timings)
+
+
+def test_replace_fusion_and_unchanged_rewrite():
+    retrieve = lambda q: [hit(q, 0.1)]
+    out = speculative_search("q", lambda q: "other", retrieve, top_k=5, fusion="replace")
+    assert out["results"] == [hit("other", 0.1)]
+
+    # 改写结果与原始查询相同（或为空）时不再检索第二次
+    calls = []
+
+    def counting(q):
+        calls.append(q)
+        return [hit(q, 0.1)]
+
+    for rewritten in (" q ", "", None):
+        calls.clear()
+        out = speculative_search("q", lambda q: rewritten, counting, top_k=5)
+        assert (out["query"], calls) == ("q", ["q"])
+        assert "retrieve_rewritten" not in out["timings"]
+
+
+def test_no_rewrite_runs_single_retrieval():
+    out = speculative_search("q", None, lambda q: [hit(q, 0.1)], top_k=5)
+    assert out["query"] == "q"
+    assert out["results"] == out["raw_results"]
+    assert out["timings"]["overlap"] == 0.0
+
+
+def test_retrieval_runs_off_the_event_loop_thread():
+    threads = []
+
+    def retrieve(q):
+        threads.append(threading.get_ident())
+        return [hit(q, 0.1)]
+
+    async def main():
+        loop_thread = threading.get_ident()
+        await run_speculative_query("q", lambda q: "r", retrieve, 5)
+        return loop_thread
+
+    loop_thread = asyncio.run(main())
+    assert len(threads) == 2 and loop_thread not in threads
@@ -0,0 +1,90 @@
+import random
+import re
+import time
+
+import pytest
+
+from reference_lines import ReferenceDetector, is_reference_line, match_reference
+
+# experimental/deep_clean.remove_references_section 原来的逐行正则，作为对比基准
+LEGACY_PATTERN = re.compile(
+    r"""(?x) ^\s*
+    (?:
+      \[\d+\]
+    | \[J\]\.?
+    | \[M\]\.?
+    | \d{1,4}[\.）]\s+
+    | \d{4}(?:年|;)\s*\d+
+    | \d{4}[:,]\d{1,4}
+    | doi[:：]\S+
+    | https?://\S+
+    | [A-Za-z]{2,}(?:[A-Za-z0-9\-,']+),
+    | [A-Z][A-Za-z0-9\-\’&, ]{10,}\.\s+[A-Z]
+    | [\u4e00-\u9fa5]{2,}(?:,|，|、).{5,}?[\.。]\s*[\u4e00-\u9fa5A-Za-z]
+    | .+?,\s*\d{4},\s*\d{1,4}:\d{1,5}(?:-\d{1,5})?
+    )
+    """,
+    re.IGNORECASE,
+)
+
+# 各分支用到的字符，以及 IGNORECASE 下特殊的 ſ/K/İ/ı
+TOKENS = (list("abcXYZJjMm019-,'’&.。，、:：;）[] \t") + ["\u3000", "\u00a0", "年", "王", "继", "光", "等", "\u017f", "\u212a",
+          "İ", "ı", "é", "doi", "DOI", "http://", "https://x", "2015", "2020", "12", "1234", "12345", "et al",
+          "Smith AB", "Group", "Research", " 2019, 12:345-367", "[J]", "[12]", "1. "])
+
+
+@pytest.mark.parametrize("line, expected", [
+    ("[1] Smith AB, Jones C. Retrieval augmented generation. Nature. 2020;12:345-367.", True),
+    ("1. Lindholm LH, Carlberg B, Samuelsson O. Beta blockers in hypertension. Lancet 2005;366:1545-53.", True),
+    ("LindholmLH,CarlbergB,SamuelssonO.Shouldbetablockers", True),
+    ("SPRINT Research Group. A randomized trial of intensive versus standard blood-pressure control.", True),
+    ("王继光,谢良地,牟建军,等.中国高血压防治指南[J].中华高血压杂志,2019,27(1):1-44.", True),
+    ("Journal of Hypertension, 2015, 33:1234-1240", True),
+    ("doi:10.1000/xyz123", True),
+    ("https://example.org/paper", True),
+    ("2020年22卷第3期", True),
+    ("Results were consistent across all subgroups.", False),
+    ("", False),
+])
+def test_real_lines(line, expected):
+    assert is_reference_line(line) is expected
+    assert (LEGACY_PATTERN.match(line) is not None) is expected
+
+
+def test_fuzz_matches_legacy_pattern():
+    rng = random.Random(0)
+    for _ in range(20000):
+        line = "".join(rng.choice(TOKENS) for _ in range(rng.randint(0, 24)))
+        expected = LEGACY_PATTERN.match(line) is not None
+        # deadline 为无穷大时走可中断的逐候选查找，两条路径都要与原正则一致
+        assert bool(match_reference(line)) == expected, repr(line)
+        assert match_reference(line, float("inf")) == expected, repr(line)
+
+
+@pytest.mark.parametrize("line", [
+    "a" * 20000,
+    "A" + "b" * 20000,
+    " " * 10000 + "x," * 5000,
+    "王" * 10000 + "，" + "x" * 10000,
+    "a," + " " * 20000 + "1",
+    ", 2015, 1" * 2000,
+])
+def test_adversarial_lines_are_linear(line):
+    # 原正则在这些行上是平方复杂度（秒级），新实现应在毫秒级完成
+    t0 = time.perf_counter()
+    match_reference(line)
+    assert time.perf_counter() - t0 < 0.5
+
+
+def test_detector_gives_up_after_time_limit():
+    detector = ReferenceDetector(time_limit=0.001)
+    line = ("ab, 1: " * 300000)[:2_000_000]  # 每个逗号都要尝试 “,年份,卷:页”
+    assert detector(line) is False
+    assert detector("[1] Smith AB. Title. 2020;1:2.") is True
+    assert detector.stats == {"lines": 2, "matched": 1, "timeouts": 1}
+
+
+def test_detector_without_limit_never_times_out():
+    detector = ReferenceDetector(time_limit=None)
+    assert detector("x, " * 5000) is False
+    assert detector.stats["timeouts"] == 0
@@ -0,0 +1,36 @@
+from retrieve import search_by_vector, search_by_vectors
+
+
+class FakeCollection:
+    def __init__(self, hits):
+        self.hits = hits  # [(chunk_id, distance)]，已按距离排序
+
+    def query(self, query_embeddings, n_results, include):
+        rows = self.hits[:n_results]
+        return {
+            "metadatas": [[{"chunk_id": cid, "source_file": "a.pdf"} for cid, _ in rows] for _ in query_embeddings],
+            "distances": [[d for _, d in rows] for _ in query_embeddings],
+        }
+
+
+class FakeDB:
+    def __init__(self, hits):
+        self._collection = FakeCollection(hits)
+
+
+DB = FakeDB([("c1", 0.4), ("c2", 0.9), ("c3", 1.6)])
+
+
+def test_threshold_drops_distant_hits():
+    hits = search_by_vector([0.0], 3, DB, relevance_threshold=1.0)
+    assert [(h["chunk_id"], h["rank"]) for h in hits] == [("c1", 1), ("c2", 2)]
+    assert search_by_vector([0.0], 3, DB, relevance_threshold=0.1) == []
+
+
+def test_no_threshold_keeps_all_hits():
+    assert [h["chunk_id"] for h in search_by_vector([0.0], 3, DB)] == ["c1", "c2", "c3"]
+
+
+def test_batched_queries_share_threshold():
+    results = search_by_vectors([[0.0], [1.0]], 2, DB, relevance_threshold=0.5)
+    assert [[h["chunk_id"] for h in r] for r in results] == [["c1"], ["c1"]]